@@ -0,0 +1,450 @@
+from __future__ import annotations
+"""
+Fluidoracle — Answer Cache
+===========================
+Serves a repeat /api/ask question from the answer already given, instead
+of another retrieval and Claude call.
+
+Exact repeats
+  A question is matched on the hash of its normalized text (case, whitespace
+  and trailing punctuation ignored — database.normalize_question), stored in
+  questions.question_hash under a unique index. Every answered question is
+  found at any age with one indexed lookup; an in-process LRU of recent hits
+  sits in front of it so popular questions skip the database too. LRU
+  entries expire after ANSWER_CACHE_TTL, so a vote or deletion handled by
+  another worker is seen within that.
+
+Paraphrases ("best beta ratio for servo valves" / "what beta do servo
+valves need")
+  After retrieval, the answer engine embeds the question and looks for the
+  nearest previously answered one in a small in-process vector index. The
+  cached answer is served only if both hold:
+
+    cosine similarity   >= SEMANTIC_CACHE_SIMILARITY (strict)
+    retrieved chunks    Jaccard overlap of the parent chunks retrieved now
+                        and those the cached answer was built from
+                        >= SEMANTIC_CACHE_MIN_OVERLAP
+
+  so a question that reads alike but pulls different material is answered
+  fresh. A served answer carries a "similar_question" marker (the original
+  question, its id and the similarity). Embeddings are stored in
+  question_embeddings; the index is loaded at startup and picks up the
+  answers other workers stored every SEMANTIC_CACHE_REFRESH seconds.
+
+Failed answers ("declined to answer", "unable to generate") and
+low-confidence answers (built without knowledge-base context) are never
+served again. A vote evicts a question from the LRU; a downvoted question
+also leaves the semantic index and is not reloaded; deleting a question
+removes it from both. Those evictions are per process, so before a
+paraphrase is served its question is re-checked in the database — one
+primary-key read — and dropped if another worker saw it downvoted or
+deleted.
+
+Config (env):
+  ANSWER_CACHE_SIZE             questions kept in the in-process LRU (default 1024; 0 = off)
+  ANSWER_CACHE_TTL              seconds an LRU entry is served before a re-read (default 60)
+  SEMANTIC_CACHE                on/off (default true)
+  SEMANTIC_CACHE_SIMILARITY     cosine threshold for a paraphrase (default 0.95)
+  SEMANTIC_CACHE_MIN_OVERLAP    retrieved-chunk Jaccard overlap required (default 0.6)
+  SEMANTIC_CACHE_MAX            questions kept in the semantic index (default 5000)
+  SEMANTIC_CACHE_REFRESH        seconds between pulls of other workers' new answers (default 30)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Iterator
+
+import numpy as np
+
+import core.database as database
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "60"))
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "true").lower() == "true"
+SEMANTIC_CACHE_SIMILARITY = float(os.getenv("SEMANTIC_CACHE_SIMILARITY", "0.95"))
+SEMANTIC_CACHE_MIN_OVERLAP = float(os.getenv("SEMANTIC_CACHE_MIN_OVERLAP", "0.6"))
+SEMANTIC_CACHE_MAX = int(os.getenv("SEMANTIC_CACHE_MAX", "5000"))
+SEMANTIC_CACHE_REFRESH = float(os.getenv("SEMANTIC_CACHE_REFRESH", "30"))
+
+# Embeddings of questions being answered, held until the answer is saved
+_STAGED_MAX = 256
+
+_lru: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+_lock = threading.Lock()
+_counts: Counter = Counter()
+
+
+# ---------------------------------------------------------------------------
+# Exact repeats
+# ---------------------------------------------------------------------------
+
+def _remember(key: str, question: dict) -> None:
+    if ANSWER_CACHE_SIZE <= 0:
+        return
+    with _lock:
+        _lru[key] = (question, time.monotonic())
+        _lru.move_to_end(key)
+        while len(_lru) > ANSWER_CACHE_SIZE:
+            _lru.popitem(last=False)
+
+
+async def lookup(question_text: str) -> dict | None:
+    """The stored answer to this question, or None if it has none yet."""
+    key = database.question_hash(question_text)
+    with _lock:
+        cached = _lru.get(key)
+        if cached is not None and time.monotonic() - cached[1] < ANSWER_CACHE_TTL:
+            _lru.move_to_end(key)
+            _counts["lru_hits"] += 1
+            return cached[0]
+    question = await database.get_question_by_hash(key)
+    if question is None:
+        _counts["misses"] += 1
+        return None
+    _counts["db_hits"] += 1
+    _remember(key, question)
+    return question
+
+
+async def remember(saved: dict) -> None:
+    """Cache a freshly saved answer: in the LRU, and in the semantic index if
+    the engine staged its question's embedding (failed answers are skipped)."""
+    if database.is_failed_answer(saved["answer"]):
+        return
+    key = database.question_hash(saved["question"])
+    _remember(key, saved)
+    with _lock:
+        staged = _staged.pop(key, None)
+    if staged is None:
+        return
+    vector, chunk_ids = staged
+    _index.add(saved, vector, chunk_ids)
+    try:
+        await database.save_question_embedding(saved["id"], vector.tobytes(), chunk_ids)
+    except Exception as e:
+        logger.warning(f"[answer_cache] could not store question embedding: {e}")
+
+
+def evict(question_id: str) -> None:
+    """Drop a question from the LRU (its votes changed, or it was deleted)."""
+    with _lock:
+        for key in [k for k, (q, _) in _lru.items() if q["id"] == question_id]:
+            del _lru[key]
+
+
+def on_vote(question_id: str, votes: dict) -> None:
+    """After a vote: counts changed, and a downvoted answer is no longer
+    served for paraphrases."""
+    evict(question_id)
+    if votes.get("vote_down", 0) > 0:
+        _index.remove(question_id)
+
+
+def forget(question_id: str) -> None:
+    """Drop a deleted question from both caches."""
+    evict(question_id)
+    _index.remove(question_id)
+
+
+def clear() -> None:
+    global _synced_to, _synced_at
+    with _lock:
+        _lru.clear()
+        _staged.clear()
+        _synced_to, _synced_at = None, 0.0
+    _index.clear()
+
+
+# ---------------------------------------------------------------------------
+# Paraphrases
+# ---------------------------------------------------------------------------
+
+class SemanticIndex:
+    """Unit-normalized question embeddings in one matrix, with the answer
+    and retrieved chunk set of each.
+
+    Rows live in a preallocated buffer that doubles when full; a removal
+    moves the last row into the gap. Entries are kept in insertion order,
+    oldest first, for eviction at SEMANTIC_CACHE_MAX.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._size = 0
+        self._ids: list[str] = []          # row → question id
+        self._rows: dict[str, int] = {}    # question id → row
+        self._entries: dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _entry(question: dict, chunk_ids: list[str]) -> dict:
+        return {
+            "id": question["id"],
+            "question": question["question"],
+            "answer": question["answer"],
+            "confidence": question.get("confidence", "MEDIUM"),
+            "sources": question.get("sources", []),
+            "warnings": question.get("warnings", []),
+            "chunk_ids": frozenset(chunk_ids),
+        }
+
+    def add(self, question: dict, vector: np.ndarray, chunk_ids: list[str]) -> None:
+        self.add_many([(question, vector, chunk_ids)])
+
+    def add_many(self, items: list[tuple[dict, np.ndarray, list[str]]]) -> None:
+        """Add (question, vector, chunk_ids) items, oldest first."""
+        with self._lock:
+            for question, vector, chunk_ids in items:
+                if self._size and vector.shape[0] != self._matrix.shape[1]:
+                    continue  # embedding model changed; entry would not compare
+                self._remove(question["id"])
+                self._append(question["id"], vector)
+                self._entries[question["id"]] = self._entry(question, chunk_ids)
+                while self._size > SEMANTIC_CACHE_MAX:
+                    self._remove(next(iter(self._entries)))
+
+    def load(self, items: list[tuple[dict, np.ndarray, list[str]]]) -> None:
+        """Replace the contents with (question, vector, chunk_ids) items,
+        oldest first, building the matrix in one go."""
+        latest: dict[str, tuple] = {}
+        for item in items:
+            latest.pop(item[0]["id"], None)
+            latest[item[0]["id"]] = item
+        kept = list(latest.values())[-SEMANTIC_CACHE_MAX:] if SEMANTIC_CACHE_MAX > 0 else []
+        if kept:
+            dim = kept[-1][1].shape[0]
+            kept = [item for item in kept if item[1].shape[0] == dim]
+        matrix = np.zeros((0, 0), dtype=np.float32)
+        if kept:
+            # Room for the next adds: at the cap an add briefly holds one row over
+            capacity = max(min(2 * len(kept), SEMANTIC_CACHE_MAX + 1), len(kept) + 1)
+            matrix = np.zeros((capacity, dim), dtype=np.float32)
+            matrix[:len(kept)] = np.stack([vector for _, vector, _ in kept])
+        with self._lock:
+            self._matrix = matrix
+            self._size = len(kept)
+            self._ids = [question["id"] for question, _, _ in kept]
+            self._rows = {qid: i for i, qid in enumerate(self._ids)}
+            self._entries = {question["id"]: self._entry(question, chunk_ids) for question, _, chunk_ids in kept}
+
+    def _append(self, question_id: str, vector: np.ndarray) -> None:
+        if self._size == 0:
+            self._matrix = np.zeros((16, vector.shape[0]), dtype=np.float32)
+        elif self._size == self._matrix.shape[0]:
+            grown = np.zeros((self._size * 2, self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._matrix
+            self._matrix = grown
+        self._matrix[self._size] = vector
+        self._rows[question_id] = self._size
+        self._ids.append(question_id)
+        self._size += 1
+
+    def _remove(self, question_id: str) -> None:
+        row = self._rows.pop(question_id, None)
+        if row is None:
+            return
+        last = self._size - 1
+        if row != last:
+            moved = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+        self._ids.pop()
+        self._size = last
+        del self._entries[question_id]
+
+    def remove(self, question_id: str) -> None:
+        with self._lock:
+            self._remove(question_id)
+
+    def clear(self) -> None:
+        self.load([])
+
+    def nearest(self, vector: np.ndarray) -> tuple[dict, float] | None:
+        """(entry, cosine similarity) of the closest stored question."""
+        with self._lock:
+            if not self._size or vector.shape[0] != self._matrix.shape[1]:
+                return None
+            scores = self._matrix[:self._size] @ vector
+            best = int(np.argmax(scores))
+            return self._entries[self._ids[best]], float(scores[best])
+
+
+_index = SemanticIndex()
+_staged: OrderedDict[str, tuple[np.ndarray, list[str]]] = OrderedDict()
+
+# Newest question_embeddings.created_at in the index, and when it was read
+_synced_to: str | None = None
+_synced_at = 0.0
+
+
+def _embed(text: str) -> np.ndarray:
+    """Unit-normalized embedding under the retrieval embedding model."""
+    from core.retrieval.config import EMBEDDING_MODEL
+    from core.retrieval.hybrid_search import _get_openai
+
+    response = _get_openai().embeddings.create(model=EMBEDDING_MODEL, input=[text])
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def retrieved_chunk_ids(results: list[dict]) -> list[str]:
+    """Identity of the parent chunks in a retrieval result."""
+    return [r.get("parent_id") or r.get("source", "") for r in results]
+
+
+def _overlap(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+
+def find_similar(question_text: str, chunk_ids: list[str]) -> dict | None:
+    """A cached answer to a paraphrase of this question, or None.
+
+    Called by the answer engine after retrieval, in its worker thread.
+    `chunk_ids` are the parent chunks retrieved for this question; empty
+    (low confidence) means no lookup and nothing to cache. The question's
+    embedding is kept until remember() stores the answer it gets.
+    """
+    if not SEMANTIC_CACHE or not chunk_ids:
+        return None
+    try:
+        vector = _embed(question_text)
+    except Exception as e:
+        logger.warning(f"[answer_cache] question embedding failed: {e}")
+        return None
+    with _lock:
+        _staged[database.question_hash(question_text)] = (vector, list(chunk_ids))
+        while len(_staged) > _STAGED_MAX:
+            _staged.popitem(last=False)
+
+    _refresh_index()
+    match = _index.nearest(vector)
+    if match is None or match[1] < SEMANTIC_CACHE_SIMILARITY:
+        _counts["semantic_misses"] += 1
+        return None
+    entry, similarity = match
+    overlap = _overlap(entry["chunk_ids"], frozenset(chunk_ids))
+    if overlap < SEMANTIC_CACHE_MIN_OVERLAP:
+        _counts["semantic_rejected_overlap"] += 1
+        logger.info(f"[answer_cache] similar question {entry['id']} (cosine {similarity:.3f}) "
+                    f"rejected: retrieved chunk overlap {overlap:.2f}")
+        return None
+    # Evictions are per process: another worker may have seen a downvote or delete
+    try:
+        servable = database.question_servable_sync(entry["id"])
+    except Exception as e:
+        logger.warning(f"[answer_cache] could not re-check {entry['id']}: {e}")
+        servable = False
+    if not servable:
+        _index.remove(entry["id"])
+        _counts["semantic_stale"] += 1
+        return None
+    _counts["semantic_hits"] += 1
+    logger.info(f"[answer_cache] serving {entry['id']} for a similar question "
+                f"(cosine {similarity:.3f}, chunk overlap {overlap:.2f})")
+    cached = {k: v for k, v in entry.items() if k != "chunk_ids"}
+    cached["similar_question"] = {
+        "question_id": entry["id"],
+        "question": entry["question"],
+        "similarity": round(similarity, 4),
+    }
+    return cached
+
+
+async def load_index() -> int:
+    """Rebuild the semantic index from question_embeddings (at startup)."""
+    if not SEMANTIC_CACHE:
+        return 0
+    try:
+        rows = await database.get_question_embeddings(SEMANTIC_CACHE_MAX)
+    except Exception as e:
+        logger.warning(f"[answer_cache] could not load question embeddings: {e}")
+        return 0
+    # Decoding and stacking thousands of embeddings is kept off the event loop
+    await asyncio.to_thread(_add_rows, rows, True)
+    return len(_index)
+
+
+def _add_rows(rows: list[dict], replace: bool = False) -> None:
+    """Add question_embeddings rows (newest first) — or replace the index
+    with them — and advance the sync mark."""
+    global _synced_to, _synced_at
+    # Oldest first, so the newest survive SEMANTIC_CACHE_MAX
+    items = [(row, np.frombuffer(row["embedding"], dtype=np.float32), row["chunk_ids"]) for row in reversed(rows)]
+    if replace:
+        _index.load(items)
+    else:
+        _index.add_many(items)
+    with _lock:
+        if rows and (_synced_to is None or rows[0]["created_at"] > _synced_to):
+            _synced_to = rows[0]["created_at"]
+        _synced_at = time.monotonic()
+
+
+def _refresh_index() -> None:
+    """Pull answers other workers stored since the last read, at most every
+    SEMANTIC_CACHE_REFRESH seconds (from the engine's worker thread)."""
+    global _synced_at
+    with _lock:
+        if time.monotonic() - _synced_at < SEMANTIC_CACHE_REFRESH:
+            return
+        _synced_at = time.monotonic()  # one refresh at a time, and none in a tight loop on errors
+    try:
+        rows = database.get_question_embeddings_since_sync(_synced_to or "", SEMANTIC_CACHE_MAX)
+    except Exception as e:
+        logger.warning(f"[answer_cache] could not refresh the semantic index: {e}")
+        return
+    _add_rows(rows)
+
+
+# ---------------------------------------------------------------------------
+# Serving
+# ---------------------------------------------------------------------------
+
+def cached_sse(question: dict) -> Iterator[str]:
+    """A stored answer as the SSE events of a streamed one, all at once."""
+    confidence = question.get("confidence", "MEDIUM")
+    sources = question.get("sources", [])
+    warnings = question.get("warnings", [])
+    marker = {"similar_question": question["similar_question"]} if question.get("similar_question") else {}
+    yield f"event: status\ndata: {json.dumps({'stage': 'generating', 'confidence': confidence, 'sources': sources, 'warnings': warnings, **marker})}\n\n"
+    yield f"event: chunk\ndata: {json.dumps({'text': question['answer']})}\n\n"
+    yield f"event: complete\ndata: {json.dumps({'answer': question['answer'], 'confidence': confidence, 'sources': sources, 'warnings': warnings, 'question_id': question['id'], **marker})}\n\n"
+
+
+def cache_stats() -> dict:
+    with _lock:
+        size = len(_lru)
+    lookups = _counts["lru_hits"] + _counts["db_hits"] + _counts["misses"]
+    checks = (_counts["semantic_hits"] + _counts["semantic_misses"] + _counts["semantic_rejected_overlap"]
+              + _counts["semantic_stale"])
+    return {
+        "lru_size": size,
+        "lru_capacity": ANSWER_CACHE_SIZE,
+        "lru_hits": _counts["lru_hits"],
+        "db_hits": _counts["db_hits"],
+        "misses": _counts["misses"],
+        "hit_rate": round((lookups - _counts["misses"]) / lookups, 3) if lookups else None,
+        "semantic": {
+            "enabled": SEMANTIC_CACHE,
+            "similarity": SEMANTIC_CACHE_SIMILARITY,
+            "min_overlap": SEMANTIC_CACHE_MIN_OVERLAP,
+            "size": len(_index),
+            "hits": _counts["semantic_hits"],
+            "misses": _counts["semantic_misses"],
+            "rejected_overlap": _counts["semantic_rejected_overlap"],
+            "stale": _counts["semantic_stale"],
+            "hit_rate": round(_counts["semantic_hits"] / checks, 3) if checks else None,
+        },
+    }
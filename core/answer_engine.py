@@ -7,7 +7,9 @@ Core intelligence: retrieves RAG context and generates expert answers via Claude
 Vertical-agnostic: receives system prompt and retrieval config from VerticalConfig.
 
 Flow:
-  1. Call verified_query() from the retrieval pipeline (vertical-scoped)
+  1. Call verified_query() from the retrieval pipeline (vertical-scoped);
+     a paraphrase of an answered question with matching retrieval is served
+     from the semantic answer cache (core/answer_cache.py) and stops here
   2. Build a prompt with system instructions + retrieved context
   3. Call Claude API for answer generation
   4. Return structured result (with automatic retry on refusal)
@@ -35,8 +37,12 @@ STREAM_MODEL = os.getenv("STREAM_MODEL", "claude-sonnet-4-5-20250929")
 print(f"[answer_engine] Using model: {CLAUDE_MODEL}, fallback: {FALLBACK_MODEL}, stream: {STREAM_MODEL}")
 
 # Import retrieval from the core package (no more sys.path hacks)
+from core import answer_cache, hedging, llm_gateway, model_router
+from core.context_packer import message_tokens
 from core.database import log_llm_usage_sync
-from core.retrieval.verified_query import verified_query
+from core.prompt_cache import cached_system
+from core.retrieval.verified_query import format_relevance, verified_query
+from core.streaming import record_aborted_stream
 
 # ---------------------------------------------------------------------------
 # Anthropic client
@@ -51,7 +57,7 @@ def _get_client() -> anthropic.Anthropic:
             raise RuntimeError(
                 "ANTHROPIC_API_KEY not set. Add it to your .env file."
             )
-        _client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        _client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=llm_gateway.CLIENT_MAX_RETRIES)
     return _client
 
 
@@ -61,6 +67,7 @@ def _get_client() -> anthropic.Anthropic:
 # Legacy module-level SYSTEM_PROMPT maintained for backward compatibility.
 # New code should use get_system_prompt(vertical_config) instead.
 SYSTEM_PROMPT: str = ""  # Will be set by init_vertical() or load at first use
+_current_vertical_id: str = ""
 
 def get_system_prompt(vertical_config=None) -> str:
     """Get the answering system prompt for a vertical.
@@ -88,8 +95,14 @@ def init_vertical(vertical_config) -> None:
 
     Called at application startup to set the default vertical for this module.
     """
-    global SYSTEM_PROMPT
+    global SYSTEM_PROMPT, _current_vertical_id
     SYSTEM_PROMPT = vertical_config.answering_prompt
+    _current_vertical_id = vertical_config.vertical_id
+
+
+def current_vertical_id() -> str:
+    """Vertical this module was initialised for ("" before init_vertical())."""
+    return _current_vertical_id
 
 
 # Legacy SYSTEM_PROMPT removed — now loaded from vertical config files.
@@ -116,6 +129,14 @@ State upfront that the answer draws on general domain knowledge rather than the
 # Answer Generation
 # ===========================================================================
 
+def _find_similar(question: str, rag_result: dict) -> dict | None:
+    """Cached answer to a paraphrase of `question`, checked against its
+    retrieval. Low-confidence retrievals are answered fresh and not cached."""
+    if rag_result["confidence"]["level"] == "LOW":
+        return None
+    return answer_cache.find_similar(question, answer_cache.retrieved_chunk_ids(rag_result["results"]))
+
+
 def generate_answer(question: str) -> dict:
     """Generate an expert answer using RAG retrieval + Claude.
 
@@ -156,7 +177,7 @@ def generate_answer(question: str) -> dict:
     all_chunks = []
     for i, result in enumerate(rag_result["results"], 1):
         source = result.get("source", "unknown")
-        score = result.get("rerank_score", 0.0)
+        score = result.get("rerank_score")
         text = result.get("parent_text", "")
         all_chunks.append({
             "index": i,
@@ -170,13 +191,28 @@ def generate_answer(question: str) -> dict:
     confidence_level = rag_result["confidence"]["level"]
     confidence_reasoning = rag_result["confidence"]["reasoning"]
 
+    # A paraphrase of an answered question whose retrieval matches this one
+    # is served from the semantic cache (core/answer_cache.py)
+    similar = _find_similar(question, rag_result)
+    if similar is not None:
+        return {
+            "answer": similar["answer"],
+            "confidence": similar["confidence"],
+            "sources": similar["sources"],
+            "warnings": similar["warnings"],
+            "rag_results": rag_result,
+            "question_id": similar["id"],
+            "similar_question": similar["similar_question"],
+        }
+
     # When confidence is LOW, drop irrelevant chunks (they add noise and
     # can cause Claude to fixate on unrelated content) and append an
     # instruction telling Claude to answer from its general knowledge.
-    system_prompt = get_system_prompt()
+    # The vertical prompt is the cached prefix; the addendum follows it.
+    system_prompt = cached_system(get_system_prompt())
     if confidence_level == "LOW":
         all_chunks = []  # discard noisy low-relevance chunks
-        system_prompt = get_system_prompt() + LOW_CONFIDENCE_ADDENDUM
+        system_prompt = cached_system(get_system_prompt(), LOW_CONFIDENCE_ADDENDUM)
 
     # Step 3: Call Claude with automatic model fallback on refusal.
     #
@@ -186,8 +222,12 @@ def generate_answer(question: str) -> dict:
     #   2. Try primary model with no RAG chunks (copyright in chunks may cause refusal)
     #   3. Try fallback model with all RAG chunks
     #   4. Try fallback model with no RAG chunks
+    #
+    # 1-2 and 3-4 are the primary and fallback lanes of a hedged race
+    # (core/hedging.py): with LLM_HEDGING on, the fallback lane starts as
+    # soon as the primary has been silent for HEDGE_AFTER_SECONDS instead of
+    # waiting for both primary strategies to fail.
     client = _get_client()
-    answer_text = None
 
     def _build_user_message(chunks):
         if chunks:
@@ -195,7 +235,7 @@ def generate_answer(question: str) -> dict:
             for c in chunks:
                 context_parts.append(
                     f"--- Reference [{c['index']}]: {c['source']} "
-                    f"(relevance: {c['score']:.3f}) ---\n{c['text']}"
+                    f"(relevance: {format_relevance(c['score'])}) ---\n{c['text']}"
                 )
             context_block = "\n\n".join(context_parts)
 
@@ -227,59 +267,79 @@ RETRIEVED CONTEXT (internal engineering reference notes):
 QUESTION:
 {question}"""
 
-    # Define retry strategies: (label, model, chunks)
+    # The model pair comes from the routing table (core/model_router.py)
+    route = model_router.route(
+        "answer", "answering", message_tokens([{"role": "user", "content": _build_user_message(all_chunks)}]),
+        CLAUDE_MODEL, FALLBACK_MODEL,
+    )
+
+    # Define retry strategies per lane: (label, chunks)
     strategies = [
-        ("primary+context", CLAUDE_MODEL, list(all_chunks)),
-        ("primary+no_context", CLAUDE_MODEL, []),
-        ("fallback+context", FALLBACK_MODEL, list(all_chunks)),
-        ("fallback+no_context", FALLBACK_MODEL, []),
+        [("primary+context", list(all_chunks)), ("primary+no_context", [])],
+        [("fallback+context", list(all_chunks)), ("fallback+no_context", [])],
     ]
 
-    for strategy_name, model, chunks_to_use in strategies:
-        user_message = _build_user_message(chunks_to_use)
+    def _answer_lane(lane: hedging.Lane):
+        for strategy_name, chunks_to_use in strategies[lane.index]:
+            if lane.lost:
+                return
+            messages = [{"role": "user", "content": _build_user_message(chunks_to_use)}]
+            started = time.time()
+
+            try:
+                response = llm_gateway.call(lane.model, lambda: client.messages.create(
+                    model=lane.model,
+                    max_tokens=4000,
+                    system=system_prompt,
+                    messages=messages,
+                ), llm_gateway.estimate_tokens(system_prompt, messages))
+            except Exception as e:
+                logger.error(f"[{strategy_name}] API error with {lane.model}: {e}")
+                continue
+
+            logger.info(
+                f"[{strategy_name}] model={response.model} "
+                f"stop_reason={response.stop_reason} "
+                f"input_tokens={response.usage.input_tokens} "
+                f"output_tokens={response.usage.output_tokens} "
+                f"chunks={len(chunks_to_use)}"
+                + (" (lost hedge)" if lane.lost else "")
+            )
+            tags = route.tags(lane.model)
+            if lane.lost:
+                hedging.record_loser(response.usage, response.model, "answering", **tags)
+                return
+            log_llm_usage_sync(
+                response.usage, response.model, "answering",
+                latency_ms=round((time.time() - started) * 1000), **tags,
+            )
 
-        try:
-            response = client.messages.create(
-                model=model,
-                max_tokens=4000,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_message},
-                ],
+            # Check if we got a valid response
+            if response.content and len(response.content) > 0:
+                for block in response.content:
+                    if hasattr(block, 'text') and block.text.strip():
+                        yield (strategy_name, block.text)
+                        return
+
+            # Log the refusal and try next strategy
+            logger.warning(
+                f"[{strategy_name}] {lane.model} refused "
+                f"({len(chunks_to_use)} chunks). Trying next strategy."
             )
-        except Exception as e:
-            logger.error(f"[{strategy_name}] API error with {model}: {e}")
-            continue
-
-        logger.info(
-            f"[{strategy_name}] model={response.model} "
-            f"stop_reason={response.stop_reason} "
-            f"input_tokens={response.usage.input_tokens} "
-            f"output_tokens={response.usage.output_tokens} "
-            f"chunks={len(chunks_to_use)}"
-        )
-        log_llm_usage_sync(response.usage, response.model, "answering")
-
-        # Check if we got a valid response
-        if response.content and len(response.content) > 0:
-            for block in response.content:
-                if hasattr(block, 'text') and block.text.strip():
-                    answer_text = block.text
-                    break
-
-        if answer_text:
-            if strategy_name != "primary+context":
-                logger.warning(
-                    f"Succeeded with fallback strategy '{strategy_name}' "
-                    f"after earlier refusal(s)."
-                )
-            break  # Success
 
-        # Log the refusal and try next strategy
-        logger.warning(
-            f"[{strategy_name}] {model} refused "
-            f"({len(chunks_to_use)} chunks). Trying next strategy."
-        )
+    lane, lane_answers, answer = hedging.race(
+        [hedging.Lane(0, route.model), hedging.Lane(1, route.fallback)],
+        _answer_lane, lambda item: True, "answer",
+    )
+    answer_text = None
+    if lane is not None:
+        lane_answers.close()
+        strategy_name, answer_text = answer
+        if strategy_name != "primary+context":
+            logger.warning(
+                f"Succeeded with fallback strategy '{strategy_name}' "
+                f"(after earlier refusal(s), or won a hedge)."
+            )
 
     t_llm = time.time()
     logger.info(
@@ -360,11 +420,16 @@ def generate_answer_stream(question: str):
     sources = rag_result["citations"]
     warnings = rag_result["warnings"]
 
+    similar = _find_similar(question, rag_result)
+    if similar is not None:
+        yield from answer_cache.cached_sse(similar)
+        return
+
     # Build context chunks
     all_chunks = []
     for i, result in enumerate(rag_result["results"], 1):
         source = result.get("source", "unknown")
-        score = result.get("rerank_score", 0.0)
+        score = result.get("rerank_score")
         text = result.get("parent_text", "")
         all_chunks.append({
             "index": i,
@@ -375,10 +440,10 @@ def generate_answer_stream(question: str):
 
     # When confidence is LOW, drop irrelevant chunks and tell Claude to
     # answer from its general domain knowledge instead.
-    system_prompt = get_system_prompt()
+    system_prompt = cached_system(get_system_prompt())
     if confidence_level == "LOW":
         all_chunks = []
-        system_prompt = get_system_prompt() + LOW_CONFIDENCE_ADDENDUM
+        system_prompt = cached_system(get_system_prompt(), LOW_CONFIDENCE_ADDENDUM)
 
     # --- Phase 2: Stream from Claude ---
     yield _sse("status", {
@@ -394,7 +459,7 @@ def generate_answer_stream(question: str):
         for c in all_chunks:
             context_parts.append(
                 f"--- Reference [{c['index']}]: {c['source']} "
-                f"(relevance: {c['score']:.3f}) ---\n{c['text']}"
+                f"(relevance: {format_relevance(c['score'])}) ---\n{c['text']}"
             )
         context_block = "\n\n".join(context_parts)
 
@@ -429,29 +494,50 @@ QUESTION:
     client = _get_client()
     full_answer = ""
 
+    messages = [{"role": "user", "content": user_message}]
+    estimated_tokens = llm_gateway.estimate_tokens(system_prompt, messages)
+    route = model_router.route("answer", "answering", message_tokens(messages), STREAM_MODEL, FALLBACK_MODEL)
+    started = time.time()
+    first_token_ms = None
+
     try:
-        with client.messages.stream(
-            model=STREAM_MODEL,
+        with llm_gateway.stream(route.model, lambda: client.messages.stream(
+            model=route.model,
             max_tokens=4000,
             system=system_prompt,
-            messages=[{"role": "user", "content": user_message}],
-        ) as stream:
-            for text in stream.text_stream:
-                full_answer += text
-                yield _sse("chunk", {"text": text})
+            messages=messages,
+        ), estimated_tokens) as stream:
+            try:
+                for text in stream.text_stream:
+                    if first_token_ms is None:
+                        first_token_ms = round((time.time() - started) * 1000)
+                    full_answer += text
+                    yield _sse("chunk", {"text": text})
+            except GeneratorExit:
+                # Client disconnected — leaving the block closes the stream
+                record_aborted_stream(stream, route.model, "answering", full_answer, 4000, **route.tags(route.model))
+                raise
             final_msg = stream.get_final_message()
-            log_llm_usage_sync(final_msg.usage, final_msg.model, "answering")
+            log_llm_usage_sync(
+                final_msg.usage, final_msg.model, "answering",
+                latency_ms=round((time.time() - started) * 1000), first_token_ms=first_token_ms,
+                **route.tags(route.model),
+            )
     except Exception as e:
-        logger.error(f"[stream] Claude streaming error with {STREAM_MODEL}: {e}")
+        logger.error(f"[stream] Claude streaming error with {route.model}: {e}")
         # Fall back to non-streaming with fallback model
         try:
-            response = client.messages.create(
-                model=FALLBACK_MODEL,
+            started = time.time()
+            response = llm_gateway.call(route.fallback, lambda: client.messages.create(
+                model=route.fallback,
                 max_tokens=4000,
                 system=system_prompt,
-                messages=[{"role": "user", "content": user_message}],
+                messages=messages,
+            ), estimated_tokens)
+            log_llm_usage_sync(
+                response.usage, response.model, "answering",
+                latency_ms=round((time.time() - started) * 1000), **route.tags(route.fallback),
             )
-            log_llm_usage_sync(response.usage, response.model, "answering")
             if response.content:
                 for block in response.content:
                     if hasattr(block, "text") and block.text.strip():
@@ -14,10 +14,14 @@ pipeline (scoped to the vertical's KB), and Claude delivers a grounded
 recommendation with full citations.
 """
 
+import asyncio
 import json
 import logging
 import os
 import re
+import threading
+import time
+from contextlib import aclosing
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -31,13 +35,25 @@ load_dotenv(_PROJECT_ROOT / ".env")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
 CONSULT_MODEL = os.getenv("CONSULT_MODEL", "claude-sonnet-4-5-20250929")
 FALLBACK_MODEL = os.getenv("FALLBACK_MODEL", "claude-sonnet-4-20250514")
+# Stream gathering turns token-by-token (signal detected on the fly) instead
+# of waiting for the whole turn before showing anything
+STREAM_GATHERING = os.getenv("STREAM_GATHERING", "true").lower() == "true"
 
 print(f"[consultation_engine] Primary model: {CONSULT_MODEL}")
 print(f"[consultation_engine] Fallback model: {FALLBACK_MODEL}")
 
+from core import hedging, llm_gateway, model_router, session_retrieval
+from core.context_packer import (
+    CONTEXT_HISTORY_SHARE, CONTEXT_PACKING, CONTEXT_TOKEN_BUDGET,
+    count_tokens, log_packed, message_tokens, pack_history, pack_results, result_tokens,
+)
 from core.database import log_llm_usage_sync
 from core.precompute import build_precomputed_context
-from core.retrieval.verified_query import verified_query
+from core.prompt_cache import cache_usage, cached_messages, cached_system, system_text
+from core.reference_sections import REFERENCE_SELECTION
+from core.retrieval.verified_query import format_relevance, verified_query
+from core.speculative_retrieval import SpeculativeRetrieval, should_speculate, speculative_query
+from core.streaming import aborted_usage, record_aborted_stream, shielded
 
 # ---------------------------------------------------------------------------
 # Anthropic client
@@ -52,10 +68,27 @@ def _get_client() -> anthropic.Anthropic:
             raise RuntimeError(
                 "ANTHROPIC_API_KEY not set. Add it to your .env file."
             )
-        _client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        _client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=llm_gateway.CLIENT_MAX_RETRIES)
     return _client
 
 
+_async_client = None
+
+
+def _get_async_client() -> anthropic.AsyncAnthropic:
+    """Async client for the non-blocking streaming path (SSE routes)."""
+    global _async_client
+    if _async_client is None:
+        if not ANTHROPIC_API_KEY:
+            raise RuntimeError(
+                "ANTHROPIC_API_KEY not set. Add it to your .env file."
+            )
+        _async_client = anthropic.AsyncAnthropic(
+            api_key=ANTHROPIC_API_KEY, max_retries=llm_gateway.CLIENT_MAX_RETRIES,
+        )
+    return _async_client
+
+
 # ---------------------------------------------------------------------------
 # System Prompts
 # ---------------------------------------------------------------------------
@@ -71,17 +104,30 @@ def _get_client() -> anthropic.Anthropic:
 # Module-level defaults (set by init_vertical)
 GATHERING_SYSTEM_PROMPT: str = ""
 ANSWERING_SYSTEM_PROMPT_TEMPLATE: str = ""
+_default_reference_index = None
 _current_vertical_id: str = ""
 
 
 def init_vertical(vertical_config) -> None:
     """Initialize module-level prompts from a vertical config."""
-    global GATHERING_SYSTEM_PROMPT, ANSWERING_SYSTEM_PROMPT_TEMPLATE, _current_vertical_id
+    global GATHERING_SYSTEM_PROMPT, ANSWERING_SYSTEM_PROMPT_TEMPLATE, _default_reference_index, _current_vertical_id
     _current_vertical_id = vertical_config.vertical_id
     GATHERING_SYSTEM_PROMPT = vertical_config.gathering_prompt
-    # The answering prompt is the vertical's full answering_prompt with
-    # placeholders for {application_profile} and {rag_context}
-    ANSWERING_SYSTEM_PROMPT_TEMPLATE = vertical_config.answering_prompt
+    ANSWERING_SYSTEM_PROMPT_TEMPLATE, _default_reference_index = _answering_template(vertical_config)
+
+
+def _answering_template(vc) -> tuple:
+    """(answering prompt template, reference index) for a vertical.
+
+    With REFERENCE_SELECTION the template is the answering prompt without its
+    CORE REFERENCE DATA block, and the index supplies the relevant sections
+    per call. Otherwise it is the full prompt and there is no index.
+    """
+    if vc is None:
+        return ANSWERING_SYSTEM_PROMPT_TEMPLATE, _default_reference_index
+    if REFERENCE_SELECTION and vc.reference_index is not None:
+        return vc.answering_prompt_base, vc.reference_index
+    return vc.answering_prompt, None
 
 
 def _retrieval_kwargs(vc) -> dict:
@@ -93,6 +139,11 @@ def _retrieval_kwargs(vc) -> dict:
     }
 
 
+def _context_budget(vc) -> int:
+    """Whole-prompt token budget for a vertical's consultation calls."""
+    return vc.context_token_budget if vc else CONTEXT_TOKEN_BUDGET
+
+
 def _enrich_profile_with_precompute(application_profile: str, params: dict | None) -> str:
     """Append pre-computed engineering values to an application profile."""
     if params:
@@ -105,20 +156,20 @@ def _enrich_profile_with_precompute(application_profile: str, params: dict | Non
     return application_profile
 
 
-def _get_answering_prompt(application_profile: str, rag_context: str, template: str | None = None) -> str:
-    """Build the answering system prompt with RAG context injected."""
+def _get_answering_prompt(template: str | None = None) -> str:
+    """Build the answering system prompt (stable across calls — cached).
+
+    The per-call application profile and retrieved context are not part of
+    it; see _answering_context().
+    """
     base = template or ANSWERING_SYSTEM_PROMPT_TEMPLATE or ""
-    return base + f"""
+    return base + """
 
 ADDITIONAL CONTEXT FOR THIS RESPONSE:
 
 You are in the ANSWERING phase of a diagnostic consultation. The user has already provided detailed information about their application through a multi-turn conversation. The full conversation history is included below.
 
-APPLICATION PROFILE:
-{application_profile}
-
-RETRIEVED TECHNICAL CONTEXT:
-{rag_context}
+The APPLICATION PROFILE, the RETRIEVED TECHNICAL CONTEXT and any CORE REFERENCE DATA selected for this consultation are supplied by the system at the start of the user's latest message, ahead of what the user wrote.
 
 YOUR TASK:
 Based on the complete application profile gathered during the diagnostic phase AND the retrieved technical data, provide a comprehensive recommendation. Your recommendation MUST include:
@@ -135,6 +186,30 @@ If the retrieved technical data doesn't contain specific product matches, say so
 For follow-up questions in this phase, maintain full context and refine or expand your recommendation based on new information."""
 
 
+def _answering_context(application_profile: str, rag_context: str, reference: str = "") -> str:
+    """Per-call context for an answering turn (sent after the cached prefix)."""
+    context = f"""APPLICATION PROFILE:
+{application_profile}
+
+RETRIEVED TECHNICAL CONTEXT:
+{rag_context}"""
+    if reference:
+        context += "\n\n" + reference
+    return context
+
+
+def _select_reference(reference_index, query: str, params: dict | None) -> str:
+    """Reference sections relevant to the query and gathered parameters, rendered."""
+    if reference_index is None:
+        return ""
+    terms = [query] + [f"{k} {v}" for k, v in (params or {}).items()]
+    sections = reference_index.select(" ".join(terms))
+    logger.info(
+        f"[reference] {len(sections)}/{len(reference_index.sections)} sections, "
+        f"~{sum(s.tokens for s in sections)}/{reference_index.total_tokens} tokens"
+    )
+    return reference_index.render(sections)
+
 
 # Addendum appended ONLY for the initial recommendation (gathering→answering transition).
 # Follow-up questions in the answering phase do NOT get this instruction.
@@ -318,103 +393,109 @@ def _parse_recommendation_sections(text: str) -> tuple[str, str | None]:
 # ===========================================================================
 # Claude API call with fallback
 # ===========================================================================
+# The model pair for a call comes from the routing table (core/model_router.py).
+# Each model attempt is a "lane" generator (core/hedging.py). Lanes run in
+# order — the fallback after the primary fails or refuses — and, with
+# LLM_HEDGING on, the fallback also starts once the primary has been silent
+# for HEDGE_AFTER_SECONDS; the first viable lane wins.
 
-def _call_claude(system: str, messages: list[dict], max_tokens: int = 4000) -> tuple:
-    """Call Claude API with automatic fallback on refusal.
+def _route(phase: str, messages: list[dict]) -> model_router.Route:
+    return model_router.route("consultation", phase, message_tokens(messages), CONSULT_MODEL, FALLBACK_MODEL)
 
-    Returns (response_text, model_used).
-    """
-    client = _get_client()
-
-    for model in [CONSULT_MODEL, FALLBACK_MODEL]:
-        try:
-            response = client.messages.create(
-                model=model,
-                max_tokens=max_tokens,
-                system=system,
-                messages=messages,
-            )
 
-            logger.info(
-                f"[consultation_engine] model={response.model} "
-                f"stop_reason={response.stop_reason} "
-                f"input_tokens={response.usage.input_tokens} "
-                f"output_tokens={response.usage.output_tokens}"
-            )
-            log_llm_usage_sync(response.usage, response.model, "gathering")
+def _lanes(models: list[str]) -> list[hedging.Lane]:
+    return [hedging.Lane(i, model) for i, model in enumerate(models)]
 
-            if response.stop_reason == "refusal" or not response.content:
-                if model == FALLBACK_MODEL:
-                    return ("Unable to generate a response. Please try rephrasing.", model)
-                logger.warning(f"{model} refused. Retrying with {FALLBACK_MODEL}...")
-                continue
 
-            for block in response.content:
-                if hasattr(block, "text"):
-                    return (block.text, response.model)
+def _elapsed_ms(started: float) -> int:
+    return round((time.perf_counter() - started) * 1000)
 
-            return ("The model returned a response but no text content.", response.model)
 
-        except Exception as e:
-            logger.error(f"[consultation_engine] API error with {model}: {e}")
-            if model == FALLBACK_MODEL:
-                return (f"An error occurred generating the response: {e}", model)
-            continue
+def _log_response(response, phase: str, lane: hedging.Lane, route: model_router.Route, started: float) -> None:
+    logger.info(
+        f"[consultation_engine] model={response.model} "
+        f"stop_reason={response.stop_reason} "
+        f"input_tokens={response.usage.input_tokens} "
+        f"output_tokens={response.usage.output_tokens} "
+        f"cache_write_read={cache_usage(response.usage)}"
+        + (" (lost hedge)" if lane.lost else "")
+    )
+    tags = route.tags(lane.model)
+    if lane.lost:
+        hedging.record_loser(response.usage, response.model, phase, **tags)
+    else:
+        log_llm_usage_sync(response.usage, response.model, phase, latency_ms=_elapsed_ms(started), **tags)
 
-    return ("Unable to generate a response.", FALLBACK_MODEL)
 
+def _record_cut_short(
+    stream, lane: hedging.Lane, phase: str, partial_text: str, max_tokens: int, route: model_router.Route,
+) -> None:
+    """A lane stream closed early: a lost hedge, or a client disconnect."""
+    tags = route.tags(lane.model)
+    if lane.lost:
+        hedging.record_loser(aborted_usage(stream, partial_text), lane.model, phase, **tags)
+    else:
+        record_aborted_stream(stream, lane.model, phase, partial_text, max_tokens, **tags)
 
-def _call_claude_stream(system: str, messages: list[dict], max_tokens: int = 4000):
-    """Stream Claude API response, yielding text deltas.
 
-    Yields tuples of (event_type, data):
-      ("text", delta_str)   — incremental text
-      ("done", model_used)  — stream finished
-      ("error", message)    — if an error occurs
-    """
-    client = _get_client()
-
-    for model in [CONSULT_MODEL, FALLBACK_MODEL]:
-        try:
-            with client.messages.stream(
-                model=model,
-                max_tokens=max_tokens,
-                system=system,
-                messages=messages,
-            ) as stream:
-                full_text = ""
-                for text in stream.text_stream:
-                    full_text += text
-                    yield ("text", text)
+def _response_item(response) -> tuple:
+    """("ok", text, model) | ("refused", None, model) for a complete response."""
+    if response.stop_reason == "refusal" or not response.content:
+        return ("refused", None, response.model)
+    for block in response.content:
+        if hasattr(block, "text"):
+            return ("ok", block.text, response.model)
+    return ("ok", "The model returned a response but no text content.", response.model)
 
-                # Get final message for logging
-                response = stream.get_final_message()
-                logger.info(
-                    f"[consultation_engine] stream model={response.model} "
-                    f"stop_reason={response.stop_reason} "
-                    f"input_tokens={response.usage.input_tokens} "
-                    f"output_tokens={response.usage.output_tokens}"
-                )
-                log_llm_usage_sync(response.usage, response.model, "gathering")
 
-                if response.stop_reason == "refusal":
-                    if model == FALLBACK_MODEL:
-                        yield ("error", "Unable to generate a response. Please try rephrasing.")
-                        return
-                    logger.warning(f"{model} refused. Retrying with {FALLBACK_MODEL}...")
-                    continue
+def _failed_call(item, model: str) -> tuple:
+    if item and item[0] == "error":
+        return (f"An error occurred generating the response: {item[1]}", model)
+    return ("Unable to generate a response. Please try rephrasing.", model)
 
-                yield ("done", response.model)
-                return
 
-        except Exception as e:
-            logger.error(f"[consultation_engine] stream API error with {model}: {e}")
-            if model == FALLBACK_MODEL:
-                yield ("error", f"An error occurred generating the response: {e}")
-                return
-            continue
+def _create_lane(
+    lane: hedging.Lane, system, messages: list[dict], max_tokens: int, phase: str, route: model_router.Route,
+):
+    started = time.perf_counter()
+    try:
+        response = llm_gateway.call(lane.model, lambda: _get_client().messages.create(
+            model=lane.model,
+            max_tokens=max_tokens,
+            system=system,
+            messages=messages,
+        ), llm_gateway.estimate_tokens(system, messages))
+    except Exception as e:
+        logger.error(f"[consultation_engine] API error with {lane.model}: {e}")
+        yield ("error", e, lane.model)
+        return
+    _log_response(response, phase, lane, route, started)
+    item = _response_item(response)
+    if item[0] == "refused" and lane.index == 0:
+        logger.warning(f"{lane.model} refused. Retrying with {route.fallback}...")
+    yield item
 
-    yield ("error", "Unable to generate a response.")
+
+def _call_claude(
+    system: str | list[dict], messages: list[dict], max_tokens: int = 4000, phase: str = "gathering",
+) -> tuple:
+    """Call Claude API with automatic fallback on refusal (hedged when enabled).
+
+    Returns (response_text, model_used).
+    """
+    route = _route(phase, messages)
+    lane, events, item = hedging.race(
+        _lanes(route.models()), lambda l: _create_lane(l, system, messages, max_tokens, phase, route),
+        lambda i: i[0] == "ok", "call",
+    )
+    if lane is None:
+        return _failed_call(item, route.fallback)
+    events.close()
+    return (item[1], item[2])
+
+
+def _stream_viable(item) -> bool:
+    return item[0] in ("text", "done")
 
 
 # ===========================================================================
@@ -461,28 +542,67 @@ def _run_retrieval(
     return rag_result
 
 
-def _build_rag_context(rag_result: dict) -> tuple[str, list[str]]:
+def _start_speculation(
+    conversation_history: list[dict],
+    user_message: str,
+    gathering_turn_count: int,
+    force_transition: bool,
+    retrieval_kwargs: dict | None,
+) -> SpeculativeRetrieval | None:
+    """Start background retrieval on the conversation so far, if a transition is plausible."""
+    if not should_speculate(gathering_turn_count, force_transition):
+        return None
+    kwargs = retrieval_kwargs or {}
+    try:
+        return SpeculativeRetrieval.start(
+            speculative_query(conversation_history, user_message),
+            lambda q: _run_retrieval(q, **kwargs),
+        )
+    except Exception as e:
+        logger.warning(f"[speculative] could not start: {e}")
+        return None
+
+
+def _followup_retrieval(session_id: str | None, user_message: str, retrieval_kwargs: dict | None) -> dict:
+    """Retrieval for an answering-phase follow-up, through the session's
+    working set (core/session_retrieval.py)."""
+    kwargs = retrieval_kwargs or {}
+    return session_retrieval.followup(session_id, user_message, lambda q: _run_retrieval(q, **kwargs))
+
+
+def _build_rag_context(rag_result: dict, token_budget: int | None = None) -> tuple[str, list[str]]:
     """Build context block and chunk ID list from RAG results.
 
+    With a `token_budget` (and CONTEXT_PACKING) the results are deduplicated
+    and MMR-selected to fit it first; chunk IDs cover only what was sent.
+
     Returns (context_block_str, chunk_ids_list).
     """
+    results = rag_result["results"]
+    if token_budget is not None and CONTEXT_PACKING and results:
+        results, duplicates = pack_results(results, token_budget)
+        logger.info(
+            f"[context] retrieved: {len(results)}/{len(rag_result['results'])} chunks "
+            f"({duplicates} duplicate), ~{sum(result_tokens(r) for r in results)}/{token_budget} tokens"
+        )
+
     context_parts = []
     chunk_ids = []
 
-    for i, result in enumerate(rag_result["results"], 1):
+    for i, result in enumerate(results, 1):
         source = result.get("source", "unknown")
-        score = result.get("rerank_score", 0.0)
+        score = result.get("rerank_score")
         text = result.get("parent_text", "")
-        chunk_id = result.get("id", f"chunk_{i}")
+        chunk_id = session_retrieval.chunk_id(result, i)
         context_parts.append(
-            f"--- Reference [{i}]: {source} (relevance: {score:.3f}) ---\n{text}"
+            f"--- Reference [{i}]: {source} (relevance: {format_relevance(score)}) ---\n{text}"
         )
         chunk_ids.append(chunk_id)
 
     if context_parts:
         # Deduplicated source summary
         from collections import Counter
-        source_counts = Counter(r.get("source", "unknown") for r in rag_result["results"])
+        source_counts = Counter(r.get("source", "unknown") for r in results)
         source_lines = [
             f"  {i}. {src} — {cnt} chunk{'s' if cnt > 1 else ''}"
             for i, (src, cnt) in enumerate(source_counts.items(), 1)
@@ -507,6 +627,75 @@ RETRIEVED CONTEXT (internal engineering reference notes):
     return context_block, chunk_ids
 
 
+# ===========================================================================
+# Context Packing
+# ===========================================================================
+# Every call is fitted to the vertical's token budget (core/context_packer.py).
+# The system prompt, selected reference data and the new user message are
+# fixed; history and retrieved context share the rest.
+
+# Room for the application profile and pre-computed values in the per-call context
+_PROFILE_RESERVE = 600
+
+
+def _pack_gathering_history(
+    system: list[dict], conversation_history: list[dict], user_message: str, context_budget: int,
+) -> list[dict]:
+    """History for a gathering call: everything the system prompt leaves over."""
+    remaining = context_budget - count_tokens(system_text(system)) - count_tokens(user_message)
+    return pack_history(conversation_history, None, max(remaining, 0)).messages
+
+
+def _pack_answering_inputs(
+    rag_result: dict,
+    conversation_history: list[dict],
+    parameters: dict | None,
+    user_message: str,
+    answering_prompt: str | None,
+    reference_index,
+    context_budget: int,
+    transition: bool = False,
+) -> tuple[list[dict], str, list[str]]:
+    """(history, rag_context, chunk_ids) for an answering call under the budget.
+
+    History may claim up to CONTEXT_HISTORY_SHARE of what the fixed parts
+    leave when the retrieved context needs the rest, more when it does not;
+    the retrieved context then gets whatever history did not use.
+    """
+    fixed = (
+        count_tokens(_get_answering_prompt(answering_prompt))
+        + count_tokens(user_message)
+        + _PROFILE_RESERVE
+        + (reference_index.token_budget if reference_index is not None else 0)
+    )
+    if transition:
+        fixed += count_tokens(INITIAL_RECOMMENDATION_FORMAT)
+    remaining = max(context_budget - fixed, 0)
+
+    rag_need = sum(result_tokens(r) for r in rag_result["results"])
+    history = pack_history(
+        conversation_history,
+        parameters,
+        remaining - min(rag_need, int(remaining * (1 - CONTEXT_HISTORY_SHARE))),
+    )
+    rag_context, chunk_ids = _build_rag_context(rag_result, remaining - history.tokens)
+    return history.messages, rag_context, chunk_ids
+
+
+def _packed_messages(
+    label: str,
+    system: list[dict],
+    history: list[dict],
+    user_message: str,
+    context_budget: int,
+    context: str | None = None,
+) -> list[dict]:
+    """_build_messages on the packed history, logging the packed call size."""
+    messages = _build_messages(history, user_message, context)
+    log_packed(label, system, messages, context_budget)
+    return messages
+
+
 # ===========================================================================
 # Main Consultation Response Generator
 # ===========================================================================
@@ -549,29 +738,35 @@ def generate_consultation_response(
     # Resolve prompts and retrieval config from vertical_config or module defaults
     vc = vertical_config
     gathering_prompt = vc.gathering_prompt if vc else GATHERING_SYSTEM_PROMPT
-    answering_prompt = vc.answering_prompt if vc else ANSWERING_SYSTEM_PROMPT_TEMPLATE
+    answering_prompt, reference_index = _answering_template(vc)
     vid = vc.vertical_id if vc else _current_vertical_id
     retrieval_kwargs = _retrieval_kwargs(vc) if vc else {}
 
     if phase == "gathering":
         return _handle_gathering_phase(
+            session_id=session_id,
             user_message=user_message,
             conversation_history=conversation_history,
             gathering_turn_count=gathering_turn_count,
             force_transition=force_transition,
             gathering_prompt=gathering_prompt,
             answering_prompt=answering_prompt,
+            reference_index=reference_index,
             vertical_id=vid,
             retrieval_kwargs=retrieval_kwargs,
+            context_budget=_context_budget(vc),
         )
     else:
         return _handle_answering_phase(
+            session_id=session_id,
             user_message=user_message,
             conversation_history=conversation_history,
             gathered_parameters=gathered_parameters,
             answering_prompt=answering_prompt,
+            reference_index=reference_index,
             vertical_id=vid,
             retrieval_kwargs=retrieval_kwargs,
+            context_budget=_context_budget(vc),
         )
 
 
@@ -581,175 +776,172 @@ CRITICAL OVERRIDE: The user has indicated they have no more information to provi
 
 
 def _handle_gathering_phase(
+    session_id: str | None,
     user_message: str,
     conversation_history: list[dict],
     gathering_turn_count: int,
     force_transition: bool = False,
     gathering_prompt: str | None = None,
     answering_prompt: str | None = None,
+    reference_index=None,
     vertical_id: str | None = None,
     retrieval_kwargs: dict | None = None,
+    context_budget: int = CONTEXT_TOKEN_BUDGET,
 ) -> dict:
     """Handle a turn during the gathering phase."""
 
     # Build system prompt, potentially with nudge or force transition
-    system = gathering_prompt or GATHERING_SYSTEM_PROMPT
-    if force_transition:
-        system += FORCE_TRANSITION_INSTRUCTION
-    elif gathering_turn_count >= MAX_GATHERING_TURNS:
-        system += GATHERING_NUDGE
+    system = _gathering_system(gathering_prompt, gathering_turn_count, force_transition)
 
     # Build messages array
-    messages = []
-    for msg in conversation_history:
-        messages.append({"role": msg["role"], "content": msg["content"]})
-    messages.append({"role": "user", "content": user_message})
+    history = _pack_gathering_history(system, conversation_history, user_message, context_budget)
+    messages = _packed_messages("gathering", system, history, user_message, context_budget)
 
-    # Call Claude (no RAG in gathering phase)
-    response_text, model_used = _call_claude(system=system, messages=messages)
-    logger.info(f"[gathering] Response from {model_used}")
+    # Retrieval on the conversation so far runs while Claude is generating
+    speculation = _start_speculation(
+        conversation_history, user_message, gathering_turn_count, force_transition, retrieval_kwargs
+    )
 
-    # Check for phase transition signal
-    signal = _parse_consultation_signal(response_text)
+    # Unless resolved below, the speculative run is discarded however the
+    # turn ends — no transition, an error, or the caller abandoning it
+    try:
+        # Call Claude (no RAG in gathering phase)
+        response_text, model_used = _call_claude(system=system, messages=messages)
+        logger.info(f"[gathering] Response from {model_used}")
+
+        # Check for phase transition signal
+        signal = _parse_consultation_signal(response_text)
+
+        if signal:
+            # Phase transition detected — strip signal and run Phase 2
+            visible_response = _strip_consultation_signal(response_text)
+            # Validate refined_query — fall back to conversation if empty
+            retrieval_query = signal["refined_query"]
+            if not retrieval_query or not retrieval_query.strip():
+                logger.warning(
+                    "[gathering→answering] Empty refined_query from signal. "
+                    "Falling back to concatenated user messages for retrieval."
+                )
+                user_messages = [
+                    msg["content"] for msg in conversation_history
+                    if msg["role"] == "user"
+                ]
+                user_messages.append(user_message)
+                retrieval_query = " ".join(user_messages)
+                signal["refined_query"] = retrieval_query
 
-    if signal:
-        # Phase transition detected — strip signal and run Phase 2
-        visible_response = _strip_consultation_signal(response_text)
-        # Validate refined_query — fall back to conversation if empty
-        retrieval_query = signal["refined_query"]
-        if not retrieval_query or not retrieval_query.strip():
-            logger.warning(
-                "[gathering→answering] Empty refined_query from signal. "
-                "Falling back to concatenated user messages for retrieval."
+            logger.info(
+                f"[gathering→answering] Domain: {signal['application_domain']}, "
+                f"Query length: {len(retrieval_query)}"
             )
-            user_messages = [
-                msg["content"] for msg in conversation_history
-                if msg["role"] == "user"
-            ]
-            user_messages.append(user_message)
-            retrieval_query = " ".join(user_messages)
-            signal["refined_query"] = retrieval_query
 
-        logger.info(
-            f"[gathering→answering] Domain: {signal['application_domain']}, "
-            f"Query length: {len(retrieval_query)}"
-        )
-
-        # Run RAG retrieval on the refined query
-        rag_result = _run_retrieval(retrieval_query, **(retrieval_kwargs or {}))
-        rag_context, chunk_ids = _build_rag_context(rag_result)
-
-        # Format the application profile from gathered parameters
-        params = signal.get("parameters", {})
-        if params:
-            profile_lines = [f"  {k}: {v}" for k, v in params.items()]
-            application_profile = "\n".join(profile_lines)
-        else:
-            application_profile = "(No structured parameters extracted)"
-
-        _vid = vertical_id or _current_vertical_id
-        application_profile = _enrich_profile_with_precompute(application_profile, params)
-
-        # Build the answering system prompt with context filled in
-        _ans_tmpl = answering_prompt or ANSWERING_SYSTEM_PROMPT_TEMPLATE
-        answering_prompt_built = _get_answering_prompt(
-            application_profile=application_profile,
-            rag_context=rag_context,
-            template=_ans_tmpl,
-        )
-        # Append the initial recommendation format instructions
-        answering_prompt_built += "\n\n" + INITIAL_RECOMMENDATION_FORMAT
-
-        # Build full conversation + user message for answering call
-        answering_messages = []
-        for msg in conversation_history:
-            answering_messages.append({"role": msg["role"], "content": msg["content"]})
-        answering_messages.append({"role": "user", "content": user_message})
-
-        # Call Claude again with full context for the grounded recommendation
-        answer_text, answer_model = _call_claude(
-            system=answering_prompt_built,
-            messages=answering_messages,
-            max_tokens=8000,
-        )
-        logger.info(f"[answering] Recommendation from {answer_model}")
-
-        # Strip any accidental signal from the answer
-        answer_text = _strip_consultation_signal(answer_text)
-
-        # Parse into summary + full report sections
-        summary_text, full_report_text = _parse_recommendation_sections(answer_text)
+            # Run RAG retrieval on the refined query (or reuse the speculative run)
+            if speculation:
+                rag_result = speculation.resolve(retrieval_query)
+            else:
+                rag_result = _run_retrieval(retrieval_query, **(retrieval_kwargs or {}))
+            # Follow-ups start from what this retrieval found
+            session_retrieval.seed(session_id, rag_result)
+            # Fit history and retrieved context to the budget
+            history, rag_context, chunk_ids = _pack_answering_inputs(
+                rag_result, conversation_history, signal["parameters"], user_message,
+                answering_prompt, reference_index, context_budget, transition=True,
+            )
 
-        # Prepend transition summary to saved content
-        saved_content = (visible_response + "\n\n" + summary_text) if visible_response.strip() else summary_text
+            # Build the answering system prompt and the per-call context
+            # (application profile, retrieved context, relevant reference data)
+            answering_prompt_built, answering_context = _build_transition_prompt(
+                signal, rag_context, answering_prompt, reference_index
+            )
 
-        confidence = rag_result["confidence"]["level"]
-        sources = rag_result["citations"]
+            # Build full conversation + context-bearing user message for answering call
+            answering_messages = _packed_messages(
+                "transition", answering_prompt_built, history, user_message, context_budget, answering_context
+            )
 
-        return {
-            "content": saved_content,
-            "full_report": full_report_text,
-            "phase": "answering",
-            "application_domain": signal["application_domain"],
-            "gathered_parameters": signal["parameters"],
-            "refined_query": signal["refined_query"],
-            "confidence": confidence,
-            "sources": sources,
-            "rag_chunks_used": chunk_ids,
-        }
-    else:
-        # No transition — still gathering
-        return {
-            "content": response_text,
-            "phase": "gathering",
-            "application_domain": None,
-            "gathered_parameters": None,
-            "refined_query": None,
-            "confidence": None,
-            "sources": [],
-            "rag_chunks_used": None,
-        }
+            # Call Claude again with full context for the grounded recommendation
+            answer_text, answer_model = _call_claude(
+                system=answering_prompt_built,
+                messages=answering_messages,
+                max_tokens=8000,
+                phase="answering",
+            )
+            logger.info(f"[answering] Recommendation from {answer_model}")
+
+            # Strip any accidental signal from the answer
+            answer_text = _strip_consultation_signal(answer_text)
+
+            # Parse into summary + full report sections
+            summary_text, full_report_text = _parse_recommendation_sections(answer_text)
+
+            # Prepend transition summary to saved content
+            saved_content = (visible_response + "\n\n" + summary_text) if visible_response.strip() else summary_text
+
+            confidence = rag_result["confidence"]["level"]
+            sources = rag_result["citations"]
+
+            return {
+                "content": saved_content,
+                "full_report": full_report_text,
+                "phase": "answering",
+                "application_domain": signal["application_domain"],
+                "gathered_parameters": signal["parameters"],
+                "refined_query": signal["refined_query"],
+                "confidence": confidence,
+                "sources": sources,
+                "rag_chunks_used": chunk_ids,
+            }
+        else:
+            # No transition — still gathering
+            return {
+                "content": response_text,
+                "phase": "gathering",
+                "application_domain": None,
+                "gathered_parameters": None,
+                "refined_query": None,
+                "confidence": None,
+                "sources": [],
+                "rag_chunks_used": None,
+            }
+    finally:
+        if speculation:
+            speculation.discard()
 
 
 def _handle_answering_phase(
+    session_id: str | None,
     user_message: str,
     conversation_history: list[dict],
     gathered_parameters: dict | None = None,
     answering_prompt: str | None = None,
+    reference_index=None,
     vertical_id: str | None = None,
     retrieval_kwargs: dict | None = None,
+    context_budget: int = CONTEXT_TOKEN_BUDGET,
 ) -> dict:
     """Handle a follow-up turn during the answering phase."""
 
-    # Run RAG on the latest user message for follow-up context
-    rag_result = _run_retrieval(user_message, **(retrieval_kwargs or {}))
-    rag_context, chunk_ids = _build_rag_context(rag_result)
-
-    # Format application profile
-    if gathered_parameters:
-        profile_lines = [f"  {k}: {v}" for k, v in gathered_parameters.items()]
-        application_profile = "\n".join(profile_lines)
-    else:
-        application_profile = "(See conversation history for application details)"
-    _vid = vertical_id or _current_vertical_id
-    application_profile = _enrich_profile_with_precompute(application_profile, gathered_parameters)
+    # RAG for the latest user message, on top of the session's working set
+    rag_result = _followup_retrieval(session_id, user_message, retrieval_kwargs)
+    history, rag_context, chunk_ids = _pack_answering_inputs(
+        rag_result, conversation_history, gathered_parameters, user_message,
+        answering_prompt, reference_index, context_budget,
+    )
 
-    answering_prompt_built = _get_answering_prompt(
-        application_profile=application_profile,
-        rag_context=rag_context,
-        template=answering_prompt,
+    answering_prompt_built, answering_context = _build_followup_prompt(
+        gathered_parameters, rag_context, answering_prompt, reference_index, user_message
     )
 
-    # Build messages with full history
-    messages = []
-    for msg in conversation_history:
-        messages.append({"role": msg["role"], "content": msg["content"]})
-    messages.append({"role": "user", "content": user_message})
+    # Build messages with the packed history
+    messages = _packed_messages(
+        "follow-up", answering_prompt_built, history, user_message, context_budget, answering_context
+    )
 
     response_text, model_used = _call_claude(
         system=answering_prompt_built,
         messages=messages,
         max_tokens=6000,
+        phase="answering",
     )
     logger.info(f"[answering follow-up] Response from {model_used}")
 
@@ -776,6 +968,337 @@ def _handle_answering_phase(
 # Streaming Variants
 # ===========================================================================
 
+def _build_messages(
+    conversation_history: list[dict],
+    user_message: str,
+    context: str | None = None,
+) -> list[dict]:
+    """Conversation history + the new user message in Messages API shape.
+
+    The history prefix is marked for prompt caching; `context` rides in the
+    new user turn, after the cached prefix.
+    """
+    return cached_messages(conversation_history, user_message, context)
+
+
+def _gathering_system(
+    gathering_prompt: str | None,
+    gathering_turn_count: int,
+    force_transition: bool,
+) -> list[dict]:
+    addendum = ""
+    if force_transition:
+        addendum = FORCE_TRANSITION_INSTRUCTION
+    elif gathering_turn_count >= MAX_GATHERING_TURNS:
+        addendum = GATHERING_NUDGE
+    return cached_system(gathering_prompt or GATHERING_SYSTEM_PROMPT, addendum)
+
+
+def _resolve_retrieval_query(signal: dict, conversation_history: list[dict], user_message: str) -> str:
+    """Refined query from the signal, falling back to the user's own messages."""
+    retrieval_query = signal["refined_query"]
+    if not retrieval_query or not retrieval_query.strip():
+        logger.warning("[gathering→answering-stream] Empty refined_query. Falling back.")
+        user_messages = [
+            msg["content"] for msg in conversation_history if msg["role"] == "user"
+        ]
+        user_messages.append(user_message)
+        retrieval_query = " ".join(user_messages)
+        signal["refined_query"] = retrieval_query
+    return retrieval_query
+
+
+def _build_transition_prompt(
+    signal: dict, rag_context: str, answering_prompt: str | None, reference_index=None,
+) -> tuple[list[dict], str]:
+    """(system, context) for the first (transition) recommendation."""
+    params = signal.get("parameters", {})
+    if params:
+        profile_lines = [f"  {k}: {v}" for k, v in params.items()]
+        application_profile = "\n".join(profile_lines)
+    else:
+        application_profile = "(No structured parameters extracted)"
+    application_profile = _enrich_profile_with_precompute(application_profile, params)
+
+    _ans_tmpl = answering_prompt or ANSWERING_SYSTEM_PROMPT_TEMPLATE
+    # The initial recommendation format instructions follow the cached part
+    system = cached_system(_get_answering_prompt(_ans_tmpl), INITIAL_RECOMMENDATION_FORMAT)
+    reference = _select_reference(reference_index, signal.get("refined_query") or "", params)
+    return system, _answering_context(application_profile, rag_context, reference)
+
+
+def _build_followup_prompt(
+    gathered_parameters: dict | None,
+    rag_context: str,
+    answering_prompt: str | None,
+    reference_index=None,
+    user_message: str = "",
+) -> tuple[list[dict], str]:
+    """(system, context) for a follow-up turn."""
+    if gathered_parameters:
+        profile_lines = [f"  {k}: {v}" for k, v in gathered_parameters.items()]
+        application_profile = "\n".join(profile_lines)
+    else:
+        application_profile = "(See conversation history for application details)"
+    application_profile = _enrich_profile_with_precompute(application_profile, gathered_parameters)
+
+    system = cached_system(_get_answering_prompt(answering_prompt))
+    reference = _select_reference(reference_index, user_message, gathered_parameters)
+    return system, _answering_context(application_profile, rag_context, reference)
+
+
+_GATHERING_ONLY_RESULT = {
+    "phase": "gathering",
+    "application_domain": None,
+    "gathered_parameters": None,
+    "refined_query": None,
+    "confidence": None,
+    "sources": [],
+    "rag_chunks_used": None,
+}
+
+
+def _transition_result(signal: dict, visible_response: str, streamed_text: str, rag_result: dict, chunk_ids: list[str]) -> dict:
+    """Final ("done") payload after a streamed transition recommendation."""
+    answer_text = _strip_consultation_signal(streamed_text)
+    summary_text, full_report_text = _parse_recommendation_sections(answer_text)
+
+    # Prepend transition summary to the saved content (matches what was streamed)
+    saved_content = (visible_response + "\n\n" + summary_text) if visible_response.strip() else summary_text
+
+    return {
+        "content": saved_content,
+        "full_report": full_report_text,
+        "phase": "answering",
+        "application_domain": signal["application_domain"],
+        "gathered_parameters": signal["parameters"],
+        "refined_query": signal["refined_query"],
+        "confidence": rag_result["confidence"]["level"],
+        "sources": rag_result["citations"],
+        "rag_chunks_used": chunk_ids,
+    }
+
+
+def _followup_result(streamed_text: str, rag_result: dict, chunk_ids: list[str]) -> dict:
+    return {
+        "content": _strip_consultation_signal(streamed_text),
+        "full_report": None,
+        "phase": "answering",
+        "application_domain": None,
+        "gathered_parameters": None,
+        "refined_query": None,
+        "confidence": rag_result["confidence"]["level"],
+        "sources": rag_result["citations"],
+        "rag_chunks_used": chunk_ids,
+    }
+
+
+class _TagScanner:
+    """Finds the first occurrence of a fixed tag across streamed deltas.
+
+    Keeps only the last len(tag) - 1 characters between feeds, so each
+    feed() is O(len(delta)) however long the stream gets.
+    """
+
+    def __init__(self, tag: str):
+        self.tag = tag
+        self.found_at = -1  # absolute offset of the first occurrence, once seen
+        self._tail = ""
+        self._offset = 0    # absolute offset of _tail[0]
+
+    def feed(self, data: str) -> bool:
+        if self.found_at >= 0:
+            return True
+        window = self._tail + data
+        i = window.find(self.tag)
+        if i >= 0:
+            self.found_at = self._offset + i
+            return True
+        keep = len(self.tag) - 1
+        tail = window[-keep:] if len(window) > keep else window
+        self._offset += len(window) - len(tail)
+        self._tail = tail
+        return False
+
+
+class _SectionStreamer:
+    """Splits a streamed recommendation into chat_summary / full_report events.
+
+    Section-aware streaming:
+      1. Buffer tokens until </chat_summary> is found
+      2. Emit summary content (tags stripped) as text chunks
+      3. Emit ("section", "full_report") marker
+      4. Stream full_report content live (stripping tags on the fly)
+      5. Fallback: if 500+ chars without <chat_summary>, switch to passthrough
+
+    feed() takes one text delta and returns the (event_type, data) tuples to
+    emit for it. Tag boundaries are found with _TagScanner, so each delta
+    costs O(len(delta)); the buffered section is joined and parsed once, when
+    its closing tag arrives. `text` is the raw stream, for the final parse.
+    """
+
+    BUFFER_FALLBACK_LIMIT = 500
+
+    def __init__(self):
+        self._chunks: list[str] = []
+        self._parts: list[str] = []  # pending buffer (buffering / summary_done)
+        self._buffer_len = 0
+        self._open = _TagScanner("<chat_summary>")
+        self._close = _TagScanner("</chat_summary>")
+        self._report: _TagScanner | None = None
+        self.mode = "buffering"  # buffering | summary_done | full_report | passthrough
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, data: str) -> list[tuple[str, str]]:
+        self._chunks.append(data)
+        events = []
+
+        if self.mode == "buffering":
+            self._parts.append(data)
+            self._buffer_len += len(data)
+            self._open.feed(data)
+            # Check if we've found the end of chat_summary
+            if self._close.feed(data):
+                buffer = "".join(self._parts)
+                self._parts = []
+                # Extract summary content, emit it
+                summary_match = re.search(
+                    r"<chat_summary>(.*?)</chat_summary>", buffer, re.DOTALL
+                )
+                if summary_match:
+                    summary_text = summary_match.group(1).strip()
+                    events.append(("text", summary_text))
+                    # Check if full_report tag has started in the buffer
+                    after_summary = buffer[buffer.index("</chat_summary>") + len("</chat_summary>"):]
+                    if "<full_report>" in after_summary:
+                        events.append(("section", "full_report"))
+                        # Emit any content after <full_report> tag
+                        report_start = after_summary.index("<full_report>") + len("<full_report>")
+                        leftover = after_summary[report_start:]
+                        if leftover.strip():
+                            events.append(("text", leftover))
+                        self.mode = "full_report"
+                    else:
+                        # Keep just the part after </chat_summary>
+                        self._parts = [after_summary]
+                        self._report = _TagScanner("<full_report>")
+                        self._report.feed(after_summary)
+                        self.mode = "summary_done"
+                else:
+                    # Malformed — fall back to passthrough
+                    cleaned = re.sub(r"</?(?:chat_summary|full_report)>", "", buffer)
+                    events.append(("text", cleaned))
+                    self.mode = "passthrough"
+            elif self._buffer_len > self.BUFFER_FALLBACK_LIMIT and self._open.found_at < 0:
+                # No XML tags — fallback to passthrough
+                events.append(("text", "".join(self._parts)))
+                self._parts = []
+                self.mode = "passthrough"
+
+        elif self.mode == "summary_done":
+            self._parts.append(data)  # Keep buffering until <full_report> tag
+            if self._report.feed(data):
+                buffer = "".join(self._parts)
+                self._parts = []
+                events.append(("section", "full_report"))
+                report_start_idx = buffer.index("<full_report>") + len("<full_report>")
+                leftover = buffer[report_start_idx:]
+                if leftover.strip():
+                    events.append(("text", leftover))
+                self.mode = "full_report"
+
+        elif self.mode == "full_report":
+            # Stream full_report content live, stripping closing tag if present
+            chunk = data.replace("</full_report>", "")
+            if chunk:
+                events.append(("text", chunk))
+
+        elif self.mode == "passthrough":
+            # Fallback — stream everything as-is, stripping any XML tags
+            chunk = re.sub(r"</?(?:chat_summary|full_report)>", "", data)
+            if chunk:
+                events.append(("text", chunk))
+
+        return events
+
+
+class _SignalGate:
+    """Forwards a streamed gathering response while watching for its signal.
+
+    Text is emitted as it arrives except for a bounded tail that could be the
+    start of `<consultation_signal>` (at most len(tag) - 1 chars, plus up to
+    WHITESPACE_HOLD_LIMIT chars of trailing whitespace, which the signal
+    stripper would remove). Once the tag appears nothing more is forwarded.
+    After the stream ends the caller either flush()es the held text (no
+    valid signal — the user sees the raw response, as before) or finish()es
+    with the stripped visible response.
+    """
+
+    TAG = "<consultation_signal>"
+    WHITESPACE_HOLD_LIMIT = 200
+
+    def __init__(self):
+        self._chunks: list[str] = []
+        self._pending = ""       # received, not yet emitted (pre-signal)
+        self._emitted: list[str] = []
+        self._emitted_len = 0    # stream offset where _pending starts
+        self._scanner = _TagScanner(self.TAG)
+        self.signal_started = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def _emit(self, text: str) -> list[tuple[str, str]]:
+        if not text:
+            return []
+        self._emitted.append(text)
+        self._emitted_len += len(text)
+        return [("text", text)]
+
+    def _safe_cut(self, pending: str) -> int:
+        """Length of the prefix of `pending` that cannot belong to the signal."""
+        cut = len(pending)
+        # The tag has a single '<', so only the last one can start a partial tag
+        i = pending.rfind("<", max(0, len(pending) - len(self.TAG) + 1))
+        if i >= 0 and self.TAG.startswith(pending[i:]):
+            cut = i
+        kept = len(pending[:cut].rstrip())
+        if cut - kept <= self.WHITESPACE_HOLD_LIMIT:
+            cut = kept
+        return cut
+
+    def feed(self, data: str) -> list[tuple[str, str]]:
+        self._chunks.append(data)
+        if self.signal_started:
+            return []
+        pending = self._pending + data
+        if self._scanner.feed(data):
+            self.signal_started = True
+            self._pending = ""
+            return self._emit(pending[:self._scanner.found_at - self._emitted_len].rstrip())
+        cut = self._safe_cut(pending)
+        self._pending = pending[cut:]
+        return self._emit(pending[:cut])
+
+    def flush(self) -> list[tuple[str, str]]:
+        """No valid signal: emit everything held back, verbatim."""
+        return self._emit(self.text[self._emitted_len:])
+
+    def finish(self, visible_response: str) -> list[tuple[str, str]]:
+        """Valid signal: complete the streamed text to `visible_response + "\\n\\n"`."""
+        if not visible_response.strip():
+            return []
+        target = visible_response + "\n\n"
+        emitted = "".join(self._emitted)
+        if target.startswith(emitted):
+            return self._emit(target[len(emitted):])
+        return self._emit("\n\n")
+
+
 def generate_consultation_response_stream(
     session_id: str,
     user_message: str,
@@ -794,303 +1317,432 @@ def generate_consultation_response_stream(
       ("text", str)             — incremental text deltas
       ("done", dict)            — final result dict (content, phase, rag_chunks_used, etc.)
       ("error", str)            — error message
+
+    A blocking iterator over generate_consultation_response_stream_async (the
+    pipeline exists once), run on a private event loop thread — for scripts
+    and tests. Closing it mid-stream closes the async generator, which closes
+    the upstream stream and records the call as aborted. The SSE route uses
+    the async generator directly.
+    """
+    loop = _sync_stream_loop()
+    events = generate_consultation_response_stream_async(
+        session_id=session_id,
+        user_message=user_message,
+        phase=phase,
+        conversation_history=conversation_history,
+        gathered_parameters=gathered_parameters,
+        gathering_turn_count=gathering_turn_count,
+        force_transition=force_transition,
+        vertical_config=vertical_config,
+    )
+
+    async def _next():
+        return await anext(events, None)
+
+    async def _close():
+        await events.aclose()
+
+    try:
+        while True:
+            event = asyncio.run_coroutine_threadsafe(_next(), loop).result()
+            if event is None:
+                return
+            yield event
+    finally:
+        asyncio.run_coroutine_threadsafe(_close(), loop).result()
+
+
+_sync_loop: asyncio.AbstractEventLoop | None = None
+_sync_loop_lock = threading.Lock()
+
+
+def _sync_stream_loop() -> asyncio.AbstractEventLoop:
+    """Event loop, in its own daemon thread, behind the blocking
+    generate_consultation_response_stream."""
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="consultation-stream-loop", daemon=True).start()
+            _sync_loop = loop
+    return _sync_loop
+
+
+# ===========================================================================
+# Async Streaming (non-blocking — for SSE routes)
+# ===========================================================================
+# The streaming pipeline. The Anthropic calls go through AsyncAnthropic and
+# retrieval / usage logging (sync, CPU- and SQLite-bound) run in the default
+# executor, so one worker can hold many concurrent streams instead of one.
+# generate_consultation_response_stream is a blocking iterator over it.
+
+async def _create_lane_async(
+    lane: hedging.Lane, system, messages: list[dict], max_tokens: int, phase: str, route: model_router.Route,
+):
+    started = time.perf_counter()
+    try:
+        response = await llm_gateway.acall(lane.model, lambda: _get_async_client().messages.create(
+            model=lane.model,
+            max_tokens=max_tokens,
+            system=system,
+            messages=messages,
+        ), llm_gateway.estimate_tokens(system, messages))
+    except Exception as e:
+        logger.error(f"[consultation_engine] API error with {lane.model}: {e}")
+        yield ("error", e, lane.model)
+        return
+    await asyncio.to_thread(_log_response, response, phase, lane, route, started)
+    item = _response_item(response)
+    if item[0] == "refused" and lane.index == 0:
+        logger.warning(f"{lane.model} refused. Retrying with {route.fallback}...")
+    yield item
+
+
+async def _call_claude_async(
+    system: str | list[dict], messages: list[dict], max_tokens: int = 4000, phase: str = "gathering",
+) -> tuple:
+    """Async _call_claude: (response_text, model_used), with refusal fallback."""
+    route = _route(phase, messages)
+    lane, events, item = await hedging.race_async(
+        _lanes(route.models()), lambda l: _create_lane_async(l, system, messages, max_tokens, phase, route),
+        lambda i: i[0] == "ok", "call",
+    )
+    if lane is None:
+        return _failed_call(item, route.fallback)
+    await events.aclose()
+    return (item[1], item[2])
+
+
+async def _abort_stream_async(
+    stream, lane: hedging.Lane, phase: str, partial_text: str, max_tokens: int, route: model_router.Route,
+) -> None:
+    """Close an upstream stream nobody reads any more — a lost hedge, or a
+    client disconnect — and record it.
+
+    Runs shielded: the disconnect cancels the response task, and every
+    unshielded await in cleanup would be cancelled again before the HTTP
+    stream to Anthropic is closed.
+    """
+    with shielded():
+        close = getattr(stream, "close", None)
+        if close is not None:
+            try:
+                await close()
+            except Exception as e:
+                logger.warning(f"[consultation_engine] error closing aborted stream: {e}")
+        await asyncio.to_thread(_record_cut_short, stream, lane, phase, partial_text, max_tokens, route)
+
+
+async def _stream_lane_async(
+    lane: hedging.Lane, system, messages: list[dict], max_tokens: int, phase: str, route: model_router.Route,
+):
+    """One model's stream: ("text", delta)... then ("done" | "refused", model),
+    or ("error", message) if the call fails."""
+    started = time.perf_counter()
+    first_token_ms = None
+    try:
+        async with llm_gateway.astream(lane.model, lambda: _get_async_client().messages.stream(
+            model=lane.model,
+            max_tokens=max_tokens,
+            system=system,
+            messages=messages,
+        ), llm_gateway.estimate_tokens(system, messages)) as stream:
+            streamed: list[str] = []
+            try:
+                async for text in stream.text_stream:
+                    if first_token_ms is None:
+                        first_token_ms = _elapsed_ms(started)
+                    streamed.append(text)
+                    yield ("text", text)
+            except (asyncio.CancelledError, GeneratorExit):
+                await _abort_stream_async(stream, lane, phase, "".join(streamed), max_tokens, route)
+                raise
+
+            response = await stream.get_final_message()
+            logger.info(
+                f"[consultation_engine] stream model={response.model} "
+                f"stop_reason={response.stop_reason} "
+                f"input_tokens={response.usage.input_tokens} "
+                f"output_tokens={response.usage.output_tokens} "
+                f"cache_write_read={cache_usage(response.usage)}"
+            )
+            await asyncio.to_thread(
+                log_llm_usage_sync, response.usage, response.model, phase,
+                latency_ms=_elapsed_ms(started), first_token_ms=first_token_ms, **route.tags(lane.model),
+            )
+            yield ("refused" if response.stop_reason == "refusal" else "done", response.model)
+
+    except Exception as e:
+        logger.error(f"[consultation_engine] stream API error with {lane.model}: {e}")
+        yield ("error", f"An error occurred generating the response: {e}")
+
+
+async def _call_claude_stream_async(
+    system: str | list[dict],
+    messages: list[dict],
+    max_tokens: int = 4000,
+    phase: str = "gathering",
+):
+    """Stream Claude API response, yielding text deltas, with refusal fallback
+    (hedged when enabled).
+
+    Yields tuples of (event_type, data):
+      ("text", delta_str)   — incremental text
+      ("done", model_used)  — stream finished
+      ("error", message)    — if an error occurs
+
+    Cancellation or aclose() mid-stream (client disconnect) closes the
+    upstream stream and records the call as aborted.
+    """
+    route = _route(phase, messages)
+    models = route.models()
+    while models:
+        lane, events, first = await hedging.race_async(
+            _lanes(models), lambda l: _stream_lane_async(l, system, messages, max_tokens, phase, route),
+            _stream_viable, "stream",
+        )
+        if lane is None:
+            if first and first[0] == "error":
+                yield first
+            else:
+                yield ("error", "Unable to generate a response. Please try rephrasing.")
+            return
+        models = models[lane.index + 1:]
+
+        async with aclosing(events):
+            event = first
+            while event[0] == "text":
+                yield event
+                event = await anext(events, ("error", "stream ended unexpectedly"))
+
+        if event[0] == "done":
+            yield event
+            return
+        if not models:
+            yield event if event[0] == "error" else ("error", "Unable to generate a response. Please try rephrasing.")
+            return
+        if event[0] == "refused":
+            logger.warning(f"{lane.model} refused. Retrying with {models[0]}...")
+
+    yield ("error", "Unable to generate a response.")
+
+
+async def _run_retrieval_async(query: str, **retrieval_kwargs) -> dict:
+    """Hybrid retrieval off the event loop."""
+    return await asyncio.to_thread(_run_retrieval, query, **retrieval_kwargs)
+
+
+async def generate_consultation_response_stream_async(
+    session_id: str,
+    user_message: str,
+    phase: str,
+    conversation_history: list[dict],
+    gathered_parameters: dict | None = None,
+    gathering_turn_count: int = 0,
+    force_transition: bool = False,
+    vertical_config=None,
+):
+    """Streaming consultation turn as an async generator — the (event_type,
+    data) tuples documented on generate_consultation_response_stream —
+    without blocking the event loop.
     """
     vc = vertical_config
     gathering_prompt = vc.gathering_prompt if vc else GATHERING_SYSTEM_PROMPT
-    answering_prompt = vc.answering_prompt if vc else ANSWERING_SYSTEM_PROMPT_TEMPLATE
-    vid = vc.vertical_id if vc else _current_vertical_id
+    answering_prompt, reference_index = _answering_template(vc)
     retrieval_kwargs = _retrieval_kwargs(vc) if vc else {}
 
     if phase == "gathering":
-        yield from _handle_gathering_phase_stream(
+        events = _handle_gathering_phase_stream_async(
+            session_id=session_id,
             user_message=user_message,
             conversation_history=conversation_history,
             gathering_turn_count=gathering_turn_count,
             force_transition=force_transition,
             gathering_prompt=gathering_prompt,
             answering_prompt=answering_prompt,
-            vertical_id=vid,
+            reference_index=reference_index,
             retrieval_kwargs=retrieval_kwargs,
+            context_budget=_context_budget(vc),
         )
     else:
-        yield from _handle_answering_phase_stream(
+        events = _handle_answering_phase_stream_async(
+            session_id=session_id,
             user_message=user_message,
             conversation_history=conversation_history,
             gathered_parameters=gathered_parameters,
             answering_prompt=answering_prompt,
-            vertical_id=vid,
+            reference_index=reference_index,
             retrieval_kwargs=retrieval_kwargs,
+            context_budget=_context_budget(vc),
         )
+    async with aclosing(events):
+        async for event in events:
+            yield event
 
 
-def _handle_gathering_phase_stream(
+async def _handle_gathering_phase_stream_async(
+    session_id: str | None,
     user_message: str,
     conversation_history: list[dict],
     gathering_turn_count: int,
     force_transition: bool = False,
     gathering_prompt: str | None = None,
     answering_prompt: str | None = None,
-    vertical_id: str | None = None,
+    reference_index=None,
     retrieval_kwargs: dict | None = None,
+    context_budget: int = CONTEXT_TOKEN_BUDGET,
 ):
     """Streaming gathering phase. If no transition, stream the response.
     If transition detected, do RAG then stream the answering call.
-    """
-    system = gathering_prompt or GATHERING_SYSTEM_PROMPT
-    if force_transition:
-        system += FORCE_TRANSITION_INSTRUCTION
-    elif gathering_turn_count >= MAX_GATHERING_TURNS:
-        system += GATHERING_NUDGE
-
-    messages = []
-    for msg in conversation_history:
-        messages.append({"role": msg["role"], "content": msg["content"]})
-    messages.append({"role": "user", "content": user_message})
-
-    # First Claude call (gathering) — we need the full text to check for signal,
-    # so we can't stream this one to the user. Use non-streaming call.
-    response_text, model_used = _call_claude(system=system, messages=messages)
-    logger.info(f"[gathering-stream] Response from {model_used}")
-
-    signal = _parse_consultation_signal(response_text)
-
-    if not signal:
-        # No transition — just yield the gathering response as text
-        visible_text = response_text
-        yield ("metadata", {"phase": "gathering"})
-        yield ("text", visible_text)
-        yield ("done", {
-            "content": visible_text,
-            "phase": "gathering",
-            "application_domain": None,
-            "gathered_parameters": None,
-            "refined_query": None,
-            "confidence": None,
-            "sources": [],
-            "rag_chunks_used": None,
-        })
-        return
-
-    # Phase transition detected — strip signal and do RAG + streaming answer
-    visible_response = _strip_consultation_signal(response_text)
-    retrieval_query = signal["refined_query"]
-    if not retrieval_query or not retrieval_query.strip():
-        logger.warning("[gathering→answering-stream] Empty refined_query. Falling back.")
-        user_messages = [
-            msg["content"] for msg in conversation_history if msg["role"] == "user"
-        ]
-        user_messages.append(user_message)
-        retrieval_query = " ".join(user_messages)
-        signal["refined_query"] = retrieval_query
 
-    logger.info(f"[gathering→answering-stream] Domain: {signal['application_domain']}")
-
-    # Send the gathering response text first (the transition summary)
-    if visible_response.strip():
-        yield ("text", visible_response + "\n\n")
-
-    # Now do RAG retrieval
-    yield ("status", "Searching knowledge base...")
-    rag_result = _run_retrieval(retrieval_query, **(retrieval_kwargs or {}))
-    rag_context, chunk_ids = _build_rag_context(rag_result)
-
-    # Build answering prompt
-    params = signal.get("parameters", {})
-    if params:
-        profile_lines = [f"  {k}: {v}" for k, v in params.items()]
-        application_profile = "\n".join(profile_lines)
-    else:
-        application_profile = "(No structured parameters extracted)"
-    application_profile = _enrich_profile_with_precompute(application_profile, params)
+    With STREAM_GATHERING the gathering turn itself is streamed through a
+    _SignalGate; otherwise it is fetched whole and emitted in one chunk.
+    """
+    system = _gathering_system(gathering_prompt, gathering_turn_count, force_transition)
+    history = _pack_gathering_history(system, conversation_history, user_message, context_budget)
+    messages = _packed_messages("gathering", system, history, user_message, context_budget)
 
-    _ans_tmpl = answering_prompt or ANSWERING_SYSTEM_PROMPT_TEMPLATE
-    answering_prompt_built = _get_answering_prompt(
-        application_profile=application_profile,
-        rag_context=rag_context,
-        template=_ans_tmpl,
+    speculation = _start_speculation(
+        conversation_history, user_message, gathering_turn_count, force_transition, retrieval_kwargs
     )
-    # Append the initial recommendation format instructions
-    answering_prompt_built += "\n\n" + INITIAL_RECOMMENDATION_FORMAT
-
-    answering_messages = []
-    for msg in conversation_history:
-        answering_messages.append({"role": msg["role"], "content": msg["content"]})
-    answering_messages.append({"role": "user", "content": user_message})
-
-    yield ("status", "Generating recommendation...")
-    yield ("metadata", {
-        "phase": "answering",
-        "application_domain": signal["application_domain"],
-        "gathered_parameters": signal["parameters"],
-        "refined_query": signal["refined_query"],
-    })
-
-    # Section-aware streaming:
-    # 1. Buffer tokens until </chat_summary> is found
-    # 2. Emit summary content (tags stripped) as text chunks
-    # 3. Emit ("section", "full_report") marker
-    # 4. Stream full_report content live (stripping tags on the fly)
-    # 5. Fallback: if 500+ chars without <chat_summary>, switch to passthrough
-    streamed_text = ""
-    buffer = ""
-    section_mode = "buffering"  # buffering | summary_done | full_report | passthrough
-    BUFFER_FALLBACK_LIMIT = 500
 
-    for event_type, data in _call_claude_stream(
-        system=answering_prompt_built,
-        messages=answering_messages,
-        max_tokens=8000,
-    ):
-        if event_type == "text":
-            streamed_text += data
-
-            if section_mode == "buffering":
-                buffer += data
-                # Check if we've found the end of chat_summary
-                if "</chat_summary>" in buffer:
-                    # Extract summary content, emit it
-                    summary_match = re.search(
-                        r"<chat_summary>(.*?)</chat_summary>", buffer, re.DOTALL
-                    )
-                    if summary_match:
-                        summary_text = summary_match.group(1).strip()
-                        yield ("text", summary_text)
-                        # Check if full_report tag has started in the buffer
-                        after_summary = buffer[buffer.index("</chat_summary>") + len("</chat_summary>"):]
-                        if "<full_report>" in after_summary:
-                            yield ("section", "full_report")
-                            # Emit any content after <full_report> tag
-                            report_start = after_summary.index("<full_report>") + len("<full_report>")
-                            leftover = after_summary[report_start:]
-                            if leftover.strip():
-                                yield ("text", leftover)
-                            section_mode = "full_report"
-                        else:
-                            # Reset buffer to just the part after </chat_summary>
-                            buffer = after_summary
-                            section_mode = "summary_done"
-                    else:
-                        # Malformed — fall back to passthrough
-                        cleaned = re.sub(r"</?(?:chat_summary|full_report)>", "", buffer)
-                        yield ("text", cleaned)
-                        section_mode = "passthrough"
-                elif len(buffer) > BUFFER_FALLBACK_LIMIT and "<chat_summary>" not in buffer:
-                    # No XML tags — fallback to passthrough
-                    yield ("text", buffer)
-                    section_mode = "passthrough"
-
-            elif section_mode == "summary_done":
-                buffer += data  # Keep buffering until <full_report> tag
-                if "<full_report>" in buffer:
-                    yield ("section", "full_report")
-                    report_start_idx = buffer.index("<full_report>") + len("<full_report>")
-                    leftover = buffer[report_start_idx:]
-                    if leftover.strip():
-                        yield ("text", leftover)
-                    section_mode = "full_report"
-                    buffer = ""
-
-            elif section_mode == "full_report":
-                # Stream full_report content live, stripping closing tag if present
-                chunk = data.replace("</full_report>", "")
-                if chunk:
-                    yield ("text", chunk)
-
-            elif section_mode == "passthrough":
-                # Fallback — stream everything as-is, stripping any XML tags
-                chunk = re.sub(r"</?(?:chat_summary|full_report)>", "", data)
-                if chunk:
-                    yield ("text", chunk)
-
-        elif event_type == "error":
-            yield ("error", data)
+    # Unless resolved below, the speculative run is discarded however the
+    # turn ends — including aclose() or cancellation on client disconnect
+    try:
+        gate = None
+        if STREAM_GATHERING:
+            gate = _SignalGate()
+            yield ("metadata", {"phase": "gathering"})
+            async with aclosing(_call_claude_stream_async(system=system, messages=messages)) as stream:
+                async for event_type, data in stream:
+                    if event_type == "text":
+                        for event in gate.feed(data):
+                            yield event
+                    elif event_type == "done":
+                        logger.info(f"[gathering-stream] Response from {data}")
+                    elif event_type == "error":
+                        yield ("error", data)
+                        return
+            response_text = gate.text
+        else:
+            response_text, model_used = await _call_claude_async(system=system, messages=messages)
+            logger.info(f"[gathering-stream] Response from {model_used}")
+
+        signal = _parse_consultation_signal(response_text)
+
+        if not signal:
+            if gate:
+                for event in gate.flush():
+                    yield event
+            else:
+                yield ("metadata", {"phase": "gathering"})
+                yield ("text", response_text)
+            yield ("done", {"content": response_text, **_GATHERING_ONLY_RESULT})
             return
 
-    # Parse the complete response for the final result
-    answer_text = _strip_consultation_signal(streamed_text)
-    summary_text, full_report_text = _parse_recommendation_sections(answer_text)
-
-    confidence = rag_result["confidence"]["level"]
-    sources = rag_result["citations"]
+        visible_response = _strip_consultation_signal(response_text)
+        retrieval_query = _resolve_retrieval_query(signal, conversation_history, user_message)
+        logger.info(f"[gathering→answering-stream] Domain: {signal['application_domain']}")
+
+        if gate:
+            for event in gate.finish(visible_response):
+                yield event
+        elif visible_response.strip():
+            yield ("text", visible_response + "\n\n")
+
+        yield ("status", "Searching knowledge base...")
+        if speculation:
+            rag_result = await speculation.resolve_async(retrieval_query)
+        else:
+            rag_result = await _run_retrieval_async(retrieval_query, **(retrieval_kwargs or {}))
+        session_retrieval.seed(session_id, rag_result)
 
-    # Prepend transition summary to the saved content (matches what was streamed)
-    saved_content = (visible_response + "\n\n" + summary_text) if visible_response.strip() else summary_text
+        def _prepare():
+            history, rag_context, chunk_ids = _pack_answering_inputs(
+                rag_result, conversation_history, signal["parameters"], user_message,
+                answering_prompt, reference_index, context_budget, transition=True,
+            )
+            system, context = _build_transition_prompt(signal, rag_context, answering_prompt, reference_index)
+            messages = _packed_messages("transition", system, history, user_message, context_budget, context)
+            return system, messages, chunk_ids
 
-    yield ("done", {
-        "content": saved_content,
-        "full_report": full_report_text,
-        "phase": "answering",
-        "application_domain": signal["application_domain"],
-        "gathered_parameters": signal["parameters"],
-        "refined_query": signal["refined_query"],
-        "confidence": confidence,
-        "sources": sources,
-        "rag_chunks_used": chunk_ids,
-    })
+        answering_prompt_built, answering_messages, chunk_ids = await asyncio.to_thread(_prepare)
 
+        yield ("status", "Generating recommendation...")
+        yield ("metadata", {
+            "phase": "answering",
+            "application_domain": signal["application_domain"],
+            "gathered_parameters": signal["parameters"],
+            "refined_query": signal["refined_query"],
+        })
 
-def _handle_answering_phase_stream(
+        sections = _SectionStreamer()
+        async with aclosing(_call_claude_stream_async(
+            system=answering_prompt_built,
+            messages=answering_messages,
+            max_tokens=8000,
+            phase="answering",
+        )) as stream:
+            async for event_type, data in stream:
+                if event_type == "text":
+                    for event in sections.feed(data):
+                        yield event
+                elif event_type == "error":
+                    yield ("error", data)
+                    return
+
+        yield ("done", _transition_result(signal, visible_response, sections.text, rag_result, chunk_ids))
+    finally:
+        if speculation:
+            speculation.discard()
+
+
+async def _handle_answering_phase_stream_async(
+    session_id: str | None,
     user_message: str,
     conversation_history: list[dict],
     gathered_parameters: dict | None = None,
     answering_prompt: str | None = None,
-    vertical_id: str | None = None,
+    reference_index=None,
     retrieval_kwargs: dict | None = None,
+    context_budget: int = CONTEXT_TOKEN_BUDGET,
 ):
     """Stream a follow-up answer in the answering phase."""
     yield ("status", "Searching knowledge base...")
-    rag_result = _run_retrieval(user_message, **(retrieval_kwargs or {}))
-    rag_context, chunk_ids = _build_rag_context(rag_result)
+    rag_result = await asyncio.to_thread(_followup_retrieval, session_id, user_message, retrieval_kwargs)
 
-    if gathered_parameters:
-        profile_lines = [f"  {k}: {v}" for k, v in gathered_parameters.items()]
-        application_profile = "\n".join(profile_lines)
-    else:
-        application_profile = "(See conversation history for application details)"
-    application_profile = _enrich_profile_with_precompute(application_profile, gathered_parameters)
-
-    answering_prompt_built = _get_answering_prompt(
-        application_profile=application_profile,
-        rag_context=rag_context,
-        template=answering_prompt,
-    )
+    def _prepare():
+        history, rag_context, chunk_ids = _pack_answering_inputs(
+            rag_result, conversation_history, gathered_parameters, user_message,
+            answering_prompt, reference_index, context_budget,
+        )
+        system, context = _build_followup_prompt(
+            gathered_parameters, rag_context, answering_prompt, reference_index, user_message
+        )
+        messages = _packed_messages("follow-up", system, history, user_message, context_budget, context)
+        return system, messages, chunk_ids
 
-    messages = []
-    for msg in conversation_history:
-        messages.append({"role": msg["role"], "content": msg["content"]})
-    messages.append({"role": "user", "content": user_message})
+    answering_prompt_built, messages, chunk_ids = await asyncio.to_thread(_prepare)
 
     yield ("status", "Generating recommendation...")
     yield ("metadata", {"phase": "answering"})
 
-    streamed_text = ""
-    for event_type, data in _call_claude_stream(
+    streamed_chunks: list[str] = []
+    async with aclosing(_call_claude_stream_async(
         system=answering_prompt_built,
         messages=messages,
         max_tokens=6000,
-    ):
-        if event_type == "text":
-            streamed_text += data
-            yield ("text", data)
-        elif event_type == "error":
-            yield ("error", data)
-            return
-
-    answer_text = _strip_consultation_signal(streamed_text)
-    confidence = rag_result["confidence"]["level"]
-    sources = rag_result["citations"]
+        phase="answering",
+    )) as stream:
+        async for event_type, data in stream:
+            if event_type == "text":
+                streamed_chunks.append(data)
+                yield ("text", data)
+            elif event_type == "error":
+                yield ("error", data)
+                return
 
-    yield ("done", {
-        "content": answer_text,
-        "full_report": None,
-        "phase": "answering",
-        "application_domain": None,
-        "gathered_parameters": None,
-        "refined_query": None,
-        "confidence": confidence,
-        "sources": sources,
-        "rag_chunks_used": chunk_ids,
-    })
+    yield ("done", _followup_result("".join(streamed_chunks), rag_result, chunk_ids))
 
 
 # ===========================================================================
@@ -0,0 +1,268 @@
+"""
+Fluidoracle — Context Packer
+=============================
+Token-budgeted packing of the retrieved context and conversation history
+for consultation calls.
+
+Left alone, an answering call carries up to 12 retrieved parent chunks of
+up to ~4000 characters each plus the whole conversation so far, with no
+size control. Each call is instead fitted to the vertical's token budget
+(counted locally with the same ~4 characters/token estimate as the
+reference sections):
+
+  History      — under budget pressure, the older gathering turns are
+                 condensed into the structured gathered parameters (or,
+                 before any are known, into the user's own statements).
+                 The most recent messages are always kept verbatim. If
+                 that is still too large, the oldest remaining turns are
+                 dropped.
+  Retrieved    — parent chunks whose text overlaps an already-kept chunk
+  context        are dropped as duplicates; the rest are picked by MMR
+                 (relevance vs. similarity to what is already picked)
+                 until the budget is spent.
+
+The stable prompt (system prompt, selected reference data, the new user
+message) is never cut; it is counted and the remainder is shared between
+history and retrieved context. The packed size is logged for every call.
+
+Config (env):
+  CONTEXT_PACKING              on/off (default true)
+  CONTEXT_TOKEN_BUDGET         whole-prompt budget per call (default 24000);
+                               a vertical's config.py may set its own
+  CONTEXT_HISTORY_SHARE        share of the remainder history may claim when
+                               retrieved context needs it (default 0.4)
+  CONTEXT_KEEP_RECENT          messages always kept verbatim (default 4)
+  CONTEXT_MMR_LAMBDA           relevance weight in MMR selection (default 0.7)
+  CONTEXT_DUPLICATE_OVERLAP    shingle containment at which a chunk counts
+                               as a duplicate (default 0.8)
+"""
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass
+
+from core.reference_sections import estimate_tokens, tokenize
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "24000"))
+CONTEXT_HISTORY_SHARE = float(os.getenv("CONTEXT_HISTORY_SHARE", "0.4"))
+CONTEXT_KEEP_RECENT = int(os.getenv("CONTEXT_KEEP_RECENT", "4"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DUPLICATE_OVERLAP = float(os.getenv("CONTEXT_DUPLICATE_OVERLAP", "0.8"))
+
+# Per-message framing overhead in the Messages API
+_MESSAGE_OVERHEAD = 4
+# "--- Reference [i]: source (relevance: x) ---" line per retrieved chunk
+_REFERENCE_OVERHEAD = 20
+_SHINGLE = 5
+
+
+# ---------------------------------------------------------------------------
+# Counting
+# ---------------------------------------------------------------------------
+
+def count_tokens(text: str) -> int:
+    """Approximate token count of a string."""
+    return estimate_tokens(text) if text else 0
+
+
+def _content_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "\n\n".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+def message_tokens(messages: list[dict]) -> int:
+    """Approximate token count of Messages API messages."""
+    return sum(count_tokens(_content_text(m["content"])) + _MESSAGE_OVERHEAD for m in messages)
+
+
+def log_packed(label: str, system, messages: list[dict], budget: int) -> int:
+    """Log the packed size of a call and return its total token estimate."""
+    system_tokens = count_tokens(_content_text(system))
+    history_tokens = message_tokens(messages[:-1])
+    turn_tokens = message_tokens(messages[-1:])
+    total = system_tokens + history_tokens + turn_tokens
+    logger.info(
+        f"[context] {label}: system ~{system_tokens} + history ~{history_tokens} "
+        f"({len(messages) - 1} msgs) + turn ~{turn_tokens} = ~{total}/{budget} tokens"
+    )
+    if total > budget:
+        logger.warning(f"[context] {label}: over budget by ~{total - budget} tokens")
+    return total
+
+
+# ---------------------------------------------------------------------------
+# Conversation history
+# ---------------------------------------------------------------------------
+
+@dataclass
+class PackedHistory:
+    """Conversation history fitted to a token budget."""
+
+    messages: list[dict]
+    tokens: int
+    condensed: int = 0  # gathering messages folded into the condensed note
+    dropped: int = 0    # messages dropped outright
+
+
+def _condensed_note(messages: list[dict], parameters: dict | None) -> str:
+    if parameters:
+        lines = [f"  {k}: {v}" for k, v in parameters.items()]
+        return (
+            f"[Earlier consultation condensed: {len(messages)} gathering messages, "
+            f"summarised by the parameters gathered from them]\n"
+            "GATHERED PARAMETERS:\n" + "\n".join(lines)
+        )
+    said = [f"  - {m['content'].strip()}" for m in messages if m["role"] == "user" and isinstance(m["content"], str)]
+    return (
+        f"[Earlier consultation condensed: {len(messages)} gathering messages, "
+        f"the user's answers kept]\n"
+        "THE USER SAID:\n" + "\n".join(said)
+    )
+
+
+def _prefix(message: dict, note: str) -> dict:
+    if not isinstance(message["content"], str):
+        return message
+    return {**message, "content": f"{note}\n\n{message['content']}"}
+
+
+def pack_history(
+    conversation_history: list[dict],
+    parameters: dict | None,
+    budget: int,
+    keep_recent: int = CONTEXT_KEEP_RECENT,
+) -> PackedHistory:
+    """Fit the history to `budget` tokens.
+
+    Messages carry the phase they were written in ("phase": "gathering" /
+    "answering"). The leading gathering turns older than the last
+    `keep_recent` messages are condensed first; then the oldest remaining
+    turns are dropped in user/assistant pairs. The kept history always
+    starts on a user message, and the result is deterministic for a given
+    history so the prompt-cache prefix stays stable between calls.
+    """
+    messages = list(conversation_history)
+    total = message_tokens(messages)
+    if not CONTEXT_PACKING or total <= budget:
+        return PackedHistory(messages, total)
+
+    floor = max(len(messages) - keep_recent, 0)
+
+    # 1. Condense the leading gathering turns
+    condensed = 0
+    cut = 0
+    while cut < floor and messages[cut].get("phase") == "gathering":
+        cut += 1
+    while cut > 0 and messages[cut]["role"] != "user":
+        cut -= 1
+    if cut > 0:
+        note = _condensed_note(messages[:cut], parameters)
+        condensed = cut
+        messages = [_prefix(messages[cut], note)] + messages[cut + 1:]
+        floor -= cut
+    else:
+        note = ""
+
+    # 2. Drop the oldest turns, a user/assistant pair at a time
+    dropped = 0
+    while message_tokens(messages) > budget and floor >= 2 and len(messages) > 2:
+        first = dict(messages[2])
+        messages = messages[2:]
+        dropped += 2
+        floor -= 2
+        omitted = f"[{dropped} earlier messages omitted to fit the context budget]"
+        messages[0] = _prefix(first, f"{note}\n{omitted}" if note else omitted)
+
+    packed = PackedHistory(messages, message_tokens(messages), condensed, dropped)
+    logger.info(
+        f"[context] history ~{total} → ~{packed.tokens}/{budget} tokens "
+        f"({condensed} condensed, {dropped} dropped)"
+    )
+    return packed
+
+
+# ---------------------------------------------------------------------------
+# Retrieved context
+# ---------------------------------------------------------------------------
+
+def _shingles(tokens: list[str]) -> set[tuple]:
+    if len(tokens) < _SHINGLE:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + _SHINGLE]) for i in range(len(tokens) - _SHINGLE + 1)}
+
+
+def _containment(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def result_tokens(result: dict) -> int:
+    return count_tokens(result.get("parent_text", "")) + _REFERENCE_OVERHEAD
+
+
+def pack_results(
+    results: list[dict],
+    budget: int,
+    mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+) -> tuple[list[dict], int]:
+    """Deduplicate and MMR-select retrieved chunks under `budget` tokens.
+
+    Returns (selected results in selection order, duplicates dropped). If
+    even the best chunk does not fit, it is kept truncated to the budget.
+    """
+    unique: list[tuple[dict, set, set]] = []
+    duplicates = 0
+    for r in results:
+        tokens = tokenize(r.get("parent_text", ""))
+        shingles = _shingles(tokens)
+        if any(_containment(shingles, s) >= CONTEXT_DUPLICATE_OVERLAP for _, s, _ in unique):
+            duplicates += 1
+            continue
+        unique.append((r, shingles, set(tokens)))
+
+    if not unique:
+        return [], duplicates
+
+    # Results the cross-encoder did not score (rerank_score None) take their
+    # relevance from their retrieval (RRF) rank, below every scored result
+    scores = [r.get("rerank_score") for r, _, _ in unique]
+    scored = [s for s in scores if s is not None]
+    top = max(scored, default=0.0) or 1.0
+    floor = min(scored) / top if scored else 1.0
+    relevances = [s / top if s is not None else floor * (1 - i / len(unique)) for i, s in enumerate(scores)]
+    candidates = list(range(len(unique)))
+    chosen: list[int] = []
+    used = 0
+    while candidates:
+        def _mmr(i: int) -> float:
+            relevance = relevances[i]
+            redundancy = max((_jaccard(unique[i][2], unique[j][2]) for j in chosen), default=0.0)
+            return mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+
+        best = max(candidates, key=_mmr)
+        candidates.remove(best)
+        cost = result_tokens(unique[best][0])
+        if used + cost <= budget:
+            chosen.append(best)
+            used += cost
+
+    if not chosen:
+        best = unique[0][0]
+        keep_chars = max(budget - _REFERENCE_OVERHEAD, 0) * 4
+        if keep_chars <= 0:
+            return [], duplicates
+        return [{**best, "parent_text": best.get("parent_text", "")[:keep_chars]}], duplicates
+
+    return [unique[i][0] for i in chosen], duplicates
@@ -5,13 +5,19 @@ Hydraulic Filter Platform — Database Layer
 Async SQLite database for community data: questions, votes, comments.
 """
 
+import hashlib
 import json
+import re
+import sqlite3
+import unicodedata
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import aiosqlite
 
+from core import db_pool, migrations, usage_writer
+
 # ---------------------------------------------------------------------------
 # Database path (set by main.py at startup)
 # ---------------------------------------------------------------------------
@@ -29,267 +35,42 @@ def _get_db_path() -> str:
     return _db_path
 
 
-# ===========================================================================
-# Initialization
-# ===========================================================================
+# ---------------------------------------------------------------------------
+# Connections (core/db_pool.py: one writer, pooled readers, once started)
+# ---------------------------------------------------------------------------
 
-async def init_db():
-    """Create tables if they don't exist."""
-    Path(_get_db_path()).parent.mkdir(parents=True, exist_ok=True)
+def _writer():
+    return db_pool.writer(_get_db_path())
 
-    async with aiosqlite.connect(_get_db_path()) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS questions (
-                id TEXT PRIMARY KEY,
-                question TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                confidence TEXT NOT NULL,
-                sources TEXT,
-                warnings TEXT,
-                vote_up INTEGER DEFAULT 0,
-                vote_down INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS comments (
-                id TEXT PRIMARY KEY,
-                question_id TEXT NOT NULL REFERENCES questions(id),
-                body TEXT NOT NULL,
-                is_correction BOOLEAN DEFAULT FALSE,
-                author_name TEXT DEFAULT 'Anonymous',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS votes (
-                id TEXT PRIMARY KEY,
-                question_id TEXT NOT NULL REFERENCES questions(id),
-                direction TEXT NOT NULL,
-                voter_ip TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(question_id, voter_ip)
-            )
-        """)
-
-        # --- Invention Sessions ---
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS invention_sessions (
-                id TEXT PRIMARY KEY,
-                title TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS invention_messages (
-                id TEXT PRIMARY KEY,
-                session_id TEXT NOT NULL REFERENCES invention_sessions(id),
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                sources TEXT,
-                confidence TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # --- Consultation Sessions ---
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS consultation_sessions (
-                id TEXT PRIMARY KEY,
-                title TEXT NOT NULL DEFAULT 'New Consultation',
-                phase TEXT NOT NULL DEFAULT 'gathering',
-                application_domain TEXT,
-                gathered_parameters TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS consultation_messages (
-                id TEXT PRIMARY KEY,
-                session_id TEXT NOT NULL REFERENCES consultation_sessions(id),
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                phase_at_time TEXT,
-                rag_chunks_used TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # --- Consultation Outcomes ---
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS consultation_outcomes (
-                id TEXT PRIMARY KEY,
-                session_id TEXT NOT NULL REFERENCES consultation_sessions(id),
-                followup_stage TEXT NOT NULL,
-                implementation_status TEXT,
-                performance_rating INTEGER,
-                performance_notes TEXT,
-                failure_occurred BOOLEAN DEFAULT FALSE,
-                failure_mode TEXT,
-                failure_timeline TEXT,
-                operating_conditions_matched BOOLEAN,
-                operating_conditions_notes TEXT,
-                modifications_made TEXT,
-                would_recommend_same BOOLEAN,
-                alternative_tried TEXT,
-                additional_notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS outcome_followup_schedule (
-                id TEXT PRIMARY KEY,
-                session_id TEXT NOT NULL REFERENCES consultation_sessions(id),
-                followup_stage TEXT NOT NULL,
-                scheduled_date TIMESTAMP NOT NULL,
-                status TEXT DEFAULT 'pending',
-                sent_at TIMESTAMP,
-                completed_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # --- Consultation Email Subscribers (legacy — kept for data, no longer written to) ---
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS consultation_subscribers (
-                id TEXT PRIMARY KEY,
-                session_id TEXT NOT NULL REFERENCES consultation_sessions(id),
-                email TEXT NOT NULL,
-                application_domain TEXT,
-                topics TEXT,
-                verification_token TEXT NOT NULL,
-                unsubscribe_token TEXT NOT NULL,
-                verified BOOLEAN DEFAULT FALSE,
-                verified_at TIMESTAMP,
-                unsubscribed BOOLEAN DEFAULT FALSE,
-                unsubscribed_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # --- Knowledge Base Updates (for topic matching) ---
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS knowledge_base_updates (
-                id TEXT PRIMARY KEY,
-                title TEXT NOT NULL,
-                description TEXT NOT NULL,
-                domains TEXT,
-                topics TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # --- Users (passwordless auth) ---
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                email_verified BOOLEAN DEFAULT FALSE,
-                topic_subscription BOOLEAN DEFAULT TRUE,
-                feature_updates BOOLEAN DEFAULT FALSE,
-                unsubscribe_token TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login_at TIMESTAMP
-            )
-        """)
-
-        # --- Auth Codes (passwordless login) ---
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS auth_codes (
-                id TEXT PRIMARY KEY,
-                email TEXT NOT NULL,
-                code TEXT NOT NULL,
-                expires_at TIMESTAMP NOT NULL,
-                used BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # --- Auth Sessions (bearer tokens) ---
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS auth_sessions (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL REFERENCES users(id),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP NOT NULL
-            )
-        """)
 
-        # --- Add user_id to consultation_sessions (migration-safe) ---
-        try:
-            await db.execute(
-                "ALTER TABLE consultation_sessions ADD COLUMN user_id TEXT REFERENCES users(id)"
-            )
-        except Exception:
-            pass  # Column already exists
+def reader():
+    """A read-only connection: `async with database.reader() as db:`."""
+    return db_pool.reader(_get_db_path())
 
-        # --- Add full_report to consultation_messages (migration-safe) ---
-        try:
-            await db.execute(
-                "ALTER TABLE consultation_messages ADD COLUMN full_report TEXT"
-            )
-        except Exception:
-            pass  # Column already exists
 
-        # --- Add vertical_id and platform_id to consultation_sessions (migration-safe) ---
-        try:
-            await db.execute(
-                "ALTER TABLE consultation_sessions ADD COLUMN vertical_id TEXT"
-            )
-        except Exception:
-            pass  # Column already exists
-        try:
-            await db.execute(
-                "ALTER TABLE consultation_sessions ADD COLUMN platform_id TEXT"
-            )
-        except Exception:
-            pass  # Column already exists
+def sync_reader():
+    """A read-only sqlite3 connection for a worker thread:
+    `with database.sync_reader() as conn:`."""
+    return db_pool.sync_reader(_get_db_path())
 
-        # --- Add vertical_id to questions for Q&A tagging (migration-safe) ---
-        try:
-            await db.execute(
-                "ALTER TABLE questions ADD COLUMN vertical_id TEXT"
-            )
-        except Exception:
-            pass  # Column already exists
-
-        # --- Off-vertical demand signal table ---
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS off_vertical_demand (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT,
-                source_vertical TEXT,
-                source_platform TEXT,
-                detected_target_vertical TEXT,
-                query_text TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS llm_usage (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT,
-                vertical_id TEXT,
-                platform_id TEXT,
-                phase TEXT,
-                model TEXT,
-                input_tokens INTEGER,
-                output_tokens INTEGER,
-                estimated_cost_usd REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
 
-        await db.commit()
+def transaction():
+    """Run several database calls as one transaction:
+    `async with database.transaction(): ...`."""
+    return db_pool.transaction(_get_db_path())
+
+
+# ===========================================================================
+# Initialization
+# ===========================================================================
+
+async def init_db() -> list[int]:
+    """Bring the schema up to date (core/migrations.py). Returns the
+    migrations applied."""
+    Path(_get_db_path()).parent.mkdir(parents=True, exist_ok=True)
+
+    async with _writer() as db:
+        return await migrations.migrate(db)
 
 
 # ===========================================================================
@@ -301,8 +82,71 @@ _MODEL_COSTS = {
     "claude-sonnet-4-20250514": {"input": 3.0, "output": 15.0},
     "claude-sonnet-4-5-20250929": {"input": 3.0, "output": 15.0},
     "claude-haiku-3-5-20241022": {"input": 0.80, "output": 4.0},
+    "claude-haiku-4-5-20251001": {"input": 1.0, "output": 5.0},
+    "claude-opus-4-6": {"input": 5.0, "output": 25.0},
 }
 
+# Prompt-cache pricing relative to the model's input price
+_CACHE_WRITE_MULTIPLIER = 1.25
+_CACHE_READ_MULTIPLIER = 0.10
+
+
+def _usage_row(response_usage, model: str) -> tuple[int, int, int, int, float]:
+    """(input, output, cache_write, cache_read, estimated_cost) for one response.
+
+    Anthropic reports cached prefix tokens separately from input_tokens:
+    cache_creation_input_tokens were written to the cache on this call,
+    cache_read_input_tokens were served from it.
+    """
+    input_tokens = getattr(response_usage, "input_tokens", 0) or 0
+    output_tokens = getattr(response_usage, "output_tokens", 0) or 0
+    cache_write = getattr(response_usage, "cache_creation_input_tokens", 0) or 0
+    cache_read = getattr(response_usage, "cache_read_input_tokens", 0) or 0
+
+    costs = _MODEL_COSTS.get(model, {"input": 3.0, "output": 15.0})
+    estimated_cost = (
+        input_tokens * costs["input"]
+        + cache_write * costs["input"] * _CACHE_WRITE_MULTIPLIER
+        + cache_read * costs["input"] * _CACHE_READ_MULTIPLIER
+        + output_tokens * costs["output"]
+    ) / 1_000_000
+    return input_tokens, output_tokens, cache_write, cache_read, estimated_cost
+
+
+def _usage_record(response_usage, model: str, phase: str, **columns) -> dict:
+    """An llm_usage row for one response, stamped with the time it was logged
+    (in CURRENT_TIMESTAMP's format, so it compares with datetime('now', ...))."""
+    input_tokens, output_tokens, cache_write, cache_read, estimated_cost = _usage_row(response_usage, model)
+    return {
+        "phase": phase,
+        "model": model,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cache_creation_input_tokens": cache_write,
+        "cache_read_input_tokens": cache_read,
+        "estimated_cost_usd": estimated_cost,
+        "aborted": 0,
+        "output_tokens_saved": 0,
+        "hedge_loser": 0,
+        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        **columns,
+    }
+
+
+def _write_usage(row: dict) -> None:
+    """Hand a usage row to the buffered writer (core/usage_writer.py), or
+    write it straight away when the writer is not running."""
+    if usage_writer.enqueue(row):
+        return
+    try:
+        conn = sqlite3.connect(_get_db_path())
+        try:
+            usage_writer.write_rows(conn, [row])
+        finally:
+            conn.close()
+    except Exception:
+        pass  # Non-critical — don't break the request over telemetry
+
 
 async def log_llm_usage(
     response_usage,
@@ -311,6 +155,11 @@ async def log_llm_usage(
     session_id: str | None = None,
     vertical_id: str | None = None,
     platform_id: str | None = None,
+    hedge_loser: bool = False,
+    route_tier: str | None = None,
+    route_rule: str | None = None,
+    latency_ms: int | None = None,
+    first_token_ms: int | None = None,
 ) -> None:
     """Persist a single LLM call's token usage. Call after every Anthropic API response.
 
@@ -318,23 +167,23 @@ async def log_llm_usage(
         response_usage: The ``response.usage`` object from the Anthropic SDK.
         model: Model identifier string.
         phase: One of 'gathering', 'answering', 'followup', 'question', 'invention', 'other'.
+        hedge_loser: The call lost a hedged race (core/hedging.py); its
+            output was discarded.
+        route_tier, route_rule: The routing decision behind the model
+            choice (core/model_router.py).
+        latency_ms, first_token_ms: Wall time of the call, and to the first
+            streamed token.
     """
-    input_tokens = getattr(response_usage, "input_tokens", 0)
-    output_tokens = getattr(response_usage, "output_tokens", 0)
-
-    costs = _MODEL_COSTS.get(model, {"input": 3.0, "output": 15.0})
-    estimated_cost = (input_tokens * costs["input"] + output_tokens * costs["output"]) / 1_000_000
-
+    row = _usage_record(
+        response_usage, model, phase, session_id=session_id, vertical_id=vertical_id,
+        platform_id=platform_id, hedge_loser=int(hedge_loser), route_tier=route_tier,
+        route_rule=route_rule, latency_ms=latency_ms, first_token_ms=first_token_ms,
+    )
+    if usage_writer.enqueue(row):
+        return
     try:
-        async with aiosqlite.connect(_get_db_path()) as db:
-            await db.execute(
-                """INSERT INTO llm_usage
-                   (session_id, vertical_id, platform_id, phase, model,
-                    input_tokens, output_tokens, estimated_cost_usd)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                (session_id, vertical_id, platform_id, phase, model,
-                 input_tokens, output_tokens, estimated_cost),
-            )
+        async with _writer() as db:
+            await db.execute(usage_writer.INSERT_SQL, usage_writer.row_values(row))
             await db.commit()
     except Exception:
         pass  # Non-critical — don't break the request over telemetry
@@ -347,36 +196,94 @@ def log_llm_usage_sync(
     session_id: str | None = None,
     vertical_id: str | None = None,
     platform_id: str | None = None,
+    hedge_loser: bool = False,
+    route_tier: str | None = None,
+    route_rule: str | None = None,
+    latency_ms: int | None = None,
+    first_token_ms: int | None = None,
 ) -> None:
     """Synchronous version for use in sync engine code (consultation/answer/invention)."""
-    import sqlite3
-
-    input_tokens = getattr(response_usage, "input_tokens", 0)
-    output_tokens = getattr(response_usage, "output_tokens", 0)
+    _write_usage(_usage_record(
+        response_usage, model, phase, session_id=session_id, vertical_id=vertical_id,
+        platform_id=platform_id, hedge_loser=int(hedge_loser), route_tier=route_tier,
+        route_rule=route_rule, latency_ms=latency_ms, first_token_ms=first_token_ms,
+    ))
 
-    costs = _MODEL_COSTS.get(model, {"input": 3.0, "output": 15.0})
-    estimated_cost = (input_tokens * costs["input"] + output_tokens * costs["output"]) / 1_000_000
 
+def log_aborted_llm_usage_sync(
+    response_usage,
+    model: str,
+    phase: str,
+    max_tokens: int,
+    session_id: str | None = None,
+    vertical_id: str | None = None,
+    platform_id: str | None = None,
+    route_tier: str | None = None,
+    route_rule: str | None = None,
+) -> int:
+    """Persist a stream cancelled because the client disconnected.
+
+    `response_usage` carries the input/cache counts reported at message
+    start and the output tokens generated before the abort. The output
+    tokens saved are estimated from the average output of completed calls
+    for the same phase and model (capped at `max_tokens`). Returns that
+    estimate.
+    """
+    output_tokens = getattr(response_usage, "output_tokens", 0) or 0
     try:
-        conn = sqlite3.connect(_get_db_path())
-        conn.execute(
-            """INSERT INTO llm_usage
-               (session_id, vertical_id, platform_id, phase, model,
-                input_tokens, output_tokens, estimated_cost_usd)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (session_id, vertical_id, platform_id, phase, model,
-             input_tokens, output_tokens, estimated_cost),
-        )
-        conn.commit()
-        conn.close()
+        typical = min(_typical_output(phase, model), max_tokens)
     except Exception:
-        pass
+        typical = 0
+    saved = max(typical - output_tokens, 0)
+    _write_usage(_usage_record(
+        response_usage, model, phase, session_id=session_id, vertical_id=vertical_id,
+        platform_id=platform_id, aborted=1, output_tokens_saved=saved,
+        route_tier=route_tier, route_rule=route_rule,
+    ))
+    return saved
+
+
+def _typical_output(phase: str, model: str) -> int:
+    """Average output tokens of completed calls for this phase and model —
+    kept in memory while the usage writer runs, else read from llm_usage."""
+    if usage_writer.running():
+        return usage_writer.typical_output(phase, model)
+    conn = sqlite3.connect(_get_db_path())
+    try:
+        row = conn.execute(
+            """SELECT AVG(output_tokens) FROM llm_usage
+               WHERE phase = ? AND model = ? AND COALESCE(aborted, 0) = 0
+                 AND COALESCE(hedge_loser, 0) = 0""",
+            (phase, model),
+        ).fetchone()
+    finally:
+        conn.close()
+    return int(row[0] or 0)
 
 
 # ===========================================================================
 # Questions
 # ===========================================================================
 
+# Answers that must not be served again for a repeat question
+_FAILED_ANSWER_MARKERS = ("declined to answer", "unable to generate")
+
+
+def normalize_question(text: str) -> str:
+    """Question text reduced to what makes two questions the same:
+    case, whitespace and trailing punctuation do not."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return re.sub(r"\s+", " ", text).strip().rstrip("?!. ").strip()
+
+
+def question_hash(text: str) -> str:
+    return hashlib.sha256(normalize_question(text).encode("utf-8")).hexdigest()
+
+
+def is_failed_answer(answer: str) -> bool:
+    return any(marker in answer for marker in _FAILED_ANSWER_MARKERS)
+
+
 async def save_question(
     id: str,
     question: str,
@@ -385,15 +292,23 @@ async def save_question(
     sources: list[str],
     warnings: list[str],
 ) -> dict:
-    """Insert a new question/answer record."""
-    async with aiosqlite.connect(_get_db_path()) as db:
-        await db.execute(
-            """
-            INSERT INTO questions (id, question, answer, confidence, sources, warnings)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (id, question, answer, confidence, json.dumps(sources), json.dumps(warnings)),
-        )
+    """Insert a new question/answer record.
+
+    The record takes the question's hash unless the answer failed or the
+    same question already has an answer (two concurrent first asks): it is
+    saved all the same, the first answer stays the one served for repeats.
+    """
+    h = None if is_failed_answer(answer) else question_hash(question)
+    async with _writer() as db:
+        insert = """
+            INSERT INTO questions (id, question, answer, confidence, sources, warnings, question_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+        values = (id, question, answer, confidence, json.dumps(sources), json.dumps(warnings))
+        try:
+            await db.execute(insert, values + (h,))
+        except sqlite3.IntegrityError:
+            await db.execute(insert, values + (None,))
         await db.commit()
 
     return {
@@ -412,7 +327,7 @@ async def get_questions(page: int = 1, limit: int = 20) -> list[dict]:
     """Get paginated list of questions, most recent first."""
     offset = (page - 1) * limit
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
@@ -447,7 +362,7 @@ async def get_questions(page: int = 1, limit: int = 20) -> list[dict]:
 
 async def get_question(id: str) -> dict | None:
     """Get a single question with full details."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
@@ -478,15 +393,112 @@ async def get_question(id: str) -> dict | None:
     }
 
 
+async def get_question_by_hash(question_hash: str) -> dict | None:
+    """The answered question with this normalized-question hash, if any."""
+    async with reader() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """
+            SELECT
+                q.*,
+                (SELECT COUNT(*) FROM comments c WHERE c.question_id = q.id) as comment_count
+            FROM questions q
+            WHERE q.question_hash = ?
+            """,
+            (question_hash,),
+        )
+        row = await cursor.fetchone()
+
+    if row is None:
+        return None
+
+    return {
+        "id": row["id"],
+        "question": row["question"],
+        "answer": row["answer"],
+        "confidence": row["confidence"],
+        "sources": json.loads(row["sources"]) if row["sources"] else [],
+        "warnings": json.loads(row["warnings"]) if row["warnings"] else [],
+        "vote_up": row["vote_up"],
+        "vote_down": row["vote_down"],
+        "comment_count": row["comment_count"],
+        "created_at": row["created_at"],
+    }
+
+
+async def save_question_embedding(question_id: str, embedding: bytes, chunk_ids: list[str]) -> None:
+    async with _writer() as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO question_embeddings (question_id, embedding, chunk_ids) VALUES (?, ?, ?)",
+            (question_id, embedding, json.dumps(chunk_ids)),
+        )
+        await db.commit()
+
+
+_EMBEDDING_SELECT = """
+    SELECT q.id, q.question, q.answer, q.confidence, q.sources, q.warnings,
+           e.embedding, e.chunk_ids, e.created_at
+    FROM question_embeddings e
+    JOIN questions q ON q.id = e.question_id
+"""
+
+
+def _embedding_row(row) -> dict:
+    return {
+        "id": row["id"],
+        "question": row["question"],
+        "answer": row["answer"],
+        "confidence": row["confidence"],
+        "sources": json.loads(row["sources"]) if row["sources"] else [],
+        "warnings": json.loads(row["warnings"]) if row["warnings"] else [],
+        "embedding": row["embedding"],
+        "chunk_ids": json.loads(row["chunk_ids"]),
+        "created_at": row["created_at"],
+    }
+
+
+async def get_question_embeddings(limit: int) -> list[dict]:
+    """Embeddings of the most recent answered questions without downvotes,
+    with what a cached answer needs."""
+    async with reader() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            _EMBEDDING_SELECT + "WHERE q.vote_down = 0 ORDER BY e.created_at DESC LIMIT ?",
+            (limit,),
+        )
+        rows = await cursor.fetchall()
+    return [_embedding_row(row) for row in rows]
+
+
+def get_question_embeddings_since_sync(since: str, limit: int) -> list[dict]:
+    """get_question_embeddings for those stored at or after `since` — answers
+    other workers added — for the answer engine's worker thread."""
+    with sync_reader() as conn:
+        rows = conn.execute(
+            _EMBEDDING_SELECT + "WHERE q.vote_down = 0 AND e.created_at >= ? ORDER BY e.created_at DESC LIMIT ?",
+            (since, limit),
+        ).fetchall()
+    return [_embedding_row(row) for row in rows]
+
+
+def question_servable_sync(question_id: str) -> bool:
+    """Whether a question still exists without downvotes (checked, from the
+    engine's worker thread, before its answer is served for a paraphrase)."""
+    with sync_reader() as conn:
+        row = conn.execute("SELECT vote_down FROM questions WHERE id = ?", (question_id,)).fetchone()
+    return row is not None and not row[0]
+
+
 # ===========================================================================
 # Delete question
 # ===========================================================================
 
 async def delete_question(question_id: str) -> bool:
     """Delete a question and all its associated votes and comments."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute("DELETE FROM comments WHERE question_id = ?", (question_id,))
         await db.execute("DELETE FROM votes WHERE question_id = ?", (question_id,))
+        await db.execute("DELETE FROM question_embeddings WHERE question_id = ?", (question_id,))
         cursor = await db.execute("DELETE FROM questions WHERE id = ?", (question_id,))
         await db.commit()
         return cursor.rowcount > 0
@@ -500,7 +512,7 @@ async def add_vote(question_id: str, direction: str, voter_ip: str) -> dict:
     """Add or update a vote. One vote per IP per question."""
     vote_id = str(uuid.uuid4())
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         # Check for existing vote from this IP
         cursor = await db.execute(
             "SELECT id, direction FROM votes WHERE question_id = ? AND voter_ip = ?",
@@ -574,7 +586,7 @@ async def add_comment(
     comment_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             """
             INSERT INTO comments (id, question_id, body, is_correction, author_name, created_at)
@@ -596,7 +608,7 @@ async def add_comment(
 
 async def get_comments(question_id: str) -> list[dict]:
     """Get all comments for a question, oldest first."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
@@ -627,7 +639,7 @@ async def get_comments(question_id: str) -> list[dict]:
 
 async def get_stats() -> dict:
     """Get basic platform statistics."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         cursor = await db.execute("SELECT COUNT(*) FROM questions")
         question_count = (await cursor.fetchone())[0]
 
@@ -659,7 +671,7 @@ async def create_invention_session(title: str = "New Session") -> dict:
     session_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             """
             INSERT INTO invention_sessions (id, title, created_at, updated_at)
@@ -680,7 +692,7 @@ async def create_invention_session(title: str = "New Session") -> dict:
 
 async def get_invention_sessions() -> list[dict]:
     """List all invention sessions, newest first."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
@@ -707,7 +719,7 @@ async def get_invention_sessions() -> list[dict]:
 
 async def get_invention_session(session_id: str) -> dict | None:
     """Get a single invention session with all its messages."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
 
         # Get session
@@ -753,7 +765,7 @@ async def get_invention_session(session_id: str) -> dict | None:
 
 async def delete_invention_session(session_id: str) -> bool:
     """Delete an invention session and all its messages."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             "DELETE FROM invention_messages WHERE session_id = ?",
             (session_id,),
@@ -777,7 +789,7 @@ async def add_invention_message(
     message_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             """
             INSERT INTO invention_messages (id, session_id, role, content, sources, confidence, created_at)
@@ -812,7 +824,7 @@ async def add_invention_message(
 
 async def update_invention_session_title(session_id: str, title: str) -> bool:
     """Update the title of an invention session."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         cursor = await db.execute(
             "UPDATE invention_sessions SET title = ? WHERE id = ?",
             (title, session_id),
@@ -834,7 +846,7 @@ async def create_consultation_session(
     session_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             """
             INSERT INTO consultation_sessions
@@ -861,7 +873,7 @@ async def create_consultation_session(
 
 async def get_consultation_sessions() -> list[dict]:
     """List all consultation sessions, newest first."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
@@ -891,7 +903,7 @@ async def get_consultation_sessions() -> list[dict]:
 
 async def get_consultation_session(session_id: str) -> dict | None:
     """Get a single consultation session with all its messages."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
 
         cursor = await db.execute(
@@ -920,6 +932,7 @@ async def get_consultation_session(session_id: str) -> dict | None:
             "phase_at_time": row["phase_at_time"],
             "rag_chunks_used": json.loads(row["rag_chunks_used"]) if row["rag_chunks_used"] else None,
             "full_report": row["full_report"] if "full_report" in row.keys() else None,
+            "incomplete": bool(row["incomplete"]) if "incomplete" in row.keys() else False,
             "created_at": row["created_at"],
         }
         for row in message_rows
@@ -939,7 +952,7 @@ async def get_consultation_session(session_id: str) -> dict | None:
 
 async def delete_consultation_session(session_id: str) -> bool:
     """Delete a consultation session and all its messages."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             "DELETE FROM consultation_messages WHERE session_id = ?",
             (session_id,),
@@ -959,17 +972,28 @@ async def add_consultation_message(
     phase_at_time: str | None = None,
     rag_chunks_used: list[str] | None = None,
     full_report: str | None = None,
+    incomplete: bool = False,
+    idempotency_key: str | None = None,
+    reply_to: str | None = None,
 ) -> dict:
-    """Add a message to a consultation session."""
+    """Add a message to a consultation session.
+
+    `incomplete` marks an assistant reply whose stream was cut short by a
+    client disconnect; `content` then holds the partial text.
+    `idempotency_key` is unique per session: adding a second message with
+    the same key raises sqlite3.IntegrityError.
+    `reply_to` is the id of the user message an assistant reply answers.
+    """
     message_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             """
             INSERT INTO consultation_messages
-                (id, session_id, role, content, phase_at_time, rag_chunks_used, full_report, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                (id, session_id, role, content, phase_at_time, rag_chunks_used, full_report,
+                 incomplete, idempotency_key, reply_to, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 message_id,
@@ -979,6 +1003,9 @@ async def add_consultation_message(
                 phase_at_time,
                 json.dumps(rag_chunks_used) if rag_chunks_used else None,
                 full_report,
+                int(incomplete),
+                idempotency_key,
+                reply_to,
                 now,
             ),
         )
@@ -995,10 +1022,56 @@ async def add_consultation_message(
         "phase_at_time": phase_at_time,
         "rag_chunks_used": rag_chunks_used,
         "full_report": full_report,
+        "incomplete": incomplete,
         "created_at": now,
     }
 
 
+async def get_idempotent_turn(session_id: str, idempotency_key: str) -> dict | None:
+    """The turn started by the user message with this idempotency key.
+
+    Returns {"user_message": ..., "reply": ...} — reply is the assistant
+    message linked to it by reply_to, or None while it is still being
+    generated — or None if no message carries the key.
+    """
+    async with reader() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            "SELECT * FROM consultation_messages WHERE session_id = ? AND idempotency_key = ?",
+            (session_id, idempotency_key),
+        )
+        user_row = await cursor.fetchone()
+        if user_row is None:
+            return None
+        cursor = await db.execute(
+            "SELECT * FROM consultation_messages WHERE reply_to = ? ORDER BY created_at DESC LIMIT 1",
+            (user_row["id"],),
+        )
+        reply_row = await cursor.fetchone()
+
+    reply = None
+    if reply_row is not None:
+        reply = {
+            "id": reply_row["id"],
+            "content": reply_row["content"],
+            "phase_at_time": reply_row["phase_at_time"],
+            "full_report": reply_row["full_report"],
+            "incomplete": bool(reply_row["incomplete"]),
+        }
+    return {
+        "user_message": {"id": user_row["id"], "content": user_row["content"]},
+        "reply": reply,
+    }
+
+
+async def delete_consultation_message(message_id: str) -> bool:
+    """Delete one consultation message (the user message of a failed turn)."""
+    async with _writer() as db:
+        cursor = await db.execute("DELETE FROM consultation_messages WHERE id = ?", (message_id,))
+        await db.commit()
+        return cursor.rowcount > 0
+
+
 # ===========================================================================
 # Consultation Outcomes
 # ===========================================================================
@@ -1023,7 +1096,7 @@ async def create_consultation_outcome(
     outcome_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             """
             INSERT INTO consultation_outcomes
@@ -1074,7 +1147,7 @@ async def create_consultation_outcome(
 
 async def get_consultation_outcomes(session_id: str) -> list[dict]:
     """Get all outcome reports for a consultation session, oldest first."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
@@ -1138,7 +1211,7 @@ async def update_consultation_outcome(
     params.append(now)
     params.append(outcome_id)
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         cursor = await db.execute(
             f"UPDATE consultation_outcomes SET {', '.join(updates)} WHERE id = ?",
             params,
@@ -1193,7 +1266,7 @@ async def create_followup_schedule(
     schedule_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             """
             INSERT INTO outcome_followup_schedule
@@ -1214,11 +1287,21 @@ async def create_followup_schedule(
     }
 
 
+async def get_followup_stages(session_id: str) -> set[str]:
+    """Follow-up stages already scheduled for a session."""
+    async with reader() as db:
+        cursor = await db.execute(
+            "SELECT followup_stage FROM outcome_followup_schedule WHERE session_id = ?",
+            (session_id,),
+        )
+        return {row[0] for row in await cursor.fetchall()}
+
+
 async def get_pending_followups() -> list[dict]:
     """Get all follow-ups that are due (scheduled_date <= now AND status = 'pending')."""
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
@@ -1282,7 +1365,7 @@ async def update_consultation_session(
     params.append(datetime.now(timezone.utc).isoformat())
     params.append(session_id)
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         cursor = await db.execute(
             f"UPDATE consultation_sessions SET {', '.join(updates)} WHERE id = ?",
             params,
@@ -1297,7 +1380,7 @@ async def update_consultation_session(
 
 async def get_or_create_user(email: str, unsubscribe_token: str) -> dict:
     """Get an existing user or create a new one by email."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM users WHERE email = ?", (email,)
@@ -1341,7 +1424,7 @@ async def create_auth_code(email: str, code: str, expires_at: str) -> dict:
     code_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             """
             INSERT INTO auth_codes (id, email, code, expires_at, created_at)
@@ -1358,7 +1441,7 @@ async def verify_auth_code(email: str, code: str) -> bool:
     """Check if a valid, unused, unexpired auth code exists for this email."""
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         cursor = await db.execute(
             """
             SELECT id FROM auth_codes
@@ -1389,7 +1472,7 @@ async def verify_auth_code(email: str, code: str) -> bool:
 
 async def count_recent_auth_codes(email: str, since: str) -> int:
     """Count auth codes sent to an email since a given timestamp (rate limiting)."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         cursor = await db.execute(
             "SELECT COUNT(*) FROM auth_codes WHERE email = ? AND created_at > ?",
             (email, since),
@@ -1402,7 +1485,7 @@ async def create_auth_session(user_id: str, expires_at: str) -> str:
     token = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             """
             INSERT INTO auth_sessions (id, user_id, created_at, expires_at)
@@ -1419,7 +1502,7 @@ async def get_user_by_token(token: str) -> dict | None:
     """Look up a user by their session token. Returns None if invalid/expired."""
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
@@ -1448,7 +1531,7 @@ async def get_user_by_token(token: str) -> dict | None:
 
 async def delete_auth_session(token: str) -> bool:
     """Delete a session token (logout)."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         cursor = await db.execute(
             "DELETE FROM auth_sessions WHERE id = ?", (token,)
         )
@@ -1458,7 +1541,7 @@ async def delete_auth_session(token: str) -> bool:
 
 async def get_user_by_email(email: str) -> dict | None:
     """Look up a user by email."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM users WHERE email = ?", (email,)
@@ -1484,7 +1567,7 @@ async def unsubscribe_user(unsubscribe_token: str) -> dict | None:
     """Unsubscribe a user via their unsubscribe token."""
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM users WHERE unsubscribe_token = ?",
@@ -1518,7 +1601,7 @@ async def claim_sessions(user_id: str, session_ids: list[str]) -> int:
         return 0
 
     claimed = 0
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         for sid in session_ids:
             cursor = await db.execute(
                 "UPDATE consultation_sessions SET user_id = ? WHERE id = ? AND user_id IS NULL",
@@ -1532,7 +1615,7 @@ async def claim_sessions(user_id: str, session_ids: list[str]) -> int:
 
 async def get_user_consultation_sessions(user_id: str) -> list[dict]:
     """Get all consultation sessions belonging to a user."""
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
@@ -1576,7 +1659,7 @@ async def create_knowledge_update(
     update_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with _writer() as db:
         await db.execute(
             """
             INSERT INTO knowledge_base_updates (id, title, description, domains, topics, created_at)
@@ -1607,7 +1690,7 @@ async def get_matching_subscribers_for_update(domains: list[str] | None) -> list
         return []
 
     placeholders = ",".join("?" for _ in domains)
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             f"""
@@ -1639,7 +1722,7 @@ async def get_pending_followups_with_users() -> list[dict]:
     """Get pending follow-ups with user email info (via consultation_sessions.user_id)."""
     now = datetime.now(timezone.utc).isoformat()
 
-    async with aiosqlite.connect(_get_db_path()) as db:
+    async with reader() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
@@ -1676,3 +1759,102 @@ async def get_pending_followups_with_users() -> list[dict]:
         }
         for row in rows
     ]
+
+
+# ===========================================================================
+# Background Jobs
+# ===========================================================================
+# Durable queue behind core/jobs.py. A job is claimed by setting it to
+# 'running' with a lease (locked_until); a worker that dies mid-job leaves
+# the lease to expire and the job is claimed again.
+
+async def enqueue_job(kind: str, payload: dict) -> int:
+    """Persist a job for the background workers. Returns its id."""
+    now = datetime.now(timezone.utc).isoformat()
+    async with _writer() as db:
+        cursor = await db.execute(
+            """INSERT INTO background_jobs (kind, payload, status, run_after, created_at, updated_at)
+               VALUES (?, ?, 'pending', ?, ?, ?)""",
+            (kind, json.dumps(payload), now, now, now),
+        )
+        await db.commit()
+        return cursor.lastrowid
+
+
+async def claim_job(lease_seconds: float) -> dict | None:
+    """Atomically claim the oldest runnable job (pending and due, or running
+    with an expired lease). Returns None when there is nothing to do."""
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    locked_until = (now + timedelta(seconds=lease_seconds)).isoformat()
+    async with _writer() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """UPDATE background_jobs
+               SET status = 'running', attempts = attempts + 1,
+                   locked_until = ?, updated_at = ?
+               WHERE id = (
+                   SELECT id FROM background_jobs
+                   WHERE (status = 'pending' AND run_after <= ?)
+                      OR (status = 'running' AND locked_until < ?)
+                   ORDER BY id LIMIT 1
+               )
+               RETURNING id, kind, payload, attempts""",
+            (locked_until, now_iso, now_iso, now_iso),
+        )
+        row = await cursor.fetchone()
+        await db.commit()
+    if row is None:
+        return None
+    return {
+        "id": row["id"],
+        "kind": row["kind"],
+        "payload": json.loads(row["payload"]),
+        "attempts": row["attempts"],
+    }
+
+
+async def finish_job(job_id: int) -> None:
+    """Mark a claimed job done."""
+    now = datetime.now(timezone.utc).isoformat()
+    async with _writer() as db:
+        await db.execute(
+            "UPDATE background_jobs SET status = 'done', locked_until = NULL, updated_at = ? WHERE id = ?",
+            (now, job_id),
+        )
+        await db.commit()
+
+
+async def fail_job(job_id: int, error: str, retry_in: float | None) -> None:
+    """Record a failed attempt: back to 'pending' after `retry_in` seconds,
+    or 'failed' for good when retry_in is None."""
+    now = datetime.now(timezone.utc)
+    status = "failed" if retry_in is None else "pending"
+    run_after = (now + timedelta(seconds=retry_in or 0)).isoformat()
+    async with _writer() as db:
+        await db.execute(
+            """UPDATE background_jobs
+               SET status = ?, last_error = ?, run_after = ?, locked_until = NULL, updated_at = ?
+               WHERE id = ?""",
+            (status, error[:1000], run_after, now.isoformat(), job_id),
+        )
+        await db.commit()
+
+
+async def get_job_counts() -> dict[str, int]:
+    """Number of jobs per status."""
+    async with reader() as db:
+        cursor = await db.execute("SELECT status, COUNT(*) FROM background_jobs GROUP BY status")
+        return {row[0]: row[1] for row in await cursor.fetchall()}
+
+
+async def purge_finished_jobs(older_than_days: int) -> int:
+    """Delete 'done' jobs older than the given age. Returns rows removed."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+    async with _writer() as db:
+        cursor = await db.execute(
+            "DELETE FROM background_jobs WHERE status = 'done' AND updated_at < ?",
+            (cutoff,),
+        )
+        await db.commit()
+        return cursor.rowcount
@@ -0,0 +1,257 @@
+from __future__ import annotations
+"""
+Fluidoracle — SQLite Connection Manager
+========================================
+Every database function used to open its own aiosqlite connection (a new
+thread and a new SQLite handle) and close it again: five to ten per
+consultation turn. The manager opened from main.py's lifespan keeps them
+open instead:
+
+  writer    one connection, serialized by a lock — SQLite admits one writer
+            at a time anyway; queuing here avoids busy-waiting on its lock
+  readers   DB_READERS connections, checked out from a pool; with WAL they
+            read while the writer writes
+
+Every connection runs in WAL mode with synchronous=NORMAL (durable at each
+checkpoint rather than each commit — safe in WAL), a memory map of
+DB_MMAP_SIZE bytes, a busy timeout, and a prepared-statement cache of
+DB_STATEMENT_CACHE statements. Readers are opened query_only.
+
+core/database.py takes its connections from writer() and reader(). A
+checked-out connection comes back with row_factory reset, and a writer
+released with uncommitted work is rolled back — as closing a connection
+did before.
+
+Code on a worker thread (the answer engine's) reads through sync_reader():
+one sqlite3 connection per thread, opened read-only with the same pragmas
+and kept until stop().
+
+transaction() runs several database calls as one unit:
+
+    async with database.transaction():
+        await database.update_consultation_session(...)
+        await database.add_consultation_message(...)
+
+Calls inside it share the transaction's writer connection (their own
+commits are deferred to the end of the block; their reads see its writes),
+and an exception rolls the whole block back. Only the task that opened the
+block joins it; tasks it starts queue for the writer like any other.
+
+When the manager is not started (scripts, tests, before startup) writer(),
+reader() and sync_reader() open a connection per call, as before.
+
+Config (env):
+  DB_READERS            pooled reader connections (default 4)
+  DB_MMAP_SIZE          bytes of the database file memory-mapped (default 268435456)
+  DB_STATEMENT_CACHE    prepared statements cached per connection (default 256)
+  DB_BUSY_TIMEOUT       seconds to wait on a lock held by another process (default 5)
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+
+
+async def _connect(path: str, query_only: bool = False) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(path, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_STATEMENT_CACHE)
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    await conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    if query_only:
+        await conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+def _connect_sync(path: str) -> sqlite3.Connection:
+    """A read-only sqlite3 connection set up like a pooled reader."""
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_STATEMENT_CACHE,
+                           check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute("PRAGMA query_only=ON")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class _Joined:
+    """The connection of an open transaction, as seen by a call inside it:
+    everything is delegated except commit, which waits for the transaction."""
+
+    def __init__(self, conn: aiosqlite.Connection):
+        object.__setattr__(self, "_conn", conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    async def commit(self) -> None:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Manager
+# ---------------------------------------------------------------------------
+
+_path = ""
+_writer: aiosqlite.Connection | None = None
+_write_lock: asyncio.Lock | None = None
+_readers: asyncio.Queue | None = None
+_all_readers: list[aiosqlite.Connection] = []
+
+# sync_reader() connections: one per worker thread, closed by stop()
+_thread_readers = threading.local()
+_sync_readers: list[sqlite3.Connection] = []
+_sync_lock = threading.Lock()
+
+# (connection, task) of the transaction() block the current task is in.
+# Tasks started inside the block inherit the variable but not the transaction.
+_transaction: contextvars.ContextVar[tuple | None] = contextvars.ContextVar("db_transaction", default=None)
+
+
+def _joined() -> aiosqlite.Connection | None:
+    current = _transaction.get()
+    if current is None or current[1] is not asyncio.current_task():
+        return None
+    return current[0]
+
+
+def is_open() -> bool:
+    return _writer is not None
+
+
+async def start(path: str) -> None:
+    """Open the writer and the reader pool (from main.py's lifespan)."""
+    global _path, _writer, _write_lock, _readers
+    if _writer is not None:
+        return
+    writer_conn = await _connect(path)
+    readers = [await _connect(path, query_only=True) for _ in range(max(DB_READERS, 1))]
+    _path, _writer, _write_lock = path, writer_conn, asyncio.Lock()
+    _readers = asyncio.Queue()
+    _all_readers[:] = readers
+    for conn in readers:
+        _readers.put_nowait(conn)
+    logger.info(f"[db_pool] opened {path}: 1 writer, {len(readers)} readers, WAL")
+
+
+async def stop() -> None:
+    """Close every pooled connection (at shutdown)."""
+    global _writer, _write_lock, _readers
+    writer_conn, readers = _writer, list(_all_readers)
+    _writer, _write_lock, _readers = None, None, None
+    _all_readers.clear()
+    for conn in ([writer_conn] if writer_conn else []) + readers:
+        try:
+            await conn.close()
+        except Exception as e:
+            logger.warning(f"[db_pool] close failed: {e}")
+    with _sync_lock:
+        sync_readers = list(_sync_readers)
+        _sync_readers.clear()
+    for conn in sync_readers:
+        conn.close()
+
+
+def _reset(conn: aiosqlite.Connection) -> None:
+    conn.row_factory = None
+
+
+@asynccontextmanager
+async def writer(path: str) -> AsyncIterator[aiosqlite.Connection]:
+    """The writer connection, held exclusively until the block exits."""
+    joined = _joined()
+    if joined is not None:
+        _reset(joined)
+        yield _Joined(joined)
+        return
+    if _writer is None or path != _path:
+        async with aiosqlite.connect(path) as conn:
+            yield conn
+        return
+    async with _write_lock:
+        conn = _writer
+        _reset(conn)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+
+
+@asynccontextmanager
+async def reader(path: str) -> AsyncIterator[aiosqlite.Connection]:
+    """A read-only connection from the pool."""
+    joined = _joined()
+    if joined is not None:
+        _reset(joined)
+        yield _Joined(joined)
+        return
+    if _readers is None or path != _path:
+        async with aiosqlite.connect(path) as conn:
+            yield conn
+        return
+    queue = _readers
+    conn = await queue.get()
+    try:
+        _reset(conn)
+        yield conn
+    finally:
+        queue.put_nowait(conn)
+
+
+@contextmanager
+def sync_reader(path: str) -> Iterator[sqlite3.Connection]:
+    """A read-only sqlite3 connection (rows as sqlite3.Row) for the calling
+    thread, kept for its next read while the manager is open."""
+    if _writer is None or path != _path:
+        conn = _connect_sync(path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+    conn = getattr(_thread_readers, "conn", None)
+    with _sync_lock:
+        if conn is None or conn not in _sync_readers:
+            conn = _connect_sync(path)
+            _sync_readers.append(conn)
+            _thread_readers.conn = conn
+    yield conn
+
+
+@asynccontextmanager
+async def transaction(path: str) -> AsyncIterator[aiosqlite.Connection]:
+    """One write transaction across several database calls; committed when
+    the block exits, rolled back if it raises. Nested blocks join the outer one."""
+    if _joined() is not None:
+        async with writer(path) as conn:
+            yield conn
+        return
+    async with writer(path) as conn:
+        await conn.execute("BEGIN IMMEDIATE")
+        token = _transaction.set((conn, asyncio.current_task()))
+        try:
+            yield _Joined(conn)
+        except BaseException:
+            _transaction.reset(token)
+            await conn.rollback()
+            raise
+        _transaction.reset(token)
+        await conn.commit()
@@ -0,0 +1,275 @@
+from __future__ import annotations
+"""
+Fluidoracle — Engine Executor
+==============================
+Shared thread pool for the blocking engine calls that async route handlers
+make (answer / consultation / invention generation: retrieval plus the sync
+Anthropic client). Running them inline in an `async def` stalls the event
+loop for every other request on the worker.
+
+Work is admitted per vertical:
+
+  ENGINE_MAX_CONCURRENT   calls per vertical running at once (default 4)
+  ENGINE_MAX_QUEUED       further calls allowed to wait for a slot (default 16)
+  ENGINE_QUEUE_TIMEOUT    seconds a queued call waits before giving up (default 30)
+  ENGINE_THREADS          size of the shared pool (default 32)
+  ENGINE_MAX_STREAMS      async streams per vertical running at once (default 64)
+
+Async streams (the consultation SSE route) hold no pool thread while they
+wait on the model, so they are admitted on a separate, much larger
+per-vertical lane (acquire_slot(..., stream=True)) and do not crowd out the
+blocking calls that do occupy the pool.
+
+Admission also tags the request's context with its vertical, so the LLM
+calls made for it are metered against that vertical's buckets
+(core/llm_gateway.py); the context is carried into the pool threads.
+
+When a vertical's queue is full, or a queued call times out, EngineOverloaded
+is raised at once; the app's exception handler turns it into a 503 with
+Retry-After (overloaded_response()) instead of piling more threads onto a
+stalled server.
+
+Per-vertical counters — in flight, queued, peak queue depth, completed,
+rejected, mean queue wait — are returned by engine_stats() and served on
+/api/admin/engine-stats.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import anyio
+
+from core import llm_gateway
+
+ENGINE_THREADS = int(os.getenv("ENGINE_THREADS", "32"))
+ENGINE_MAX_CONCURRENT = int(os.getenv("ENGINE_MAX_CONCURRENT", "4"))
+ENGINE_MAX_STREAMS = int(os.getenv("ENGINE_MAX_STREAMS", "64"))
+ENGINE_MAX_QUEUED = int(os.getenv("ENGINE_MAX_QUEUED", "16"))
+ENGINE_QUEUE_TIMEOUT = float(os.getenv("ENGINE_QUEUE_TIMEOUT", "30"))
+ENGINE_RETRY_AFTER = int(os.getenv("ENGINE_RETRY_AFTER", "5"))
+
+
+class EngineOverloaded(Exception):
+    """Raised when a vertical has no free slot and no room left to queue."""
+
+    def __init__(self, vertical_id: str, reason: str):
+        super().__init__(f"Engine overloaded for vertical '{vertical_id}': {reason}")
+        self.vertical_id = vertical_id
+        self.reason = reason
+
+
+# ---------------------------------------------------------------------------
+# Per-vertical lanes
+# ---------------------------------------------------------------------------
+
+class _Lane:
+    """Admission state for one vertical (bound to the running event loop)."""
+
+    def __init__(self, max_concurrent: int):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_ms_total = 0.0
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_lanes: dict[str, _Lane] = {}
+_stream_lanes: dict[str, _Lane] = {}
+_lanes_loop = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ENGINE_THREADS, thread_name_prefix="engine")
+    return _executor
+
+
+def _lane(vertical_id: str, stream: bool = False) -> _Lane:
+    global _lanes_loop
+    loop = asyncio.get_running_loop()
+    if loop is not _lanes_loop:
+        # Semaphores belong to one loop; a new loop (tests, reload) starts fresh
+        _lanes.clear()
+        _stream_lanes.clear()
+        _lanes_loop = loop
+    lanes = _stream_lanes if stream else _lanes
+    lane = lanes.get(vertical_id)
+    if lane is None:
+        lane = lanes[vertical_id] = _Lane(ENGINE_MAX_STREAMS if stream else ENGINE_MAX_CONCURRENT)
+    return lane
+
+
+class EngineSlot:
+    """One admitted unit of work for a vertical. release() is idempotent."""
+
+    def __init__(self, lane: _Lane):
+        self._lane = lane
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._lane.in_flight -= 1
+        self._lane.completed += 1
+        self._lane.semaphore.release()
+
+
+async def acquire_slot(vertical_id: str | None, stream: bool = False) -> EngineSlot:
+    """Wait for one of the vertical's concurrency slots.
+
+    Raises EngineOverloaded if the queue is full or the wait exceeds
+    ENGINE_QUEUE_TIMEOUT. Streaming routes acquire before returning the
+    StreamingResponse (so overload is a clean 503, not a broken stream)
+    and release when the response is done with (on_close). stream=True
+    takes a slot on the vertical's async-stream lane (ENGINE_MAX_STREAMS)
+    instead of the pool-bound one.
+    """
+    vid = vertical_id or "default"
+    lane = _lane(vid, stream)
+
+    # Counters, not semaphore.locked(): requests admitted in the same tick
+    # are all still "queued" until their acquire() task runs.
+    if lane.in_flight + lane.queued >= lane.max_concurrent + ENGINE_MAX_QUEUED:
+        lane.rejected += 1
+        raise EngineOverloaded(vid, f"{lane.queued} requests already queued")
+
+    lane.queued += 1
+    lane.peak_queued = max(lane.peak_queued, lane.queued)
+    t0 = time.perf_counter()
+    try:
+        await asyncio.wait_for(lane.semaphore.acquire(), timeout=ENGINE_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        lane.rejected += 1
+        raise EngineOverloaded(vid, f"no slot within {ENGINE_QUEUE_TIMEOUT:.0f}s")
+    finally:
+        lane.queued -= 1
+    lane.wait_ms_total += (time.perf_counter() - t0) * 1000
+    lane.in_flight += 1
+    llm_gateway.set_vertical(vid)
+    return EngineSlot(lane)
+
+
+@asynccontextmanager
+async def engine_slot(vertical_id: str | None):
+    """Hold one of the vertical's slots for the duration of the block."""
+    slot = await acquire_slot(vertical_id)
+    try:
+        yield slot
+    finally:
+        slot.release()
+
+
+async def run_in_pool(fn, *args, **kwargs):
+    """Run a blocking engine call in the shared pool. Admission is the
+    caller's job (hold an EngineSlot) — see run_engine()."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), lambda: context.run(fn, *args, **kwargs))
+
+
+async def run_engine(vertical_id: str | None, fn, *args, **kwargs):
+    """Run a blocking engine call in the shared pool under the vertical's limit."""
+    async with engine_slot(vertical_id):
+        return await run_in_pool(fn, *args, **kwargs)
+
+
+_EXHAUSTED = object()
+
+
+def _next_or_exhausted(iterator):
+    try:
+        return next(iterator)
+    except StopIteration:
+        return _EXHAUSTED
+
+
+def _close_after(pending, close) -> None:
+    # A generator cannot be closed while a next() on it is still running
+    if pending is not None:
+        try:
+            pending.result()
+        except BaseException:
+            pass
+    close()
+
+
+async def iterate_in_executor(sync_gen):
+    """Drive a blocking generator from the shared pool, yielding its items asynchronously.
+
+    Admission is the caller's job (hold an EngineSlot for the stream).
+    If the consumer goes away (aclose, or cancellation on client
+    disconnect), the generator is closed once its in-flight next() returns,
+    so its GeneratorExit handling — e.g. closing an upstream LLM stream —
+    runs promptly.
+    """
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    iterator = iter(sync_gen)
+    pending = None
+    try:
+        while True:
+            pending = executor.submit(contextvars.copy_context().run, _next_or_exhausted, iterator)
+            item = await asyncio.wrap_future(pending)
+            if item is _EXHAUSTED:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            with anyio.CancelScope(shield=True):
+                await loop.run_in_executor(executor, _close_after, pending, close)
+
+
+# ---------------------------------------------------------------------------
+# Metrics / responses
+# ---------------------------------------------------------------------------
+
+def _lane_stats(lanes: dict[str, _Lane]) -> dict:
+    return {
+        vid: {
+            "in_flight": lane.in_flight,
+            "queued": lane.queued,
+            "peak_queued": lane.peak_queued,
+            "completed": lane.completed,
+            "rejected": lane.rejected,
+            "mean_wait_ms": round(lane.wait_ms_total / lane.completed, 2) if lane.completed else 0.0,
+        }
+        for vid, lane in lanes.items()
+    }
+
+
+def engine_stats() -> dict:
+    """Queue depth and throughput counters per vertical, pool-bound and async streams."""
+    return {
+        "threads": ENGINE_THREADS,
+        "max_concurrent_per_vertical": ENGINE_MAX_CONCURRENT,
+        "max_streams_per_vertical": ENGINE_MAX_STREAMS,
+        "max_queued_per_vertical": ENGINE_MAX_QUEUED,
+        "queue_timeout_s": ENGINE_QUEUE_TIMEOUT,
+        "verticals": _lane_stats(_lanes),
+        "streams": _lane_stats(_stream_lanes),
+    }
+
+
+def overloaded_response(exc: EngineOverloaded):
+    """Well-formed 503 for an overloaded vertical."""
+    from fastapi.responses import JSONResponse
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy — please retry shortly.", "vertical": exc.vertical_id},
+        headers={"Retry-After": str(ENGINE_RETRY_AFTER)},
+    )
@@ -0,0 +1,339 @@
+from __future__ import annotations
+"""
+Fluidoracle — Hedged Model Requests
+====================================
+Primary / fallback model races for the Claude calls.
+
+Without hedging, the fallback model is tried only after the primary has
+failed or refused, so a slow primary costs its full latency before anything
+else happens. With LLM_HEDGING on, a call whose primary lane has produced
+nothing viable — no first token for a stream, no response for a plain
+call — within HEDGE_AFTER_SECONDS starts the fallback lane alongside it.
+The first lane with a viable first item wins; the loser is cancelled. A
+lane that fails outright hands over to the next at once, hedging or not.
+
+A lane is one model attempt (or, for generate_answer, a model's chain of
+retry strategies) written as a generator: its first item decides the race,
+the winner's generator is handed back to the caller to continue. Losers:
+
+  async lanes        cancelled; a stream's partial usage is recorded
+  sync streams       the HTTP stream is closed from the racing thread
+  sync plain calls   cannot be interrupted; they finish and are recorded
+
+Whatever a loser consumed is written to llm_usage with hedge_loser=1 and
+added to the counters here, so the token cost of hedging is visible next
+to the latency it buys.
+
+Config (env):
+  LLM_HEDGING            on/off (default false)
+  HEDGE_AFTER_SECONDS    first-token / response threshold before the
+                         fallback starts (default 4)
+  HEDGE_THREADS          threads for racing sync lanes (default 16)
+  HEDGE_LATENCY_WINDOW   latency samples kept per call type (default 2000)
+
+Per call type — time to first viable item p50/p95/p99, hedges started,
+wins per lane — plus loser tokens and cost are returned by hedge_stats()
+and served on /api/admin/hedge-stats.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Callable, Iterator
+
+from core.streaming import shielded
+
+logger = logging.getLogger(__name__)
+
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+HEDGE_AFTER_SECONDS = float(os.getenv("HEDGE_AFTER_SECONDS", "4"))
+HEDGE_THREADS = int(os.getenv("HEDGE_THREADS", "16"))
+HEDGE_LATENCY_WINDOW = int(os.getenv("HEDGE_LATENCY_WINDOW", "2000"))
+
+_NOTHING = object()
+
+
+class Lane:
+    """One model attempt in a race. `lost` is set once another lane has won."""
+
+    def __init__(self, index: int, model: str):
+        self.index = index
+        self.model = model
+        self.lost = False
+        self.stream = None  # a sync lane's open stream, so a loser can be closed
+
+    def cancel(self) -> None:
+        """Mark as lost and close a sync lane's stream (unblocks its read)."""
+        self.lost = True
+        stream = self.stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+_latency: dict[str, deque] = {}
+_counts: Counter = Counter()
+_metrics_lock = threading.Lock()
+
+
+def _record_latency(label: str, seconds: float) -> None:
+    with _metrics_lock:
+        samples = _latency.get(label)
+        if samples is None:
+            samples = _latency[label] = deque(maxlen=HEDGE_LATENCY_WINDOW)
+        samples.append(seconds)
+
+
+def _count(key: str, n: int = 1) -> None:
+    with _metrics_lock:
+        _counts[key] += n
+
+
+def record_loser(usage, model: str, phase: str, **tags) -> None:
+    """Persist what a losing lane consumed (llm_usage.hedge_loser = 1);
+    `tags` are extra llm_usage columns (the routing decision)."""
+    import core.database as database
+
+    try:
+        _, output_tokens, cache_write, cache_read, cost = database._usage_row(usage, model)
+        input_tokens = getattr(usage, "input_tokens", 0) or 0
+        with _metrics_lock:
+            _counts["loser:input_tokens"] += input_tokens + cache_write + cache_read
+            _counts["loser:output_tokens"] += output_tokens
+            _counts["loser:cost_microusd"] += round(cost * 1_000_000)
+        database.log_llm_usage_sync(usage, model, phase, hedge_loser=True, **tags)
+    except Exception as e:
+        logger.warning(f"[hedging] could not record losing lane: {e}")
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def hedge_stats() -> dict:
+    """Latency percentiles and race outcomes per call type, plus loser cost."""
+    with _metrics_lock:
+        counts = dict(_counts)
+        latency = {label: list(samples) for label, samples in _latency.items()}
+    labels = sorted({k.split(":", 1)[0] for k in counts if not k.startswith("loser:")} | set(latency))
+    return {
+        "enabled": LLM_HEDGING,
+        "hedge_after_s": HEDGE_AFTER_SECONDS,
+        "calls": {
+            label: {
+                "calls": counts.get(f"{label}:calls", 0),
+                "hedged": counts.get(f"{label}:hedged", 0),
+                "won_by_primary": counts.get(f"{label}:won:0", 0),
+                "won_by_fallback": counts.get(f"{label}:won:1", 0),
+                "failed": counts.get(f"{label}:failed", 0),
+                **({
+                    f"first_item_{name}_ms": round(_percentile(latency[label], q) * 1000, 1)
+                    for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+                } if latency.get(label) else {}),
+            }
+            for label in labels
+        },
+        "loser": {
+            "input_tokens": counts.get("loser:input_tokens", 0),
+            "output_tokens": counts.get("loser:output_tokens", 0),
+            "estimated_cost_usd": round(counts.get("loser:cost_microusd", 0) / 1_000_000, 4),
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Sync race (threads)
+# ---------------------------------------------------------------------------
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="hedge")
+    return _pool
+
+
+def _first(gen: Iterator):
+    try:
+        return next(gen)
+    except StopIteration:
+        return _NOTHING
+
+
+def _close_when_done(pending, gen: Iterator) -> None:
+    # A generator cannot be closed while its next() is still running
+    try:
+        pending.result()
+    except BaseException:
+        pass
+    gen.close()
+
+
+def race(
+    lanes: list[Lane],
+    start: Callable[[Lane], Iterator],
+    viable: Callable[[object], bool],
+    label: str,
+) -> tuple[Lane | None, Iterator | None, object]:
+    """Race sync generator lanes on their first item.
+
+    Returns (winning lane, its generator positioned after the first item,
+    that item). If no lane yields a viable first item, returns
+    (None, None, the last lane's first item).
+    """
+    _count(f"{label}:calls")
+    t0 = time.perf_counter()
+    pool = _get_pool()
+    running: dict = {}
+    launched = 0
+    last_start = t0
+    failure = _NOTHING
+
+    def _launch():
+        nonlocal launched, last_start
+        lane = lanes[launched]
+        launched += 1
+        last_start = time.perf_counter()
+        gen = start(lane)
+        running[pool.submit(contextvars.copy_context().run, _first, gen)] = (lane, gen)
+
+    _launch()
+    while running:
+        timeout = None
+        if LLM_HEDGING and launched < len(lanes):
+            timeout = max(HEDGE_AFTER_SECONDS - (time.perf_counter() - last_start), 0)
+        done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            logger.info(f"[hedging] {label}: nothing from {lanes[launched - 1].model} "
+                        f"after {HEDGE_AFTER_SECONDS:.1f}s — starting {lanes[launched].model}")
+            _count(f"{label}:hedged")
+            _launch()
+            continue
+
+        for fut in sorted(done, key=lambda f: running[f][0].index):
+            lane, gen = running.pop(fut)
+            try:
+                item = fut.result()
+            except Exception as e:
+                logger.warning(f"[hedging] {label}: lane {lane.model} raised: {e}")
+                item = _NOTHING
+            if item is not _NOTHING and viable(item):
+                for other_fut, (other, other_gen) in running.items():
+                    other.cancel()
+                    pool.submit(_close_when_done, other_fut, other_gen)
+                _record_latency(label, time.perf_counter() - t0)
+                _count(f"{label}:won:{lane.index}")
+                return lane, gen, item
+            gen.close()
+            if lane.index == len(lanes) - 1 or failure is _NOTHING:
+                failure = item
+            if launched < len(lanes):
+                _launch()
+
+    _count(f"{label}:failed")
+    return None, None, (None if failure is _NOTHING else failure)
+
+
+# ---------------------------------------------------------------------------
+# Async race (tasks)
+# ---------------------------------------------------------------------------
+
+async def _first_async(gen: AsyncIterator):
+    try:
+        return await gen.__anext__()
+    except StopAsyncIteration:
+        return _NOTHING
+
+
+async def race_async(
+    lanes: list[Lane],
+    start: Callable[[Lane], AsyncIterator],
+    viable: Callable[[object], bool],
+    label: str,
+) -> tuple[Lane | None, AsyncIterator | None, object]:
+    """Async race(): lanes are async generators, losers are cancelled.
+
+    If the race itself is cancelled (client disconnect), every running lane
+    is cancelled too, and closes its upstream stream.
+    """
+    _count(f"{label}:calls")
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    running: dict[asyncio.Task, tuple[Lane, AsyncIterator]] = {}
+    launched = 0
+    last_start = t0
+    failure = _NOTHING
+
+    def _launch():
+        nonlocal launched, last_start
+        lane = lanes[launched]
+        launched += 1
+        last_start = loop.time()
+        gen = start(lane)
+        running[asyncio.ensure_future(_first_async(gen))] = (lane, gen)
+
+    async def _stop(tasks: dict, lost: bool) -> None:
+        for task, (lane, _) in tasks.items():
+            lane.lost = lost
+            task.cancel()
+        with shielded():
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for _, gen in tasks.values():
+                await gen.aclose()
+
+    try:
+        _launch()
+        while running:
+            timeout = None
+            if LLM_HEDGING and launched < len(lanes):
+                timeout = max(HEDGE_AFTER_SECONDS - (loop.time() - last_start), 0)
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.info(f"[hedging] {label}: nothing from {lanes[launched - 1].model} "
+                            f"after {HEDGE_AFTER_SECONDS:.1f}s — starting {lanes[launched].model}")
+                _count(f"{label}:hedged")
+                _launch()
+                continue
+
+            for task in sorted(done, key=lambda t: running[t][0].index):
+                lane, gen = running.pop(task)
+                try:
+                    item = task.result()
+                except Exception as e:
+                    logger.warning(f"[hedging] {label}: lane {lane.model} raised: {e}")
+                    item = _NOTHING
+                if item is not _NOTHING and viable(item):
+                    losers = dict(running)
+                    running.clear()
+                    await _stop(losers, lost=True)
+                    _record_latency(label, loop.time() - t0)
+                    _count(f"{label}:won:{lane.index}")
+                    return lane, gen, item
+                await gen.aclose()
+                if lane.index == len(lanes) - 1 or failure is _NOTHING:
+                    failure = item
+                if launched < len(lanes):
+                    _launch()
+    except BaseException:
+        await _stop(running, lost=False)
+        raise
+
+    _count(f"{label}:failed")
+    return None, None, (None if failure is _NOTHING else failure)
@@ -9,6 +9,7 @@ full conversation history with fresh RAG retrieval on every turn.
 """
 
 import os
+import time
 from pathlib import Path
 
 # ---------------------------------------------------------------------------
@@ -17,7 +18,10 @@ from pathlib import Path
 import anthropic
 from dotenv import load_dotenv
 
+from core import llm_gateway, model_router
+from core.context_packer import message_tokens
 from core.database import log_llm_usage_sync
+from core.prompt_cache import cached_messages, cached_system
 
 # Load env from project root
 _PROJECT_ROOT = Path(__file__).parent.parent
@@ -32,7 +36,7 @@ print(f"[invention_engine] Primary model: {INVENT_MODEL}")
 print(f"[invention_engine] Fallback model: {FALLBACK_MODEL}")
 
 # Import from existing RAG pipeline
-from core.retrieval.verified_query import verified_query  # noqa: E402
+from core.retrieval.verified_query import format_relevance, verified_query  # noqa: E402
 
 # ---------------------------------------------------------------------------
 # Anthropic client (shared with answer_engine if both loaded)
@@ -47,7 +51,7 @@ def _get_client() -> anthropic.Anthropic:
             raise RuntimeError(
                 "ANTHROPIC_API_KEY not set. Add it to your .env file."
             )
-        _client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        _client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=llm_gateway.CLIENT_MAX_RETRIES)
     return _client
 
 
@@ -161,37 +165,42 @@ NON-NEWTONIAN FLUIDS:
 # Internal: call Claude with retry on refusal
 # ===========================================================================
 
-def _call_claude(system: str, messages: list[dict], max_tokens: int = 4000) -> tuple:
+def _call_claude(system: str | list[dict], messages: list[dict], max_tokens: int = 4000) -> tuple:
     """Call Claude API with automatic fallback on refusal.
 
     Returns:
         (response_text, model_used)
     """
     client = _get_client()
+    route = model_router.route("invention", "invention", message_tokens(messages), INVENT_MODEL, FALLBACK_MODEL)
 
-    # Try primary model first
-    for model in [INVENT_MODEL, FALLBACK_MODEL]:
+    # Try the routed model first
+    for model in route.models():
         print(f"[invention_engine] Trying model: {model}")
+        started = time.time()
 
-        response = client.messages.create(
+        response = llm_gateway.call(model, lambda: client.messages.create(
             model=model,
             max_tokens=max_tokens,
             system=system,
             messages=messages,
-        )
+        ), llm_gateway.estimate_tokens(system, messages))
 
         print(f"[invention_engine] model={response.model} stop_reason={response.stop_reason} "
               f"input_tokens={response.usage.input_tokens} output_tokens={response.usage.output_tokens}")
-        log_llm_usage_sync(response.usage, response.model, "invention")
+        log_llm_usage_sync(
+            response.usage, response.model, "invention",
+            latency_ms=round((time.time() - started) * 1000), **route.tags(model),
+        )
 
         # Check for refusal
         if response.stop_reason == "refusal" or not response.content:
-            if model == FALLBACK_MODEL:
+            if model == route.fallback:
                 # Both models refused — return error
                 print(f"[invention_engine] Both models refused.")
                 return ("Unable to generate a response. Both primary and fallback models declined.", model)
             else:
-                print(f"[invention_engine] {model} refused. Retrying with {FALLBACK_MODEL}...")
+                print(f"[invention_engine] {model} refused. Retrying with {route.fallback}...")
                 continue
 
         # Extract text from response
@@ -201,7 +210,7 @@ def _call_claude(system: str, messages: list[dict], max_tokens: int = 4000) -> t
 
         return ("The model returned a response but no text content.", response.model)
 
-    return ("Unable to generate a response.", FALLBACK_MODEL)
+    return ("Unable to generate a response.", route.fallback)
 
 
 # ===========================================================================
@@ -261,10 +270,10 @@ def generate_invention_response(
     context_parts = []
     for i, result in enumerate(rag_result["results"], 1):
         source = result.get("source", "unknown")
-        score = result.get("rerank_score", 0.0)
+        score = result.get("rerank_score")
         text = result.get("parent_text", "")
         context_parts.append(
-            f"--- Source [{i}]: {source} (relevance: {score:.3f}) ---\n{text}"
+            f"--- Source [{i}]: {source} (relevance: {format_relevance(score)}) ---\n{text}"
         )
 
     if context_parts:
@@ -275,14 +284,6 @@ def generate_invention_response(
     confidence_level = rag_result["confidence"]["level"]
 
     # Step 3: Build the messages array for Claude
-    # Use the same structured format as the working answer_engine
-    messages = []
-    for msg in conversation_history:
-        messages.append({
-            "role": msg["role"],
-            "content": msg["content"],
-        })
-
     # Format user message with labeled sections (matches answer_engine style)
     augmented_user_message = f"""RETRIEVAL CONFIDENCE: {confidence_level}
 
@@ -292,14 +293,12 @@ RETRIEVED CONTEXT:
 USER MESSAGE:
 {user_message}"""
 
-    messages.append({
-        "role": "user",
-        "content": augmented_user_message,
-    })
+    # History prefix is marked for prompt caching; the new turn follows it
+    messages = cached_messages(conversation_history, augmented_user_message)
 
     # Step 4: Call Claude with automatic fallback on refusal
     response_text, model_used = _call_claude(
-        system=INVENTION_SYSTEM_PROMPT,
+        system=cached_system(INVENTION_SYSTEM_PROMPT),
         messages=messages,
     )
     print(f"[invention_engine] Final response from: {model_used}")
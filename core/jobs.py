@@ -0,0 +1,247 @@
+from __future__ import annotations
+"""
+Fluidoracle — Background Jobs
+==============================
+In-process, durable queue for side work that does not have to finish
+before the response: session titles, training-data logs, outcome
+follow-up scheduling and off-vertical demand checks.
+
+Routes call enqueue(); the job is written to the background_jobs table
+and a worker task is woken. Workers (asyncio tasks started from main.py's
+lifespan) claim jobs atomically in SQLite, so several uvicorn workers can
+share the table, and hold each for a lease. A job whose worker died
+mid-run — or whose process restarted before it ran — is picked up again
+once the lease expires or on the next poll. Failures are retried with
+exponential backoff up to JOB_MAX_ATTEMPTS, then left as 'failed' with
+the error recorded.
+
+Handlers must be safe to run more than once for the same payload.
+
+Config (env):
+  JOB_WORKERS          worker tasks per process (default 2)
+  JOB_POLL_INTERVAL    seconds between polls when idle (default 2)
+  JOB_LEASE_SECONDS    how long a claimed job is held (default 300)
+  JOB_MAX_ATTEMPTS     attempts before a job is marked failed (default 5)
+  JOB_RETRY_BASE       first retry delay in seconds, doubled per attempt (default 5)
+  JOB_RETENTION_DAYS   finished jobs kept this long (default 7)
+
+Counters — enqueued, completed, retried, failed, by kind — plus the table's
+per-status counts are returned by job_stats() and served on
+/api/admin/job-stats.
+"""
+
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+import core.database as database
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "5"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+# Outcome follow-ups scheduled when a consultation reaches a recommendation
+FOLLOWUP_STAGES = [("30_day", 30), ("90_day", 90), ("180_day", 180)]
+
+
+# ---------------------------------------------------------------------------
+# Handlers
+# ---------------------------------------------------------------------------
+
+_handlers: dict[str, Callable[[dict], Awaitable[None]]] = {}
+
+
+def job_handler(kind: str):
+    """Register an async handler for a job kind."""
+    def _register(fn):
+        _handlers[kind] = fn
+        return fn
+    return _register
+
+
+@job_handler("session_title")
+async def _session_title(payload: dict) -> None:
+    from core.consultation_engine import generate_session_title
+    title = generate_session_title(payload["first_message"])
+    await database.update_consultation_session(payload["session_id"], title=title)
+
+
+@job_handler("training_log")
+async def _training_log(payload: dict) -> None:
+    import core.training as training
+    if not await asyncio.to_thread(training.log_consultation, **payload):
+        raise RuntimeError("training.log_consultation failed")
+
+
+@job_handler("followup_schedule")
+async def _followup_schedule(payload: dict) -> None:
+    session_id = payload["session_id"]
+    start = datetime.fromisoformat(payload["transitioned_at"])
+    existing = await database.get_followup_stages(session_id)
+    for stage, days in FOLLOWUP_STAGES:
+        if stage not in existing:
+            await database.create_followup_schedule(
+                session_id=session_id,
+                followup_stage=stage,
+                scheduled_date=(start + timedelta(days=days)).isoformat(),
+            )
+
+
+@job_handler("demand_check")
+async def _demand_check(payload: dict) -> None:
+    from core.cross_vertical import check_off_vertical
+    await asyncio.to_thread(check_off_vertical, **payload)
+
+
+# ---------------------------------------------------------------------------
+# Queue
+# ---------------------------------------------------------------------------
+
+_wakeup: asyncio.Event | None = None
+_workers: list[asyncio.Task] = []
+_detached: set[asyncio.Task] = set()
+_stopping = False
+_counts: Counter = Counter()
+
+
+def _get_wakeup() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+async def enqueue(kind: str, **payload) -> int | None:
+    """Queue a job and wake a worker. Returns the job id.
+
+    If the job cannot be persisted it is run as a plain background task
+    instead (not restart-safe, but not lost either); only an unknown kind
+    raises.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    _counts[f"enqueued:{kind}"] += 1
+    try:
+        job_id = await database.enqueue_job(kind, payload)
+    except Exception as e:
+        logger.warning(f"[jobs] could not persist {kind} job, running it directly: {e}")
+        task = asyncio.get_running_loop().create_task(
+            _run({"id": None, "kind": kind, "payload": payload, "attempts": JOB_MAX_ATTEMPTS})
+        )
+        _detached.add(task)
+        task.add_done_callback(_detached.discard)
+        return None
+    _get_wakeup().set()
+    return job_id
+
+
+async def _run(job: dict) -> None:
+    kind, job_id = job["kind"], job["id"]
+    handler = _handlers.get(kind)
+    try:
+        if handler is None:
+            raise RuntimeError(f"no handler for job kind '{kind}'")
+        await handler(job["payload"])
+    except Exception as e:
+        retry = handler is not None and job["attempts"] < JOB_MAX_ATTEMPTS
+        retry_in = JOB_RETRY_BASE * 2 ** (job["attempts"] - 1) if retry else None
+        _counts[f"{'retried' if retry else 'failed'}:{kind}"] += 1
+        logger.warning(
+            f"[jobs] {kind} #{job_id} attempt {job['attempts']} failed: {e}"
+            + (f" — retrying in {retry_in:.0f}s" if retry else " — giving up")
+        )
+        if job_id is not None:
+            try:
+                await database.fail_job(job_id, str(e), retry_in)
+            except Exception as db_error:
+                logger.warning(f"[jobs] could not record failure of #{job_id}: {db_error}")
+        return
+
+    _counts[f"completed:{kind}"] += 1
+    if job_id is not None:
+        try:
+            await database.finish_job(job_id)
+        except Exception as e:
+            # The lease will expire and the (idempotent) job run again
+            logger.warning(f"[jobs] could not mark #{job_id} done: {e}")
+
+
+async def run_pending() -> int:
+    """Run every job that is due right now, in this task. Returns the count.
+
+    Used by the workers and directly by scripts and tests.
+    """
+    ran = 0
+    while True:
+        job = await database.claim_job(JOB_LEASE_SECONDS)
+        if job is None:
+            return ran
+        await _run(job)
+        ran += 1
+
+
+async def _worker(n: int) -> None:
+    wakeup = _get_wakeup()
+    while not _stopping:
+        try:
+            await run_pending()
+        except Exception as e:
+            logger.warning(f"[jobs] worker {n}: {e}")
+        if _stopping:
+            return
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+
+
+async def start(workers: int = JOB_WORKERS) -> None:
+    """Start the worker tasks (call once from the app lifespan)."""
+    global _stopping, _wakeup
+    _stopping = False
+    _wakeup = asyncio.Event()
+    try:
+        purged = await database.purge_finished_jobs(JOB_RETENTION_DAYS)
+        if purged:
+            logger.info(f"[jobs] purged {purged} finished jobs")
+    except Exception as e:
+        logger.warning(f"[jobs] purge failed: {e}")
+    _workers[:] = [asyncio.create_task(_worker(i), name=f"job-worker-{i}") for i in range(workers)]
+    print(f"[startup] Background job workers: {workers}")
+
+
+async def stop(timeout: float = 10.0) -> None:
+    """Stop the workers, letting in-flight jobs finish for up to `timeout`
+    seconds. Jobs not yet run stay in the table for the next start."""
+    global _stopping
+    _stopping = True
+    if _wakeup is not None:
+        _wakeup.set()
+    if not _workers:
+        return
+    done, pending = await asyncio.wait(_workers, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    _workers.clear()
+
+
+async def job_stats() -> dict:
+    """Process counters plus per-status counts from the jobs table."""
+    try:
+        table = await database.get_job_counts()
+    except Exception:
+        table = {}
+    return {
+        "workers": len(_workers),
+        "counters": dict(sorted(_counts.items())),
+        "table": table,
+    }
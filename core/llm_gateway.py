@@ -0,0 +1,588 @@
+from __future__ import annotations
+"""
+Fluidoracle — LLM Gateway
+==========================
+Admission control for every Anthropic call the answer, consultation and
+invention engines make.
+
+Without it, a traffic spike sends every engine at the API at once, and the
+rate-limit errors that follow surface as fallbacks or error strings. Each
+call now passes through here first:
+
+  Token buckets   per model and per vertical, in requests per minute and
+                  estimated input tokens per minute (Anthropic's limits are
+                  per model; the vertical buckets stop one vertical from
+                  starving the others). Output tokens are not metered; a
+                  call's estimate is corrected from its reported usage.
+  Fair queue      a call that does not fit waits in its vertical's FIFO;
+                  verticals are served round-robin. Within a vertical the
+                  queue is FIFO per model: a call whose model is held or
+                  out of budget does not block the vertical's calls to
+                  other models (e.g. the fallback). A call still queued
+                  after LLM_QUEUE_TIMEOUT raises LLMQueueTimeout, which the
+                  engines treat like any other failed call (the fallback
+                  model has its own bucket).
+  Retry           429 / 5xx / overloaded / connection errors are retried
+                  with full-jitter exponential backoff. A retry-after header
+                  is honoured, and also holds the model's bucket so queued
+                  calls for that model wait it out instead of piling in. A
+                  retry-after longer than LLM_BACKOFF_MAX is not waited for.
+
+Streams are admitted and retried only while being opened; once tokens flow
+they are the caller's.
+
+Calls are attributed to the vertical set with set_vertical() — the engine
+executor does this when it admits a request (core/engine_executor.py).
+
+Config (env):
+  LLM_GATEWAY            on/off (default true); off = direct calls with the
+                         SDK's own retries
+  LLM_MODEL_RPM          requests/min per model (default 0 = unlimited)
+  LLM_MODEL_TPM          input tokens/min per model (default 0 = unlimited)
+  LLM_VERTICAL_RPM       requests/min per vertical (default 0 = unlimited)
+  LLM_VERTICAL_TPM       input tokens/min per vertical (default 0 = unlimited)
+  LLM_MODEL_LIMITS       JSON per-model overrides, e.g.
+                         {"claude-opus-4-6": {"rpm": 50, "tpm": 30000}}
+  LLM_VERTICAL_LIMITS    JSON per-vertical overrides, same shape
+  LLM_QUEUE_TIMEOUT      seconds a call may wait for admission (default 60)
+  LLM_MAX_RETRIES        retries per call (default 3)
+  LLM_BACKOFF_BASE       backoff base in seconds (default 1)
+  LLM_BACKOFF_MAX        backoff / retry-after cap in seconds (default 30)
+
+Live queue depth, admission wait (mean / p95 / max), retries and
+rate-limit counts per model and per vertical are returned by
+gateway_stats() and served on /api/admin/llm-gateway.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import anthropic
+
+from core.context_packer import count_tokens, message_tokens
+from core.prompt_cache import system_text
+
+logger = logging.getLogger(__name__)
+
+LLM_GATEWAY = os.getenv("LLM_GATEWAY", "true").lower() == "true"
+LLM_MODEL_RPM = int(os.getenv("LLM_MODEL_RPM", "0"))
+LLM_MODEL_TPM = int(os.getenv("LLM_MODEL_TPM", "0"))
+LLM_VERTICAL_RPM = int(os.getenv("LLM_VERTICAL_RPM", "0"))
+LLM_VERTICAL_TPM = int(os.getenv("LLM_VERTICAL_TPM", "0"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+
+def _limit_overrides(name: str) -> dict:
+    try:
+        return json.loads(os.getenv(name, "") or "{}")
+    except ValueError:
+        logger.warning(f"[llm_gateway] ignoring invalid {name}")
+        return {}
+
+
+LLM_MODEL_LIMITS = _limit_overrides("LLM_MODEL_LIMITS")
+LLM_VERTICAL_LIMITS = _limit_overrides("LLM_VERTICAL_LIMITS")
+
+# Retries belong to the gateway; the SDK clients are built with this many
+CLIENT_MAX_RETRIES = 0 if LLM_GATEWAY else 2
+
+_WAIT_WINDOW = 1000
+
+
+class LLMQueueTimeout(Exception):
+    """Raised when a call is not admitted within LLM_QUEUE_TIMEOUT."""
+
+    def __init__(self, model: str, vertical: str, waited: float):
+        super().__init__(f"LLM call to {model} for '{vertical}' not admitted within {waited:.0f}s")
+        self.model = model
+        self.vertical = vertical
+
+
+# ---------------------------------------------------------------------------
+# Vertical attribution
+# ---------------------------------------------------------------------------
+
+_vertical: contextvars.ContextVar[str] = contextvars.ContextVar("llm_vertical", default="default")
+
+
+def set_vertical(vertical_id: str | None) -> None:
+    """Attribute this context's LLM calls to a vertical."""
+    _vertical.set(vertical_id or "default")
+
+
+def current_vertical() -> str:
+    """The vertical this context's LLM calls are attributed to."""
+    return _vertical.get()
+
+
+def estimate_tokens(system, messages: list[dict]) -> int:
+    """Local estimate of a request's input tokens (for the TPM buckets)."""
+    return count_tokens(system_text(system)) + message_tokens(messages)
+
+
+# ---------------------------------------------------------------------------
+# Buckets
+# ---------------------------------------------------------------------------
+
+class _Bucket:
+    """Token bucket refilled continuously at `per_minute`, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, n: float, now: float) -> float:
+        self._refill(now)
+        n = min(n, self.capacity)
+        return 0.0 if self.level >= n else (n - self.level) / self.rate
+
+    def take(self, n: float, now: float) -> None:
+        self._refill(now)
+        self.level -= min(n, self.capacity)
+
+    def adjust(self, extra: float) -> None:
+        self.level = max(self.level - extra, -self.capacity)
+
+
+class _Limits:
+    """Request and token buckets for one model or vertical, plus its counters."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = _Bucket(rpm) if rpm > 0 else None
+        self.tokens = _Bucket(tpm) if tpm > 0 else None
+        self.held_until = 0.0
+        self.queued = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.waits: deque = deque(maxlen=_WAIT_WINDOW)
+
+    def wait(self, tokens: int, now: float) -> float:
+        wait = max(self.held_until - now, 0.0)
+        if self.requests:
+            wait = max(wait, self.requests.wait(1, now))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait(tokens, now))
+        return wait
+
+    def take(self, tokens: int, now: float) -> None:
+        if self.requests:
+            self.requests.take(1, now)
+        if self.tokens:
+            self.tokens.take(tokens, now)
+
+
+_models: dict[str, _Limits] = {}
+_verticals: dict[str, _Limits] = {}
+
+
+def _limits(table: dict, key: str, overrides: dict, rpm: int, tpm: int) -> _Limits:
+    limits = table.get(key)
+    if limits is None:
+        override = overrides.get(key, {})
+        limits = table[key] = _Limits(int(override.get("rpm", rpm)), int(override.get("tpm", tpm)))
+    return limits
+
+
+def _model(model: str) -> _Limits:
+    return _limits(_models, model, LLM_MODEL_LIMITS, LLM_MODEL_RPM, LLM_MODEL_TPM)
+
+
+def _vertical_limits(vertical: str) -> _Limits:
+    return _limits(_verticals, vertical, LLM_VERTICAL_LIMITS, LLM_VERTICAL_RPM, LLM_VERTICAL_TPM)
+
+
+# ---------------------------------------------------------------------------
+# Fair queue
+# ---------------------------------------------------------------------------
+# One lock for all state: sync callers wait in threads, async callers on the
+# event loop, and both are woken by whichever caller dispatches.
+
+_lock = threading.Lock()
+_queues: dict[str, deque] = {}
+_rotation: deque = deque()
+
+
+class _Ticket:
+    def __init__(self, model: str, vertical: str, tokens: int, wake):
+        self.model = model
+        self.vertical = vertical
+        self.tokens = tokens
+        self.wake = wake
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+def _enqueue(model: str, tokens: int, wake) -> _Ticket:
+    ticket = _Ticket(model, _vertical.get(), tokens, wake)
+    with _lock:
+        queue = _queues.get(ticket.vertical)
+        if queue is None:
+            queue = _queues[ticket.vertical] = deque()
+            _rotation.append(ticket.vertical)
+        queue.append(ticket)
+        for limits in (_model(model), _vertical_limits(ticket.vertical)):
+            limits.queued += 1
+            limits.peak_queued = max(limits.peak_queued, limits.queued)
+    return ticket
+
+
+def _unqueue(ticket: _Ticket) -> None:
+    # Caller holds _lock and has taken the ticket off its queue
+    if not _queues[ticket.vertical]:
+        del _queues[ticket.vertical]
+        _rotation.remove(ticket.vertical)
+    _model(ticket.model).queued -= 1
+    _vertical_limits(ticket.vertical).queued -= 1
+
+
+def _dispatch() -> float | None:
+    """Admit queued calls round-robin across verticals.
+
+    Returns the seconds until the next queued call could fit, or None if
+    nothing is waiting on a bucket.
+    """
+    granted = []
+    with _lock:
+        while True:
+            now = time.monotonic()
+            next_wait = None
+            for vertical in list(_rotation):
+                vlimits = _vertical_limits(vertical)
+                ticket = None
+                blocked_models = set()
+                for candidate in _queues[vertical]:
+                    if candidate.model in blocked_models:
+                        continue  # FIFO per model: not past its own blocked head
+                    model_wait = _model(candidate.model).wait(candidate.tokens, now)
+                    vertical_wait = vlimits.wait(candidate.tokens, now)
+                    wait = max(model_wait, vertical_wait)
+                    if wait > 0:
+                        next_wait = wait if next_wait is None else min(next_wait, wait)
+                    if vertical_wait > 0:
+                        break  # the vertical's own budget: strict FIFO
+                    if model_wait > 0:
+                        blocked_models.add(candidate.model)
+                        continue
+                    ticket = candidate
+                    break
+                if ticket is None:
+                    continue
+                model = _model(ticket.model)
+                model.take(ticket.tokens, now)
+                vlimits.take(ticket.tokens, now)
+                _queues[vertical].remove(ticket)
+                _rotation.remove(vertical)
+                _rotation.append(vertical)
+                _unqueue(ticket)
+                waited = now - ticket.enqueued
+                for limits in (model, vlimits):
+                    limits.admitted += 1
+                    limits.waits.append(waited)
+                ticket.granted = True
+                granted.append(ticket)
+                break
+            else:
+                break
+    for ticket in granted:
+        ticket.wake()
+    return next_wait
+
+
+def _withdraw(ticket: _Ticket) -> bool:
+    """Take a waiting ticket out of the queue; False if it was granted meanwhile."""
+    with _lock:
+        if ticket.granted:
+            return False
+        _queues[ticket.vertical].remove(ticket)
+        _unqueue(ticket)
+        return True
+
+
+def _timed_out(ticket: _Ticket) -> LLMQueueTimeout:
+    with _lock:
+        _model(ticket.model).timeouts += 1
+        _vertical_limits(ticket.vertical).timeouts += 1
+    logger.warning(f"[llm_gateway] {ticket.model} call for '{ticket.vertical}' timed out in the queue")
+    return LLMQueueTimeout(ticket.model, ticket.vertical, time.monotonic() - ticket.enqueued)
+
+
+def _admit(model: str, tokens: int) -> None:
+    """Block until the call fits the model's and the vertical's buckets."""
+    woken = threading.Event()
+    ticket = _enqueue(model, tokens, woken.set)
+    deadline = ticket.enqueued + LLM_QUEUE_TIMEOUT
+    while True:
+        next_wait = _dispatch()
+        if ticket.granted:
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 and _withdraw(ticket):
+            raise _timed_out(ticket)
+        woken.wait(max(min(next_wait if next_wait is not None else remaining, remaining), 0.001))
+        woken.clear()
+
+
+async def _admit_async(model: str, tokens: int) -> None:
+    """_admit for the event loop: waits without holding a thread."""
+    loop = asyncio.get_running_loop()
+    woken = asyncio.Event()
+
+    def _wake():
+        try:
+            loop.call_soon_threadsafe(woken.set)
+        except RuntimeError:
+            pass  # loop closed
+
+    ticket = _enqueue(model, tokens, _wake)
+    deadline = ticket.enqueued + LLM_QUEUE_TIMEOUT
+    try:
+        while True:
+            next_wait = _dispatch()
+            if ticket.granted:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and _withdraw(ticket):
+                raise _timed_out(ticket)
+            try:
+                await asyncio.wait_for(
+                    woken.wait(), max(min(next_wait if next_wait is not None else remaining, remaining), 0.001)
+                )
+            except asyncio.TimeoutError:
+                pass
+            woken.clear()
+    except asyncio.CancelledError:
+        _withdraw(ticket)
+        raise
+
+
+def _settle(model: str, estimated: int, usage) -> None:
+    """Correct the token buckets from a call's reported input usage."""
+    if usage is None:
+        return
+    actual = (getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+    if not isinstance(actual, int) or actual == estimated:
+        return
+    with _lock:
+        for limits in (_model(model), _vertical_limits(_vertical.get())):
+            if limits.tokens:
+                limits.tokens.adjust(actual - estimated)
+
+
+# ---------------------------------------------------------------------------
+# Retry
+# ---------------------------------------------------------------------------
+
+def _retry_after(error) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return max(float(value) * scale, 0.0)
+            except ValueError:
+                pass  # an HTTP date: fall back to backoff
+    return None
+
+
+def _retry_delay(error: Exception, attempt: int, model: str) -> float | None:
+    """Seconds to wait before retrying `error`, or None if it should not be retried."""
+    status = getattr(error, "status_code", None)
+    retryable = (
+        isinstance(error, anthropic.APIConnectionError)
+        or status in (408, 409, 429)
+        or (isinstance(status, int) and status >= 500)
+    )
+    if not retryable or attempt >= LLM_MAX_RETRIES:
+        return None
+
+    backoff = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    retry_after = _retry_after(error)
+    limits = _model(model)
+    with _lock:
+        limits.retries += 1
+        _vertical_limits(_vertical.get()).retries += 1
+        if status == 429:
+            limits.rate_limited += 1
+    if retry_after is None:
+        delay = backoff
+    elif retry_after > LLM_BACKOFF_MAX:
+        logger.warning(f"[llm_gateway] {model} asks to retry after {retry_after:.0f}s — not waiting")
+        return None
+    else:
+        delay = retry_after + random.uniform(0, LLM_BACKOFF_BASE)
+        with _lock:
+            limits.held_until = max(limits.held_until, time.monotonic() + retry_after)
+    logger.warning(f"[llm_gateway] {model} {status or type(error).__name__} — retry {attempt + 1} in {delay:.1f}s")
+    return delay
+
+
+# ---------------------------------------------------------------------------
+# Calls
+# ---------------------------------------------------------------------------
+
+def call(model: str, request, tokens: int = 0):
+    """Run `request()` (a blocking messages.create) under admission and retry."""
+    if not LLM_GATEWAY:
+        return request()
+    attempt = 0
+    while True:
+        _admit(model, tokens)
+        try:
+            response = request()
+        except Exception as e:
+            delay = _retry_delay(e, attempt, model)
+            if delay is None:
+                raise
+            attempt += 1
+            time.sleep(delay)
+            continue
+        _settle(model, tokens, getattr(response, "usage", None))
+        return response
+
+
+async def acall(model: str, request, tokens: int = 0):
+    """call() for the async client: `request()` returns an awaitable."""
+    if not LLM_GATEWAY:
+        return await request()
+    attempt = 0
+    while True:
+        await _admit_async(model, tokens)
+        try:
+            response = await request()
+        except Exception as e:
+            delay = _retry_delay(e, attempt, model)
+            if delay is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+        _settle(model, tokens, getattr(response, "usage", None))
+        return response
+
+
+def _snapshot_usage(stream):
+    return getattr(getattr(stream, "current_message_snapshot", None), "usage", None)
+
+
+@contextmanager
+def stream(model: str, open_stream, tokens: int = 0):
+    """`with stream(model, lambda: client.messages.stream(...)) as s:` —
+    the stream is admitted and (re)tried until it opens."""
+    if not LLM_GATEWAY:
+        with open_stream() as opened:
+            yield opened
+        return
+    attempt = 0
+    while True:
+        _admit(model, tokens)
+        manager = open_stream()
+        try:
+            opened = manager.__enter__()
+            break
+        except Exception as e:
+            delay = _retry_delay(e, attempt, model)
+            if delay is None:
+                raise
+            attempt += 1
+            time.sleep(delay)
+    try:
+        yield opened
+    except BaseException as e:
+        _settle(model, tokens, _snapshot_usage(opened))
+        if not manager.__exit__(type(e), e, e.__traceback__):
+            raise
+    else:
+        _settle(model, tokens, _snapshot_usage(opened))
+        manager.__exit__(None, None, None)
+
+
+@asynccontextmanager
+async def astream(model: str, open_stream, tokens: int = 0):
+    """stream() for the async client."""
+    if not LLM_GATEWAY:
+        async with open_stream() as opened:
+            yield opened
+        return
+    attempt = 0
+    while True:
+        await _admit_async(model, tokens)
+        manager = open_stream()
+        try:
+            opened = await manager.__aenter__()
+            break
+        except Exception as e:
+            delay = _retry_delay(e, attempt, model)
+            if delay is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+    try:
+        yield opened
+    except BaseException as e:
+        _settle(model, tokens, _snapshot_usage(opened))
+        if not await manager.__aexit__(type(e), e, e.__traceback__):
+            raise
+    else:
+        _settle(model, tokens, _snapshot_usage(opened))
+        await manager.__aexit__(None, None, None)
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+def _percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _limits_stats(limits: _Limits, now: float) -> dict:
+    waits = list(limits.waits)
+    return {
+        "queued": limits.queued,
+        "peak_queued": limits.peak_queued,
+        "admitted": limits.admitted,
+        "mean_wait_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+        "p95_wait_ms": round(_percentile(waits, 0.95) * 1000, 1) if waits else 0.0,
+        "max_wait_ms": round(max(waits) * 1000, 1) if waits else 0.0,
+        "retries": limits.retries,
+        "rate_limited": limits.rate_limited,
+        "queue_timeouts": limits.timeouts,
+        "held_for_s": round(max(limits.held_until - now, 0.0), 1),
+        "rpm": round(limits.requests.capacity) if limits.requests else None,
+        "tpm": round(limits.tokens.capacity) if limits.tokens else None,
+    }
+
+
+def gateway_stats() -> dict:
+    """Queue depth, admission wait and retry counters per model and vertical."""
+    now = time.monotonic()
+    with _lock:
+        return {
+            "enabled": LLM_GATEWAY,
+            "queue_depth": sum(len(q) for q in _queues.values()),
+            "queue_timeout_s": LLM_QUEUE_TIMEOUT,
+            "max_retries": LLM_MAX_RETRIES,
+            "models": {m: _limits_stats(l, now) for m, l in _models.items()},
+            "verticals": {v: _limits_stats(l, now) for v, l in _verticals.items()},
+        }
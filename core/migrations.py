@@ -0,0 +1,522 @@
+from __future__ import annotations
+"""
+Fluidoracle — Schema Migrations
+================================
+The community database schema as numbered migrations, applied in order by
+database.init_db() at startup. Each migration runs in its own transaction
+and is recorded in schema_migrations (version, name, applied_at), so a
+database is brought from whatever version it is at to the latest, once.
+Several workers starting together are safe: each migration is claimed
+under BEGIN IMMEDIATE and re-checked before it runs.
+
+  1  baseline          the tables and columns init_db used to create with
+                       CREATE IF NOT EXISTS / ALTER blocks; written to be a
+                       no-op on a database those blocks already set up
+  2  hot-path indexes  secondary indexes for the per-session, per-question,
+                       time-range and due-follow-up queries
+  3  reply links       consultation_messages.reply_to: an assistant message
+                       names the user message it answers; existing keyed
+                       turns are linked to the reply that followed them
+
+A schema change is a new migration appended to MIGRATIONS — never an edit
+to one that has shipped. HOT_QUERIES lists the queries the indexes serve;
+tests/test_migrations.py checks each one's EXPLAIN QUERY PLAN.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+async def _columns(db: aiosqlite.Connection, table: str) -> set[str]:
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in await cursor.fetchall()}
+
+
+async def _add_column(db: aiosqlite.Connection, table: str, column: str, decl: str) -> bool:
+    """Add a column unless the table has it. Returns whether it was added."""
+    if column in await _columns(db, table):
+        return False
+    await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return True
+
+
+async def _backfill_question_hashes(db: aiosqlite.Connection) -> None:
+    """Hash existing questions; the newest good answer of each duplicate group takes it."""
+    from core.database import is_failed_answer, question_hash
+
+    cursor = await db.execute("SELECT id, question, answer FROM questions ORDER BY created_at DESC")
+    seen = set()
+    for qid, question, answer in await cursor.fetchall():
+        h = question_hash(question)
+        if h in seen or is_failed_answer(answer):
+            continue
+        seen.add(h)
+        await db.execute("UPDATE questions SET question_hash = ? WHERE id = ?", (h, qid))
+
+
+# ===========================================================================
+# 1 — Baseline
+# ===========================================================================
+
+async def _baseline(db: aiosqlite.Connection) -> None:
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS questions (
+            id TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            confidence TEXT NOT NULL,
+            sources TEXT,
+            warnings TEXT,
+            vote_up INTEGER DEFAULT 0,
+            vote_down INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            question_hash TEXT
+        )
+    """)
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS comments (
+            id TEXT PRIMARY KEY,
+            question_id TEXT NOT NULL REFERENCES questions(id),
+            body TEXT NOT NULL,
+            is_correction BOOLEAN DEFAULT FALSE,
+            author_name TEXT DEFAULT 'Anonymous',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS votes (
+            id TEXT PRIMARY KEY,
+            question_id TEXT NOT NULL REFERENCES questions(id),
+            direction TEXT NOT NULL,
+            voter_ip TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(question_id, voter_ip)
+        )
+    """)
+
+    # --- Invention Sessions ---
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS invention_sessions (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS invention_messages (
+            id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL REFERENCES invention_sessions(id),
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            sources TEXT,
+            confidence TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # --- Consultation Sessions ---
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS consultation_sessions (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL DEFAULT 'New Consultation',
+            phase TEXT NOT NULL DEFAULT 'gathering',
+            application_domain TEXT,
+            gathered_parameters TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS consultation_messages (
+            id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL REFERENCES consultation_sessions(id),
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            phase_at_time TEXT,
+            rag_chunks_used TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # --- Consultation Outcomes ---
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS consultation_outcomes (
+            id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL REFERENCES consultation_sessions(id),
+            followup_stage TEXT NOT NULL,
+            implementation_status TEXT,
+            performance_rating INTEGER,
+            performance_notes TEXT,
+            failure_occurred BOOLEAN DEFAULT FALSE,
+            failure_mode TEXT,
+            failure_timeline TEXT,
+            operating_conditions_matched BOOLEAN,
+            operating_conditions_notes TEXT,
+            modifications_made TEXT,
+            would_recommend_same BOOLEAN,
+            alternative_tried TEXT,
+            additional_notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS outcome_followup_schedule (
+            id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL REFERENCES consultation_sessions(id),
+            followup_stage TEXT NOT NULL,
+            scheduled_date TIMESTAMP NOT NULL,
+            status TEXT DEFAULT 'pending',
+            sent_at TIMESTAMP,
+            completed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # --- Consultation Email Subscribers (legacy — kept for data, no longer written to) ---
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS consultation_subscribers (
+            id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL REFERENCES consultation_sessions(id),
+            email TEXT NOT NULL,
+            application_domain TEXT,
+            topics TEXT,
+            verification_token TEXT NOT NULL,
+            unsubscribe_token TEXT NOT NULL,
+            verified BOOLEAN DEFAULT FALSE,
+            verified_at TIMESTAMP,
+            unsubscribed BOOLEAN DEFAULT FALSE,
+            unsubscribed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # --- Knowledge Base Updates (for topic matching) ---
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS knowledge_base_updates (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            domains TEXT,
+            topics TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # --- Users (passwordless auth) ---
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            email_verified BOOLEAN DEFAULT FALSE,
+            topic_subscription BOOLEAN DEFAULT TRUE,
+            feature_updates BOOLEAN DEFAULT FALSE,
+            unsubscribe_token TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login_at TIMESTAMP
+        )
+    """)
+
+    # --- Auth Codes (passwordless login) ---
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS auth_codes (
+            id TEXT PRIMARY KEY,
+            email TEXT NOT NULL,
+            code TEXT NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            used BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # --- Auth Sessions (bearer tokens) ---
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS auth_sessions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL REFERENCES users(id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL
+        )
+    """)
+
+    # --- Question embeddings (semantic answer cache) ---
+    # float32 embedding of an answered question and the parent chunks
+    # its answer was built from; loaded into core/answer_cache.py
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS question_embeddings (
+            question_id TEXT PRIMARY KEY REFERENCES questions(id),
+            embedding BLOB NOT NULL,
+            chunk_ids TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # --- Off-vertical demand signal table ---
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS off_vertical_demand (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            source_vertical TEXT,
+            source_platform TEXT,
+            detected_target_vertical TEXT,
+            query_text TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            vertical_id TEXT,
+            platform_id TEXT,
+            phase TEXT,
+            model TEXT,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            cache_creation_input_tokens INTEGER DEFAULT 0,
+            cache_read_input_tokens INTEGER DEFAULT 0,
+            estimated_cost_usd REAL,
+            aborted INTEGER DEFAULT 0,
+            output_tokens_saved INTEGER DEFAULT 0,
+            hedge_loser INTEGER DEFAULT 0,
+            route_tier TEXT,
+            route_rule TEXT,
+            latency_ms INTEGER,
+            first_token_ms INTEGER,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # --- Background jobs (core/jobs.py) ---
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS background_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            run_after TEXT NOT NULL,
+            locked_until TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
+    # --- Columns added after the tables first shipped ---
+    await _add_column(db, "consultation_sessions", "user_id", "TEXT REFERENCES users(id)")
+    await _add_column(db, "consultation_messages", "full_report", "TEXT")
+    # Set on assistant replies cut short by a client disconnect
+    await _add_column(db, "consultation_messages", "incomplete", "INTEGER DEFAULT 0")
+    # Client-supplied key on a submitted user message; a retry with the
+    # same key resumes the original turn instead of creating another
+    await _add_column(db, "consultation_messages", "idempotency_key", "TEXT")
+    await db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_consultation_messages_idempotency "
+        "ON consultation_messages(session_id, idempotency_key) "
+        "WHERE idempotency_key IS NOT NULL"
+    )
+    await _add_column(db, "consultation_sessions", "vertical_id", "TEXT")
+    await _add_column(db, "consultation_sessions", "platform_id", "TEXT")
+    await _add_column(db, "questions", "vertical_id", "TEXT")
+
+    # Hash of the normalized question text, unique so a repeat question
+    # is one indexed lookup. Failed answers carry no hash; on an existing
+    # database the newest answer of each duplicate group takes it.
+    if await _add_column(db, "questions", "question_hash", "TEXT"):
+        await _backfill_question_hashes(db)
+    await db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_hash ON questions(question_hash)"
+    )
+
+    # Prompt-cache token counts, client-aborted streams (core/streaming.py),
+    # lost hedges (core/hedging.py), routing decisions and call latency
+    # (core/model_router.py)
+    for col in ("cache_creation_input_tokens", "cache_read_input_tokens", "aborted", "output_tokens_saved",
+                "hedge_loser"):
+        await _add_column(db, "llm_usage", col, "INTEGER DEFAULT 0")
+    for col, col_type in (("route_tier", "TEXT"), ("route_rule", "TEXT"),
+                          ("latency_ms", "INTEGER"), ("first_token_ms", "INTEGER")):
+        await _add_column(db, "llm_usage", col, col_type)
+
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_background_jobs_status "
+        "ON background_jobs(status, run_after)"
+    )
+
+
+# ===========================================================================
+# 2 — Hot-path indexes
+# ===========================================================================
+
+_HOT_PATH_INDEXES = (
+    # A session's messages in order; message counts per session
+    "CREATE INDEX IF NOT EXISTS idx_consultation_messages_session "
+    "ON consultation_messages(session_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_invention_messages_session "
+    "ON invention_messages(session_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_consultation_outcomes_session "
+    "ON consultation_outcomes(session_id, created_at)",
+    # A user's sessions, most recent first
+    "CREATE INDEX IF NOT EXISTS idx_consultation_sessions_user "
+    "ON consultation_sessions(user_id, updated_at)",
+    # A question's comments in order; comment counts per question.
+    # votes needs none: UNIQUE(question_id, voter_ip) already indexes question_id
+    "CREATE INDEX IF NOT EXISTS idx_comments_question "
+    "ON comments(question_id, created_at)",
+    # Due follow-ups; the stages already scheduled for a session
+    "CREATE INDEX IF NOT EXISTS idx_followup_schedule_due "
+    "ON outcome_followup_schedule(status, scheduled_date)",
+    "CREATE INDEX IF NOT EXISTS idx_followup_schedule_session "
+    "ON outcome_followup_schedule(session_id, followup_stage)",
+    # Time-range reports
+    "CREATE INDEX IF NOT EXISTS idx_llm_usage_timestamp ON llm_usage(timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_off_vertical_demand_timestamp ON off_vertical_demand(timestamp)",
+    # Login rate limit and code check
+    "CREATE INDEX IF NOT EXISTS idx_auth_codes_email ON auth_codes(email, created_at)",
+)
+
+
+async def _hot_path_indexes(db: aiosqlite.Connection) -> None:
+    for statement in _HOT_PATH_INDEXES:
+        await db.execute(statement)
+
+
+# The queries the indexes above serve, with sample parameters
+HOT_QUERIES: dict[str, tuple[str, tuple]] = {
+    "session messages": (
+        "SELECT * FROM consultation_messages WHERE session_id = ? ORDER BY created_at ASC", ("s",)),
+    "reply to a message": (
+        "SELECT * FROM consultation_messages WHERE reply_to = ? ORDER BY created_at DESC LIMIT 1", ("m",)),
+    "session message count": (
+        "SELECT s.id, (SELECT COUNT(*) FROM consultation_messages m WHERE m.session_id = s.id) "
+        "FROM consultation_sessions s WHERE s.id = ?", ("s",)),
+    "invention messages": (
+        "SELECT * FROM invention_messages WHERE session_id = ? ORDER BY created_at ASC", ("s",)),
+    "session outcomes": (
+        "SELECT * FROM consultation_outcomes WHERE session_id = ? ORDER BY created_at ASC", ("s",)),
+    "user sessions": (
+        "SELECT * FROM consultation_sessions WHERE user_id = ? ORDER BY updated_at DESC", ("u",)),
+    "question comments": (
+        "SELECT * FROM comments WHERE question_id = ? ORDER BY created_at ASC", ("q",)),
+    "question comment count": (
+        "SELECT COUNT(*) FROM comments WHERE question_id = ?", ("q",)),
+    "question votes": (
+        "DELETE FROM votes WHERE question_id = ?", ("q",)),
+    "voter's vote": (
+        "SELECT id, direction FROM votes WHERE question_id = ? AND voter_ip = ?", ("q", "ip")),
+    "due follow-ups": (
+        "SELECT f.*, s.title FROM outcome_followup_schedule f "
+        "JOIN consultation_sessions s ON f.session_id = s.id "
+        "WHERE f.scheduled_date <= ? AND f.status = 'pending' ORDER BY f.scheduled_date ASC", ("2026-01-01",)),
+    "scheduled stages": (
+        "SELECT followup_stage FROM outcome_followup_schedule WHERE session_id = ?", ("s",)),
+    "usage since": (
+        "SELECT phase, model, COUNT(*), SUM(estimated_cost_usd) FROM llm_usage "
+        "WHERE timestamp > datetime('now', ?) GROUP BY phase, model", ("-30 days",)),
+    "recent off-vertical demand": (
+        "SELECT * FROM off_vertical_demand ORDER BY timestamp DESC LIMIT ?", (50,)),
+    "recent auth codes": (
+        "SELECT COUNT(*) FROM auth_codes WHERE email = ? AND created_at > ?", ("e", "2026-01-01")),
+}
+
+
+# ===========================================================================
+# 3 — Reply links
+# ===========================================================================
+
+async def _reply_links(db: aiosqlite.Connection) -> None:
+    await _add_column(db, "consultation_messages", "reply_to", "TEXT")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_consultation_messages_reply_to "
+        "ON consultation_messages(reply_to, created_at)"
+    )
+    # Keyed turns already answered: the reply is the message that followed
+    cursor = await db.execute(
+        "SELECT id, session_id, created_at FROM consultation_messages "
+        "WHERE role = 'user' AND idempotency_key IS NOT NULL"
+    )
+    for message_id, session_id, created_at in await cursor.fetchall():
+        next_cursor = await db.execute(
+            "SELECT id, role FROM consultation_messages WHERE session_id = ? AND created_at > ? "
+            "ORDER BY created_at ASC LIMIT 1",
+            (session_id, created_at),
+        )
+        following = await next_cursor.fetchone()
+        if following is not None and following[1] == "assistant":
+            await db.execute(
+                "UPDATE consultation_messages SET reply_to = ? WHERE id = ? AND reply_to IS NULL",
+                (message_id, following[0]),
+            )
+
+
+# ===========================================================================
+# Runner
+# ===========================================================================
+
+Migration = Callable[[aiosqlite.Connection], Awaitable[None]]
+
+MIGRATIONS: list[tuple[int, str, Migration]] = [
+    (1, "baseline", _baseline),
+    (2, "hot-path indexes", _hot_path_indexes),
+    (3, "reply links", _reply_links),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def _applied(db: aiosqlite.Connection) -> set[int]:
+    cursor = await db.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in await cursor.fetchall()}
+
+
+async def schema_version(db: aiosqlite.Connection) -> int:
+    """Highest applied migration (0 for a database that has none)."""
+    cursor = await db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return (await cursor.fetchone())[0]
+
+
+async def migrate(db: aiosqlite.Connection) -> list[int]:
+    """Apply every migration the database does not have yet. Returns their versions."""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+    await db.commit()
+
+    pending = [m for m in MIGRATIONS if m[0] not in await _applied(db)]
+    applied = []
+    for version, name, apply in pending:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            if version in await _applied(db):  # another worker got there first
+                await db.rollback()
+                continue
+            await apply(db)
+            await db.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, datetime.now(timezone.utc).isoformat()),
+            )
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            logger.error(f"[migrations] {version} ({name}) failed; database left at the previous version")
+            raise
+        applied.append(version)
+        logger.info(f"[migrations] applied {version} ({name})")
+    return applied
@@ -0,0 +1,162 @@
+from __future__ import annotations
+"""
+Fluidoracle — Model Routing
+============================
+Picks the model for each Claude call from what the call is, instead of
+sending everything to the engine's one primary/fallback pair.
+
+A routing table maps (call type, phase, vertical, input size) to a tier:
+
+  fast       small, quick model — short clarifying turns
+  standard   mid-size model
+  primary    the engine's configured model (CONSULT_MODEL, CLAUDE_MODEL /
+             STREAM_MODEL, INVENT_MODEL) — the strongest it is set up with
+
+Rules are tried in order; the first whose fields all match wins, and a call
+no rule matches stays on primary. Input size is the conversational part of
+the request (messages, not the system prompt), so it tracks how far into a
+consultation the call is.
+
+Routing ships off, with an empty default table: every call stays on
+primary until a rule has been replayed (tests/replay_routing.py) and shown
+to hold answer quality, then enabled with MODEL_ROUTING and MODEL_ROUTES.
+The candidate rules the replay evaluates by default (CANDIDATE_ROUTES):
+
+  consultation  gathering   input <= MODEL_ROUTING_SHORT_TOKENS  → fast
+  invention     any         input <= MODEL_ROUTING_SHORT_TOKENS  → standard
+
+A fast or standard route falls back to the engine's primary model (a
+refusal or failure escalates); a primary route keeps the engine's
+FALLBACK_MODEL. Session titles are built without a model call and are not
+routed.
+
+Each decision is logged and written to llm_usage with the call (route_tier,
+route_rule, latency_ms, first_token_ms), so cost and latency per tier come
+straight out of /api/admin/model-routing. tests/replay_routing.py replays
+recorded consultations against the routed and the primary model to compare
+answer quality offline before a rule goes live.
+
+Config (env):
+  MODEL_ROUTING                on/off (default false); off = every call on
+                               the engine's primary/fallback pair
+  MODEL_TIER_FAST              fast-tier model (default claude-haiku-4-5-20251001)
+  MODEL_TIER_STANDARD          standard-tier model (default claude-sonnet-4-5-20250929)
+  MODEL_ROUTING_SHORT_TOKENS   input size still routed as short (default 1500)
+  MODEL_ROUTES                 JSON list of rules (the default table is empty), e.g.
+                               [{"name": "qa", "call_type": "answer", "tier": "standard"}]
+                               fields: call_type, phase, vertical,
+                               min_input_tokens, max_input_tokens, tier
+"""
+
+import json
+import logging
+import os
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "false").lower() == "true"
+MODEL_TIER_FAST = os.getenv("MODEL_TIER_FAST", "claude-haiku-4-5-20251001")
+MODEL_TIER_STANDARD = os.getenv("MODEL_TIER_STANDARD", "claude-sonnet-4-5-20250929")
+MODEL_ROUTING_SHORT_TOKENS = int(os.getenv("MODEL_ROUTING_SHORT_TOKENS", "1500"))
+
+TIERS = ("fast", "standard", "primary")
+
+# Nothing is routed until a rule has been validated by replay
+DEFAULT_ROUTES: list[dict] = []
+
+# Proposed rules, not yet validated — what tests/replay_routing.py replays
+# when MODEL_ROUTES is not set
+CANDIDATE_ROUTES = [
+    {"name": "short-gathering", "call_type": "consultation", "phase": "gathering",
+     "max_input_tokens": MODEL_ROUTING_SHORT_TOKENS, "tier": "fast"},
+    {"name": "short-invention", "call_type": "invention",
+     "max_input_tokens": MODEL_ROUTING_SHORT_TOKENS, "tier": "standard"},
+]
+
+
+def _load_routes() -> list[dict]:
+    raw = os.getenv("MODEL_ROUTES", "")
+    if not raw:
+        return DEFAULT_ROUTES
+    try:
+        routes = json.loads(raw)
+        bad = [r for r in routes if r.get("tier") not in TIERS]
+        if bad:
+            raise ValueError(f"unknown tier in {bad}")
+        return routes
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning(f"[model_router] ignoring invalid MODEL_ROUTES ({e}); using the default table")
+        return DEFAULT_ROUTES
+
+
+MODEL_ROUTES = _load_routes()
+
+
+@dataclass(frozen=True)
+class Route:
+    """A routing decision: the model to try first and the one after it."""
+
+    tier: str
+    model: str
+    fallback: str
+    fallback_tier: str
+    rule: str
+
+    def models(self) -> list[str]:
+        return [self.model, self.fallback]
+
+    def tags(self, model: str) -> dict:
+        """llm_usage columns for a call made to `model` on this route."""
+        return {
+            "route_tier": self.tier if model == self.model else self.fallback_tier,
+            "route_rule": self.rule,
+        }
+
+
+def _matches(rule: dict, call_type: str, phase: str, vertical: str, input_tokens: int) -> bool:
+    for field, value in (("call_type", call_type), ("phase", phase), ("vertical", vertical)):
+        if field in rule and rule[field] != value:
+            return False
+    if input_tokens > rule.get("max_input_tokens", input_tokens):
+        return False
+    return input_tokens >= rule.get("min_input_tokens", 0)
+
+
+def route(
+    call_type: str,
+    phase: str,
+    input_tokens: int,
+    primary: str,
+    fallback: str,
+    vertical: str | None = None,
+) -> Route:
+    """Route one call.
+
+    Args:
+        call_type: 'consultation', 'answer' or 'invention'.
+        phase: The llm_usage phase ('gathering', 'answering', 'invention').
+        input_tokens: Estimated size of the request's messages.
+        primary, fallback: The engine's configured model pair.
+        vertical: Defaults to the vertical the LLM gateway attributes this
+            context's calls to.
+    """
+    if not MODEL_ROUTING:
+        return Route("primary", primary, fallback, "primary", "off")
+    if vertical is None:
+        from core.llm_gateway import current_vertical
+        vertical = current_vertical()
+
+    rule = next((r for r in MODEL_ROUTES if _matches(r, call_type, phase, vertical, input_tokens)), None)
+    tier = rule["tier"] if rule else "primary"
+    name = (rule.get("name") or f"rule{MODEL_ROUTES.index(rule)}") if rule else "default"
+    if tier == "primary":
+        decision = Route("primary", primary, fallback, "primary", name)
+    else:
+        model = MODEL_TIER_FAST if tier == "fast" else MODEL_TIER_STANDARD
+        decision = Route(tier, model, primary, "primary", name)
+    logger.info(
+        f"[model_router] {call_type}/{phase} vertical={vertical} input~{input_tokens} "
+        f"→ {decision.tier} ({decision.model}, rule={decision.rule})"
+    )
+    return decision
@@ -0,0 +1,95 @@
+"""
+Fluidoracle — Preload Serving Mode
+===================================
+Copy-on-write friendly multi-process serving (gunicorn `--preload` style).
+
+The master process loads the platform config, every vertical's BM25 index
+and parent store, and the cross-encoder weights once, then forks workers
+that share those pages. Two things keep them shared:
+
+  1. Layout — large read-only structures are converted to a few big buffers
+     (see core/retrieval/compact_store.py) instead of millions of small
+     Python objects whose refcount writes would dirty every page.
+  2. gc.freeze() — moves everything loaded so far into the permanent
+     generation, so the cyclic GC in each worker never walks (and writes to)
+     those objects.
+
+Alternative to the out-of-process retrieval service (RETRIEVAL_SOCKET);
+use one or the other.
+
+Usage:
+    gunicorn -c deploy/gunicorn.conf.py main:app
+    python deploy/measure_rss.py --launch preload --workers 4
+"""
+from __future__ import annotations
+
+import gc
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_preloaded: bool = False
+
+
+def preload(platform_id: str) -> None:
+    """Load shared read-only state in the master process. Call once, before fork."""
+    global _preloaded
+    if _preloaded:
+        return
+
+    # No collections while loading — avoids promoting half-built structures
+    # and keeps the loaded objects in one contiguous run of pages. Collection
+    # resumes in the master afterwards, however the load ends: the frozen
+    # objects are out of its reach either way.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    t0 = time.perf_counter()
+    try:
+        from core.vertical_loader import load_platform
+        import core.retrieval.hybrid_search as hs
+
+        platform = load_platform(platform_id)
+        for vid, vc in platform.verticals.items():
+            try:
+                hs.preload_indexes(
+                    child_collection=vc.child_collection,
+                    parent_collection=vc.parent_collection,
+                    bm25_index_path=vc.bm25_index_path,
+                )
+                print(f"[preload] Indexes loaded: {vid}")
+            except Exception as e:
+                print(f"[preload] WARNING: index preload failed for {vid}: {e}")
+
+        try:
+            hs._get_cross_encoder()
+            print("[preload] Cross-encoder loaded")
+        except Exception as e:
+            print(f"[preload] WARNING: cross-encoder not preloaded: {e}")
+
+        # SQLite handles must not cross a fork: drop the master's ChromaDB
+        # client so each worker opens its own on first use.
+        try:
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        except Exception:
+            pass
+        hs._chroma_client = None
+
+        gc.collect()
+        gc.freeze()
+        _preloaded = True
+        print(f"[preload] Done in {time.perf_counter() - t0:.1f}s — "
+              f"{gc.get_freeze_count():,} objects frozen")
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def after_fork() -> None:
+    """Make sure the cyclic GC runs in a forked worker (frozen objects stay frozen)."""
+    gc.enable()
+
+
+def is_preloaded() -> bool:
+    return _preloaded
@@ -0,0 +1,86 @@
+"""
+Fluidoracle — Prompt Caching
+=============================
+Request shaping for Anthropic prompt caching.
+
+Every engine call resends the vertical's full system prompt (identity,
+core reference data, answering template) and, in consultations, the whole
+conversation so far. Both are identical from one call to the next; only
+the retrieved context and the newest user message change. Requests are
+therefore assembled as
+
+  system   [stable prompt ▮] [small per-call addenda]
+  messages [history ... last history message ▮] [volatile context + new user message]
+
+where ▮ is a `cache_control: ephemeral` breakpoint. The API bills cached
+prefix tokens at a fraction of the input price and skips reprocessing
+them. Anything that changes per call (RAG context, application profile)
+must stay after the last breakpoint, or it invalidates the prefix.
+
+Cache hits and writes are reported on `response.usage` as
+cache_read_input_tokens / cache_creation_input_tokens and recorded in
+llm_usage by log_llm_usage().
+
+Config (env):
+  PROMPT_CACHING    add cache breakpoints (default true)
+"""
+from __future__ import annotations
+
+import os
+
+PROMPT_CACHING = os.getenv("PROMPT_CACHING", "true").lower() == "true"
+
+
+def _text_block(text: str, cache: bool = False) -> dict:
+    block = {"type": "text", "text": text}
+    if cache and PROMPT_CACHING:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+def cached_system(stable: str, *addenda: str) -> list[dict]:
+    """System prompt as content blocks with a breakpoint after the stable part.
+
+    Addenda (nudges, format instructions, low-confidence notes) follow the
+    breakpoint so that toggling them does not invalidate the cached prompt.
+    """
+    blocks = [_text_block(stable, cache=True)]
+    blocks.extend(_text_block(a) for a in addenda if a and a.strip())
+    return blocks
+
+
+def cached_messages(
+    conversation_history: list[dict],
+    user_message: str,
+    context: str | None = None,
+) -> list[dict]:
+    """History + new user turn, with a breakpoint on the last history message.
+
+    `context` (retrieved technical data, application profile) is sent as a
+    separate block ahead of the user's text in the final turn — after the
+    cached prefix, so it can change every call.
+    """
+    messages = [{"role": msg["role"], "content": msg["content"]} for msg in conversation_history]
+    if messages and isinstance(messages[-1]["content"], str) and messages[-1]["content"].strip():
+        messages[-1]["content"] = [_text_block(messages[-1]["content"], cache=True)]
+
+    if context:
+        messages.append({"role": "user", "content": [_text_block(context), _text_block(user_message)]})
+    else:
+        messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+def cache_usage(response_usage) -> tuple[int, int]:
+    """(cache_creation_input_tokens, cache_read_input_tokens) from an SDK usage object."""
+    return (
+        getattr(response_usage, "cache_creation_input_tokens", 0) or 0,
+        getattr(response_usage, "cache_read_input_tokens", 0) or 0,
+    )
+
+
+def system_text(system) -> str:
+    """Plain text of a system prompt given as a string or content blocks."""
+    if isinstance(system, str):
+        return system
+    return "\n\n".join(block.get("text", "") for block in system)
@@ -0,0 +1,216 @@
+"""
+Fluidoracle — Reference Sections
+=================================
+Relevance-selected CORE REFERENCE DATA for answering prompts.
+
+Each vertical's answering_prompt.md carries a large block of reference
+tables, correlations and rules of thumb ("CORE REFERENCE DATA ..." up to
+the closing instructions). Pasting all of it into every answering call
+costs thousands of input tokens when a consultation touches one table.
+
+At vertical load time the block is cut out of the prompt and split into
+addressable sections — one per column-0 heading such as
+"EFFICIENCY TABLE:" or "VISCOSITY REFERENCE DATA — ...:", tagged with the
+enclosing "SECTION n — ..." banner where the file has one — and indexed
+with BM25. Answering calls then inject only the sections that match the
+refined query and gathered parameters, best first, under a token budget.
+
+Config (env):
+  REFERENCE_SELECTION        on/off (default true; off → full block in the prompt)
+  REFERENCE_TOKEN_BUDGET     default budget per call (default 1500);
+                             a vertical's config.py may set its own
+  REFERENCE_MIN_RELATIVE_SCORE  drop sections scoring below this fraction
+                             of the best match (default 0.2)
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_SELECTION = os.getenv("REFERENCE_SELECTION", "true").lower() == "true"
+REFERENCE_TOKEN_BUDGET = int(os.getenv("REFERENCE_TOKEN_BUDGET", "1500"))
+REFERENCE_MIN_RELATIVE_SCORE = float(os.getenv("REFERENCE_MIN_RELATIVE_SCORE", "0.2"))
+
+# Block boundaries in answering_prompt.md
+_START_MARKER = "CORE REFERENCE DATA"
+_END_MARKERS = ("If the context doesn't cover", "ANSWER STRUCTURE:")
+
+_BANNER_RE = re.compile(r"^━+$")
+_GROUP_RE = re.compile(r"^SECTION \d+\b")
+_PARENS_RE = re.compile(r"\([^)]*\)")
+_TOKEN_RE = re.compile(r"[a-zA-Z0-9][\w/\-\.]*[a-zA-Z0-9]|[a-zA-Z0-9]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def tokenize(text: str) -> list[str]:
+    """BM25 tokens — same scheme as the knowledge-base index, with
+    parameter names like ``fluid_viscosity_cst`` split into words."""
+    return _TOKEN_RE.findall(text.lower().replace("_", " "))
+
+
+def _heading_title(line: str) -> str | None:
+    """Title of a column-0 heading line ("EFFICIENCY TABLE:"), else None.
+
+    A heading is capitalised text before the first colon outside
+    parentheses; parenthesised
+    notes and short symbols ("Oh REGIMES") are allowed, prose
+    ("Source: ...", "Correct: ...") is not.
+    """
+    if not line or line[0].isspace():
+        return None
+    depth, colon = 0, -1
+    for i, ch in enumerate(line):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == ":" and depth == 0:
+            colon = i
+            break
+    if colon < 0:
+        return None
+    title = line[:colon]
+    words = _PARENS_RE.sub(" ", title).split()
+    if not any(sum(c.isupper() for c in w) >= 3 for w in words):
+        return None
+    if any(len(w) >= 3 and any(c.islower() for c in w) for w in words):
+        return None
+    return title.strip()
+
+
+@dataclass
+class ReferenceSection:
+    """One addressable piece of a vertical's reference data."""
+
+    section_id: str
+    group: str       # Enclosing "SECTION n — ..." banner (with its Source line), or ""
+    title: str
+    text: str
+    tokens: int
+
+
+@dataclass
+class ReferenceIndex:
+    """A vertical's reference sections plus their BM25 index."""
+
+    header: str
+    sections: list[ReferenceSection]
+    token_budget: int = REFERENCE_TOKEN_BUDGET
+    _bm25: object = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.sections:
+            from rank_bm25 import BM25Okapi
+            self._bm25 = BM25Okapi([
+                tokenize(f"{s.group} {s.title} {s.text}") for s in self.sections
+            ])
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(s.tokens for s in self.sections)
+
+    def select(self, query: str, budget: int | None = None) -> list[ReferenceSection]:
+        """Sections matching `query`, best first until the budget is spent,
+        returned in document order."""
+        budget = self.token_budget if budget is None else budget
+        query_tokens = tokenize(query)
+        if not self.sections or not query_tokens:
+            return []
+
+        scores = self._bm25.get_scores(query_tokens)
+        ranked = sorted(range(len(self.sections)), key=lambda i: scores[i], reverse=True)
+        floor = max(scores[ranked[0]] * REFERENCE_MIN_RELATIVE_SCORE, 0.0)
+        chosen, used = [], 0
+        for i in ranked:
+            if scores[i] <= floor:
+                break
+            if used + self.sections[i].tokens > budget:
+                continue
+            chosen.append(i)
+            used += self.sections[i].tokens
+        return [self.sections[i] for i in sorted(chosen)]
+
+    def render(self, sections: list[ReferenceSection]) -> str:
+        """Selected sections under the block header, grouped under their banners."""
+        if not sections:
+            return ""
+        parts = [self.header]
+        group = None
+        for s in sections:
+            if s.group and s.group != group:
+                parts.append(s.group)
+            group = s.group
+            parts.append(s.text)
+        return "\n\n".join(parts)
+
+
+def split_reference_data(answering_prompt: str) -> tuple[str, str, str, list[ReferenceSection]]:
+    """Cut the CORE REFERENCE DATA block out of an answering prompt.
+
+    Returns (prompt_without_block, block_text, header_line, sections).
+    A prompt without the block comes back unchanged with no sections.
+    """
+    lines = answering_prompt.split("\n")
+    start = next((i for i, ln in enumerate(lines) if ln.startswith(_START_MARKER)), None)
+    if start is None:
+        return answering_prompt, "", "", []
+    end = next(
+        (i for i in range(start + 1, len(lines)) if lines[i].startswith(_END_MARKERS)),
+        len(lines),
+    )
+
+    header = lines[start]
+    block = "\n".join(lines[start:end]).strip()
+    base = "\n".join(lines[:start]).rstrip() + "\n\n" + "\n".join(lines[end:]).lstrip()
+
+    sections: list[ReferenceSection] = []
+    group_lines: list[str] = []
+    title, body = None, []
+
+    def _flush():
+        text = "\n".join(body).strip("\n").rstrip()
+        if title and text:
+            number = re.match(r"SECTION (\d+)", group_lines[0]) if group_lines else None
+            slug = re.sub(r"[^a-z0-9]+", "-", _PARENS_RE.sub("", title).lower()).strip("-")
+            sections.append(ReferenceSection(
+                section_id=f"{number.group(1)}-{slug}" if number else slug,
+                group="\n".join(group_lines),
+                title=title,
+                text=text,
+                tokens=estimate_tokens(text),
+            ))
+
+    in_group_header = False
+    for line in lines[start + 1:end]:
+        if _BANNER_RE.match(line):
+            continue
+        if _GROUP_RE.match(line):
+            _flush()
+            title, body = None, []
+            group_lines = [line]
+            in_group_header = True
+            continue
+        if in_group_header and line.startswith("Source:"):
+            group_lines.append(line)
+            continue
+        heading = _heading_title(line)
+        if heading:
+            _flush()
+            title, body = heading, [line]
+            in_group_header = False
+        elif in_group_header and line.strip():
+            # Content directly under a banner, before any heading
+            title, body = group_lines[0].split("—", 1)[-1].strip(), [line]
+            in_group_header = False
+        elif title:
+            body.append(line)
+    _flush()
+    return base, block, header, sections
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+"""
+Fluidoracle — Compact Read-Only Index Layouts
+==============================================
+Fork-friendly replacements for the large read-only structures the retrieval
+pipeline keeps in memory (used by preload serving — see core/preload.py).
+
+After a gunicorn-style fork, every Python object a worker *touches* gets its
+refcount written, which copies the whole page it lives on. A BM25 index held
+as a list of per-document dicts plus lists of strings is millions of small
+objects, so within minutes each worker has a private copy of all of it.
+
+Here the same data is held in a handful of large buffers instead:
+
+  PackedStrings   one UTF-8 blob + an int64 offsets array
+  PackedJSON      PackedStrings of JSON-encoded dicts (decoded on access)
+  CompactBM25     CSR postings (term → doc ids, term freqs) + numpy idf/doc_len;
+                  get_scores() returns the same values as rank_bm25.BM25Okapi
+  ParentStore     a parent collection (ids, texts, metadata) served from memory
+                  instead of a ChromaDB round-trip per query
+
+Lookups touch the buffers' data, not per-item object headers, so pages stay
+shared between workers. Scoring is also vectorized over postings instead of
+looping over every document's dict.
+"""
+
+import bisect
+import json
+
+import numpy as np
+
+
+class PackedStrings:
+    """Immutable sequence of strings stored as one UTF-8 blob + offsets."""
+
+    def __init__(self, strings):
+        encoded = [s.encode("utf-8") for s in strings]
+        self._offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=self._offsets[1:])
+        self._blob = b"".join(encoded)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._blob[start:end].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._blob) + self._offsets.nbytes
+
+
+class PackedJSON(PackedStrings):
+    """Sequence of dicts stored as packed JSON; each access returns a fresh dict."""
+
+    def __init__(self, items):
+        super().__init__(json.dumps(item or {}, separators=(",", ":")) for item in items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return json.loads(super().__getitem__(i))
+
+
+class CompactBM25:
+    """BM25Okapi scoring over CSR postings. Drop-in for `.get_scores(tokens)`."""
+
+    def __init__(self, bm25):
+        vocab = sorted(bm25.idf)
+        self.vocab = PackedStrings(vocab)
+        self.idf = np.array([bm25.idf[t] for t in vocab], dtype=np.float64)
+        self.k1 = bm25.k1
+        self.b = bm25.b
+        self.avgdl = bm25.avgdl
+        self.corpus_size = bm25.corpus_size
+        self.doc_len = np.asarray(bm25.doc_len, dtype=np.float64)
+
+        # Invert per-document frequency dicts into term-major postings
+        term_col = {t: i for i, t in enumerate(vocab)}
+        counts = np.zeros(len(vocab), dtype=np.int64)
+        for freqs in bm25.doc_freqs:
+            for term in freqs:
+                counts[term_col[term]] += 1
+        self.indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+        self.doc_ids = np.empty(self.indptr[-1], dtype=np.int32)
+        self.tfs = np.empty(self.indptr[-1], dtype=np.int32)
+        cursor = self.indptr[:-1].copy()
+        for doc_id, freqs in enumerate(bm25.doc_freqs):
+            for term, tf in freqs.items():
+                col = term_col[term]
+                pos = cursor[col]
+                self.doc_ids[pos] = doc_id
+                self.tfs[pos] = tf
+                cursor[col] += 1
+
+        # Per-document length normalisation, precomputed once
+        self._norm = self.k1 * (1 - self.b + self.b * self.doc_len / self.avgdl)
+
+    def _term_index(self, term: str) -> int | None:
+        i = bisect.bisect_left(self.vocab, term)
+        if i < len(self.vocab) and self.vocab[i] == term:
+            return i
+        return None
+
+    def get_scores(self, query: list[str]) -> np.ndarray:
+        score = np.zeros(self.corpus_size)
+        for term in query:
+            col = self._term_index(term)
+            if col is None:
+                continue
+            start, end = self.indptr[col], self.indptr[col + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float64)
+            score[docs] += self.idf[col] * (tf * (self.k1 + 1) / (tf + self._norm[docs]))
+        return score
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.vocab.nbytes + self.idf.nbytes + self.doc_len.nbytes + self._norm.nbytes
+                   + self.indptr.nbytes + self.doc_ids.nbytes + self.tfs.nbytes)
+
+
+def compact_bm25_data(bm25_data: dict) -> dict:
+    """Convert a load_bm25_index() dict into the compact layout (same keys used by search).
+
+    `tokenized_corpus` is dropped — it is only needed to rebuild the index.
+    """
+    return {
+        "bm25": CompactBM25(bm25_data["bm25"]),
+        "ids": PackedStrings(bm25_data["ids"]),
+        "documents": PackedStrings(bm25_data["documents"]),
+        "metadatas": PackedJSON(bm25_data["metadatas"]),
+    }
+
+
+class ParentStore:
+    """In-memory parent collection with ChromaDB-compatible `get(ids=...)`."""
+
+    def __init__(self, ids: list[str], documents: list[str], metadatas: list[dict]):
+        order = sorted(range(len(ids)), key=lambda i: ids[i])
+        self.ids = PackedStrings([ids[i] for i in order])
+        self.documents = PackedStrings([documents[i] or "" for i in order])
+        self.metadatas = PackedJSON([metadatas[i] for i in order])
+
+    @classmethod
+    def from_collection(cls, collection, batch_size: int = 5000) -> ParentStore:
+        ids, documents, metadatas = [], [], []
+        total = collection.count()
+        for offset in range(0, total, batch_size):
+            batch = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            ids.extend(batch["ids"])
+            documents.extend(batch["documents"])
+            metadatas.extend(batch["metadatas"])
+        return cls(ids, documents, metadatas)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get(self, ids: list[str], include=None) -> dict:
+        found_ids, documents, metadatas = [], [], []
+        for pid in ids:
+            i = bisect.bisect_left(self.ids, pid)
+            if i < len(self.ids) and self.ids[i] == pid:
+                found_ids.append(pid)
+                documents.append(self.documents[i])
+                metadatas.append(self.metadatas[i])
+        return {"ids": found_ids, "documents": documents, "metadatas": metadatas}
@@ -40,6 +40,21 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 EMBEDDING_MODEL = "text-embedding-3-small"
 EMBEDDING_DIMENSIONS = 1536  # dimensions for text-embedding-3-small
 
+# ---------------------------------------------------------------------------
+# Semantic Search Backend
+# "chroma" — ChromaDB HNSW (default)
+# "flat"   — exact search over an mmap'd .npy export of the child collection
+#            (see core.retrieval.flat_index); falls back to chroma per
+#            collection when no export exists.
+# ---------------------------------------------------------------------------
+SEMANTIC_BACKEND = os.getenv("SEMANTIC_BACKEND", "chroma").lower()
+FLAT_INDEX_PATH = VECTOR_STORE_PATH / "flat"
+FLAT_INDEX_DTYPE = "float16"
+# Reduced-dimension / quantized coarse index (core.retrieval.quantized_index),
+# e.g. "d512-int8". Empty → the variant activated per collection, if any.
+FLAT_INDEX_VARIANT = os.getenv("FLAT_INDEX_VARIANT", "")
+RESCORE_FACTOR = 4             # coarse candidates per final hit, rescored at full precision
+
 # ---------------------------------------------------------------------------
 # ChromaDB Collection Names — DEFAULTS
 # These are overridden per-vertical via vertical config.
@@ -72,6 +87,30 @@ FINAL_TOP_K = 10
 # ---------------------------------------------------------------------------
 CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 
+# ---------------------------------------------------------------------------
+# Cascaded Reranking
+# A cheap pre-score (RRF rank agreement between semantic and BM25) decides
+# how much cross-encoder work a query needs. When both methods agree on the
+# leading candidates, only the top CASCADE_TRUNCATE_K go through the
+# cross-encoder. RERANK_BUDGET_MS caps the time a single search may spend
+# reranking; 0 disables the budget.
+# Off by default: every candidate is cross-encoded until the cascade's effect
+# on answer quality has been measured for a vertical.
+# ---------------------------------------------------------------------------
+RERANK_CASCADE = os.getenv("RERANK_CASCADE", "false").lower() in ("1", "true", "yes")
+CASCADE_AGREEMENT_DEPTH = 3    # top-N ranks compared between semantic and BM25
+CASCADE_AGREEMENT_MIN = 2      # leading candidates in both top-N lists → decisive
+CASCADE_TRUNCATE_K = 6         # candidates reranked when the pre-score is decisive
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "0"))
+RERANK_MIN_PAIRS = 3           # below this many affordable pairs, skip the reranker
+
+# ---------------------------------------------------------------------------
+# Out-of-Process Retrieval Service (core.retrieval.retrieval_service)
+# When set, web workers forward search() over this Unix socket to a single
+# process that holds the indexes and cross-encoder.
+# ---------------------------------------------------------------------------
+RETRIEVAL_SOCKET = os.getenv("RETRIEVAL_SOCKET", "")
+
 # ---------------------------------------------------------------------------
 # Confidence Thresholds (for verified_query)
 # ---------------------------------------------------------------------------
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+"""
+Fluidoracle — Flat Vector Index
+==============================================
+Exact semantic search over a vertical's child chunks without ChromaDB.
+
+A child collection is small enough to live in RAM as a single matrix, so
+instead of going through HNSW + the SQLite metadata layer on every query we
+export the embeddings once into a contiguous, L2-normalized `.npy` file and
+open it with mmap:
+
+  <VECTOR_STORE_PATH>/flat/<collection>.npy        (N × D, float16 or float32)
+  <VECTOR_STORE_PATH>/flat/<collection>.meta.pkl   (ids, documents, metadatas)
+
+Search is a blocked matrix–vector product (cosine = dot product on unit
+vectors) followed by argpartition for the top-k. Metadata filters are
+evaluated as vectorized boolean masks over per-key column arrays. Results
+are exact — no HNSW recall artifacts — and the mmap'd matrix is shared by
+every process that opens the same file.
+
+Usage:
+    python -m core.retrieval.ingest --export-flat --platform fps --vertical hydraulic_filtration
+
+    # then, at serve time
+    SEMANTIC_BACKEND=flat uvicorn main:app
+"""
+
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from .config import FLAT_INDEX_PATH, FLAT_INDEX_DTYPE, VECTOR_STORE_PATH, VERBOSE
+
+# Rows scored per block — bounds the float32 temporary to ~50MB at 1536 dims
+_BLOCK_ROWS = 8192
+
+
+def flat_index_paths(collection_name: str, index_dir: str | Path | None = None) -> tuple[Path, Path]:
+    """Return (vectors_path, meta_path) for a collection's flat index."""
+    base = Path(index_dir) if index_dir else FLAT_INDEX_PATH
+    return base / f"{collection_name}.npy", base / f"{collection_name}.meta.pkl"
+
+
+# ===========================================================================
+# Export (ChromaDB → .npy)
+# ===========================================================================
+
+def export_flat_index(
+    collection_name: str,
+    index_dir: str | Path | None = None,
+    dtype: str = FLAT_INDEX_DTYPE,
+    chroma_client=None,
+) -> Path | None:
+    """Export a ChromaDB child collection into a flat, normalized `.npy` matrix.
+
+    Args:
+        collection_name: ChromaDB collection to export.
+        index_dir: Output directory. Defaults to FLAT_INDEX_PATH.
+        dtype: "float16" (half the size, ~1e-3 score error) or "float32".
+        chroma_client: Optional existing client (the ingest CLI passes its own).
+
+    Returns:
+        Path to the written vectors file, or None if the collection is empty.
+    """
+    if chroma_client is None:
+        import chromadb
+        chroma_client = chromadb.PersistentClient(path=str(VECTOR_STORE_PATH))
+
+    collection = chroma_client.get_collection(name=collection_name)
+    total = collection.count()
+    if total == 0:
+        print(f"[!] Collection {collection_name} is empty — nothing to export.")
+        return None
+
+    # Paginate to avoid "too many SQL variables" on large collections
+    ids, documents, metadatas, vectors = [], [], [], []
+    batch_size = 5000
+    for offset in range(0, total, batch_size):
+        batch = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=batch_size,
+            offset=offset,
+        )
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+        metadatas.extend(batch["metadatas"])
+        vectors.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        if VERBOSE:
+            print(f"  Exported {len(ids):,}/{total:,} embeddings...")
+
+    matrix = np.concatenate(vectors, axis=0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = (matrix / norms).astype(dtype)
+
+    vectors_path, meta_path = flat_index_paths(collection_name, index_dir)
+    vectors_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to temp names and rename, so a serving process never mmaps a half-written file
+    tmp_vectors = vectors_path.with_suffix(".npy.tmp")
+    tmp_meta = meta_path.with_suffix(".pkl.tmp")
+    with open(tmp_vectors, "wb") as f:
+        np.save(f, np.ascontiguousarray(matrix))
+    with open(tmp_meta, "wb") as f:
+        pickle.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, f)
+    tmp_vectors.replace(vectors_path)
+    tmp_meta.replace(meta_path)
+
+    if VERBOSE:
+        size_mb = vectors_path.stat().st_size / 1e6
+        print(f"  Flat index written: {matrix.shape[0]:,} × {matrix.shape[1]} {dtype} "
+              f"({size_mb:.1f} MB) → {vectors_path}")
+    return vectors_path
+
+
+# ===========================================================================
+# Search
+# ===========================================================================
+
+class FlatIndex:
+    """Exact cosine search over a mmap'd, L2-normalized embedding matrix."""
+
+    def __init__(self, vectors: np.ndarray, ids: list, documents: list, metadatas: list):
+        self.vectors = vectors
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self._columns: dict[str, np.ndarray] = {}
+
+    @classmethod
+    def load(cls, collection_name: str, index_dir: str | Path | None = None) -> FlatIndex | None:
+        """Open a previously exported index. Returns None if it doesn't exist."""
+        vectors_path, meta_path = flat_index_paths(collection_name, index_dir)
+        if not vectors_path.exists() or not meta_path.exists():
+            return None
+        vectors = np.load(vectors_path, mmap_mode="r")
+        with open(meta_path, "rb") as f:
+            meta = pickle.load(f)
+        return cls(vectors, meta["ids"], meta["documents"], meta["metadatas"])
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    # -- metadata masks -----------------------------------------------------
+
+    def _column(self, key: str) -> np.ndarray:
+        """Per-key metadata column (object array, None where absent), built once."""
+        col = self._columns.get(key)
+        if col is None:
+            col = np.empty(len(self.metadatas), dtype=object)
+            col[:] = [m.get(key) if m else None for m in self.metadatas]
+            self._columns[key] = col
+        return col
+
+    def _condition_mask(self, key: str, cond) -> np.ndarray:
+        col = self._column(key)
+        if not isinstance(cond, dict):
+            return col == cond
+
+        mask = np.ones(len(col), dtype=bool)
+        present = np.not_equal(col, None)
+        for op, value in cond.items():
+            if op == "$eq":
+                mask &= col == value
+            elif op == "$ne":
+                mask &= col != value
+            elif op in ("$in", "$nin"):
+                hit = np.zeros(len(col), dtype=bool)
+                for v in value:
+                    hit |= col == v
+                mask &= hit if op == "$in" else ~hit
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                numeric = np.array(
+                    [v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
+                     for v in col],
+                    dtype=np.float64,
+                )
+                with np.errstate(invalid="ignore"):
+                    if op == "$gt":
+                        mask &= numeric > value
+                    elif op == "$gte":
+                        mask &= numeric >= value
+                    elif op == "$lt":
+                        mask &= numeric < value
+                    else:
+                        mask &= numeric <= value
+            elif op == "$contains":
+                text = np.array([v if isinstance(v, str) else "" for v in col], dtype=str)
+                mask &= present & (np.char.find(text, str(value)) >= 0)
+            else:
+                raise ValueError(f"Unsupported metadata filter operator: {op}")
+        return mask
+
+    def filter_mask(self, where: dict) -> np.ndarray:
+        """Evaluate a ChromaDB-style where clause as a boolean row mask."""
+        if "$and" in where:
+            mask = np.ones(len(self), dtype=bool)
+            for clause in where["$and"]:
+                mask &= self.filter_mask(clause)
+            return mask
+        if "$or" in where:
+            mask = np.zeros(len(self), dtype=bool)
+            for clause in where["$or"]:
+                mask |= self.filter_mask(clause)
+            return mask
+
+        mask = np.ones(len(self), dtype=bool)
+        for key, cond in where.items():
+            mask &= self._condition_mask(key, cond)
+        return mask
+
+    # -- scoring ------------------------------------------------------------
+
+    def scores(self, query_embedding) -> np.ndarray:
+        """Cosine similarity of the query against every row."""
+        q = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm > 0:
+            q = q / norm
+        n = len(self)
+        out = np.empty(n, dtype=np.float32)
+        for start in range(0, n, _BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + _BLOCK_ROWS], dtype=np.float32)
+            out[start:start + len(block)] = block @ q
+        return out
+
+    def search(self, query_embedding, top_k: int, where_filter: dict | None = None) -> list[dict]:
+        """Return the top_k hits in the same shape as hybrid_search._semantic_search."""
+        if len(self) == 0:
+            return []
+
+        scores = self.scores(query_embedding)
+        if where_filter:
+            mask = self.filter_mask(where_filter)
+            scores[~mask] = -np.inf
+            available = int(mask.sum())
+        else:
+            available = len(scores)
+
+        k = min(top_k, available)
+        if k <= 0:
+            return []
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [
+            {
+                "child_id": self.ids[i],
+                "child_text": self.documents[i],
+                "metadata": self.metadatas[i],
+                "semantic_score": max(0.0, float(scores[i])),
+                "bm25_score": 0.0,
+                "source": "semantic",
+            }
+            for i in top
+        ]
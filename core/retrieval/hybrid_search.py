@@ -30,15 +30,32 @@ Each result is a dict:
         "parent_text": str,           # the context chunk for the LLM
         "child_text": str,            # the matched child chunk
         "source": str,                # source filename
-        "rerank_score": float,        # cross-encoder confidence (0-1)
+        "rerank_score": float | None, # cross-encoder confidence (0-1);
+                                      # None when the cross-encoder did not score it
         "semantic_score": float,      # cosine similarity score
         "bm25_score": float,          # BM25 relevance score
         "metadata": dict,             # full metadata
+        "rerank_path": str,           # full | truncated | budget_truncated |
+                                      # budget_fallback | disabled | unreranked
     }
+
+Cascaded reranking (RERANK_CASCADE, off by default): before the cross-encoder
+runs, the RRF rank agreement between semantic and BM25 is used as a free
+pre-score. When both methods agree on the leading candidates, only the top
+CASCADE_TRUNCATE_K are reranked. An optional per-request millisecond budget
+truncates further or skips the reranker entirely under load.
+
+Candidates the cross-encoder did not score are not given a score: they
+follow the scored ones in RRF order with rerank_score None and rerank_path
+"unreranked". When the budget skips the reranker, the results are served in
+RRF order with rerank_score None and rerank_path "budget_fallback";
+assess_confidence treats such a set as unscored, not as a knowledge gap.
 """
 
+import logging
 import re
 import sys
+import time
 import numpy as np
 from pathlib import Path
 
@@ -58,9 +75,23 @@ from .config import (
     RERANK_CANDIDATES,
     FINAL_TOP_K,
     CROSS_ENCODER_MODEL,
+    RERANK_CASCADE,
+    CASCADE_AGREEMENT_DEPTH,
+    CASCADE_AGREEMENT_MIN,
+    CASCADE_TRUNCATE_K,
+    RERANK_BUDGET_MS,
+    RERANK_MIN_PAIRS,
+    SEMANTIC_BACKEND,
+    FLAT_INDEX_VARIANT,
     VERBOSE,
 )
 from .ingest import load_bm25_index, tokenize_for_bm25
+from .flat_index import FlatIndex
+from .quantized_index import QuantizedIndex, active_variant
+from .retrieval_service import get_client as get_retrieval_client, respawn_if_down
+from .compact_store import ParentStore, compact_bm25_data
+
+logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
 # Clients (initialized lazily)
@@ -69,6 +100,8 @@ _openai_client = None
 _chroma_client = None
 _cross_encoder = None
 _bm25_data = {}  # keyed by index path
+_flat_indexes = {}  # keyed by collection name; None = no export on disk
+_parent_stores = {}  # keyed by collection name; only populated by preload_indexes()
 
 
 def _get_openai():
@@ -96,6 +129,64 @@ def _get_bm25_index(bm25_index_path: str | None = None):
     return _bm25_data[cache_key]
 
 
+def _get_flat_index(collection_name: str) -> FlatIndex | QuantizedIndex | None:
+    """Open the mmap'd flat export of a child collection once; None if not exported.
+
+    If a reduced/quantized variant is configured (FLAT_INDEX_VARIANT) or was
+    activated for this collection, the coarse variant is served with
+    rescoring against the full-precision flat matrix.
+    """
+    if collection_name not in _flat_indexes:
+        index = FlatIndex.load(collection_name)
+        if index is not None:
+            variant = FLAT_INDEX_VARIANT or active_variant(collection_name)
+            if variant:
+                quantized = QuantizedIndex.load(collection_name, variant, full=index)
+                if quantized is not None:
+                    index = quantized
+                elif VERBOSE:
+                    print(f"  [!] Index variant {variant} not built for {collection_name}; using exact flat.")
+        if VERBOSE:
+            if index is not None:
+                label = getattr(index, "variant", "exact")
+                print(f"  Flat vector index loaded: {collection_name} ({len(index):,} vectors, {label})")
+            else:
+                print(f"  [!] No flat index for {collection_name}; using ChromaDB.")
+        _flat_indexes[collection_name] = index
+    return _flat_indexes[collection_name]
+
+
+def preload_indexes(
+    child_collection: str | None = None,
+    parent_collection: str | None = None,
+    bm25_index_path: str | None = None,
+) -> None:
+    """Load a vertical's read-only indexes in compact, fork-friendly form.
+
+    Used by preload serving (core/preload.py) in the master process before
+    workers fork: the BM25 index becomes CSR postings + packed strings and
+    the parent collection is held in memory, so workers share the pages
+    instead of each copying millions of small Python objects.
+    """
+    cache_key = str(bm25_index_path or "default")
+    bm25_data = _bm25_data.get(cache_key) or load_bm25_index(index_path=bm25_index_path)
+    if bm25_data is not None and "tokenized_corpus" in bm25_data:
+        bm25_data = compact_bm25_data(bm25_data)
+    _bm25_data[cache_key] = bm25_data
+
+    collection_name = parent_collection or PARENT_COLLECTION
+    if collection_name not in _parent_stores:
+        try:
+            parent_col = _get_chroma().get_collection(name=collection_name)
+            _parent_stores[collection_name] = ParentStore.from_collection(parent_col)
+        except Exception as e:
+            if VERBOSE:
+                print(f"  [!] Parent collection {collection_name} not preloaded: {e}")
+
+    if SEMANTIC_BACKEND == "flat":
+        _get_flat_index(child_collection or CHILD_COLLECTION)
+
+
 def _get_cross_encoder():
     """Load cross-encoder model. Downloads ~80MB on first use, then cached."""
     global _cross_encoder
@@ -111,6 +202,15 @@ def _get_cross_encoder():
 # Stage 1: Hybrid Search (Semantic + BM25)
 # ===========================================================================
 
+def _embed_query(query: str) -> list[float]:
+    """Embed a search query with the shared embedding model."""
+    response = _get_openai().embeddings.create(
+        model=EMBEDDING_MODEL,
+        input=[query],
+    )
+    return response.data[0].embedding
+
+
 def _semantic_search(
     query: str,
     top_k: int = SEMANTIC_TOP_K,
@@ -124,9 +224,16 @@ def _semantic_search(
             Example: {"source": "REFERENCE-ISO-Cleanliness-Codes.md"}
         child_collection: Override the default child collection name.
     """
-    client = _get_chroma()
     collection_name = child_collection or CHILD_COLLECTION
 
+    if SEMANTIC_BACKEND == "flat":
+        flat = _get_flat_index(collection_name)
+        if flat is not None:
+            if len(flat) == 0:
+                return []
+            return flat.search(_embed_query(query), top_k, where_filter)
+
+    client = _get_chroma()
     try:
         collection = client.get_collection(name=collection_name)
     except Exception:
@@ -137,12 +244,7 @@ def _semantic_search(
     if collection.count() == 0:
         return []
 
-    # Embed the query
-    response = _get_openai().embeddings.create(
-        model=EMBEDDING_MODEL,
-        input=[query],
-    )
-    query_embedding = response.data[0].embedding
+    query_embedding = _embed_query(query)
 
     # Search (with optional metadata filter)
     query_kwargs = {
@@ -327,6 +429,8 @@ def _merge_results(
         bm25_rrf = bm25_weight / (RRF_K + bm25_ranks.get(cid, len(bm25_hits) + 1))
         
         entry["combined_score"] = sem_rrf + bm25_rrf
+        entry["semantic_rank"] = semantic_ranks.get(cid)
+        entry["bm25_rank"] = bm25_ranks.get(cid)
         
         if cid in semantic_ranks and cid in bm25_ranks:
             entry["source"] = "both"
@@ -352,11 +456,10 @@ def _resolve_parents(candidates: list[dict], parent_collection: str | None = Non
     Deduplicates: if multiple children point to the same parent,
     keep the child with the highest score and return the parent once.
     """
-    client = _get_chroma()
     collection_name = parent_collection or PARENT_COLLECTION
 
     try:
-        parent_col = client.get_collection(name=collection_name)
+        parent_col = _parent_stores.get(collection_name) or _get_chroma().get_collection(name=collection_name)
     except Exception:
         # No parent collection — fall back to using child text as context
         if VERBOSE:
@@ -410,6 +513,12 @@ def _resolve_parents(candidates: list[dict], parent_collection: str | None = Non
 # Stage 3: Cross-Encoder Reranking
 # ===========================================================================
 
+# Rolling estimate of cross-encoder cost per (query, passage) pair, in ms.
+# Updated after every rerank; used to decide how many pairs fit a budget.
+_rerank_ms_per_pair: float | None = None
+_RERANK_EWMA_ALPHA = 0.3
+
+
 def _rerank(query: str, candidates: list[dict], top_k: int = FINAL_TOP_K) -> list[dict]:
     """Rerank candidates using a cross-encoder model.
     
@@ -417,6 +526,8 @@ def _rerank(query: str, candidates: list[dict], top_k: int = FINAL_TOP_K) -> lis
     and produces a relevance score. This is much more accurate than embedding
     similarity for determining actual relevance.
     """
+    global _rerank_ms_per_pair
+
     if not candidates:
         return []
 
@@ -426,7 +537,13 @@ def _rerank(query: str, candidates: list[dict], top_k: int = FINAL_TOP_K) -> lis
     pairs = [(query, c["parent_text"]) for c in candidates]
 
     # Score all pairs
+    t0 = time.perf_counter()
     scores = cross_encoder.predict(pairs)
+    per_pair = (time.perf_counter() - t0) * 1000 / len(pairs)
+    if _rerank_ms_per_pair is None:
+        _rerank_ms_per_pair = per_pair
+    else:
+        _rerank_ms_per_pair += _RERANK_EWMA_ALPHA * (per_pair - _rerank_ms_per_pair)
 
     # Apply sigmoid to get scores in [0, 1] range
     import math
@@ -439,6 +556,69 @@ def _rerank(query: str, candidates: list[dict], top_k: int = FINAL_TOP_K) -> lis
     return candidates[:top_k]
 
 
+def _rank_agreement(candidates: list[dict], depth: int = CASCADE_AGREEMENT_DEPTH) -> int:
+    """Cheap pre-score: how many of the leading candidates sit in the top
+    `depth` of BOTH the semantic and the BM25 rankings.
+
+    Costs nothing — the ranks were recorded during RRF merging.
+    """
+    agreed = 0
+    for c in candidates[:depth]:
+        sem_rank = c.get("semantic_rank")
+        bm25_rank = c.get("bm25_rank")
+        if sem_rank is not None and bm25_rank is not None and sem_rank <= depth and bm25_rank <= depth:
+            agreed += 1
+    return agreed
+
+
+def _plan_rerank(
+    candidates: list[dict],
+    top_k: int,
+    cascade: bool,
+    budget_ms: float,
+    elapsed_ms: float,
+) -> tuple[str, int]:
+    """Decide how many leading candidates go through the cross-encoder.
+
+    Returns (rerank_path, n_pairs). n_pairs == 0 means skip the reranker.
+    """
+    n = len(candidates)
+    path = "full"
+
+    if cascade and n > CASCADE_TRUNCATE_K and _rank_agreement(candidates) >= CASCADE_AGREEMENT_MIN:
+        n = CASCADE_TRUNCATE_K
+        path = "truncated"
+
+    if budget_ms and budget_ms > 0 and _rerank_ms_per_pair:
+        remaining = budget_ms - elapsed_ms
+        affordable = int(remaining / _rerank_ms_per_pair) if remaining > 0 else 0
+        if affordable < min(n, RERANK_MIN_PAIRS):
+            return "budget_fallback", 0
+        if affordable < n:
+            return "budget_truncated", affordable
+
+    return path, n
+
+
+def _cascade_rerank(
+    query: str,
+    candidates: list[dict],
+    top_k: int,
+    n_pairs: int,
+) -> list[dict]:
+    """Cross-encode the first n_pairs candidates and append the rest in RRF order.
+
+    Tail candidates keep no rerank_score (None) and are marked "unreranked" —
+    a cross-encoder score is never made up for a passage it did not read.
+    """
+    head = _rerank(query, candidates[:n_pairs], top_k=n_pairs)
+    tail = candidates[n_pairs:]
+    for c in tail:
+        c["rerank_score"] = None
+        c["rerank_path"] = "unreranked"
+    return (head + tail)[:top_k]
+
+
 # ===========================================================================
 # Main Search API
 # ===========================================================================
@@ -453,6 +633,8 @@ def search(
     child_collection: str | None = None,
     parent_collection: str | None = None,
     bm25_index_path: str | None = None,
+    cascade: bool | None = None,
+    rerank_budget_ms: float | None = None,
 ) -> list[dict]:
     """Execute the full hybrid retrieval pipeline.
     
@@ -469,17 +651,71 @@ def search(
         child_collection: Override the default ChromaDB child collection name.
         parent_collection: Override the default ChromaDB parent collection name.
         bm25_index_path: Override the default BM25 index file path.
+        cascade: Use the rank-agreement pre-score to truncate reranking.
+            None → config RERANK_CASCADE.
+        rerank_budget_ms: Wall-clock budget for the whole search; reranking
+            shrinks or is skipped to stay inside it. None → config
+            RERANK_BUDGET_MS (0 = unlimited).
     
     Returns:
         List of result dicts, each containing:
         - parent_text: the context chunk for the LLM
         - child_text: the matched child chunk
         - source: source filename
-        - rerank_score: cross-encoder confidence
+        - rerank_score: cross-encoder confidence (None if not cross-encoded)
         - semantic_score: embedding similarity
         - bm25_score: keyword relevance
         - metadata: full chunk metadata
+        - rerank_path: which reranking path was taken ("unreranked" for
+          candidates past the cross-encoded head)
     """
+    client = get_retrieval_client()
+    if client is not None:
+        try:
+            return client.search(
+                query, top_k,
+                use_reranker=use_reranker,
+                semantic_weight=semantic_weight,
+                bm25_weight=bm25_weight,
+                metadata_filter=metadata_filter,
+                child_collection=child_collection,
+                parent_collection=parent_collection,
+                bm25_index_path=bm25_index_path,
+                cascade=cascade,
+                rerank_budget_ms=rerank_budget_ms,
+            )
+        except OSError as e:
+            # Unreachable (connection / socket error) — not an error the service
+            # reported or a timeout (RetrievalServiceError), raised like any search error
+            logger.warning(f"[hybrid_search] retrieval service unavailable ({e}); searching in-process")
+            respawn_if_down()
+
+    return _local_search(
+        query, top_k, use_reranker, semantic_weight, bm25_weight, metadata_filter,
+        child_collection, parent_collection, bm25_index_path, cascade, rerank_budget_ms,
+    )
+
+
+def _local_search(
+    query: str,
+    top_k: int = FINAL_TOP_K,
+    use_reranker: bool = True,
+    semantic_weight: float | None = None,
+    bm25_weight: float | None = None,
+    metadata_filter: dict | None = None,
+    child_collection: str | None = None,
+    parent_collection: str | None = None,
+    bm25_index_path: str | None = None,
+    cascade: bool | None = None,
+    rerank_budget_ms: float | None = None,
+) -> list[dict]:
+    """In-process pipeline behind search(); also what the retrieval service runs."""
+    t_start = time.perf_counter()
+    if cascade is None:
+        cascade = RERANK_CASCADE
+    if rerank_budget_ms is None:
+        rerank_budget_ms = RERANK_BUDGET_MS
+
     if VERBOSE:
         print(f"\n  Searching: \"{query}\"")
 
@@ -527,33 +763,48 @@ def search(
         print(f"    Resolved to {len(resolved)} unique parent chunks")
 
     # Stage 3: Rerank
+    rerank_path, n_pairs = "disabled", 0
     if use_reranker:
+        elapsed_ms = (time.perf_counter() - t_start) * 1000
+        rerank_path, n_pairs = _plan_rerank(
+            resolved, top_k, cascade, rerank_budget_ms, elapsed_ms,
+        )
+
+    if n_pairs > 0:
         if VERBOSE:
-            print("  Stage 3: Cross-encoder reranking...")
+            print(f"  Stage 3: Cross-encoder reranking ({rerank_path}, {n_pairs}/{len(resolved)} pairs)...")
 
-        results = _rerank(query, resolved, top_k)
+        if n_pairs >= len(resolved):
+            results = _rerank(query, resolved, top_k)
+        else:
+            results = _cascade_rerank(query, resolved, top_k, n_pairs)
 
         if VERBOSE:
             print(f"    Top score: {results[0]['rerank_score']:.3f}" if results else "    No results")
     else:
+        if VERBOSE and rerank_path == "budget_fallback":
+            print(f"  Stage 3: Skipped — rerank budget ({rerank_budget_ms:.0f}ms) exhausted")
         results = resolved[:top_k]
         for r in results:
-            r["rerank_score"] = r.get("combined_score", 0.0)
+            # Skipped for the budget: no score rather than an RRF score posing as one
+            r["rerank_score"] = None if rerank_path == "budget_fallback" else r.get("combined_score", 0.0)
 
     # Clean up output format
     clean_results = []
     for r in results:
+        rerank_score = r.get("rerank_score")
         clean_results.append({
             "parent_id": r.get("parent_id", r.get("child_id", "")),
             "parent_text": r.get("parent_text", ""),
             "child_text": r.get("child_text", ""),
             "source": r.get("metadata", {}).get("source", "unknown"),
-            "rerank_score": round(r.get("rerank_score", 0.0), 4),
+            "rerank_score": round(rerank_score, 4) if rerank_score is not None else None,
             "semantic_score": round(r.get("semantic_score", 0.0), 4),
             "bm25_score": round(r.get("bm25_score", 0.0), 4),
             "combined_score": round(r.get("combined_score", 0.0), 4),
             "metadata": r.get("metadata", {}),
             "parent_metadata": r.get("parent_metadata", {}),
+            "rerank_path": r.get("rerank_path", rerank_path),
         })
 
     return clean_results
@@ -573,6 +824,8 @@ def main():
     parser.add_argument("--no-rerank", action="store_true", help="Skip cross-encoder reranking")
     parser.add_argument("--semantic-only", action="store_true", help="Use semantic search only")
     parser.add_argument("--bm25-only", action="store_true", help="Use BM25 keyword search only")
+    parser.add_argument("--no-cascade", action="store_true", help="Always rerank every candidate")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Per-search rerank budget (ms)")
 
     args = parser.parse_args()
 
@@ -581,7 +834,12 @@ def main():
         return
 
     # Handle search mode overrides
-    kwargs = {"top_k": args.top_k, "use_reranker": not args.no_rerank}
+    kwargs = {
+        "top_k": args.top_k,
+        "use_reranker": not args.no_rerank,
+        "cascade": False if args.no_cascade else None,
+        "rerank_budget_ms": args.budget_ms,
+    }
     if args.semantic_only:
         kwargs["semantic_weight"] = 1.0
         kwargs["bm25_weight"] = 0.0
@@ -602,7 +860,8 @@ def main():
     for i, r in enumerate(results, 1):
         print(f"\n--- Result {i} ---")
         print(f"  Source:       {r['source']}")
-        print(f"  Rerank score: {r['rerank_score']:.4f}")
+        score = "n/a" if r["rerank_score"] is None else f"{r['rerank_score']:.4f}"
+        print(f"  Rerank score: {score} ({r['rerank_path']})")
         print(f"  Semantic:     {r['semantic_score']:.4f} | BM25: {r['bm25_score']:.4f} | Combined: {r['combined_score']:.4f}")
         print(f"  Child text:   {r['child_text'][:150]}...")
         print(f"  Parent text:  {r['parent_text'][:200]}...")
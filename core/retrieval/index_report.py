@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+"""
+Fluidoracle — Vector Index Footprint Report
+==============================================
+Recall vs latency vs size for reduced-dimension / quantized index variants,
+measured on the test_coverage query suite against exact search over the
+full-precision flat export.
+
+One OpenAI embedding call for all queries (cost < $0.01); everything else
+is local. Use it to pick a footprint per vertical, then build and activate
+the chosen variant with core.retrieval.quantized_index.
+
+"coarse MB" is what a variant keeps resident. "disk MB" is what it needs on
+disk: its codes plus the full-precision flat export used for rescoring —
+always more than the flat export alone (and the ChromaDB store stays too).
+
+Usage:
+    python -m core.retrieval.index_report --platform fps --vertical hydraulic_filtration
+    python -m core.retrieval.index_report --collection hydraulic_filtration-children \\
+        --variants d512,d768,int8,binary,d512-int8 --top-k 10 --output footprint.json
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from .config import CHILD_COLLECTION, EMBEDDING_MODEL, FINAL_TOP_K, SEMANTIC_TOP_K
+from .flat_index import FlatIndex
+from .quantized_index import QuantizedIndex
+
+DEFAULT_VARIANTS = ["d1536", "d768", "d512", "int8", "d768-int8", "d512-int8", "binary", "d768-binary"]
+
+
+def _time_search(index, query_vectors: np.ndarray, top_k: int, **kwargs) -> tuple[list[list[str]], list[float]]:
+    results, latencies = [], []
+    for q in query_vectors:
+        t0 = time.perf_counter()
+        hits = index.search(q, top_k, **kwargs)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        results.append([h["child_id"] for h in hits])
+    return results, latencies
+
+
+def _recall(truth: list[list[str]], got: list[list[str]]) -> float:
+    per_query = [len(set(t) & set(g)) / len(t) for t, g in zip(truth, got) if t]
+    return float(np.mean(per_query)) if per_query else 0.0
+
+
+def build_report(
+    full: FlatIndex,
+    query_vectors: np.ndarray,
+    variants: list[str],
+    top_k: int = SEMANTIC_TOP_K,
+) -> dict:
+    """Measure each variant against exact search on `full`.
+
+    Recall is reported at top_k (the semantic candidate depth that feeds RRF)
+    and at FINAL_TOP_K, with and without the full-precision rescoring step.
+    """
+    truth, exact_lat = _time_search(full, query_vectors, top_k)
+    truth_final = [t[:FINAL_TOP_K] for t in truth]
+
+    rows = [{
+        "variant": f"exact ({full.vectors.dtype})",
+        "coarse_mb": round(full.vectors.nbytes / 1e6, 2),
+        "disk_mb": round(full.vectors.nbytes / 1e6, 2),
+        f"recall@{top_k}": 1.0,
+        f"recall@{FINAL_TOP_K}": 1.0,
+        f"recall@{top_k}_no_rescore": 1.0,
+        "p50_ms": round(float(np.percentile(exact_lat, 50)), 3),
+        "p95_ms": round(float(np.percentile(exact_lat, 95)), 3),
+    }]
+
+    for variant in variants:
+        index = QuantizedIndex.build(full, variant)
+        got, lat = _time_search(index, query_vectors, top_k)
+        raw, _ = _time_search(index, query_vectors, top_k, rescore=False)
+        rows.append({
+            "variant": variant,
+            "coarse_mb": round(index.nbytes / 1e6, 2),
+            # Rescoring keeps the full-precision matrix: codes are on top of it
+            "disk_mb": round((index.nbytes + full.vectors.nbytes) / 1e6, 2),
+            f"recall@{top_k}": round(_recall(truth, got), 4),
+            f"recall@{FINAL_TOP_K}": round(_recall(truth_final, [g[:FINAL_TOP_K] for g in got]), 4),
+            f"recall@{top_k}_no_rescore": round(_recall(truth, raw), 4),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        })
+
+    return {
+        "num_vectors": len(full),
+        "dimensions": int(full.vectors.shape[1]),
+        "num_queries": int(len(query_vectors)),
+        "top_k": top_k,
+        "full_precision_mb": round(full.vectors.nbytes / 1e6, 2),
+        "variants": rows,
+    }
+
+
+def print_report(report: dict) -> None:
+    top_k = report["top_k"]
+    print(f"\n{'='*88}")
+    print(f"VECTOR INDEX FOOTPRINT — {report['num_vectors']:,} vectors × {report['dimensions']} dims, "
+          f"{report['num_queries']} queries")
+    print(f"{'='*88}")
+    header = (f"  {'variant':<18}{'coarse MB':>10}{'disk MB':>9}{f'R@{top_k}':>9}{f'R@{FINAL_TOP_K}':>8}"
+              f"{'R no-rescore':>14}{'p50 ms':>9}{'p95 ms':>9}")
+    print(header)
+    print(f"  {'-'*(len(header) - 2)}")
+    for r in report["variants"]:
+        print(f"  {r['variant']:<18}{r['coarse_mb']:>10.2f}{r['disk_mb']:>9.2f}{r[f'recall@{top_k}']:>9.3f}"
+              f"{r[f'recall@{FINAL_TOP_K}']:>8.3f}{r[f'recall@{top_k}_no_rescore']:>14.3f}"
+              f"{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}")
+    print(f"\n  Rescoring reads only top_k × RESCORE_FACTOR rows from the "
+          f"{report['full_precision_mb']:.1f} MB full-precision store (mmap).")
+    print("  That store stays on disk beside ChromaDB, so a variant adds to the on-disk\n"
+          "  footprint; it only shrinks what is resident.")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency vs size for vector index variants")
+    parser.add_argument("--platform", default=None, help="Platform ID (e.g., fps, fds)")
+    parser.add_argument("--vertical", default=None, help="Vertical ID (e.g., hydraulic_filtration)")
+    parser.add_argument("--collection", default=None, help="Child collection (overrides --platform/--vertical)")
+    parser.add_argument("--variants", default=",".join(DEFAULT_VARIANTS), help="Comma-separated variants")
+    parser.add_argument("--top-k", type=int, default=SEMANTIC_TOP_K, help="Recall depth")
+    parser.add_argument("--output", default=None, help="Write JSON report to this path")
+    args = parser.parse_args()
+
+    collection = args.collection
+    if not collection and args.platform and args.vertical:
+        from core.vertical_loader import get_vertical_config
+        collection = get_vertical_config(args.platform, args.vertical).child_collection
+    collection = collection or CHILD_COLLECTION
+
+    full = FlatIndex.load(collection)
+    if full is None:
+        print(f"[!] No flat export for {collection}. Run: python -m core.retrieval.ingest --export-flat")
+        raise SystemExit(1)
+
+    from .test_coverage import TEST_QUERIES
+    from .hybrid_search import _get_openai
+
+    queries = [q["query"] for q in TEST_QUERIES]
+    response = _get_openai().embeddings.create(model=EMBEDDING_MODEL, input=queries)
+    query_vectors = np.asarray([d.embedding for d in response.data], dtype=np.float32)
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    report = build_report(full, query_vectors, variants, top_k=args.top_k)
+    report["collection"] = collection
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,7 @@ Usage:
     py -3.12 ingest.py "path/to/document.pdf" --collection reference --tags "spray-systems,general"
     py -3.12 ingest.py --status
     py -3.12 ingest.py --rebuild-bm25
+    py -3.12 ingest.py --export-flat
 """
 
 import argparse
@@ -631,6 +632,10 @@ Examples:
     parser.add_argument("--source-dir", default=None, help="Ingest all .md files from this directory")
     parser.add_argument("--status", action="store_true", help="Show knowledge base status")
     parser.add_argument("--rebuild-bm25", action="store_true", help="Rebuild the BM25 keyword index")
+    parser.add_argument("--export-flat", action="store_true",
+                        help="Export child embeddings to a flat .npy index (SEMANTIC_BACKEND=flat)")
+    parser.add_argument("--flat-dtype", default=None, choices=["float16", "float32"],
+                        help="Flat index precision (default: float16)")
 
     args = parser.parse_args()
 
@@ -646,6 +651,14 @@ Examples:
             bm25_output_path=bm25_path,
         )
         print("Done.")
+    elif args.export_flat:
+        from .flat_index import export_flat_index
+        print("Exporting flat vector index...")
+        export_kwargs = {"chroma_client": chroma_client}
+        if args.flat_dtype:
+            export_kwargs["dtype"] = args.flat_dtype
+        export_flat_index(child_col or CHILD_COLLECTION, **export_kwargs)
+        print("Done.")
     elif args.source_dir:
         # Batch ingest all .md files from a directory
         source_dir = Path(args.source_dir)
@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+"""
+Fluidoracle — Reduced-Dimension / Quantized Vector Index
+==============================================
+Smaller coarse indexes built from a flat export (see flat_index.py), with a
+full-precision rescoring step.
+
+Variants are named "<dims>-<quant>", either part optional:
+
+  d512, d768          — Matryoshka truncation: text-embedding-3 vectors keep
+                        most of their ranking quality when cut to a prefix
+                        and re-normalized, so no re-embedding is needed
+  int8                — symmetric per-dimension scalar quantization (4× smaller)
+  binary              — sign bits packed 8/byte, Hamming distance (32× smaller)
+  d512-int8, d768-binary, ...
+
+Search runs in two passes:
+  1. Coarse: score every row with the compact codes, keep the best
+     top_k × RESCORE_FACTOR candidates.
+  2. Rescore: exact cosine for those rows against the full-precision flat
+     matrix. It is mmap'd, so only the touched rows are paged in — the
+     resident footprint is the coarse codes.
+
+Memory shrinks; disk does not. Rescoring needs the full-precision flat
+export, which stays on disk next to the ChromaDB store, and the codes are
+written beside it — so every variant adds to the on-disk footprint rather
+than replacing anything. index_report prints both.
+
+Files live beside the flat export:
+  <FLAT_INDEX_PATH>/<collection>.<variant>.codes.npy
+  <FLAT_INDEX_PATH>/<collection>.<variant>.scale.npy   (int8 only)
+  <FLAT_INDEX_PATH>/<collection>.variant               (active variant name)
+
+Usage:
+    python -m core.retrieval.quantized_index --platform fps --vertical hydraulic_filtration \\
+        --variant d512-int8 --activate
+    python -m core.retrieval.index_report --platform fps --vertical hydraulic_filtration
+"""
+
+import argparse
+import re
+from pathlib import Path
+
+import numpy as np
+
+from .config import FLAT_INDEX_PATH, RESCORE_FACTOR, VERBOSE
+from .flat_index import FlatIndex, _BLOCK_ROWS
+
+_VARIANT_RE = re.compile(r"^d(?P<dims>\d+)(?:-(?P<quant>float16|int8|binary))?$|^(?P<quant_only>float16|int8|binary)$")
+
+# Bits set per byte value — popcount for Hamming distance over packed codes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def parse_variant(variant: str) -> tuple[int | None, str]:
+    """Split "d512-int8" → (512, "int8"). Quantization defaults to float16."""
+    m = _VARIANT_RE.match(variant.strip().lower())
+    if not m or (m.group("dims") and int(m.group("dims")) == 0):
+        raise ValueError(f"Unknown index variant: {variant!r} (expected e.g. d512, int8, d768-binary)")
+    dims = int(m.group("dims")) if m.group("dims") else None
+    return dims, m.group("quant") or m.group("quant_only") or "float16"
+
+
+def _truncate(vectors: np.ndarray, dims: int | None) -> np.ndarray:
+    """Keep the first `dims` components and re-normalize rows (float32)."""
+    v = np.asarray(vectors if dims is None else vectors[..., :dims], dtype=np.float32)
+    norms = np.linalg.norm(v, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return v / norms
+
+
+def _variant_paths(collection_name: str, variant: str, index_dir: str | Path | None) -> tuple[Path, Path]:
+    base = Path(index_dir) if index_dir else FLAT_INDEX_PATH
+    return base / f"{collection_name}.{variant}.codes.npy", base / f"{collection_name}.{variant}.scale.npy"
+
+
+def active_variant(collection_name: str, index_dir: str | Path | None = None) -> str | None:
+    """Variant chosen for a collection with --activate, or None for the plain flat index."""
+    base = Path(index_dir) if index_dir else FLAT_INDEX_PATH
+    marker = base / f"{collection_name}.variant"
+    if not marker.exists():
+        return None
+    return marker.read_text().strip() or None
+
+
+class QuantizedIndex:
+    """Compact coarse index over a FlatIndex, with exact rescoring."""
+
+    def __init__(
+        self,
+        full: FlatIndex,
+        variant: str,
+        codes: np.ndarray,
+        scale: np.ndarray | None = None,
+        rescore_factor: int = RESCORE_FACTOR,
+    ):
+        self.full = full
+        self.variant = variant
+        self.dims, self.quant = parse_variant(variant)
+        self.codes = codes
+        self.scale = scale
+        self.rescore_factor = rescore_factor
+
+    # -- build / persist ----------------------------------------------------
+
+    @classmethod
+    def build(cls, full: FlatIndex, variant: str, rescore_factor: int = RESCORE_FACTOR) -> QuantizedIndex:
+        """Derive coarse codes from a full-precision flat index (in memory)."""
+        dims, quant = parse_variant(variant)
+        n = len(full)
+        width = dims or full.vectors.shape[1]
+
+        scale = None
+        if quant == "int8":
+            # Per-dimension symmetric scale from the max magnitude in each column
+            max_abs = np.zeros(width, dtype=np.float32)
+            for start in range(0, n, _BLOCK_ROWS):
+                block = _truncate(full.vectors[start:start + _BLOCK_ROWS], dims)
+                np.maximum(max_abs, np.abs(block).max(axis=0), out=max_abs)
+            max_abs[max_abs == 0] = 1.0
+            scale = max_abs / 127.0
+            codes = np.empty((n, width), dtype=np.int8)
+        elif quant == "binary":
+            codes = np.empty((n, (width + 7) // 8), dtype=np.uint8)
+        else:
+            codes = np.empty((n, width), dtype=np.float16)
+
+        for start in range(0, n, _BLOCK_ROWS):
+            block = _truncate(full.vectors[start:start + _BLOCK_ROWS], dims)
+            end = start + len(block)
+            if quant == "int8":
+                codes[start:end] = np.clip(np.rint(block / scale), -127, 127)
+            elif quant == "binary":
+                codes[start:end] = np.packbits(block > 0, axis=1)
+            else:
+                codes[start:end] = block
+
+        return cls(full, variant, codes, scale, rescore_factor)
+
+    def save(self, collection_name: str, index_dir: str | Path | None = None) -> Path:
+        codes_path, scale_path = _variant_paths(collection_name, self.variant, index_dir)
+        codes_path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(codes_path, np.ascontiguousarray(self.codes))
+        if self.scale is not None:
+            np.save(scale_path, self.scale)
+        return codes_path
+
+    @classmethod
+    def load(
+        cls,
+        collection_name: str,
+        variant: str,
+        full: FlatIndex,
+        index_dir: str | Path | None = None,
+    ) -> QuantizedIndex | None:
+        codes_path, scale_path = _variant_paths(collection_name, variant, index_dir)
+        if not codes_path.exists():
+            return None
+        codes = np.load(codes_path, mmap_mode="r")
+        scale = np.load(scale_path) if scale_path.exists() else None
+        return cls(full, variant, codes, scale)
+
+    # -- size ---------------------------------------------------------------
+
+    @property
+    def nbytes(self) -> int:
+        """Resident bytes of the coarse index (codes + scale)."""
+        return int(self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0))
+
+    def __len__(self) -> int:
+        return len(self.full)
+
+    # -- search -------------------------------------------------------------
+
+    def coarse_scores(self, query_embedding) -> np.ndarray:
+        """Approximate cosine (truncated/int8) or 1 − 2·Hamming/bits (binary) for every row."""
+        q = _truncate(np.asarray(query_embedding, dtype=np.float32), self.dims)
+        n = len(self.codes)
+        out = np.empty(n, dtype=np.float32)
+
+        if self.quant == "binary":
+            q_bits = np.packbits(q > 0)
+            bits = q.shape[-1]
+            for start in range(0, n, _BLOCK_ROWS):
+                block = np.asarray(self.codes[start:start + _BLOCK_ROWS])
+                hamming = _POPCOUNT[np.bitwise_xor(block, q_bits)].sum(axis=1)
+                out[start:start + len(block)] = 1.0 - 2.0 * hamming / bits
+            return out
+
+        if self.quant == "int8":
+            q = q * self.scale
+        for start in range(0, n, _BLOCK_ROWS):
+            block = np.asarray(self.codes[start:start + _BLOCK_ROWS], dtype=np.float32)
+            out[start:start + len(block)] = block @ q
+        return out
+
+    def search(
+        self,
+        query_embedding,
+        top_k: int,
+        where_filter: dict | None = None,
+        rescore: bool = True,
+    ) -> list[dict]:
+        """Coarse top-(k × factor), then exact rescoring. Same hit shape as FlatIndex.search."""
+        if len(self) == 0:
+            return []
+
+        scores = self.coarse_scores(query_embedding)
+        if where_filter:
+            mask = self.full.filter_mask(where_filter)
+            scores[~mask] = -np.inf
+            available = int(mask.sum())
+        else:
+            available = len(scores)
+
+        k = min(top_k, available)
+        if k <= 0:
+            return []
+
+        pool = min(available, k * self.rescore_factor) if rescore else k
+        if pool < len(scores):
+            rows = np.argpartition(-scores, pool - 1)[:pool]
+        else:
+            rows = np.arange(len(scores))
+        rows = rows[np.isfinite(scores[rows])]
+
+        if rescore:
+            q = _truncate(np.asarray(query_embedding, dtype=np.float32), None)
+            order = np.sort(rows)  # ascending row order → sequential mmap reads
+            exact = np.asarray(self.full.vectors[order], dtype=np.float32) @ q
+            final = dict(zip(order.tolist(), exact.tolist()))
+        else:
+            final = {int(r): float(scores[r]) for r in rows}
+
+        top = sorted(final, key=lambda r: -final[r])[:k]
+        return [
+            {
+                "child_id": self.full.ids[i],
+                "child_text": self.full.documents[i],
+                "metadata": self.full.metadatas[i],
+                "semantic_score": max(0.0, final[i]),
+                "bm25_score": 0.0,
+                "source": "semantic",
+            }
+            for i in top
+        ]
+
+
+# ===========================================================================
+# CLI
+# ===========================================================================
+
+def main():
+    from .config import CHILD_COLLECTION
+
+    parser = argparse.ArgumentParser(description="Build a reduced-dimension / quantized vector index")
+    parser.add_argument("--platform", default=None, help="Platform ID (e.g., fps, fds)")
+    parser.add_argument("--vertical", default=None, help="Vertical ID (e.g., hydraulic_filtration)")
+    parser.add_argument("--collection", default=None, help="Child collection (overrides --platform/--vertical)")
+    parser.add_argument("--variant", required=True, help="e.g. d512, d768, int8, binary, d512-int8")
+    parser.add_argument("--activate", action="store_true",
+                        help="Serve this variant for the collection (SEMANTIC_BACKEND=flat)")
+    args = parser.parse_args()
+
+    collection = args.collection
+    if not collection and args.platform and args.vertical:
+        from core.vertical_loader import get_vertical_config
+        collection = get_vertical_config(args.platform, args.vertical).child_collection
+    collection = collection or CHILD_COLLECTION
+
+    full = FlatIndex.load(collection)
+    if full is None:
+        print(f"[!] No flat export for {collection}. Run: python -m core.retrieval.ingest --export-flat")
+        raise SystemExit(1)
+
+    index = QuantizedIndex.build(full, args.variant)
+    path = index.save(collection)
+    if VERBOSE:
+        print(f"  {args.variant}: {index.nbytes / 1e6:.1f} MB coarse "
+              f"(full-precision store {full.vectors.nbytes / 1e6:.1f} MB) → {path}")
+
+    if args.activate:
+        (FLAT_INDEX_PATH / f"{collection}.variant").write_text(args.variant + "\n")
+        print(f"  Activated {args.variant} for {collection}")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,14 +33,17 @@ def display_results(query: str, results: list[dict], show_child: bool = False):
     for i, r in enumerate(results, 1):
         score = r["rerank_score"]
         # Confidence label based on rerank score
-        if score >= 0.75:
+        if score is None:
+            conf = "UNRERANKED"
+        elif score >= 0.75:
             conf = "HIGH"
         elif score >= 0.40:
             conf = "MEDIUM"
         else:
             conf = "LOW"
 
-        print(f"\n╔══ Result {i}  [{conf} confidence: {score:.3f}] ══")
+        shown = "n/a" if score is None else f"{score:.3f}"
+        print(f"\n╔══ Result {i}  [{conf} confidence: {shown}] ══")
         print(f"║  Source: {r['source']}")
         print(f"║  Scores — Semantic: {r['semantic_score']:.3f} | BM25: {r['bm25_score']:.3f} | Combined: {r['combined_score']:.3f}")
         print(f"╠══ Context ══")
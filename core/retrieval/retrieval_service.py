@@ -0,0 +1,568 @@
+from __future__ import annotations
+
+"""
+Fluidoracle — Out-of-Process Retrieval Service
+==============================================
+One process holds the ChromaDB client, BM25 indexes and cross-encoder; every
+web worker talks to it over a local Unix socket. RAM no longer scales with
+the uvicorn worker count, so workers can be added for I/O concurrency.
+
+Enable by setting RETRIEVAL_SOCKET (e.g. /tmp/fluidoracle-retrieval.sock).
+hybrid_search.search() then transparently forwards to the service — same
+signature, same result dicts. If the service cannot be reached (a
+connection or socket error), search() asks for a respawn and answers that
+request in-process; errors the service itself reports are raised. So is a
+search that outlives the client timeout: the service is up but slow, and
+neither a resend nor an in-process search (loading the indexes into the web
+worker) would help it.
+
+The service's lifetime belongs to no single web worker:
+
+  gunicorn   deploy/gunicorn.conf.py runs it from the master (supervise()),
+             which respawns it whenever it exits
+  uvicorn    the first worker to find it down spawns it (start_service());
+             it runs until the process managing the workers exits, so a
+             worker restart does not take retrieval down for the others
+
+The running service holds an exclusive flock on "<socket>.lock"; a second
+copy started by a race exits at once.
+
+Wire protocol (all integers big-endian):
+
+  frame    := type:u8  length:u32  payload[length]
+  request  := SEARCH  top_k:u16  flags:u8  sem_w:f64  bm25_w:f64  budget_ms:f64
+              str(query) str(child) str(parent) str(bm25_path) str(filter_json)
+  response := RESULTS count:u16  { scores:4×f32  str(parent_id) str(parent_text)
+              str(child_text) str(source) str(rerank_path) str(metadata_json)
+              str(parent_metadata_json) } × count
+            | ERROR str(message)
+  str      := length:u32  utf-8 bytes
+
+NaN encodes "None" for the optional floats (and for an unreranked result's
+rerank_score). Chunk text travels as raw UTF-8,
+not JSON-escaped; only the small metadata dicts are JSON.
+
+Usage:
+    python -m core.retrieval.retrieval_service --socket /tmp/fluidoracle-retrieval.sock --platform fps
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from .config import RETRIEVAL_SOCKET
+
+logger = logging.getLogger(__name__)
+
+MSG_SEARCH = 0x01
+MSG_PING = 0x02
+MSG_RESULTS = 0x81
+MSG_ERROR = 0x82
+MSG_PONG = 0x83
+
+_FRAME = struct.Struct("!BI")
+_SEARCH_HEAD = struct.Struct("!HBddd")
+_SCORES = struct.Struct("!ffff")
+_COUNT = struct.Struct("!H")
+_STRLEN = struct.Struct("!I")
+
+_FLAG_RERANK = 0x01
+_FLAG_CASCADE_SET = 0x02
+_FLAG_CASCADE = 0x04
+
+_RESULT_STRINGS = ("parent_id", "parent_text", "child_text", "source", "rerank_path")
+
+RESPAWN_INTERVAL_S = 30.0   # least time between spawns of the service by one process
+_OWNER_POLL_S = 2.0         # how often a service checks that its owner is alive
+
+
+# ===========================================================================
+# Encoding
+# ===========================================================================
+
+def _pack_str(value: str | None) -> bytes:
+    data = (value or "").encode("utf-8")
+    return _STRLEN.pack(len(data)) + data
+
+
+def _unpack_str(buf: memoryview, offset: int) -> tuple[str, int]:
+    (n,) = _STRLEN.unpack_from(buf, offset)
+    offset += _STRLEN.size
+    return bytes(buf[offset:offset + n]).decode("utf-8"), offset + n
+
+
+def _opt_float(value: float | None) -> float:
+    return float("nan") if value is None else float(value)
+
+
+def _from_opt_float(value: float) -> float | None:
+    return None if math.isnan(value) else value
+
+
+def encode_search_request(
+    query: str,
+    top_k: int,
+    use_reranker: bool = True,
+    semantic_weight: float | None = None,
+    bm25_weight: float | None = None,
+    metadata_filter: dict | None = None,
+    child_collection: str | None = None,
+    parent_collection: str | None = None,
+    bm25_index_path: str | None = None,
+    cascade: bool | None = None,
+    rerank_budget_ms: float | None = None,
+) -> bytes:
+    flags = (_FLAG_RERANK if use_reranker else 0)
+    if cascade is not None:
+        flags |= _FLAG_CASCADE_SET | (_FLAG_CASCADE if cascade else 0)
+    return b"".join((
+        _SEARCH_HEAD.pack(top_k, flags, _opt_float(semantic_weight),
+                          _opt_float(bm25_weight), _opt_float(rerank_budget_ms)),
+        _pack_str(query),
+        _pack_str(child_collection),
+        _pack_str(parent_collection),
+        _pack_str(str(bm25_index_path) if bm25_index_path else None),
+        _pack_str(json.dumps(metadata_filter) if metadata_filter else None),
+    ))
+
+
+def decode_search_request(payload: bytes) -> dict:
+    buf = memoryview(payload)
+    top_k, flags, sem_w, bm25_w, budget = _SEARCH_HEAD.unpack_from(buf, 0)
+    offset = _SEARCH_HEAD.size
+    query, offset = _unpack_str(buf, offset)
+    child, offset = _unpack_str(buf, offset)
+    parent, offset = _unpack_str(buf, offset)
+    bm25_path, offset = _unpack_str(buf, offset)
+    filter_json, offset = _unpack_str(buf, offset)
+    return {
+        "query": query,
+        "top_k": top_k,
+        "use_reranker": bool(flags & _FLAG_RERANK),
+        "semantic_weight": _from_opt_float(sem_w),
+        "bm25_weight": _from_opt_float(bm25_w),
+        "metadata_filter": json.loads(filter_json) if filter_json else None,
+        "child_collection": child or None,
+        "parent_collection": parent or None,
+        "bm25_index_path": bm25_path or None,
+        "cascade": bool(flags & _FLAG_CASCADE) if flags & _FLAG_CASCADE_SET else None,
+        "rerank_budget_ms": _from_opt_float(budget),
+    }
+
+
+def encode_results(results: list[dict]) -> bytes:
+    parts = [_COUNT.pack(len(results))]
+    for r in results:
+        parts.append(_SCORES.pack(
+            _opt_float(r.get("rerank_score")), r.get("semantic_score", 0.0),
+            r.get("bm25_score", 0.0), r.get("combined_score", 0.0),
+        ))
+        for key in _RESULT_STRINGS:
+            parts.append(_pack_str(r.get(key)))
+        parts.append(_pack_str(json.dumps(r.get("metadata", {}))))
+        parts.append(_pack_str(json.dumps(r.get("parent_metadata", {}))))
+    return b"".join(parts)
+
+
+def decode_results(payload: bytes) -> list[dict]:
+    buf = memoryview(payload)
+    (count,) = _COUNT.unpack_from(buf, 0)
+    offset = _COUNT.size
+    results = []
+    for _ in range(count):
+        rerank, semantic, bm25, combined = _SCORES.unpack_from(buf, offset)
+        offset += _SCORES.size
+        fields = {}
+        for key in _RESULT_STRINGS:
+            fields[key], offset = _unpack_str(buf, offset)
+        metadata, offset = _unpack_str(buf, offset)
+        parent_metadata, offset = _unpack_str(buf, offset)
+        results.append({
+            "parent_id": fields["parent_id"],
+            "parent_text": fields["parent_text"],
+            "child_text": fields["child_text"],
+            "source": fields["source"],
+            # f32 on the wire; round as search() does so values compare equal
+            "rerank_score": None if math.isnan(rerank) else round(rerank, 4),
+            "semantic_score": round(semantic, 4),
+            "bm25_score": round(bm25, 4),
+            "combined_score": round(combined, 4),
+            "metadata": json.loads(metadata),
+            "parent_metadata": json.loads(parent_metadata),
+            "rerank_path": fields["rerank_path"],
+        })
+    return results
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    chunks = []
+    while n:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            raise ConnectionError("retrieval service closed the connection")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def _read_frame(sock: socket.socket) -> tuple[int, bytes]:
+    msg_type, length = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    return msg_type, _recv_exact(sock, length) if length else b""
+
+
+def _send_frame(sock: socket.socket, msg_type: int, payload: bytes = b"") -> None:
+    sock.sendall(_FRAME.pack(msg_type, len(payload)) + payload)
+
+
+# ===========================================================================
+# Server
+# ===========================================================================
+
+class _Handler(socketserver.BaseRequestHandler):
+    """One persistent connection per client; frames are handled in order."""
+
+    def handle(self):
+        from .hybrid_search import _local_search
+        while True:
+            try:
+                msg_type, payload = _read_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                if msg_type == MSG_PING:
+                    _send_frame(self.request, MSG_PONG)
+                elif msg_type == MSG_SEARCH:
+                    kwargs = decode_search_request(payload)
+                    results = _local_search(**kwargs)
+                    _send_frame(self.request, MSG_RESULTS, encode_results(results))
+                else:
+                    _send_frame(self.request, MSG_ERROR, _pack_str(f"unknown message type {msg_type}"))
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                try:
+                    _send_frame(self.request, MSG_ERROR, _pack_str(f"{type(e).__name__}: {e}"))
+                except OSError:
+                    return
+
+
+class RetrievalServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _warmup(platform_id: str | None) -> None:
+    """Load every vertical's indexes and the cross-encoder before accepting requests."""
+    if not platform_id:
+        return
+    from core.vertical_loader import load_platform
+    from .hybrid_search import _local_search
+    for vid, vc in load_platform(platform_id).verticals.items():
+        try:
+            _local_search(
+                "warmup", top_k=1, use_reranker=True,
+                child_collection=vc.child_collection,
+                parent_collection=vc.parent_collection,
+                bm25_index_path=vc.bm25_index_path,
+            )
+            print(f"[retrieval-service] Warmed: {vid}")
+        except Exception as e:
+            print(f"[retrieval-service] WARNING: warmup failed for {vid}: {e}")
+
+
+def _take_lock(socket_path: str):
+    """Exclusive flock on "<socket>.lock", or None if another process holds it."""
+    import fcntl
+    lock_file = open(f"{socket_path}.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _watch_owner(owner_pid: int, server: RetrievalServer) -> None:
+    while _alive(owner_pid):
+        time.sleep(_OWNER_POLL_S)
+    print(f"[retrieval-service] Owner process {owner_pid} exited; shutting down")
+    server.shutdown()
+
+
+def serve(socket_path: str, platform_id: str | None = None, owner_pid: int | None = None) -> None:
+    """Run the retrieval service in the foreground, until killed or, with
+    owner_pid, until that process exits."""
+    lock = _take_lock(socket_path)
+    if lock is None:
+        print(f"[retrieval-service] Another service holds {socket_path}.lock; exiting")
+        return
+    path = Path(socket_path)
+    try:
+        if path.exists():
+            path.unlink()
+        _warmup(platform_id)
+        with RetrievalServer(str(path), _Handler) as server:
+            os.chmod(path, 0o600)
+            if owner_pid:
+                threading.Thread(target=_watch_owner, args=(owner_pid, server), daemon=True).start()
+            print(f"[retrieval-service] Listening on {path} (pid {os.getpid()})")
+            try:
+                server.serve_forever()
+            finally:
+                if path.exists():
+                    path.unlink()
+    finally:
+        lock.close()
+
+
+# ===========================================================================
+# Client shim
+# ===========================================================================
+
+class RetrievalServiceError(RuntimeError):
+    """An error the service reported for a request (not an unreachable service)."""
+
+
+class RetrievalClient:
+    """Thread-safe client; keeps one persistent connection per thread."""
+
+    def __init__(self, socket_path: str, timeout: float = 60.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+            self._local.sock = None
+
+    def _roundtrip(self, msg_type: int, payload: bytes = b"") -> tuple[int, bytes]:
+        # One retry covers a stale connection left over from a service restart
+        for attempt in range(2):
+            try:
+                sock = self._connect()
+                _send_frame(sock, msg_type, payload)
+                return _read_frame(sock)
+            except TimeoutError as e:
+                # Slow, not down: never resent. The late reply would land on
+                # this connection's next request, so it is dropped.
+                self._close()
+                raise RetrievalServiceError(f"retrieval service timed out after {self.timeout:g}s") from e
+            except (ConnectionError, OSError):
+                self._close()
+                if attempt:
+                    raise
+
+    def ping(self) -> bool:
+        try:
+            msg_type, _ = self._roundtrip(MSG_PING)
+            return msg_type == MSG_PONG
+        except (ConnectionError, OSError, RetrievalServiceError):
+            return False
+
+    def search(self, query: str, top_k: int, **kwargs) -> list[dict]:
+        msg_type, payload = self._roundtrip(MSG_SEARCH, encode_search_request(query, top_k, **kwargs))
+        if msg_type == MSG_ERROR:
+            message, _ = _unpack_str(memoryview(payload), 0)
+            raise RetrievalServiceError(f"retrieval service error: {message}")
+        return decode_results(payload)
+
+
+_client: RetrievalClient | None = None
+
+
+def get_client() -> RetrievalClient | None:
+    """Client for RETRIEVAL_SOCKET, or None when the service is not configured."""
+    global _client
+    if not RETRIEVAL_SOCKET:
+        return None
+    if _client is None:
+        _client = RetrievalClient(RETRIEVAL_SOCKET)
+    return _client
+
+
+# ===========================================================================
+# Launch and supervision
+# ===========================================================================
+
+_service_proc: subprocess.Popen | None = None   # spawned by this process
+_last_spawn = 0.0
+_platform_id = ""                               # remembered by start_service() for respawns
+_socket_path = ""
+
+
+def _spawn(platform_id: str, socket_path: str, owner_pid: int) -> subprocess.Popen:
+    project_root = Path(__file__).parent.parent.parent
+    return subprocess.Popen(
+        [sys.executable, "-m", "core.retrieval.retrieval_service",
+         "--socket", socket_path, "--platform", platform_id, "--owner-pid", str(owner_pid)],
+        cwd=str(project_root),
+        start_new_session=True,
+    )
+
+
+def _owner_pid() -> int:
+    """Process whose exit ends a worker-spawned service: the uvicorn supervisor
+    when this is one of its workers, otherwise this process."""
+    import multiprocessing
+    parent = multiprocessing.parent_process()
+    return parent.pid if parent is not None else os.getpid()
+
+
+def _spawn_if_down(platform_id: str, socket_path: str) -> bool:
+    """Spawn the service unless one holds the lock. Returns whether it spawned."""
+    global _service_proc, _last_spawn
+    if _service_proc is not None and _service_proc.poll() is None:
+        return False    # ours is still warming up
+    lock = _take_lock(socket_path)
+    if lock is None:
+        return False
+    lock.close()        # the service takes it itself
+    _service_proc = _spawn(platform_id, socket_path, _owner_pid())
+    _last_spawn = time.monotonic()
+    return True
+
+
+def start_service(platform_id: str, socket_path: str | None = None, wait_s: float = 300.0) -> bool:
+    """Ensure a retrieval service is listening, spawning it if none is running.
+
+    Every worker calls this from its lifespan (in a thread: it blocks while
+    the service warms up). Returns True once the service answers a ping.
+    """
+    global _platform_id, _socket_path
+    socket_path = socket_path or RETRIEVAL_SOCKET
+    _platform_id, _socket_path = platform_id, socket_path
+    client = RetrievalClient(socket_path, timeout=5.0)
+    if client.ping():
+        return True
+
+    _spawn_if_down(platform_id, socket_path)
+    deadline = time.monotonic() + wait_s
+    while time.monotonic() < deadline:
+        if client.ping():
+            return True
+        # Exit code 0 is a duplicate that lost the lock race; keep waiting for the winner
+        if _service_proc is not None and _service_proc.poll():
+            logger.warning(f"[retrieval_service] service exited with code {_service_proc.returncode}")
+            return False
+        time.sleep(0.5)
+    logger.warning(f"[retrieval_service] service not reachable at {socket_path}")
+    return False
+
+
+def respawn_if_down() -> None:
+    """Called by hybrid_search.search() when the service is unreachable: spawn
+    a new one if none is running, at most once per RESPAWN_INTERVAL_S. Does
+    not wait for it."""
+    global _last_spawn
+    if not _platform_id or time.monotonic() - _last_spawn < RESPAWN_INTERVAL_S:
+        return
+    _last_spawn = time.monotonic()
+    try:
+        if _spawn_if_down(_platform_id, _socket_path):
+            logger.warning(f"[retrieval_service] service down; respawned at {_socket_path}")
+    except Exception as e:
+        logger.warning(f"[retrieval_service] respawn failed: {e}")
+
+
+_supervisor: threading.Thread | None = None
+_supervisor_stop = threading.Event()
+_supervised: subprocess.Popen | None = None
+
+
+def supervise(platform_id: str, socket_path: str | None = None) -> None:
+    """Run the service as a child of this process (the gunicorn master) and
+    respawn it whenever it exits, until stop_supervised()."""
+    global _supervisor
+    socket_path = socket_path or RETRIEVAL_SOCKET
+    if _supervisor is not None:
+        return
+
+    def _loop():
+        global _supervised
+        last_spawn = -RESPAWN_INTERVAL_S
+        while not _supervisor_stop.is_set():
+            proc = _supervised
+            if proc is None or proc.poll() is not None:
+                if proc is not None and proc.returncode:
+                    logger.warning(f"[retrieval_service] service exited with code {proc.returncode}; respawning")
+                # A service that keeps crashing is respawned at most once per interval
+                wait = last_spawn + RESPAWN_INTERVAL_S - time.monotonic()
+                if wait > 0 and _supervisor_stop.wait(wait):
+                    return
+                lock = _take_lock(socket_path)
+                if lock is None:
+                    _supervised = None      # another copy is running or warming up
+                else:
+                    lock.close()
+                    _supervised = _spawn(platform_id, socket_path, os.getpid())
+                    last_spawn = time.monotonic()
+            _supervisor_stop.wait(_OWNER_POLL_S)
+
+    _supervisor_stop.clear()
+    _supervisor = threading.Thread(target=_loop, name="retrieval-supervisor", daemon=True)
+    _supervisor.start()
+
+
+def stop_supervised() -> None:
+    """Stop supervising and terminate the supervised service (at master exit)."""
+    global _supervisor, _supervised
+    if _supervisor is None:
+        return
+    _supervisor_stop.set()
+    _supervisor.join(timeout=5)
+    _supervisor = None
+    proc, _supervised = _supervised, None
+    if proc is None or proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fluidoracle retrieval service (Unix socket)")
+    parser.add_argument("--socket", default=RETRIEVAL_SOCKET or "/tmp/fluidoracle-retrieval.sock",
+                        help="Unix socket path")
+    parser.add_argument("--platform", default=os.getenv("PLATFORM_ID"), help="Platform to pre-warm")
+    parser.add_argument("--owner-pid", type=int, default=None, help="Exit when this process exits")
+    args = parser.parse_args()
+    serve(args.socket, args.platform, args.owner_pid)
+
+
+if __name__ == "__main__":
+    main()
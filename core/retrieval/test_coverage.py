@@ -24,7 +24,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from .config import HIGH_CONFIDENCE_THRESHOLD, MEDIUM_CONFIDENCE_THRESHOLD
 from . import config as _config_module
-import verified_query as _vq_module
+from . import verified_query as _vq_module
 from .verified_query import verified_query
 
 
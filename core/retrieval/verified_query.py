@@ -186,6 +186,12 @@ def _humanize_source(source_filename: str) -> str:
 # Confidence Assessment
 # ===========================================================================
 
+def format_relevance(score: float | None) -> str:
+    """A result's rerank score for a prompt or report; results the
+    cross-encoder did not score (rerank_score None) say so."""
+    return "not reranked" if score is None else f"{score:.3f}"
+
+
 def assess_confidence(results: list[dict]) -> dict:
     """Analyze retrieval results and produce a structured confidence assessment.
     
@@ -199,7 +205,11 @@ def assess_confidence(results: list[dict]) -> dict:
             "sources": [list of unique source filenames],
             "contradictions": [list of potential contradictions],
             "reasoning": str,
+            "unscored": bool,   # nothing was cross-encoded (rerank budget spent)
         }
+
+    A result set the cross-encoder skipped is not evidence of a gap: it
+    is assessed MEDIUM on its hybrid-search order, not LOW.
     """
     if not results:
         return {
@@ -211,10 +221,12 @@ def assess_confidence(results: list[dict]) -> dict:
             "sources": [],
             "contradictions": [],
             "reasoning": "No relevant documents found in the knowledge base.",
+            "unscored": False,
         }
 
-    scores = [r["rerank_score"] for r in results]
-    top_score = max(scores)
+    # Only cross-encoder scores count; unreranked results have none
+    scores = [r["rerank_score"] for r in results if r.get("rerank_score") is not None]
+    top_score = max(scores, default=0.0)
     high_conf_count = sum(1 for s in scores if s >= HIGH_CONFIDENCE_THRESHOLD)
     sources = list(set(r["source"] for r in results))
 
@@ -236,6 +248,12 @@ def assess_confidence(results: list[dict]) -> dict:
             f"Moderate confidence. Top score: {top_score:.3f}. "
             f"Limitations: {'; '.join(reasons)}. Verify before relying on this."
         )
+    elif not scores:
+        level = "MEDIUM"
+        reasoning = (
+            "Relevance unverified. Reranking was skipped under load, so results "
+            "are in hybrid-search order without cross-encoder scores."
+        )
     else:
         level = "LOW"
         reasoning = (
@@ -252,8 +270,8 @@ def assess_confidence(results: list[dict]) -> dict:
         # flag for manual review (a more sophisticated system would compare content)
         r1, r2 = results[0], results[1]
         if (r1["source"] != r2["source"]
-            and r1["rerank_score"] >= MEDIUM_CONFIDENCE_THRESHOLD
-            and r2["rerank_score"] >= MEDIUM_CONFIDENCE_THRESHOLD):
+            and (r1.get("rerank_score") or 0.0) >= MEDIUM_CONFIDENCE_THRESHOLD
+            and (r2.get("rerank_score") or 0.0) >= MEDIUM_CONFIDENCE_THRESHOLD):
             # Check for different content overlap — crude but useful
             words1 = set(r1["parent_text"].lower().split())
             words2 = set(r2["parent_text"].lower().split())
@@ -286,6 +304,7 @@ def assess_confidence(results: list[dict]) -> dict:
         "contradictions": contradictions,
         "reasoning": reasoning,
         "dominant_vendor": dominant_vendor,
+        "unscored": not scores,
     }
 
 
@@ -409,6 +428,7 @@ def verified_query(
     child_collection: str | None = None,
     parent_collection: str | None = None,
     bm25_index_path: str | None = None,
+    rerank_budget_ms: float | None = None,
 ) -> dict:
     """Execute a verified query against the knowledge base.
     
@@ -418,6 +438,7 @@ def verified_query(
         use_reranker: Whether to use cross-encoder reranking
         semantic_weight: Override semantic search weight (0-1). Default uses config value (0.60).
         bm25_weight: Override BM25 keyword weight (0-1). Default uses config value (0.40).
+        rerank_budget_ms: Per-search rerank budget in ms (None → config default).
     
     Returns:
         {
@@ -439,6 +460,7 @@ def verified_query(
         child_collection=child_collection,
         parent_collection=parent_collection,
         bm25_index_path=bm25_index_path,
+        rerank_budget_ms=rerank_budget_ms,
     )
 
     # Assess confidence
@@ -521,7 +543,7 @@ def display_verified_result(result: dict):
     if result["results"]:
         print(f"\n  Retrieved Context ({len(result['results'])} chunks):")
         for i, r in enumerate(result["results"][:5], 1):
-            print(f"\n  ── Chunk {i} [{r['source']}] (score: {r['rerank_score']:.3f}) ──")
+            print(f"\n  ── Chunk {i} [{r['source']}] (score: {format_relevance(r['rerank_score'])}) ──")
             # Truncate for display
             text = r["parent_text"]
             if len(text) > 500:
@@ -42,6 +42,8 @@ async def admin_delete_question(
     """Delete a question and all its associated votes and comments."""
     _verify_admin_key(x_admin_key)
     deleted = await database.delete_question(question_id)
+    from core.answer_cache import forget
+    forget(question_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Question not found")
     return {"status": "deleted", "question_id": question_id}
@@ -123,8 +125,7 @@ async def admin_demand_signals(
     _verify_admin_key(x_admin_key)
 
     import aiosqlite
-    db_path = database._get_db_path()
-    async with aiosqlite.connect(db_path) as db:
+    async with database.reader() as db:
         db.row_factory = aiosqlite.Row
         rows = await db.execute_fetchall(
             """SELECT source_vertical, detected_target_vertical,
@@ -135,7 +136,7 @@ async def admin_demand_signals(
             (limit,),
         )
 
-    async with aiosqlite.connect(db_path) as db:
+    async with database.reader() as db:
         summary_rows = await db.execute_fetchall(
             """SELECT source_vertical, detected_target_vertical, COUNT(*) as count
                FROM off_vertical_demand
@@ -167,15 +168,19 @@ async def admin_llm_costs(
     """View LLM usage costs, grouped by vertical and phase."""
     _verify_admin_key(x_admin_key)
 
-    import aiosqlite
-    db_path = database._get_db_path()
-    async with aiosqlite.connect(db_path) as db:
+    async with database.reader() as db:
         rows = await db.execute_fetchall(
             """SELECT vertical_id, phase, model,
                       COUNT(*) as calls,
                       SUM(input_tokens) as total_input,
                       SUM(output_tokens) as total_output,
-                      SUM(estimated_cost_usd) as total_cost
+                      SUM(cache_creation_input_tokens) as total_cache_write,
+                      SUM(cache_read_input_tokens) as total_cache_read,
+                      SUM(estimated_cost_usd) as total_cost,
+                      SUM(aborted) as aborted,
+                      SUM(output_tokens_saved) as total_saved,
+                      SUM(hedge_loser) as hedge_losers,
+                      SUM(CASE WHEN hedge_loser = 1 THEN estimated_cost_usd ELSE 0 END) as hedge_cost
                FROM llm_usage
                WHERE timestamp > datetime('now', ?)
                GROUP BY vertical_id, phase, model
@@ -184,27 +189,158 @@ async def admin_llm_costs(
         )
         totals = await db.execute_fetchall(
             """SELECT COUNT(*), SUM(input_tokens), SUM(output_tokens),
-                      SUM(estimated_cost_usd)
+                      SUM(cache_creation_input_tokens), SUM(cache_read_input_tokens),
+                      SUM(estimated_cost_usd), SUM(aborted), SUM(output_tokens_saved),
+                      SUM(hedge_loser), SUM(CASE WHEN hedge_loser = 1 THEN estimated_cost_usd ELSE 0 END)
                FROM llm_usage
                WHERE timestamp > datetime('now', ?)""",
             (f"-{days} days",),
         )
 
-    total = totals[0] if totals else (0, 0, 0, 0)
+    total = totals[0] if totals else (0,) * 10
     return {
         "period_days": days,
         "totals": {
             "calls": total[0],
             "input_tokens": total[1],
             "output_tokens": total[2],
-            "estimated_cost_usd": round(total[3] or 0, 4),
+            "cache_write_tokens": total[3],
+            "cache_read_tokens": total[4],
+            "estimated_cost_usd": round(total[5] or 0, 4),
+            # Streams cancelled on client disconnect, and the output tokens
+            # that cancelling them is estimated to have saved
+            "aborted_streams": total[6] or 0,
+            "output_tokens_saved": total[7] or 0,
+            # Hedged calls that lost the race (core/hedging.py): the cost of hedging
+            "hedge_loser_calls": total[8] or 0,
+            "hedge_loser_cost_usd": round(total[9] or 0, 4),
         },
         "breakdown": [
             {
                 "vertical": r[0], "phase": r[1], "model": r[2],
                 "calls": r[3], "input_tokens": r[4], "output_tokens": r[5],
-                "estimated_cost_usd": round(r[6] or 0, 4),
+                "cache_write_tokens": r[6], "cache_read_tokens": r[7],
+                "estimated_cost_usd": round(r[8] or 0, 4),
+                "aborted_streams": r[9] or 0, "output_tokens_saved": r[10] or 0,
+                "hedge_loser_calls": r[11] or 0, "hedge_loser_cost_usd": round(r[12] or 0, 4),
             }
             for r in rows
         ],
     }
+
+
+@router.get("/api/admin/model-routing")
+async def admin_model_routing(
+    x_admin_key: str | None = Header(default=None),
+    days: int = 7,
+):
+    """Model routing (core/model_router.py): calls, latency and cost per
+    tier, rule and model, from the decisions recorded in llm_usage."""
+    _verify_admin_key(x_admin_key)
+
+    from core import model_router
+    async with database.reader() as db:
+        rows = await db.execute_fetchall(
+            """SELECT COALESCE(route_tier, 'unrouted'), route_rule, phase, model,
+                      COUNT(*) as calls,
+                      AVG(latency_ms), MAX(latency_ms), AVG(first_token_ms),
+                      SUM(input_tokens), SUM(output_tokens),
+                      SUM(estimated_cost_usd) as total_cost
+               FROM llm_usage
+               WHERE timestamp > datetime('now', ?)
+                 AND COALESCE(aborted, 0) = 0 AND COALESCE(hedge_loser, 0) = 0
+               GROUP BY route_tier, route_rule, phase, model
+               ORDER BY total_cost DESC""",
+            (f"-{days} days",),
+        )
+
+    return {
+        "period_days": days,
+        "enabled": model_router.MODEL_ROUTING,
+        "tiers": {"fast": model_router.MODEL_TIER_FAST, "standard": model_router.MODEL_TIER_STANDARD},
+        "routes": model_router.MODEL_ROUTES,
+        "breakdown": [
+            {
+                "tier": r[0], "rule": r[1], "phase": r[2], "model": r[3], "calls": r[4],
+                "mean_latency_ms": round(r[5]) if r[5] is not None else None,
+                "max_latency_ms": r[6],
+                "mean_first_token_ms": round(r[7]) if r[7] is not None else None,
+                "input_tokens": r[8], "output_tokens": r[9],
+                "estimated_cost_usd": round(r[10] or 0, 4),
+                "cost_per_call_usd": round((r[10] or 0) / r[4], 5) if r[4] else 0.0,
+            }
+            for r in rows
+        ],
+    }
+
+
+@router.get("/api/admin/engine-stats")
+async def admin_engine_stats(
+    x_admin_key: str | None = Header(default=None),
+):
+    """Engine executor load (per-vertical in-flight, queue depth, rejections),
+    speculative retrieval hit rate, follow-up working-set reuse and the
+    buffered usage writer."""
+    _verify_admin_key(x_admin_key)
+    from core.engine_executor import engine_stats
+    from core.session_retrieval import session_retrieval_stats
+    from core.speculative_retrieval import speculation_stats
+    from core.usage_writer import usage_writer_stats
+    return {
+        **engine_stats(),
+        "speculative_retrieval": speculation_stats(),
+        "session_retrieval": session_retrieval_stats(),
+        "usage_writer": usage_writer_stats(),
+    }
+
+
+@router.get("/api/admin/job-stats")
+async def admin_job_stats(
+    x_admin_key: str | None = Header(default=None),
+):
+    """Background job queue: workers, per-kind counters, jobs by status."""
+    _verify_admin_key(x_admin_key)
+    from core.jobs import job_stats
+    return await job_stats()
+
+
+@router.get("/api/admin/stream-stats")
+async def admin_stream_stats(
+    x_admin_key: str | None = Header(default=None),
+):
+    """Resumable SSE streams: buffers held, in flight, resume counters."""
+    _verify_admin_key(x_admin_key)
+    from core.stream_buffer import stream_stats
+    return stream_stats()
+
+
+@router.get("/api/admin/hedge-stats")
+async def admin_hedge_stats(
+    x_admin_key: str | None = Header(default=None),
+):
+    """Hedged model requests: first-token latency percentiles, races, loser cost."""
+    _verify_admin_key(x_admin_key)
+    from core.hedging import hedge_stats
+    return hedge_stats()
+
+
+@router.get("/api/admin/llm-gateway")
+async def admin_llm_gateway(
+    x_admin_key: str | None = Header(default=None),
+):
+    """LLM admission control: live queue depth, admission wait, retries and
+    rate limits per model and per vertical."""
+    _verify_admin_key(x_admin_key)
+    from core.llm_gateway import gateway_stats
+    return gateway_stats()
+
+
+@router.get("/api/admin/answer-cache")
+async def admin_answer_cache(
+    x_admin_key: str | None = Header(default=None),
+):
+    """Repeat-question cache: exact hits from the LRU and the database, and
+    paraphrase hits, misses and overlap rejections of the semantic index."""
+    _verify_admin_key(x_admin_key)
+    from core.answer_cache import cache_stats
+    return cache_stats()
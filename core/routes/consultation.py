@@ -2,17 +2,24 @@ from __future__ import annotations
 """
 Fluidoracle — Consultation Routes
 """
+import asyncio
 import json
 import logging
 import os
 import re
+import sqlite3
 import traceback
+from contextlib import aclosing
 from pathlib import Path
 
 from fastapi import APIRouter, HTTPException, Request, Header
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse
 
 import core.database as database
+import core.training as training
+from core import jobs, stream_buffer
+from core.engine_executor import acquire_slot, engine_slot, run_in_pool
+from core.streaming import CancellableStreamingResponse, shielded
 
 
 def strip_html(text: str) -> str:
@@ -50,6 +57,165 @@ async def get_current_user(authorization):
     return await database.get_user_by_token(token)
 
 
+_INTERRUPTED_NOTE = "[Response interrupted — the user disconnected before it finished.]"
+
+
+def _history_message(m: dict) -> dict:
+    """Engine history entry for a stored message (phase-annotated for packing)."""
+    content = m["content"]
+    if m.get("incomplete"):
+        content = f"{content}\n\n{_INTERRUPTED_NOTE}"
+    return {"role": m["role"], "content": content, "phase": m.get("phase_at_time")}
+
+
+async def _save_interrupted_reply(
+    session_id: str, phase: str, streamed: list[str], user_message_id: str, idempotency_key: str | None,
+) -> None:
+    """Keep what was streamed before a client disconnect as an incomplete message.
+
+    The session's phase and parameters are left as they were: the turn did
+    not finish, so the user's next message picks up from the same state.
+    A turn cut off before any text is undone instead (_fail_turn).
+    """
+    partial = "".join(streamed).strip()
+    if not partial:
+        await _fail_turn(session_id, user_message_id, idempotency_key)
+        return
+    try:
+        await database.add_consultation_message(
+            session_id=session_id,
+            role="assistant",
+            content=partial,
+            phase_at_time=phase,
+            incomplete=True,
+            reply_to=user_message_id,
+        )
+    except Exception as e:
+        logger.warning(f"Could not save interrupted reply for {session_id}: {e}")
+
+
+async def _fail_turn(session_id: str, user_message_id: str, idempotency_key: str | None) -> None:
+    """Undo a turn that produced no reply: delete its user message and drop
+    its stream buffer, so a retry with the same Idempotency-Key runs the
+    turn again rather than getting a 409 or the replayed error."""
+    try:
+        await database.delete_consultation_message(user_message_id)
+    except Exception as e:
+        logger.warning(f"Could not remove the failed turn's message in {session_id}: {e}")
+    if idempotency_key:
+        stream_buffer.forget(session_id, idempotency_key)
+
+
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+def _sse_response(events) -> CancellableStreamingResponse:
+    return CancellableStreamingResponse(events, media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
+async def _replay_reply(session: dict, reply: dict):
+    """A stored reply as SSE, for a retry whose stream buffer is gone.
+
+    Sent as one `replay` event (the whole text — the client replaces what it
+    has rather than appending) followed by the usual `complete`.
+    """
+    yield f"event: replay\ndata: {json.dumps({'content': reply['content'], 'incomplete': reply['incomplete']})}\n\n"
+    complete_data = {
+        "phase": reply["phase_at_time"] or session["phase"],
+        "application_domain": session.get("application_domain"),
+    }
+    if reply.get("full_report"):
+        complete_data["full_report"] = reply["full_report"]
+    if reply["incomplete"]:
+        complete_data["incomplete"] = True
+    yield f"event: complete\ndata: {json.dumps(complete_data)}\n\n"
+
+
+async def _resume_turn(session: dict, idempotency_key: str, last_event_id: str | None):
+    """Response for a turn already submitted with this key, or None if new.
+
+    Served from the in-process stream buffer while it is held (live or
+    replayed after Last-Event-ID), else from the stored reply.
+    """
+    buffer = stream_buffer.get(session["id"], idempotency_key)
+    if buffer is not None:
+        stream_buffer.count("resumed")
+        return _sse_response(buffer.follow(stream_buffer.parse_event_id(last_event_id)))
+
+    turn = await database.get_idempotent_turn(session["id"], idempotency_key)
+    if turn is None:
+        return None
+    if turn["reply"] is None:
+        raise HTTPException(
+            status_code=409,
+            detail="A message with this Idempotency-Key was already submitted and has no reply yet.",
+        )
+    stream_buffer.count("replayed")
+    return _sse_response(_replay_reply(session, turn["reply"]))
+
+
+async def _queue_turn_jobs(
+    session: dict,
+    session_id: str,
+    user_content: str,
+    result: dict,
+    new_phase: str,
+    gathering_turn_count: int,
+) -> None:
+    """Queue the side work after a consultation turn (core/jobs.py).
+
+    The session title on the first message pair; on the transition to
+    answering, the training-data log and the outcome follow-up schedule.
+    """
+    if len(session["messages"]) == 0:
+        await jobs.enqueue("session_title", session_id=session_id, first_message=user_content)
+
+    if new_phase == "answering" and session["phase"] == "gathering":
+        # Phase-annotated message history for training data.
+        # session["messages"] has phase_at_time from the DB; use it directly.
+        annotated_messages = [
+            {
+                "role": m["role"],
+                "content": m["content"],
+                "phase": m.get("phase_at_time") or "gathering",
+            }
+            for m in session["messages"]
+        ]
+        # Add the current turn's messages (user = gathering, assistant = answering)
+        annotated_messages.append(
+            {"role": "user", "content": user_content, "phase": "gathering"}
+        )
+        annotated_messages.append(
+            {"role": "assistant", "content": result["content"], "phase": "answering"}
+        )
+
+        await jobs.enqueue(
+            "training_log",
+            session_id=session_id,
+            application_domain=result.get("application_domain", "general"),
+            gathered_parameters=result.get("gathered_parameters", {}),
+            refined_query=result.get("refined_query", ""),
+            messages=annotated_messages,
+            rag_chunks_used=result.get("rag_chunks_used", []),
+            confidence=result.get("confidence", "MEDIUM"),
+            num_gathering_turns=gathering_turn_count,
+            recommendation_summary=result.get("content"),
+            recommendation_full_report=result.get("full_report"),
+        )
+
+        # Outcome follow-ups at 30, 90, and 180 days
+        from datetime import datetime as _dt, timezone as _tz
+        await jobs.enqueue(
+            "followup_schedule",
+            session_id=session_id,
+            transitioned_at=_dt.now(_tz.utc).isoformat(),
+        )
+
+
 router = APIRouter()
 
 # Routes: Consultation Sessions (public, no auth required)
@@ -99,16 +265,40 @@ async def delete_consult_session(session_id: str):
     deleted = await database.delete_consultation_session(session_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Session not found")
+    from core.session_retrieval import forget
+    forget(session_id)
     return {"status": "deleted"}
 
 
 @router.post("/api/consult/sessions/{session_id}/messages")
-async def send_consult_message(session_id: str, req: ConsultMessageRequest):
-    """Send a message in a consultation session and get an AI response."""
+async def send_consult_message(
+    session_id: str,
+    req: ConsultMessageRequest,
+    idempotency_key: str | None = Header(default=None),
+):
+    """Send a message in a consultation session and get an AI response.
+
+    A retry with the same Idempotency-Key returns the original turn.
+    """
     session = await database.get_consultation_session(session_id)
     if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
+    if idempotency_key:
+        turn = await database.get_idempotent_turn(session_id, idempotency_key)
+        if turn is not None:
+            if turn["reply"] is None:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A message with this Idempotency-Key was already submitted and has no reply yet.",
+                )
+            return {
+                "user_message": turn["user_message"],
+                "assistant_message": turn["reply"],
+                "phase": session["phase"],
+                "application_domain": session.get("application_domain"),
+            }
+
     # Handle force_transition: use canned message and flag
     is_force_transition = req.force_transition and session["phase"] == "gathering"
     if is_force_transition:
@@ -121,60 +311,70 @@ async def send_consult_message(session_id: str, req: ConsultMessageRequest):
         if not user_content:
             raise HTTPException(status_code=422, detail="Message content is required")
 
-    # Save the user message
-    user_msg = await database.add_consultation_message(
-        session_id=session_id,
-        role="user",
-        content=user_content,
-        phase_at_time=session["phase"],
-    )
+    # Admission before the message is saved, so overload is a clean 503
+    # that leaves nothing behind for the retry to trip over
+    async with engine_slot(session.get("vertical_id")):
+        # Save the user message
+        try:
+            user_msg = await database.add_consultation_message(
+                session_id=session_id,
+                role="user",
+                content=user_content,
+                phase_at_time=session["phase"],
+                idempotency_key=idempotency_key,
+            )
+        except sqlite3.IntegrityError:
+            raise HTTPException(
+                status_code=409,
+                detail="A message with this Idempotency-Key was already submitted and has no reply yet.",
+            )
 
-    # Check for off-vertical demand (embedding-based, non-blocking)
-    try:
-        from core.cross_vertical import check_off_vertical
-        check_off_vertical(
+        # Check for off-vertical demand (embedding call — background job)
+        await jobs.enqueue(
+            "demand_check",
             message_text=user_content,
             current_vertical_id=session.get("vertical_id", ""),
             session_id=session_id,
         )
-    except Exception:
-        pass  # Never block consultation on demand detection
 
-    # Build conversation history from existing messages
-    conversation_history = [
-        {"role": m["role"], "content": m["content"]}
-        for m in session["messages"]
-    ]
+        # Build conversation history from existing messages
+        conversation_history = [_history_message(m) for m in session["messages"]]
 
-    # Count gathering-phase user turns
-    gathering_turn_count = sum(
-        1 for m in session["messages"]
-        if m["role"] == "user" and m["phase_at_time"] == "gathering"
-    )
-    if session["phase"] == "gathering":
-        gathering_turn_count += 1  # Include current message
+        # Count gathering-phase user turns
+        gathering_turn_count = sum(
+            1 for m in session["messages"]
+            if m["role"] == "user" and m["phase_at_time"] == "gathering"
+        )
+        if session["phase"] == "gathering":
+            gathering_turn_count += 1  # Include current message
 
-    # Resolve vertical config for this session
-    _vc = _resolve_vertical_config(session)
+        # Resolve vertical config for this session
+        _vc = _resolve_vertical_config(session)
 
-    # Generate AI response
-    from core.consultation_engine import generate_consultation_response, generate_session_title
+        # Generate AI response
+        from core.consultation_engine import generate_consultation_response
 
-    try:
-        result = generate_consultation_response(
-            session_id=session_id,
-            user_message=user_content,
-            phase=session["phase"],
-            conversation_history=conversation_history,
-            gathered_parameters=session.get("gathered_parameters"),
-            gathering_turn_count=gathering_turn_count,
-            force_transition=is_force_transition,
-            vertical_config=_vc,
-        )
-    except Exception as e:
-        logger.error(f"Consultation response failed: {e}")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Response generation failed: {e}")
+        try:
+            result = await run_in_pool(
+                generate_consultation_response,
+                session_id=session_id,
+                user_message=user_content,
+                phase=session["phase"],
+                conversation_history=conversation_history,
+                gathered_parameters=session.get("gathered_parameters"),
+                gathering_turn_count=gathering_turn_count,
+                force_transition=is_force_transition,
+                vertical_config=_vc,
+            )
+        except Exception as e:
+            logger.error(f"Consultation response failed: {e}")
+            traceback.print_exc()
+            await _fail_turn(session_id, user_msg["id"], idempotency_key)
+            raise HTTPException(status_code=500, detail=f"Response generation failed: {e}")
+        except BaseException:
+            with shielded():
+                await _fail_turn(session_id, user_msg["id"], idempotency_key)
+            raise
 
     # If phase transitioned, update session metadata
     new_phase = result.get("phase", session["phase"])
@@ -189,73 +389,24 @@ async def send_consult_message(session_id: str, req: ConsultMessageRequest):
     if result.get("gathered_parameters"):
         update_kwargs["gathered_parameters"] = result["gathered_parameters"]
 
-    if update_kwargs:
-        await database.update_consultation_session(session_id, **update_kwargs)
-
-    # Save the assistant message
-    assistant_msg = await database.add_consultation_message(
-        session_id=session_id,
-        role="assistant",
-        content=result["content"],
-        phase_at_time=new_phase,
-        rag_chunks_used=result.get("rag_chunks_used"),
-        full_report=result.get("full_report"),
-    )
-
-    # Auto-title on first message pair
-    if len(session["messages"]) == 0:
-        try:
-            title = generate_session_title(user_content)
-            await database.update_consultation_session(session_id, title=title)
-        except Exception:
-            pass  # Non-critical
-
-    # Log consultation training data and schedule follow-ups when we transition to answering
-    if new_phase == "answering" and session["phase"] == "gathering":
-        # Build phase-annotated message history for training data.
-        # session["messages"] has phase_at_time from the DB; use it directly.
-        annotated_messages = [
-            {
-                "role": m["role"],
-                "content": m["content"],
-                "phase": m.get("phase_at_time") or "gathering",
-            }
-            for m in session["messages"]
-        ]
-        # Add the current turn's messages (user = gathering, assistant = answering)
-        annotated_messages.append(
-            {"role": "user", "content": user_content, "phase": "gathering"}
-        )
-        annotated_messages.append(
-            {"role": "assistant", "content": result["content"], "phase": "answering"}
-        )
+    # Session update and assistant message land together
+    async with database.transaction():
+        if update_kwargs:
+            await database.update_consultation_session(session_id, **update_kwargs)
 
-        training.log_consultation(
+        # Save the assistant message
+        assistant_msg = await database.add_consultation_message(
             session_id=session_id,
-            application_domain=result.get("application_domain", "general"),
-            gathered_parameters=result.get("gathered_parameters", {}),
-            refined_query=result.get("refined_query", ""),
-            messages=annotated_messages,
-            rag_chunks_used=result.get("rag_chunks_used", []),
-            confidence=result.get("confidence", "MEDIUM"),
-            num_gathering_turns=gathering_turn_count,
-            recommendation_summary=result.get("content"),
-            recommendation_full_report=result.get("full_report"),
+            role="assistant",
+            content=result["content"],
+            phase_at_time=new_phase,
+            rag_chunks_used=result.get("rag_chunks_used"),
+            full_report=result.get("full_report"),
+            reply_to=user_msg["id"],
         )
 
-        # Schedule outcome follow-ups at 30, 90, and 180 days
-        from datetime import datetime as _dt, timedelta, timezone as _tz
-        now = _dt.now(_tz.utc)
-        for stage, days in [("30_day", 30), ("90_day", 90), ("180_day", 180)]:
-            try:
-                scheduled = (now + timedelta(days=days)).isoformat()
-                await database.create_followup_schedule(
-                    session_id=session_id,
-                    followup_stage=stage,
-                    scheduled_date=scheduled,
-                )
-            except Exception as e:
-                logger.warning(f"Failed to schedule {stage} follow-up: {e}")
+    # Title, training log and follow-up scheduling run in the background
+    await _queue_turn_jobs(session, session_id, user_content, result, new_phase, gathering_turn_count)
 
     return {
         "user_message": user_msg,
@@ -266,12 +417,27 @@ async def send_consult_message(session_id: str, req: ConsultMessageRequest):
 
 
 @router.post("/api/consult/sessions/{session_id}/messages/stream")
-async def send_consult_message_stream(session_id: str, req: ConsultMessageRequest):
-    """Stream a consultation response via SSE."""
+async def send_consult_message_stream(
+    session_id: str,
+    req: ConsultMessageRequest,
+    idempotency_key: str | None = Header(default=None),
+    last_event_id: str | None = Header(default=None),
+):
+    """Stream a consultation response via SSE.
+
+    With an Idempotency-Key header the turn is resumable: retrying the same
+    submission (with Last-Event-ID) continues the original stream instead
+    of saving the message and generating the reply again.
+    """
     session = await database.get_consultation_session(session_id)
     if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
+    if idempotency_key:
+        resumed = await _resume_turn(session, idempotency_key, last_event_id)
+        if resumed is not None:
+            return resumed
+
     # Handle force_transition
     is_force_transition = req.force_transition and session["phase"] == "gathering"
     if is_force_transition:
@@ -284,30 +450,41 @@ async def send_consult_message_stream(session_id: str, req: ConsultMessageReques
         if not user_content:
             raise HTTPException(status_code=422, detail="Message content is required")
 
-    # Save user message
-    user_msg = await database.add_consultation_message(
-        session_id=session_id,
-        role="user",
-        content=user_content,
-        phase_at_time=session["phase"],
-    )
+    # Admission before anything is saved or streamed, so overload is a clean
+    # 503. The engine is async and holds no pool thread, so the turn takes a
+    # slot on the vertical's (much larger) async-stream lane.
+    slot = await acquire_slot(session.get("vertical_id"), stream=True)
 
-    # Check for off-vertical demand (embedding-based, non-blocking)
+    # Save user message
     try:
-        from core.cross_vertical import check_off_vertical
-        check_off_vertical(
-            message_text=user_content,
-            current_vertical_id=session.get("vertical_id", ""),
+        user_msg = await database.add_consultation_message(
             session_id=session_id,
+            role="user",
+            content=user_content,
+            phase_at_time=session["phase"],
+            idempotency_key=idempotency_key,
         )
-    except Exception:
-        pass
+    except sqlite3.IntegrityError:
+        # A concurrent retry with the same key got there first
+        slot.release()
+        resumed = await _resume_turn(session, idempotency_key, last_event_id)
+        if resumed is None:
+            raise
+        return resumed
+    except BaseException:
+        slot.release()
+        raise
+
+    # Check for off-vertical demand (embedding call — background job)
+    await jobs.enqueue(
+        "demand_check",
+        message_text=user_content,
+        current_vertical_id=session.get("vertical_id", ""),
+        session_id=session_id,
+    )
 
     # Build conversation history
-    conversation_history = [
-        {"role": m["role"], "content": m["content"]}
-        for m in session["messages"]
-    ]
+    conversation_history = [_history_message(m) for m in session["messages"]]
 
     gathering_turn_count = sum(
         1 for m in session["messages"]
@@ -319,14 +496,15 @@ async def send_consult_message_stream(session_id: str, req: ConsultMessageReques
     # Resolve vertical config for this session
     _vc = _resolve_vertical_config(session)
 
-    from core.consultation_engine import generate_consultation_response_stream, generate_session_title
+    from core.consultation_engine import generate_consultation_response_stream_async
 
     async def event_generator():
         """SSE event generator."""
         final_result = None
+        streamed: list[str] = []
 
         try:
-            for event_type, data in generate_consultation_response_stream(
+            async with aclosing(generate_consultation_response_stream_async(
                 session_id=session_id,
                 user_message=user_content,
                 phase=session["phase"],
@@ -335,28 +513,41 @@ async def send_consult_message_stream(session_id: str, req: ConsultMessageReques
                 gathering_turn_count=gathering_turn_count,
                 force_transition=is_force_transition,
                 vertical_config=_vc,
-            ):
-                if event_type == "status":
-                    yield f"event: status\ndata: {json.dumps({'message': data})}\n\n"
-                elif event_type == "metadata":
-                    yield f"event: metadata\ndata: {json.dumps(data)}\n\n"
-                elif event_type == "text":
-                    yield f"event: chunk\ndata: {json.dumps({'text': data})}\n\n"
-                elif event_type == "section":
-                    yield f"event: section\ndata: {json.dumps({'section': data})}\n\n"
-                elif event_type == "done":
-                    final_result = data
-                elif event_type == "error":
-                    yield f"event: error\ndata: {json.dumps({'message': data})}\n\n"
-                    return
-
+            )) as events:
+                async for event_type, data in events:
+                    if event_type == "status":
+                        yield f"event: status\ndata: {json.dumps({'message': data})}\n\n"
+                    elif event_type == "metadata":
+                        yield f"event: metadata\ndata: {json.dumps(data)}\n\n"
+                    elif event_type == "text":
+                        streamed.append(data)
+                        yield f"event: chunk\ndata: {json.dumps({'text': data})}\n\n"
+                    elif event_type == "section":
+                        yield f"event: section\ndata: {json.dumps({'section': data})}\n\n"
+                    elif event_type == "done":
+                        final_result = data
+                    elif event_type == "error":
+                        await _fail_turn(session_id, user_msg["id"], idempotency_key)
+                        yield f"event: error\ndata: {json.dumps({'message': data})}\n\n"
+                        return
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # Abandoned by the client: leaving aclosing() has already closed
+            # the engine's upstream stream; keep what was generated
+            with shielded():
+                await _save_interrupted_reply(session_id, session["phase"], streamed, user_msg["id"], idempotency_key)
+            raise
         except Exception as e:
             logger.error(f"Streaming consultation failed: {e}")
             traceback.print_exc()
+            await _fail_turn(session_id, user_msg["id"], idempotency_key)
             yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
             return
+        finally:
+            slot.release()
 
         if not final_result:
+            await _fail_turn(session_id, user_msg["id"], idempotency_key)
             yield f"event: error\ndata: {json.dumps({'message': 'No response generated'})}\n\n"
             return
 
@@ -370,69 +561,22 @@ async def send_consult_message_stream(session_id: str, req: ConsultMessageReques
             update_kwargs["application_domain"] = final_result["application_domain"]
         if final_result.get("gathered_parameters"):
             update_kwargs["gathered_parameters"] = final_result["gathered_parameters"]
-        if update_kwargs:
-            await database.update_consultation_session(session_id, **update_kwargs)
-
-        assistant_msg = await database.add_consultation_message(
-            session_id=session_id,
-            role="assistant",
-            content=final_result["content"],
-            phase_at_time=new_phase,
-            rag_chunks_used=final_result.get("rag_chunks_used"),
-            full_report=final_result.get("full_report"),
-        )
+        async with database.transaction():
+            if update_kwargs:
+                await database.update_consultation_session(session_id, **update_kwargs)
 
-        # Auto-title on first message pair
-        if len(session["messages"]) == 0:
-            try:
-                title = generate_session_title(user_content)
-                await database.update_consultation_session(session_id, title=title)
-            except Exception:
-                pass
-
-        # Log training data on phase transition
-        if new_phase == "answering" and session["phase"] == "gathering":
-            annotated_messages = [
-                {
-                    "role": m["role"],
-                    "content": m["content"],
-                    "phase": m.get("phase_at_time") or "gathering",
-                }
-                for m in session["messages"]
-            ]
-            annotated_messages.append(
-                {"role": "user", "content": user_content, "phase": "gathering"}
-            )
-            annotated_messages.append(
-                {"role": "assistant", "content": final_result["content"], "phase": "answering"}
-            )
-
-            training.log_consultation(
+            assistant_msg = await database.add_consultation_message(
                 session_id=session_id,
-                application_domain=final_result.get("application_domain", "general"),
-                gathered_parameters=final_result.get("gathered_parameters", {}),
-                refined_query=final_result.get("refined_query", ""),
-                messages=annotated_messages,
-                rag_chunks_used=final_result.get("rag_chunks_used", []),
-                confidence=final_result.get("confidence", "MEDIUM"),
-                num_gathering_turns=gathering_turn_count,
-                recommendation_summary=final_result.get("content"),
-                recommendation_full_report=final_result.get("full_report"),
+                role="assistant",
+                content=final_result["content"],
+                phase_at_time=new_phase,
+                rag_chunks_used=final_result.get("rag_chunks_used"),
+                full_report=final_result.get("full_report"),
+                reply_to=user_msg["id"],
             )
 
-            # Schedule follow-ups
-            from datetime import datetime as _dt, timedelta, timezone as _tz
-            now = _dt.now(_tz.utc)
-            for stage, days in [("30_day", 30), ("90_day", 90), ("180_day", 180)]:
-                try:
-                    scheduled = (now + timedelta(days=days)).isoformat()
-                    await database.create_followup_schedule(
-                        session_id=session_id,
-                        followup_stage=stage,
-                        scheduled_date=scheduled,
-                    )
-                except Exception as e:
-                    logger.warning(f"Failed to schedule {stage} follow-up: {e}")
+        # Title, training log and follow-up scheduling run in the background
+        await _queue_turn_jobs(session, session_id, user_content, final_result, new_phase, gathering_turn_count)
 
         # Send final complete event with metadata
         complete_data = {
@@ -443,15 +587,29 @@ async def send_consult_message_stream(session_id: str, req: ConsultMessageReques
             complete_data["full_report"] = final_result["full_report"]
         yield f"event: complete\ndata: {json.dumps(complete_data)}\n\n"
 
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
-    )
+    # Generation runs as its own task feeding a buffer; the response follows
+    # the buffer, so a keyed turn survives its client reconnecting
+    buffer = stream_buffer.start(event_generator(), session_id, idempotency_key)
+    # Also released if the producer is cancelled before the generator starts
+    buffer.task.add_done_callback(lambda _task: slot.release())
+    return _sse_response(buffer.follow())
+
+
+@router.get("/api/consult/sessions/{session_id}/messages/stream/{idempotency_key}")
+async def resume_consult_message_stream(
+    session_id: str,
+    idempotency_key: str,
+    last_event_id: str | None = Header(default=None),
+):
+    """Resume (or replay, once finished) the stream of a turn submitted with
+    this Idempotency-Key, from the event after Last-Event-ID."""
+    session = await database.get_consultation_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    resumed = await _resume_turn(session, idempotency_key, last_event_id)
+    if resumed is None:
+        raise HTTPException(status_code=404, detail="No message was submitted with this key")
+    return resumed
 
 
 @router.post("/api/consult/sessions/{session_id}/feedback")
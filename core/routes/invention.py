@@ -5,6 +5,7 @@ Fluidoracle — Invention Routes
 import json
 import logging
 import os
+import re
 import traceback
 from pathlib import Path
 
@@ -12,8 +13,14 @@ from fastapi import APIRouter, HTTPException, Request, Header
 from fastapi.responses import HTMLResponse, StreamingResponse
 
 import core.database as database
+from core.engine_executor import EngineOverloaded, run_engine
 from core.models import InventAuthRequest, InventSessionRequest, InventMessageRequest
 
+
+def strip_html(text: str) -> str:
+    return re.sub(r'<[^>]+>', '', text)
+
+
 INVENT_PASSPHRASE = os.getenv("INVENT_PASSPHRASE", "")
 
 logger = logging.getLogger(__name__)
@@ -125,10 +132,14 @@ async def send_invent_message(
     from core.invention_engine import generate_invention_response, generate_session_title
 
     try:
-        result = generate_invention_response(
+        result = await run_engine(
+            "invention",
+            generate_invention_response,
             user_message=user_content,
             conversation_history=conversation_history,
         )
+    except EngineOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Invention response failed: {e}")
         traceback.print_exc()
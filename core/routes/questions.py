@@ -6,12 +6,18 @@ import json
 import logging
 import os
 import traceback
+import uuid
+from contextlib import aclosing
 from pathlib import Path
 
 from fastapi import APIRouter, HTTPException, Request, Header
 from fastapi.responses import HTMLResponse, StreamingResponse
 
+import core.answer_cache as answer_cache
 import core.database as database
+import core.training as training
+from core.engine_executor import EngineOverloaded, acquire_slot, iterate_in_executor, run_engine
+from core.streaming import CancellableStreamingResponse
 from core.models import (
     AskRequest, VoteRequest, CommentRequest,
 )
@@ -35,26 +41,32 @@ async def ask_question(req: AskRequest):
     """Submit a question and get an AI-powered expert answer."""
     question_text = strip_html(req.question.strip())
 
-    # Check for duplicate question (skip if the cached answer was a failure)
-    existing = await database.get_questions(page=1, limit=100)
-    for q in existing:
-        if q["question"].lower().strip() == question_text.lower().strip():
-            # Don't return cached failures
-            if "declined to answer" in q["answer"] or "unable to generate" in q["answer"]:
-                continue
-            return q  # Return existing answer instead of re-generating
+    # Repeat question: return the existing answer instead of re-generating
+    cached = await answer_cache.lookup(question_text)
+    if cached is not None:
+        return cached
 
     # Generate answer (this is slow — RAG retrieval + Claude API call)
     # Import here to avoid loading heavy ML models at startup
-    from core.answer_engine import generate_answer
+    import core.answer_engine as answer_engine
 
     try:
-        result = generate_answer(question_text)
+        result = await run_engine(
+            answer_engine.current_vertical_id(), answer_engine.generate_answer, question_text,
+        )
+    except EngineOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Answer generation failed: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Answer generation failed: {e}")
 
+    # Paraphrase of an answered question: the original, marked as such
+    if result.get("similar_question"):
+        original = await database.get_question(result["question_id"])
+        if original is not None:
+            return {**original, "similar_question": result["similar_question"]}
+
     # Save to database
     question_id = str(uuid.uuid4())
     saved = await database.save_question(
@@ -65,6 +77,7 @@ async def ask_question(req: AskRequest):
         sources=result["sources"],
         warnings=result["warnings"],
     )
+    await answer_cache.remember(saved)
 
     # Log as training data (fire-and-forget, never fails the request)
     training.log_answered_question(
@@ -85,61 +98,60 @@ async def ask_question_stream(req: AskRequest):
 
     question_text = strip_html(req.question.strip())
 
-    # Check for duplicate question (return cached answer as instant SSE)
-    existing = await database.get_questions(page=1, limit=100)
-    for q in existing:
-        if q["question"].lower().strip() == question_text.lower().strip():
-            if "declined to answer" in q["answer"] or "unable to generate" in q["answer"]:
-                continue
-
-            # Return cached answer as an instant SSE stream
-            def _cached_stream():
-                yield f"event: status\ndata: {_json.dumps({'stage': 'generating', 'confidence': q.get('confidence', 'MEDIUM'), 'sources': q.get('sources', []), 'warnings': q.get('warnings', [])})}\n\n"
-                yield f"event: chunk\ndata: {_json.dumps({'text': q['answer']})}\n\n"
-                yield f"event: complete\ndata: {_json.dumps({'answer': q['answer'], 'confidence': q.get('confidence', 'MEDIUM'), 'sources': q.get('sources', []), 'warnings': q.get('warnings', []), 'question_id': q['id']})}\n\n"
-
-            return StreamingResponse(
-                _cached_stream(),
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "X-Accel-Buffering": "no",
-                },
-            )
+    # Repeat question: return the existing answer as an instant SSE stream
+    cached = await answer_cache.lookup(question_text)
+    if cached is not None:
+        return StreamingResponse(
+            answer_cache.cached_sse(cached),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+            },
+        )
+
+    # Stream a fresh answer — the sync generator runs in the engine pool,
+    # under the vertical's concurrency limit (503 if it is saturated). The
+    # slot is released when the stream ends, or by the response's on_close
+    # if the stream never starts.
+    import core.answer_engine as answer_engine
 
-    # Stream a fresh answer
-    from core.answer_engine import generate_answer_stream
+    slot = await acquire_slot(answer_engine.current_vertical_id())
 
-    def _streaming_wrapper():
+    async def _streaming_wrapper():
         """Wrap the generator to capture the final answer and save to DB after streaming."""
         final_data = {}
-        for event in generate_answer_stream(question_text):
-            yield event
-            # Capture the complete event data for DB save
-            if event.startswith("event: complete"):
-                data_line = event.split("data: ", 1)[1].strip()
-                final_data = _json.loads(data_line)
+        try:
+            # On client disconnect, leaving aclosing() closes the engine
+            # generator, which closes its upstream stream. A cut-short
+            # answer is not saved: questions are public.
+            async with aclosing(iterate_in_executor(answer_engine.generate_answer_stream(question_text))) as events:
+                async for event in events:
+                    yield event
+                    # Capture the complete event data for DB save
+                    if event.startswith("event: complete"):
+                        data_line = event.split("data: ", 1)[1].strip()
+                        final_data = _json.loads(data_line)
+        finally:
+            slot.release()
 
         # After streaming is done, save to DB and send the question_id
-        if final_data.get("answer"):
-            import asyncio
+        # (an answer served for a similar question is already saved)
+        if final_data.get("answer") and not final_data.get("similar_question"):
             question_id = str(uuid.uuid4())
 
-            # Run the async DB save in a new event loop (we're in a sync generator)
-            loop = asyncio.new_event_loop()
             try:
-                loop.run_until_complete(database.save_question(
+                saved = await database.save_question(
                     id=question_id,
                     question=question_text,
                     answer=final_data["answer"],
                     confidence=final_data.get("confidence", "MEDIUM"),
                     sources=final_data.get("sources", []),
                     warnings=final_data.get("warnings", []),
-                ))
+                )
+                await answer_cache.remember(saved)
             except Exception as e:
                 logger.error(f"[stream] DB save failed: {e}")
-            finally:
-                loop.close()
 
             # Log training data
             training.log_answered_question(
@@ -153,13 +165,14 @@ async def ask_question_stream(req: AskRequest):
             # Send final event with question_id so frontend can enable voting
             yield f"event: saved\ndata: {_json.dumps({'question_id': question_id})}\n\n"
 
-    return StreamingResponse(
+    return CancellableStreamingResponse(
         _streaming_wrapper(),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "X-Accel-Buffering": "no",
         },
+        on_close=[slot.release],
     )
 
 
@@ -198,6 +211,7 @@ async def vote(question_id: str, req: VoteRequest, request: Request):
 
     voter_ip = get_client_ip(request)
     result = await database.add_vote(question_id, req.direction, voter_ip)
+    answer_cache.on_vote(question_id, result)
 
     # If upvotes cross the threshold (3+), log as high-quality training data
     if req.direction == "up" and result["vote_up"] >= 3:
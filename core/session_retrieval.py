@@ -0,0 +1,256 @@
+from __future__ import annotations
+"""
+Fluidoracle — Session Retrieval Working Set
+============================================
+Follow-up turns in the answering phase usually ask about the same
+application and draw on the sources the recommendation was built from.
+Instead of a full retrieval per follow-up, each session keeps a working set:
+the parent chunks (id, text, source, scores) its transition retrieval
+returned, plus their embeddings once computed.
+
+On a follow-up, one embedding call covers the message and any parents not
+yet embedded, and the message is scored against the working set:
+
+  covered   at least SESSION_RETRIEVAL_COVER_PARENTS parents at cosine
+            >= SESSION_RETRIEVAL_REUSE_SIMILARITY
+              → no retrieval; the working set is the context
+  delta     otherwise → retrieval on the message; what it finds is merged
+              with the working set and new parents join it
+
+One close parent only says the working set touches the topic; a follow-up
+that shares a word with a single source would otherwise be answered from a
+context that barely covers it. Several parents at the threshold mean the
+top of the packed context is on the question.
+
+Working-set parents are ranked for the follow-up by their retrieval score
+(the session prior) times min(1, cosine / SESSION_RETRIEVAL_REUSE_SIMILARITY),
+so parents far from the question are damped rather than dropped. Chunk ids
+are parent ids throughout, so rag_chunks_used names the same chunk the same
+way across a session's turns.
+
+Working sets live in this process. A session without one (another worker, a
+restart, a session that transitioned before this existed) does a full
+retrieval, which seeds it. An embedding failure also falls back to a full
+retrieval.
+
+Counters (seeded / cold / covered / delta / errors) are served on
+/api/admin/engine-stats.
+
+Config (env):
+  SESSION_RETRIEVAL                     on/off (default true)
+  SESSION_RETRIEVAL_REUSE_SIMILARITY    cosine for a parent to cover a follow-up (default 0.5)
+  SESSION_RETRIEVAL_COVER_PARENTS       parents that must cover it to skip retrieval (default 3)
+  SESSION_RETRIEVAL_TOP_K               parents handed to the context packer (default 12)
+  SESSION_WORKING_SET_MAX               parents kept per session (default 40)
+  SESSION_RETRIEVAL_TTL                 seconds a working set outlives its last use (default 3600)
+  SESSION_RETRIEVAL_MAX_SESSIONS        working sets kept per process (default 500)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SESSION_RETRIEVAL = os.getenv("SESSION_RETRIEVAL", "true").lower() == "true"
+SESSION_RETRIEVAL_REUSE_SIMILARITY = float(os.getenv("SESSION_RETRIEVAL_REUSE_SIMILARITY", "0.5"))
+SESSION_RETRIEVAL_COVER_PARENTS = int(os.getenv("SESSION_RETRIEVAL_COVER_PARENTS", "3"))
+SESSION_RETRIEVAL_TOP_K = int(os.getenv("SESSION_RETRIEVAL_TOP_K", "12"))
+SESSION_WORKING_SET_MAX = int(os.getenv("SESSION_WORKING_SET_MAX", "40"))
+SESSION_RETRIEVAL_TTL = float(os.getenv("SESSION_RETRIEVAL_TTL", "3600"))
+SESSION_RETRIEVAL_MAX_SESSIONS = int(os.getenv("SESSION_RETRIEVAL_MAX_SESSIONS", "500"))
+
+# Characters of a parent sent to the embedding model
+_EMBED_MAX_CHARS = 8000
+
+_counts: Counter = Counter()
+_lock = threading.Lock()
+
+
+def chunk_id(result: dict, position: int) -> str:
+    """Stable id of a retrieved chunk (its parent id), by position if it has none."""
+    return result.get("id") or result.get("parent_id") or f"chunk_{position}"
+
+
+class WorkingSet:
+    """One session's retrieved parents, keyed by chunk id, oldest first."""
+
+    def __init__(self, rag_result: dict):
+        self.parents: OrderedDict[str, dict] = OrderedDict()
+        self.embeddings: dict[str, np.ndarray] = {}
+        self.confidence = rag_result["confidence"]
+        self.warnings = list(rag_result.get("warnings", []))
+        self.used_at = time.monotonic()
+        self.add(rag_result["results"])
+
+    def add(self, results: list[dict]) -> None:
+        for i, r in enumerate(results, 1):
+            cid = chunk_id(r, i)
+            known = self.parents.pop(cid, None)
+            if known is not None and (known.get("rerank_score") or 0.0) > (r.get("rerank_score") or 0.0):
+                r = {**r, "rerank_score": known["rerank_score"]}
+            self.parents[cid] = r
+        while len(self.parents) > SESSION_WORKING_SET_MAX:
+            cid, _ = self.parents.popitem(last=False)
+            self.embeddings.pop(cid, None)
+
+    def unembedded(self) -> list[str]:
+        return [cid for cid in self.parents if cid not in self.embeddings]
+
+    def similarities(self, query_vector: np.ndarray) -> dict[str, float]:
+        return {cid: float(self.embeddings[cid] @ query_vector) for cid in self.parents if cid in self.embeddings}
+
+
+_sets: OrderedDict[str, WorkingSet] = OrderedDict()
+
+
+def _get(session_id: str) -> WorkingSet | None:
+    with _lock:
+        ws = _sets.get(session_id)
+        if ws is not None and time.monotonic() - ws.used_at > SESSION_RETRIEVAL_TTL:
+            del _sets[session_id]
+            ws = None
+        if ws is not None:
+            _sets.move_to_end(session_id)
+            ws.used_at = time.monotonic()
+        return ws
+
+
+def seed(session_id: str | None, rag_result: dict) -> None:
+    """Start a session's working set from its transition retrieval."""
+    if not SESSION_RETRIEVAL or not session_id or not rag_result.get("results"):
+        return
+    ws = WorkingSet(rag_result)
+    with _lock:
+        _sets[session_id] = ws
+        _sets.move_to_end(session_id)
+        while len(_sets) > SESSION_RETRIEVAL_MAX_SESSIONS:
+            _sets.popitem(last=False)
+    _counts["seeded"] += 1
+
+
+def forget(session_id: str) -> None:
+    with _lock:
+        _sets.pop(session_id, None)
+
+
+def clear() -> None:
+    with _lock:
+        _sets.clear()
+
+
+def _embed(texts: list[str]) -> list[np.ndarray]:
+    """Unit-normalized embeddings under the retrieval embedding model."""
+    from core.retrieval.config import EMBEDDING_MODEL
+    from core.retrieval.hybrid_search import _get_openai
+
+    response = _get_openai().embeddings.create(
+        model=EMBEDDING_MODEL, input=[t[:_EMBED_MAX_CHARS] or " " for t in texts],
+    )
+    vectors = []
+    for item in response.data:
+        v = np.asarray(item.embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        vectors.append(v / norm if norm else v)
+    return vectors
+
+
+def _citations(results: list[dict]) -> list[str]:
+    from core.retrieval.verified_query import _humanize_source
+    return [f"[{i}] {_humanize_source(r.get('source', 'unknown'))}" for i, r in enumerate(results, 1)]
+
+
+def _ranked_priors(ws: WorkingSet, similarities: dict[str, float], exclude: set[str]) -> list[dict]:
+    """Working-set parents as results for this follow-up, best first."""
+    ranked = []
+    for cid, sim in similarities.items():
+        if cid in exclude:
+            continue
+        weight = min(1.0, max(sim, 0.0) / SESSION_RETRIEVAL_REUSE_SIMILARITY)
+        parent = ws.parents[cid]
+        ranked.append({**parent, "id": cid, "rerank_score": (parent.get("rerank_score") or 0.0) * weight,
+                       "session_similarity": round(sim, 4)})
+    ranked.sort(key=lambda r: r["rerank_score"], reverse=True)
+    return ranked
+
+
+def followup(session_id: str | None, query: str, retrieve: Callable[[str], dict]) -> dict:
+    """Retrieval result for a follow-up turn, using the session's working set.
+
+    `retrieve` is the engine's retrieval callable (query → verified_query
+    result), used for a cold session and for the delta.
+    """
+    ws = _get(session_id) if SESSION_RETRIEVAL and session_id else None
+    if ws is None:
+        rag_result = retrieve(query)
+        if SESSION_RETRIEVAL and session_id:
+            _counts["cold"] += 1
+            seed(session_id, rag_result)
+        return rag_result
+
+    t0 = time.perf_counter()
+    missing = ws.unembedded()
+    try:
+        vectors = _embed([query] + [ws.parents[cid].get("parent_text", "") for cid in missing])
+    except Exception as e:
+        _counts["errors"] += 1
+        logger.warning(f"[session_retrieval] embedding failed ({e}); full retrieval")
+        rag_result = retrieve(query)
+        ws.add(rag_result["results"])
+        return rag_result
+    query_vector = vectors[0]
+    ws.embeddings.update(zip(missing, vectors[1:]))
+    similarities = ws.similarities(query_vector)
+    best = max(similarities.values(), default=0.0)
+    covering = sum(1 for sim in similarities.values() if sim >= SESSION_RETRIEVAL_REUSE_SIMILARITY)
+
+    if covering >= SESSION_RETRIEVAL_COVER_PARENTS:
+        results = _ranked_priors(ws, similarities, set())[:SESSION_RETRIEVAL_TOP_K]
+        _counts["covered"] += 1
+        logger.info(f"[session_retrieval] follow-up covered by the working set ({covering} parents at cosine "
+                    f">= {SESSION_RETRIEVAL_REUSE_SIMILARITY}, best {best:.3f}, {len(results)}/{len(ws.parents)} "
+                    f"parents, {(time.perf_counter() - t0) * 1000:.0f} ms)")
+        return {
+            "query": query,
+            "results": results,
+            "confidence": ws.confidence,
+            "citations": _citations(results),
+            "warnings": ws.warnings,
+            "gap_logged": False,
+        }
+
+    rag_result = retrieve(query)
+    fresh = [{**r, "id": chunk_id(r, i)} for i, r in enumerate(rag_result["results"], 1)]
+    priors = _ranked_priors(ws, similarities, {r["id"] for r in fresh})
+    merged = sorted(fresh + priors, key=lambda r: r.get("rerank_score") or 0.0, reverse=True)
+    results = merged[:SESSION_RETRIEVAL_TOP_K]
+    ws.add(fresh)
+    _counts["delta"] += 1
+    new = sum(1 for r in results if r in fresh)
+    logger.info(f"[session_retrieval] follow-up outside the working set ({covering} covering, best {best:.3f}): "
+                f"{new} retrieved + {len(results) - new} session parents")
+    return {**rag_result, "results": results, "citations": _citations(results)}
+
+
+def session_retrieval_stats() -> dict:
+    with _lock:
+        sessions = len(_sets)
+    followups = _counts["cold"] + _counts["covered"] + _counts["delta"] + _counts["errors"]
+    return {
+        "enabled": SESSION_RETRIEVAL,
+        "reuse_similarity": SESSION_RETRIEVAL_REUSE_SIMILARITY,
+        "cover_parents": SESSION_RETRIEVAL_COVER_PARENTS,
+        "sessions": sessions,
+        "seeded": _counts["seeded"],
+        "followups": followups,
+        "cold": _counts["cold"],
+        "covered": _counts["covered"],
+        "delta": _counts["delta"],
+        "errors": _counts["errors"],
+        "covered_rate": round(_counts["covered"] / followups, 4) if followups else None,
+    }
@@ -0,0 +1,192 @@
+"""
+Fluidoracle — Speculative Retrieval
+=====================================
+Overlaps knowledge-base retrieval with the gathering-phase Claude call.
+
+A gathering turn that ends in a <consultation_signal> used to run retrieval
+on the refined query only after the whole gathering response arrived — the
+user waited for generation, then retrieval, then the answering stream. Late
+in gathering (or on force_transition) the engine now starts retrieval in the
+background on the conversation so far. When the signal arrives:
+
+  - refined query ≈ speculative query (embedding cosine ≥ threshold)
+      → hit: reuse the speculative results (waiting for them if still running)
+  - otherwise, or if the speculation failed
+      → miss: retrieve again on the refined query
+
+Counters (launched / hits / misses / unused / errors, mean similarity)
+are kept per process and served on /api/admin/engine-stats.
+
+Config (env):
+  SPECULATIVE_RETRIEVAL            on/off (default true)
+  SPECULATIVE_MIN_TURN             first gathering turn to speculate on (default 2)
+  SPECULATIVE_REUSE_SIMILARITY     cosine threshold for reuse (default 0.85)
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+SPECULATIVE_MIN_TURN = int(os.getenv("SPECULATIVE_MIN_TURN", "2"))
+SPECULATIVE_REUSE_SIMILARITY = float(os.getenv("SPECULATIVE_REUSE_SIMILARITY", "0.85"))
+SPECULATIVE_MAX_QUERY_CHARS = 2000
+SPECULATIVE_THREADS = int(os.getenv("SPECULATIVE_THREADS", "4"))
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "launched": 0,
+    "hits": 0,
+    "misses": 0,
+    "unused": 0,
+    "errors": 0,
+    "similarity_sum": 0.0,
+    "decisions": 0,
+    "saved_ms": 0.0,
+}
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=SPECULATIVE_THREADS, thread_name_prefix="speculate")
+    return _pool
+
+
+def _record(**increments) -> None:
+    with _stats_lock:
+        for key, value in increments.items():
+            _stats[key] += value
+
+
+def speculation_stats() -> dict:
+    """Hit rate and counters for speculative retrieval in this process."""
+    with _stats_lock:
+        s = dict(_stats)
+    decided = s["hits"] + s["misses"]
+    return {
+        "enabled": SPECULATIVE_RETRIEVAL,
+        "reuse_similarity": SPECULATIVE_REUSE_SIMILARITY,
+        "launched": s["launched"],
+        "hits": s["hits"],
+        "misses": s["misses"],
+        "unused": s["unused"],
+        "errors": s["errors"],
+        "hit_rate": round(s["hits"] / decided, 4) if decided else None,
+        "mean_similarity": round(s["similarity_sum"] / s["decisions"], 4) if s["decisions"] else None,
+        "mean_saved_ms": round(s["saved_ms"] / s["hits"], 1) if s["hits"] else None,
+    }
+
+
+def should_speculate(gathering_turn_count: int, force_transition: bool) -> bool:
+    """Speculate only when a transition is plausible on this turn."""
+    if not SPECULATIVE_RETRIEVAL:
+        return False
+    return force_transition or gathering_turn_count >= SPECULATIVE_MIN_TURN
+
+
+def speculative_query(conversation_history: list[dict], user_message: str) -> str:
+    """The user's side of the conversation so far, most recent text kept if long."""
+    parts = [m["content"] for m in conversation_history if m["role"] == "user"]
+    parts.append(user_message)
+    return " ".join(parts)[-SPECULATIVE_MAX_QUERY_CHARS:]
+
+
+def query_similarity(a: str, b: str) -> float:
+    """Cosine similarity of two queries under the retrieval embedding model."""
+    if a.strip() == b.strip():
+        return 1.0
+    from core.retrieval.config import EMBEDDING_MODEL
+    from core.retrieval.hybrid_search import _get_openai
+
+    response = _get_openai().embeddings.create(model=EMBEDDING_MODEL, input=[a, b])
+    va = np.asarray(response.data[0].embedding, dtype=np.float32)
+    vb = np.asarray(response.data[1].embedding, dtype=np.float32)
+    denom = float(np.linalg.norm(va) * np.linalg.norm(vb))
+    return float(va @ vb) / denom if denom else 0.0
+
+
+class SpeculativeRetrieval:
+    """One background retrieval for a gathering turn.
+
+    `retrieve` is the engine's retrieval callable, query → result. start()
+    submits it on the speculative query; resolve() returns the result to use
+    for the refined query, rerunning `retrieve` on a miss.
+    """
+
+    def __init__(self, query: str, retrieve):
+        self.query = query
+        self._retrieve = retrieve
+        self._future: Future | None = None
+        self._started_at = 0.0
+        self._finished_at = 0.0
+        self._settled = False
+
+    @classmethod
+    def start(cls, query: str, retrieve) -> SpeculativeRetrieval:
+        spec = cls(query, retrieve)
+        spec._started_at = time.perf_counter()
+        spec._future = _get_pool().submit(spec._run)
+        _record(launched=1)
+        return spec
+
+    def _run(self):
+        try:
+            return self._retrieve(self.query)
+        finally:
+            self._finished_at = time.perf_counter()
+
+    def resolve(self, refined_query: str):
+        """Result for the refined query: the speculative one on a hit, a fresh one otherwise."""
+        self._settled = True
+        try:
+            similarity = query_similarity(self.query, refined_query)
+        except Exception as e:
+            logger.warning(f"[speculative] similarity check failed: {e}")
+            similarity = 0.0
+        _record(similarity_sum=similarity, decisions=1)
+
+        if similarity >= SPECULATIVE_REUSE_SIMILARITY:
+            try:
+                decided_at = time.perf_counter()
+                result = self._future.result()
+                # Retrieval time the user did not wait for
+                saved_ms = max(0.0, (min(self._finished_at, decided_at) - self._started_at) * 1000)
+                _record(hits=1, saved_ms=saved_ms)
+                logger.info(f"[speculative] hit (similarity {similarity:.3f}, saved {saved_ms:.0f} ms)")
+                return result
+            except Exception as e:
+                _record(errors=1)
+                logger.warning(f"[speculative] background retrieval failed: {e}")
+
+        _record(misses=1)
+        logger.info(f"[speculative] miss (similarity {similarity:.3f}) — retrieving refined query")
+        return self._retrieve(refined_query)
+
+    async def resolve_async(self, refined_query: str):
+        """resolve() without blocking the event loop."""
+        import asyncio
+        return await asyncio.to_thread(self.resolve, refined_query)
+
+    def discard(self) -> None:
+        """The speculative result goes unused (no transition, or the turn
+        failed or was abandoned). No-op once resolved or discarded, so
+        callers can discard unconditionally when the turn ends."""
+        if self._settled:
+            return
+        self._settled = True
+        if self._future is not None:
+            self._future.cancel()
+        _record(unused=1)
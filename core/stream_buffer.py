@@ -0,0 +1,196 @@
+from __future__ import annotations
+"""
+Fluidoracle — Resumable Streams
+================================
+Server-side buffers for in-flight SSE responses, so a client that loses
+its connection can pick the stream up again instead of regenerating it.
+
+A consultation turn submitted with an Idempotency-Key header runs as a
+producer task that appends every SSE event to a StreamBuffer, numbering
+each with an `id:` line. The HTTP response only follows the buffer. A
+retry of the same submission, or a GET on the resume endpoint, carrying
+Last-Event-ID is served the events after that id — live while the turn is
+still generating, replayed once it is done. No second user message, no
+second retrieval or model call.
+
+When the last follower disconnects, the producer keeps going for
+STREAM_RESUME_GRACE seconds waiting for a reconnect. After that it is
+cancelled, which closes the upstream LLM stream and saves the partial reply
+(see core/streaming.py). Streams without a key cannot be resumed and are
+cancelled as soon as their client goes away.
+
+Buffers live in this process. Finished ones are kept for STREAM_BUFFER_TTL
+seconds; a retry after that (or on another worker) is answered from the
+stored reply. Duplicate submission is blocked in the database
+(consultation_messages.idempotency_key), so it holds across workers.
+
+Config (env):
+  STREAM_RESUME_GRACE   seconds an abandoned keyed stream keeps generating (default 30)
+  STREAM_BUFFER_TTL     seconds a finished stream stays replayable (default 600)
+  STREAM_BUFFER_MAX     buffers kept per process before the oldest finished
+                        ones are evicted early (default 500)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import aclosing
+from typing import AsyncIterator
+
+from core.streaming import shielded
+
+logger = logging.getLogger(__name__)
+
+STREAM_RESUME_GRACE = float(os.getenv("STREAM_RESUME_GRACE", "30"))
+STREAM_BUFFER_TTL = float(os.getenv("STREAM_BUFFER_TTL", "600"))
+STREAM_BUFFER_MAX = int(os.getenv("STREAM_BUFFER_MAX", "500"))
+
+_counts: Counter = Counter()
+
+
+def parse_event_id(value: str | None) -> int:
+    """Sequence id from a Last-Event-ID header (0 = from the start)."""
+    try:
+        return max(int((value or "0").strip()), 0)
+    except ValueError:
+        return 0
+
+
+# ---------------------------------------------------------------------------
+# Buffer
+# ---------------------------------------------------------------------------
+
+class StreamBuffer:
+    """SSE events of one response, numbered from 1, plus its producer task."""
+
+    def __init__(self, resumable: bool):
+        self.resumable = resumable
+        self.events: list[str] = []
+        self.done = False
+        self.finished_at: float | None = None
+        self.task: asyncio.Task | None = None
+        self._followers = 0
+        self._changed = asyncio.Event()
+        self._abandon_timer: asyncio.TimerHandle | None = None
+
+    def append(self, event: str) -> None:
+        self.events.append(f"id: {len(self.events) + 1}\n{event}")
+        self._wake()
+
+    def finish(self) -> None:
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, after: int = 0) -> AsyncIterator[str]:
+        """Events after sequence id `after`, live until the stream is done."""
+        self._attach()
+        try:
+            sent = min(after, len(self.events))
+            while True:
+                while sent < len(self.events):
+                    sent += 1
+                    yield self.events[sent - 1]
+                if self.done:
+                    return
+                await self._changed.wait()
+        finally:
+            await self._detach()
+
+    def _attach(self) -> None:
+        self._followers += 1
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+
+    async def _detach(self) -> None:
+        self._followers -= 1
+        if self._followers or self.done or self.task is None:
+            return
+        if self.resumable and STREAM_RESUME_GRACE > 0:
+            loop = asyncio.get_running_loop()
+            self._abandon_timer = loop.call_later(STREAM_RESUME_GRACE, self._abandon)
+            return
+        # Nobody can come back for it: stop now, and wait so the partial
+        # reply is saved before the response finishes
+        self._abandon()
+        with shielded():
+            await asyncio.wait({self.task})
+
+    def _abandon(self) -> None:
+        self._abandon_timer = None
+        if self._followers == 0 and not self.done and self.task is not None:
+            _counts["abandoned"] += 1
+            self.task.cancel()
+
+
+async def _produce(buffer: StreamBuffer, source) -> None:
+    try:
+        async with aclosing(source) as events:
+            async for event in events:
+                buffer.append(event)
+    finally:
+        buffer.finish()
+
+
+# ---------------------------------------------------------------------------
+# Registry
+# ---------------------------------------------------------------------------
+
+_buffers: dict[tuple[str, str], StreamBuffer] = {}
+
+
+def _evict() -> None:
+    now = time.monotonic()
+    for k in [k for k, b in _buffers.items() if b.done and now - b.finished_at > STREAM_BUFFER_TTL]:
+        del _buffers[k]
+    if len(_buffers) > STREAM_BUFFER_MAX:
+        finished = sorted((b.finished_at, k) for k, b in _buffers.items() if b.done)
+        for _, k in finished[:len(_buffers) - STREAM_BUFFER_MAX]:
+            del _buffers[k]
+
+
+def start(source, session_id: str, key: str | None = None) -> StreamBuffer:
+    """Run `source` (an async generator of SSE event strings) as a producer
+    task. With a key, the buffer is registered for resume."""
+    buffer = StreamBuffer(resumable=key is not None)
+    buffer.task = asyncio.get_running_loop().create_task(_produce(buffer, source))
+    _counts["started"] += 1
+    if key is not None:
+        _evict()
+        _buffers[(session_id, key)] = buffer
+    return buffer
+
+
+def get(session_id: str, key: str) -> StreamBuffer | None:
+    """Registered buffer for a session's idempotency key, if still held."""
+    buffer = _buffers.get((session_id, key))
+    if buffer is not None and buffer.done and time.monotonic() - buffer.finished_at > STREAM_BUFFER_TTL:
+        del _buffers[(session_id, key)]
+        return None
+    return buffer
+
+
+def forget(session_id: str, key: str) -> None:
+    """Drop a turn's buffer (the turn failed), so a retry runs it again
+    instead of replaying the failure."""
+    _buffers.pop((session_id, key), None)
+
+
+def count(event: str) -> None:
+    _counts[event] += 1
+
+
+def stream_stats() -> dict:
+    """Buffer counts and resume counters for /api/admin/stream-stats."""
+    return {
+        "buffers": len(_buffers),
+        "in_flight": sum(1 for b in _buffers.values() if not b.done),
+        "counters": dict(sorted(_counts.items())),
+    }
@@ -0,0 +1,113 @@
+from __future__ import annotations
+"""
+Fluidoracle — Stream Cancellation
+==================================
+Client-disconnect handling for the SSE routes.
+
+When a user closes the tab mid-answer, Starlette notices the disconnect and
+cancels the response task. Without help, that cancellation either lands in
+the middle of the engine's stream loop — where anyio re-cancels every
+cleanup `await`, so the upstream Anthropic stream is never closed cleanly —
+or it lands while the response is waiting on `send`. In the second case the
+SSE generator is abandoned at a `yield` and keeps its upstream stream open
+until garbage collection. Either way the model keeps generating output
+tokens nobody reads and the route's engine slot stays taken.
+
+The pieces here make the abort deterministic:
+
+  CancellableStreamingResponse  closes its body iterator, shielded from
+                                cancellation, whenever streaming stops
+                                early. The close propagates as
+                                GeneratorExit through every generator in
+                                the chain (routes and engines nest them
+                                with contextlib.aclosing).
+  shielded()                    cancel scope for cleanup that must finish:
+                                closing the upstream stream, saving
+                                partial output.
+  record_aborted_stream()       writes the cut-short call to llm_usage
+                                (aborted=1, output tokens generated so far,
+                                and an estimate of the output tokens saved).
+"""
+
+import logging
+from types import SimpleNamespace
+
+import anyio
+from starlette.responses import StreamingResponse
+
+from core.context_packer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def shielded() -> anyio.CancelScope:
+    """Cancel scope whose awaits survive the surrounding cancellation."""
+    return anyio.CancelScope(shield=True)
+
+
+class CancellableStreamingResponse(StreamingResponse):
+    """StreamingResponse that closes its body iterator if streaming stops early
+    (client disconnect), so the generators' abort handlers run right away.
+
+    `on_close` callbacks (e.g. releasing an engine slot) run once the
+    response is done with, however it ends — including when the body
+    iterator never started, so its own finally blocks never ran.
+    """
+
+    def __init__(self, content, *args, on_close=(), **kwargs):
+        super().__init__(content, *args, **kwargs)
+        self._on_close = list(on_close)
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            for callback in self._on_close:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.warning(f"[stream] on_close callback failed: {e}")
+
+    async def stream_response(self, send) -> None:
+        try:
+            await super().stream_response(send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                with shielded():
+                    try:
+                        await aclose()
+                    except Exception as e:
+                        logger.warning(f"[stream] error closing aborted stream: {e}")
+
+
+def aborted_usage(stream, partial_text: str) -> SimpleNamespace:
+    """Usage for a stream cut short: input/cache counts from the message_start
+    snapshot, output estimated from the text generated so far."""
+    snapshot_usage = None
+    try:
+        snapshot_usage = stream.current_message_snapshot.usage
+    except Exception:
+        pass  # Aborted before message_start arrived
+    return SimpleNamespace(
+        input_tokens=getattr(snapshot_usage, "input_tokens", 0) or 0,
+        output_tokens=count_tokens(partial_text),
+        cache_creation_input_tokens=getattr(snapshot_usage, "cache_creation_input_tokens", 0) or 0,
+        cache_read_input_tokens=getattr(snapshot_usage, "cache_read_input_tokens", 0) or 0,
+    )
+
+
+def record_aborted_stream(stream, model: str, phase: str, partial_text: str, max_tokens: int, **tags) -> None:
+    """Log a client-aborted stream to llm_usage (`tags`: extra llm_usage
+    columns, e.g. the routing decision). Never raises."""
+    from core.database import log_aborted_llm_usage_sync
+
+    try:
+        usage = aborted_usage(stream, partial_text)
+        saved = log_aborted_llm_usage_sync(usage, model, phase, max_tokens, **tags)
+        logger.info(
+            f"[stream] client disconnected — {model} stream aborted after "
+            f"~{usage.output_tokens} output tokens (~{saved} saved)"
+        )
+    except Exception as e:
+        logger.warning(f"[stream] could not record aborted stream: {e}")
@@ -9,6 +9,7 @@ Training data is written to the same JSONL files the existing pipeline
 uses (08-training-data/), so exports and stats still work.
 """
 
+import fcntl
 import json
 import sys
 from datetime import datetime, timezone
@@ -182,7 +183,9 @@ def log_consultation(
     """Log a completed consultation as training data.
 
     Each consultation is a full case study: multi-turn diagnostic → grounded recommendation.
-    Returns True on success, False on error (never raises).
+    One entry per session: if the session is already logged (a retried
+    background job), nothing is appended. Returns True on success, False on
+    error (never raises).
     """
     try:
         entry = {
@@ -202,14 +205,34 @@ def log_consultation(
         }
 
         CONSULTATIONS_LOG.parent.mkdir(parents=True, exist_ok=True)
-        with open(CONSULTATIONS_LOG, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry) + "\n")
+        with open(CONSULTATIONS_LOG, "a+", encoding="utf-8") as f:
+            # Check and append under one lock, so concurrent runs of the
+            # same job cannot both write
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            if not _consultation_logged(f, session_id):
+                f.write(json.dumps(entry) + "\n")
 
         return True
     except Exception:
         return False
 
 
+def _consultation_logged(f, session_id: str) -> bool:
+    """True if the open log already holds this session's consultation entry."""
+    needle = json.dumps(session_id)
+    for line in f:
+        if needle not in line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if entry.get("type") == "consultation" and entry.get("session_id") == session_id:
+            return True
+    return False
+
+
 def log_consultation_feedback(
     session_id: str,
     rating: str,
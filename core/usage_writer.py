@@ -0,0 +1,246 @@
+from __future__ import annotations
+"""
+Fluidoracle — Buffered LLM Usage Writer
+========================================
+Every engine call records its token usage in llm_usage. Written inline,
+that is a fresh SQLite connection, an INSERT and a commit inside the call,
+often inside a streaming loop, contending for the write lock with session
+writes.
+
+While the writer runs (started and stopped from main.py's lifespan), the
+log_*llm_usage* functions in core/database.py only append a row to an
+in-memory buffer. One background thread writes the buffer out in a single
+transaction every USAGE_FLUSH_INTERVAL seconds, or as soon as it holds
+USAGE_FLUSH_ROWS rows, and once more on shutdown. Request threads never
+touch SQLite for telemetry.
+
+Rows carry the time they were logged, not the time they were flushed. A
+failed flush keeps its rows for the next one; past USAGE_BUFFER_MAX pending
+rows, new rows are dropped (and counted) rather than growing without bound.
+
+The output-tokens-saved estimate for an aborted stream needs the typical
+output of completed calls for the same phase and model. The writer keeps
+those averages in memory — loaded from llm_usage at start, updated as rows
+are logged — so the estimate needs no query either.
+
+When the writer is not running (scripts, tests, a disabled buffer), rows
+are written straight to the database as before.
+
+Config (env):
+  USAGE_BUFFER            on/off (default true)
+  USAGE_FLUSH_INTERVAL    seconds between flushes (default 2)
+  USAGE_FLUSH_ROWS        pending rows that trigger an early flush (default 200)
+  USAGE_BUFFER_MAX        pending rows kept while the database is unavailable (default 10000)
+
+Counters (logged / written / batches / failures / dropped) are served on
+/api/admin/engine-stats.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+USAGE_BUFFER = os.getenv("USAGE_BUFFER", "true").lower() == "true"
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "2"))
+USAGE_FLUSH_ROWS = int(os.getenv("USAGE_FLUSH_ROWS", "200"))
+USAGE_BUFFER_MAX = int(os.getenv("USAGE_BUFFER_MAX", "10000"))
+
+# llm_usage columns a usage row carries, in INSERT order
+USAGE_COLUMNS = (
+    "session_id", "vertical_id", "platform_id", "phase", "model",
+    "input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens",
+    "estimated_cost_usd", "aborted", "output_tokens_saved", "hedge_loser",
+    "route_tier", "route_rule", "latency_ms", "first_token_ms", "timestamp",
+)
+
+INSERT_SQL = (
+    f"INSERT INTO llm_usage ({', '.join(USAGE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in USAGE_COLUMNS)})"
+)
+
+
+def row_values(row: dict) -> tuple:
+    return tuple(row.get(c) for c in USAGE_COLUMNS)
+
+
+def write_rows(conn: sqlite3.Connection, rows: list[dict]) -> None:
+    """Insert usage rows in one transaction."""
+    with conn:
+        conn.executemany(INSERT_SQL, [row_values(r) for r in rows])
+
+
+# ---------------------------------------------------------------------------
+# Typical output per (phase, model)
+# ---------------------------------------------------------------------------
+
+_TYPICAL_SQL = """SELECT phase, model, SUM(output_tokens), COUNT(*) FROM llm_usage
+                  WHERE COALESCE(aborted, 0) = 0 AND COALESCE(hedge_loser, 0) = 0
+                  GROUP BY phase, model"""
+
+# (phase, model) → [output token sum, completed calls]
+_typical: dict[tuple[str, str], list[int]] = {}
+
+
+def typical_output(phase: str, model: str) -> int:
+    """Average output tokens of completed calls for this phase and model."""
+    with _lock:
+        total, calls = _typical.get((phase, model), (0, 0))
+    return total // calls if calls else 0
+
+
+def _count_completed(row: dict) -> None:
+    if row.get("aborted") or row.get("hedge_loser"):
+        return
+    totals = _typical.setdefault((row["phase"], row["model"]), [0, 0])
+    totals[0] += row.get("output_tokens") or 0
+    totals[1] += 1
+
+
+# ---------------------------------------------------------------------------
+# Buffer and writer thread
+# ---------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_wake = threading.Condition(_lock)
+_pending: list[dict] = []
+_counts: Counter = Counter()
+_thread: threading.Thread | None = None
+_stopping = False
+_db_path = ""
+
+
+def running() -> bool:
+    return _thread is not None
+
+
+def enqueue(row: dict) -> bool:
+    """Buffer a usage row. False if the writer is not running — the caller
+    writes the row itself."""
+    with _lock:
+        if _thread is None:
+            return False
+        _count_completed(row)
+        if len(_pending) >= USAGE_BUFFER_MAX:
+            _counts["dropped"] += 1
+            return True
+        _pending.append(row)
+        _counts["logged"] += 1
+        if len(_pending) >= USAGE_FLUSH_ROWS:
+            _wake.notify()
+    return True
+
+
+def _write(rows: list[dict]) -> bool:
+    try:
+        conn = sqlite3.connect(_db_path, timeout=30)
+        try:
+            write_rows(conn, rows)
+        finally:
+            conn.close()
+    except Exception as e:
+        with _lock:
+            _counts["failures"] += 1
+            # Keep the rows for the next flush, oldest first, within the cap
+            room = max(USAGE_BUFFER_MAX - len(_pending), 0)
+            _counts["dropped"] += max(len(rows) - room, 0)
+            _pending[:0] = rows[-room:] if room else []
+        logger.warning(f"[usage_writer] flush of {len(rows)} rows failed: {e}")
+        return False
+    with _lock:
+        _counts["written"] += len(rows)
+        _counts["batches"] += 1
+    return True
+
+
+def flush() -> int:
+    """Write out everything pending now. Returns the rows written."""
+    with _lock:
+        rows = _pending[:]
+        _pending.clear()
+    if not rows:
+        return 0
+    return len(rows) if _write(rows) else 0
+
+
+def _run() -> None:
+    retry = False
+    while True:
+        with _lock:
+            # After a failed flush, wait out the interval even with a full buffer
+            if not _stopping and (retry or len(_pending) < USAGE_FLUSH_ROWS):
+                _wake.wait(USAGE_FLUSH_INTERVAL)
+            stopping = _stopping
+        retry = flush() == 0 and bool(_pending)
+        if stopping:
+            return
+
+
+def start(db_path: str | None = None) -> bool:
+    """Start the writer thread (from main.py's lifespan). Returns whether it runs."""
+    global _thread, _stopping, _db_path
+    if not USAGE_BUFFER or _thread is not None:
+        return _thread is not None
+    if db_path is None:
+        from core.database import _get_db_path
+        db_path = _get_db_path()
+    _db_path = db_path
+
+    typical: dict[tuple[str, str], list[int]] = {}
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            for phase, model, total, calls in conn.execute(_TYPICAL_SQL):
+                typical[(phase, model)] = [int(total or 0), int(calls)]
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"[usage_writer] could not load typical output per phase/model: {e}")
+
+    with _lock:
+        _typical.clear()
+        _typical.update(typical)
+        _stopping = False
+        _thread = threading.Thread(target=_run, name="usage-writer", daemon=True)
+        _thread.start()
+    logger.info(f"[usage_writer] started (flush every {USAGE_FLUSH_INTERVAL}s or {USAGE_FLUSH_ROWS} rows)")
+    return True
+
+
+def stop(timeout: float = 10.0) -> None:
+    """Flush what is pending and stop the writer thread."""
+    global _thread, _stopping
+    with _lock:
+        thread = _thread
+        if thread is None:
+            return
+        _stopping = True
+        _wake.notify()
+    thread.join(timeout)
+    with _lock:
+        _thread = None
+    # Rows logged while the thread was finishing its last flush
+    flush()
+    with _lock:
+        left = len(_pending)
+    if left:
+        logger.warning(f"[usage_writer] stopped with {left} usage rows unwritten")
+
+
+def usage_writer_stats() -> dict:
+    with _lock:
+        pending = len(_pending)
+    return {
+        "running": running(),
+        "flush_interval_s": USAGE_FLUSH_INTERVAL,
+        "flush_rows": USAGE_FLUSH_ROWS,
+        "pending": pending,
+        "logged": _counts["logged"],
+        "written": _counts["written"],
+        "batches": _counts["batches"],
+        "failures": _counts["failures"],
+        "dropped": _counts["dropped"],
+    }
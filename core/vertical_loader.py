@@ -12,6 +12,9 @@ from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional
 
+from core.context_packer import CONTEXT_TOKEN_BUDGET
+from core.reference_sections import REFERENCE_TOKEN_BUDGET, ReferenceIndex, split_reference_data
+
 # Repository root (parent of core/)
 REPO_ROOT = Path(__file__).parent.parent
 
@@ -41,12 +44,18 @@ class VerticalConfig:
 
     # Reference data (full text for prompt injection)
     core_reference_data: str = ""
+    # answering_prompt with the CORE REFERENCE DATA block cut out, and that
+    # block split into sections for relevance-selected injection
+    answering_prompt_base: str = ""
+    reference_index: Optional[ReferenceIndex] = None
 
     # Tuning
     confidence_threshold_high: float = 0.75
     confidence_threshold_medium: float = 0.40
     retrieval_top_k: int = 10
     semantic_weight: float = 0.60
+    # Whole-prompt token budget per consultation call (core/context_packer.py)
+    context_token_budget: int = CONTEXT_TOKEN_BUDGET
 
     # UI
     example_questions: list = field(default_factory=list)
@@ -105,18 +114,28 @@ def _load_vertical(platform_id: str, vertical_id: str, vertical_dir: Path) -> Ve
     except ModuleNotFoundError:
         pass
 
-    # Load reference data text (the full answering prompt already contains it,
-    # but we also expose it separately for programmatic use)
-    core_reference_data = ""
-    try:
-        ref_mod = importlib.import_module(
-            f"platforms.{platform_id}.verticals.{vertical_id}.reference_data"
+    # Load reference data text. The answering prompt carries it as a
+    # CORE REFERENCE DATA block; split it into indexed sections so answering
+    # calls can inject only the relevant ones.
+    answering_prompt_base, core_reference_data, reference_header, reference_sections = (
+        split_reference_data(answering_prompt)
+    )
+    reference_index = None
+    if reference_sections:
+        reference_index = ReferenceIndex(
+            header=reference_header,
+            sections=reference_sections,
+            token_budget=getattr(config_mod, "REFERENCE_TOKEN_BUDGET", REFERENCE_TOKEN_BUDGET),
         )
-        # The reference data is available as structured Python objects in ref_mod
-        # For prompt injection, the answering_prompt.md already contains the full text
-        core_reference_data = "(structured reference data available via reference_data module)"
-    except ModuleNotFoundError:
-        pass
+    if not core_reference_data:
+        try:
+            importlib.import_module(
+                f"platforms.{platform_id}.verticals.{vertical_id}.reference_data"
+            )
+            # The reference data is available as structured Python objects in ref_mod
+            core_reference_data = "(structured reference data available via reference_data module)"
+        except ModuleNotFoundError:
+            pass
 
     # Build BM25 index absolute path
     bm25_path = str(
@@ -137,10 +156,13 @@ def _load_vertical(platform_id: str, vertical_id: str, vertical_dir: Path) -> Ve
         identity_prompt=identity_prompt,
         application_domains=application_domains,
         core_reference_data=core_reference_data,
+        answering_prompt_base=answering_prompt_base,
+        reference_index=reference_index,
         confidence_threshold_high=getattr(config_mod, "CONFIDENCE_THRESHOLD_HIGH", 0.75),
         confidence_threshold_medium=getattr(config_mod, "CONFIDENCE_THRESHOLD_MEDIUM", 0.40),
         retrieval_top_k=getattr(config_mod, "RETRIEVAL_TOP_K", 10),
         semantic_weight=getattr(config_mod, "SEMANTIC_WEIGHT", 0.60),
+        context_token_budget=getattr(config_mod, "CONTEXT_TOKEN_BUDGET", CONTEXT_TOKEN_BUDGET),
         example_questions=getattr(config_mod, "EXAMPLE_QUESTIONS", []),
         warmup_query=getattr(config_mod, "WARMUP_QUERY", ""),
     )
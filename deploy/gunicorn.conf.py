@@ -0,0 +1,48 @@
+# =============================================================
+# Fluidoracle — Preload Serving (gunicorn + uvicorn workers)
+# =============================================================
+# Loads indexes and the cross-encoder once in the master, then forks
+# workers that share those pages copy-on-write (see core/preload.py).
+#
+#   pip install gunicorn
+#   gunicorn -c deploy/gunicorn.conf.py main:app
+#
+# Env: WEB_CONCURRENCY (workers, default 4), PORT (default 8000),
+#      PLATFORM_ID (default fps), RETRIEVAL_SOCKET (run the shared
+#      retrieval service from the master instead of preloading).
+# =============================================================
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 180          # long SSE recommendations
+graceful_timeout = 30
+preload_app = True
+
+
+def on_starting(server):
+    # Runs in the master after main:app is imported (preload_app) and before any worker forks
+    platform_id = os.getenv("PLATFORM_ID", "fps")
+    if os.getenv("RETRIEVAL_SOCKET"):
+        # Shared retrieval service instead of preloading: the master runs it and
+        # respawns it if it exits, so no worker restart takes it down
+        from core.retrieval.retrieval_service import supervise
+        supervise(platform_id)
+        return
+    from core.preload import preload
+    preload(platform_id)
+
+
+def on_exit(server):
+    from core.retrieval.retrieval_service import stop_supervised
+    stop_supervised()
+
+
+def post_fork(server, worker):
+    from core.preload import after_fork
+    after_fork()
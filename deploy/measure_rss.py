@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Fluidoracle — Shared vs Private Memory per Worker
+==================================================
+Reports RSS / PSS / shared / private memory for a server's master process and
+each worker, from /proc/<pid>/smaps_rollup (Linux only).
+
+Either attach to a running server or launch main.py in one of two modes and
+measure it once it answers /api/health:
+
+    uvicorn  — `uvicorn main:app --workers N` (each worker loads everything)
+    preload  — `gunicorn -c deploy/gunicorn.conf.py main:app` (shared, COW)
+
+Usage:
+    python deploy/measure_rss.py --pid 12345
+    python deploy/measure_rss.py --launch uvicorn --workers 4
+    python deploy/measure_rss.py --launch preload --workers 4 --requests 20
+    python deploy/measure_rss.py --launch preload --json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_smaps_rollup(pid: int) -> dict[str, int]:
+    """Memory counters for one process, in kB."""
+    counters = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].rstrip(":") in _FIELDS:
+                counters[parts[0].rstrip(":")] = int(parts[1])
+    return counters
+
+
+def child_pids(pid: int) -> list[int]:
+    """Direct children of a process (workers of a gunicorn/uvicorn master)."""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Field 4 is ppid; comm (field 2) may contain spaces, so split after ')'
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def measure(master_pid: int) -> dict:
+    rows = []
+    for role, pid in [("master", master_pid)] + [("worker", p) for p in child_pids(master_pid)]:
+        try:
+            c = read_smaps_rollup(pid)
+        except OSError:
+            continue
+        rows.append({
+            "role": role,
+            "pid": pid,
+            "rss_mb": c.get("Rss", 0) / 1024,
+            "pss_mb": c.get("Pss", 0) / 1024,
+            "shared_mb": (c.get("Shared_Clean", 0) + c.get("Shared_Dirty", 0)) / 1024,
+            "private_mb": (c.get("Private_Clean", 0) + c.get("Private_Dirty", 0)) / 1024,
+        })
+    workers = [r for r in rows if r["role"] == "worker"]
+    return {
+        "master_pid": master_pid,
+        "processes": rows,
+        "total_pss_mb": sum(r["pss_mb"] for r in rows),
+        "total_rss_mb": sum(r["rss_mb"] for r in rows),
+        "mean_worker_private_mb": (sum(r["private_mb"] for r in workers) / len(workers)) if workers else 0.0,
+    }
+
+
+def print_report(report: dict, mode: str | None = None) -> None:
+    title = f"MEMORY PER PROCESS{f' — {mode}' if mode else ''}"
+    print(f"\n{'='*72}\n{title}\n{'='*72}")
+    print(f"  {'role':<8}{'pid':>8}{'RSS MB':>12}{'PSS MB':>12}{'shared MB':>12}{'private MB':>12}")
+    print(f"  {'-'*64}")
+    for r in report["processes"]:
+        print(f"  {r['role']:<8}{r['pid']:>8}{r['rss_mb']:>12.1f}{r['pss_mb']:>12.1f}"
+              f"{r['shared_mb']:>12.1f}{r['private_mb']:>12.1f}")
+    print(f"\n  Total PSS (actual footprint): {report['total_pss_mb']:.1f} MB")
+    print(f"  Sum of RSS (double-counts shared): {report['total_rss_mb']:.1f} MB")
+    print(f"  Mean private per worker: {report['mean_worker_private_mb']:.1f} MB\n")
+
+
+def _wait_healthy(url: str, timeout_s: float) -> bool:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as resp:
+                if resp.status == 200:
+                    return True
+        except Exception:
+            pass
+        time.sleep(1)
+    return False
+
+
+def _exercise(base_url: str, n: int) -> None:
+    """Send n cheap requests so workers touch their (shared) state."""
+    for _ in range(n):
+        try:
+            urllib.request.urlopen(f"{base_url}/api/config", timeout=10).read()
+        except Exception:
+            pass
+
+
+def launch(mode: str, workers: int, port: int) -> subprocess.Popen:
+    env = {**os.environ, "PORT": str(port), "WEB_CONCURRENCY": str(workers)}
+    if mode == "preload":
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "deploy/gunicorn.conf.py", "main:app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+               "--port", str(port), "--workers", str(workers)]
+    return subprocess.Popen(cmd, cwd=str(PROJECT_ROOT), env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared vs private RSS per worker")
+    parser.add_argument("--pid", type=int, help="Master PID of a running server")
+    parser.add_argument("--launch", choices=["uvicorn", "preload"], help="Start main.py in this mode and measure")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=0, help="Requests to send before measuring")
+    parser.add_argument("--settle", type=float, default=5.0, help="Seconds to wait after startup")
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args()
+
+    if not args.pid and not args.launch:
+        parser.print_help()
+        return
+
+    proc = None
+    master = args.pid
+    if args.launch:
+        proc = launch(args.launch, args.workers, args.port)
+        master = proc.pid
+        base = f"http://127.0.0.1:{args.port}"
+        if not _wait_healthy(f"{base}/api/health", args.startup_timeout):
+            proc.terminate()
+            print("[!] Server did not become healthy", file=sys.stderr)
+            sys.exit(1)
+        _exercise(base, args.requests)
+        time.sleep(args.settle)
+
+    try:
+        report = measure(master)
+        report["mode"] = args.launch or "attached"
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report, args.launch)
+    finally:
+        if proc is not None:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ Main application entry point. Defines app, lifespan, CORS, and includes
 route modules. All route handlers live in core/routes/.
 """
 
+import asyncio
 import logging
 import os
 from contextlib import asynccontextmanager
@@ -44,8 +45,27 @@ database.set_db_path(DATABASE_PATH)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    await database.init_db()
+    migrated = await database.init_db()
     print(f"Database initialized at: {DATABASE_PATH}")
+    if migrated:
+        print(f"[startup] Schema migrations applied: {migrated}")
+
+    # Persistent connections: one writer, pooled readers, WAL
+    from core import db_pool
+    await db_pool.start(DATABASE_PATH)
+
+    # LLM usage telemetry: buffered, written in batches off the request path
+    from core import usage_writer
+    if usage_writer.start(DATABASE_PATH):
+        print(f"[startup] Usage writer: flushing every {usage_writer.USAGE_FLUSH_INTERVAL}s")
+
+    # Semantic answer cache: embeddings of answered questions
+    from core import answer_cache
+    print(f"[startup] Semantic answer cache: {await answer_cache.load_index()} questions")
+
+    # Background job workers (titles, training logs, follow-ups, demand checks)
+    from core import jobs
+    await jobs.start()
 
     # Load platform and vertical config
     platform = load_platform(PLATFORM_ID)
@@ -71,27 +91,43 @@ async def lifespan(app: FastAPI):
             db_path=DATABASE_PATH,
         )
 
+        # Out-of-process retrieval: one shared service holds the indexes and
+        # reranker (and warms them itself); this worker stays lightweight.
+        # The service outlives this worker — it is not stopped at shutdown.
+        from core.retrieval.config import RETRIEVAL_SOCKET
+        retrieval_service_ready = False
+        if RETRIEVAL_SOCKET:
+            from core.retrieval.retrieval_service import start_service
+            print(f"[startup] Connecting to retrieval service at {RETRIEVAL_SOCKET}...")
+            retrieval_service_ready = await asyncio.to_thread(start_service, PLATFORM_ID)
+            if retrieval_service_ready:
+                print("[startup] Retrieval service ready")
+
         # Pre-warm the RAG pipeline — retrieval only, no LLM calls
         # Warms: embedding model, BM25 index, ChromaDB collections, cross-encoder
-        print("[startup] Pre-warming retrieval pipeline (embeddings + BM25 + ChromaDB + reranker)...")
-        from core.retrieval.hybrid_search import search as _warmup_search
-        from core.retrieval.config import EMBEDDING_MODEL
-        for vid, vc in platform.verticals.items():
-            try:
-                _warmup_search(
-                    "warmup",
-                    top_k=1,
-                    use_reranker=True,
-                    child_collection=vc.child_collection,
-                    parent_collection=vc.parent_collection,
-                    bm25_index_path=vc.bm25_index_path,
-                )
-                print(f"[startup] Warmed: {vid}")
-            except Exception as e:
-                print(f"[startup] WARNING: warmup failed for {vid}: {e}")
+        if not retrieval_service_ready:
+            print("[startup] Pre-warming retrieval pipeline (embeddings + BM25 + ChromaDB + reranker)...")
+            from core.retrieval.hybrid_search import search as _warmup_search
+            for vid, vc in platform.verticals.items():
+                try:
+                    _warmup_search(
+                        "warmup",
+                        top_k=1,
+                        use_reranker=True,
+                        child_collection=vc.child_collection,
+                        parent_collection=vc.parent_collection,
+                        bm25_index_path=vc.bm25_index_path,
+                    )
+                    print(f"[startup] Warmed: {vid}")
+                except Exception as e:
+                    print(f"[startup] WARNING: warmup failed for {vid}: {e}")
 
     yield
-    # Shutdown (nothing to clean up)
+
+    # Shutdown
+    await jobs.stop()
+    usage_writer.stop()
+    await db_pool.stop()
 
 
 # ---------------------------------------------------------------------------
@@ -118,6 +154,16 @@ app.add_middleware(
 )
 
 
+# Engine overload (per-vertical queue full) → fast 503 with Retry-After
+from core.engine_executor import EngineOverloaded, overloaded_response
+
+
+@app.exception_handler(EngineOverloaded)
+async def engine_overloaded_handler(request, exc: EngineOverloaded):
+    logger.warning(str(exc))
+    return overloaded_response(exc)
+
+
 # ---------------------------------------------------------------------------
 # Health check (inline — too small for its own module)
 # ---------------------------------------------------------------------------
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Fluidoracle Model Routing Replay
+=================================
+Replays recorded consultation gathering turns against the model the router
+picks and against the engine's primary model, and compares the two replies
+offline — before a routing rule (core/model_router.py) goes live or after
+the table is changed.
+
+Each gathering turn in the database is rebuilt the way the engine builds it
+(vertical gathering prompt, packed history, same budget). Turns the router
+keeps on primary are skipped: there is nothing to compare. For the rest, both
+models answer the same request and the replies are scored with zero extra
+LLM calls:
+
+  signal_agree    both emit (or both withhold) a ready consultation_signal
+  param_overlap   Jaccard overlap of the signal's parameter names
+  term_overlap    Jaccard overlap of the replies' content terms
+  length_ratio    routed reply length / primary reply length
+
+plus latency and estimated cost per side.
+
+The table replayed is --routes (a JSON file of rules), else MODEL_ROUTES,
+else the router's CANDIDATE_ROUTES — routing need not be switched on.
+
+Usage:
+    python3 tests/replay_routing.py --db data/community.db --dry-run   # decisions only
+    python3 tests/replay_routing.py --db data/community.db --limit 20
+    python3 tests/replay_routing.py --vertical spray --output replay.json
+    python3 tests/replay_routing.py --routes proposed_routes.json --limit 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core import consultation_engine as ce  # noqa: E402
+from core import database, model_router  # noqa: E402
+from core.context_packer import message_tokens  # noqa: E402
+from core.reference_sections import tokenize  # noqa: E402
+from core.vertical_loader import load_platform  # noqa: E402
+
+# ---------------------------------------------------------------------------
+# Config
+# ---------------------------------------------------------------------------
+DEFAULT_DB = Path(__file__).resolve().parents[1] / "data" / "community.db"
+PLATFORM_ID = os.getenv("PLATFORM_ID", "fps")
+MAX_TOKENS = 4000
+DELAY_BETWEEN_REQUESTS = 1.0  # seconds — be polite to the API
+
+
+# ---------------------------------------------------------------------------
+# Recorded turns
+# ---------------------------------------------------------------------------
+
+def load_turns(db_path: str, limit: int | None = None, vertical: str | None = None) -> list[dict]:
+    """Recorded gathering turns: each user message sent in the gathering
+    phase, with the history before it and the reply that was recorded."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        query = "SELECT id, vertical_id, platform_id FROM consultation_sessions"
+        params: list = []
+        if vertical:
+            query += " WHERE vertical_id = ?"
+            params.append(vertical)
+        sessions = conn.execute(query + " ORDER BY created_at DESC", params).fetchall()
+
+        turns = []
+        for s in sessions:
+            messages = conn.execute(
+                "SELECT role, content, phase_at_time FROM consultation_messages "
+                "WHERE session_id = ? ORDER BY created_at", (s["id"],),
+            ).fetchall()
+            history: list[dict] = []
+            gathering_turns = 0
+            for i, m in enumerate(messages):
+                reply = messages[i + 1] if i + 1 < len(messages) else None
+                if (m["role"] == "user" and (m["phase_at_time"] or "gathering") == "gathering"
+                        and reply is not None and reply["role"] == "assistant"):
+                    turns.append({
+                        "session_id": s["id"],
+                        "vertical_id": s["vertical_id"],
+                        "platform_id": s["platform_id"],
+                        "history": list(history),
+                        "user_message": m["content"],
+                        "gathering_turn_count": gathering_turns,
+                        "recorded_reply": reply["content"],
+                    })
+                    gathering_turns += 1
+                    if limit and len(turns) >= limit:
+                        return turns
+                history.append({"role": m["role"], "content": m["content"]})
+        return turns
+    finally:
+        conn.close()
+
+
+def build_request(turn: dict) -> tuple[list[dict], list[dict]]:
+    """(system, messages) for a recorded turn, built as the engine builds it."""
+    vc = None
+    if turn["vertical_id"]:
+        try:
+            vc = load_platform(turn["platform_id"] or PLATFORM_ID).verticals.get(turn["vertical_id"])
+        except Exception:
+            vc = None
+    system = ce._gathering_system(
+        vc.gathering_prompt if vc else None, turn["gathering_turn_count"], force_transition=False,
+    )
+    budget = ce._context_budget(vc)
+    history = ce._pack_gathering_history(system, turn["history"], turn["user_message"], budget)
+    messages = ce._packed_messages("replay", system, history, turn["user_message"], budget)
+    return system, messages
+
+
+def route_turn(turn: dict, messages: list[dict]) -> model_router.Route:
+    return model_router.route(
+        "consultation", "gathering", message_tokens(messages),
+        ce.CONSULT_MODEL, ce.FALLBACK_MODEL, vertical=turn["vertical_id"] or "",
+    )
+
+
+# ---------------------------------------------------------------------------
+# Replay and scoring
+# ---------------------------------------------------------------------------
+
+def call_model(model: str, system: list[dict], messages: list[dict]) -> dict:
+    """One direct call (no routing, no fallback); reply text, latency, cost."""
+    t0 = time.perf_counter()
+    response = ce._get_client().messages.create(
+        model=model, max_tokens=MAX_TOKENS, system=system, messages=messages,
+    )
+    latency = time.perf_counter() - t0
+    text = "".join(b.text for b in response.content if getattr(b, "type", "") == "text")
+    return {
+        "model": model,
+        "text": text,
+        "latency_s": round(latency, 2),
+        "cost_usd": round(database._usage_row(response.usage, model)[4], 5),
+    }
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return round(len(a & b) / len(a | b), 3)
+
+
+def _visible(text: str) -> str:
+    return text.split("<consultation_signal>", 1)[0]
+
+
+def compare(routed_text: str, primary_text: str) -> dict:
+    """Agreement of a routed reply with the primary model's reply."""
+    routed_signal = ce._parse_consultation_signal(routed_text)
+    primary_signal = ce._parse_consultation_signal(primary_text)
+    routed_ready = bool(routed_signal and routed_signal.get("ready"))
+    primary_ready = bool(primary_signal and primary_signal.get("ready"))
+    routed_params = set((routed_signal or {}).get("parameters") or {})
+    primary_params = set((primary_signal or {}).get("parameters") or {})
+    primary_len = len(_visible(primary_text)) or 1
+    return {
+        "signal_agree": routed_ready == primary_ready,
+        "routed_ready": routed_ready,
+        "primary_ready": primary_ready,
+        "param_overlap": _jaccard(routed_params, primary_params),
+        "term_overlap": _jaccard(set(tokenize(_visible(routed_text))), set(tokenize(_visible(primary_text)))),
+        "length_ratio": round(len(_visible(routed_text)) / primary_len, 2),
+    }
+
+
+def replay_turn(turn: dict, dry_run: bool = False) -> dict | None:
+    """Replay one turn; None if the router keeps it on primary."""
+    system, messages = build_request(turn)
+    decision = route_turn(turn, messages)
+    result = {
+        "session_id": turn["session_id"],
+        "vertical_id": turn["vertical_id"],
+        "turn": turn["gathering_turn_count"],
+        "input_tokens": message_tokens(messages),
+        "tier": decision.tier,
+        "rule": decision.rule,
+        "routed_model": decision.model,
+    }
+    if decision.tier == "primary":
+        return None
+    if dry_run:
+        return result
+    routed = call_model(decision.model, system, messages)
+    primary = call_model(ce.CONSULT_MODEL, system, messages)
+    result.update(compare(routed["text"], primary["text"]))
+    result["routed"] = routed
+    result["primary"] = primary
+    return result
+
+
+def summarize(results: list[dict]) -> dict:
+    scored = [r for r in results if "signal_agree" in r]
+    if not scored:
+        return {"turns": len(results)}
+
+    def mean(key, side=None):
+        values = [(r[side][key] if side else r[key]) for r in scored]
+        return round(sum(values) / len(values), 3)
+
+    return {
+        "turns": len(results),
+        "signal_agreement": round(sum(r["signal_agree"] for r in scored) / len(scored), 3),
+        "param_overlap": mean("param_overlap"),
+        "term_overlap": mean("term_overlap"),
+        "length_ratio": mean("length_ratio"),
+        "routed_latency_s": mean("latency_s", "routed"),
+        "primary_latency_s": mean("latency_s", "primary"),
+        "routed_cost_usd": round(sum(r["routed"]["cost_usd"] for r in scored), 4),
+        "primary_cost_usd": round(sum(r["primary"]["cost_usd"] for r in scored), 4),
+    }
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay consultations against routed vs primary models")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="Database with recorded consultations")
+    parser.add_argument("--limit", type=int, default=None, help="Max gathering turns to load")
+    parser.add_argument("--vertical", default=None, help="Only sessions of this vertical")
+    parser.add_argument("--dry-run", action="store_true", help="Routing decisions only, no API calls")
+    parser.add_argument("--routes", default=None, help="JSON file of rules to replay (default: MODEL_ROUTES, "
+                                                       "else the candidate rules)")
+    parser.add_argument("--verbose", action="store_true", help="Print both replies per turn")
+    parser.add_argument("--output", default=None, help="Save results to a JSON file")
+    args = parser.parse_args()
+
+    if not Path(args.db).exists():
+        print(f"Database not found: {args.db}")
+        return 1
+
+    # Replay the table under evaluation, whether or not routing is live
+    if args.routes:
+        model_router.MODEL_ROUTES = json.loads(Path(args.routes).read_text())
+    elif not model_router.MODEL_ROUTES:
+        model_router.MODEL_ROUTES = model_router.CANDIDATE_ROUTES
+    model_router.MODEL_ROUTING = True
+
+    turns = load_turns(args.db, args.limit, args.vertical)
+    print(f"Loaded {len(turns)} gathering turns from {args.db}")
+
+    results = []
+    for i, turn in enumerate(turns):
+        try:
+            result = replay_turn(turn, dry_run=args.dry_run)
+        except Exception as e:
+            print(f"  {turn['session_id'][:8]} turn {turn['gathering_turn_count']}: ERROR {e}")
+            continue
+        if result is None:
+            continue
+        results.append(result)
+        line = (f"  {result['session_id'][:8]} turn {result['turn']} "
+                f"~{result['input_tokens']} tok → {result['tier']} ({result['rule']})")
+        if "signal_agree" in result:
+            line += (f"  signal={'agree' if result['signal_agree'] else 'DIFFER'}"
+                     f" params={result['param_overlap']:.2f} terms={result['term_overlap']:.2f}"
+                     f" len={result['length_ratio']:.2f}"
+                     f" latency {result['routed']['latency_s']}s vs {result['primary']['latency_s']}s")
+        print(line)
+        if args.verbose and "routed" in result:
+            print(f"    routed:  {result['routed']['text'][:400]}")
+            print(f"    primary: {result['primary']['text'][:400]}")
+        if not args.dry_run and i < len(turns) - 1:
+            time.sleep(DELAY_BETWEEN_REQUESTS)
+
+    summary = summarize(results)
+    print(f"\nSummary: {json.dumps(summary, indent=2)}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "run_at": datetime.now().isoformat(),
+                "routes": model_router.MODEL_ROUTES,
+                "summary": summary,
+                "results": results,
+            }, f, indent=2)
+        print(f"Results saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
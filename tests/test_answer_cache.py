@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+Answer Cache Tests
+===================
+Repeat /api/ask questions served from the stored answer
+(core/answer_cache.py): normalized-question hash with a unique index, found
+at any age, failed answers never served, the in-process LRU in front, vote
+eviction and the migration backfill; paraphrases served from the semantic
+index only above the similarity threshold and with overlapping retrieval,
+downvotes evicting them. Temporary SQLite database, fake embeddings and
+retrieval, engine replaced by a counter — no API calls.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import sqlite3
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import core.answer_cache as answer_cache
+import core.database as database
+from core.models import AskRequest
+from core.routes import questions as routes
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+def _fresh_db() -> None:
+    database.set_db_path(tempfile.mktemp(suffix=".db"))
+    asyncio.run(database.init_db())
+    answer_cache.clear()
+    answer_cache._counts.clear()
+
+
+async def _save(question: str, answer: str = "Use a beta ratio of 200.") -> dict:
+    return await database.save_question(
+        id=str(uuid.uuid4()), question=question, answer=answer,
+        confidence="HIGH", sources=["kb.md"], warnings=[],
+    )
+
+
+# ── Normalization ───────────────────────────────────────────────────────
+
+def test_normalization():
+    print("\n── Normalized question hash ──")
+    h = database.question_hash("What beta ratio do servo valves need?")
+    check("Case and trailing punctuation ignored", database.question_hash("what beta ratio do servo valves need") == h)
+    check("Whitespace collapsed", database.question_hash("  What  beta ratio\tdo servo valves need ?? ") == h)
+    check("Different wording differs", database.question_hash("What beta ratio do pumps need?") != h)
+    check("Failed answers detected", database.is_failed_answer("Claude declined to answer this.")
+          and not database.is_failed_answer("Beta 200."))
+
+
+# ── Lookup ──────────────────────────────────────────────────────────────
+
+def test_found_at_any_age():
+    print("\n── Duplicate found at any age with one indexed lookup ──")
+    _fresh_db()
+
+    async def _run():
+        first = await _save("Which filter for a servo valve?")
+        for i in range(150):
+            await _save(f"Unrelated question {i}?")
+        answer_cache.clear()
+        return first, await answer_cache.lookup("which FILTER for a servo valve")
+
+    first, found = asyncio.run(_run())
+    check("Oldest question found behind 150 newer ones", found is not None and found["id"] == first["id"], str(found))
+    check("Served from the database", answer_cache.cache_stats()["db_hits"] == 1, str(answer_cache.cache_stats()))
+
+    conn = sqlite3.connect(database._get_db_path())
+    plan = " ".join(r[-1] for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM questions WHERE question_hash = ?", ("x",)))
+    conn.close()
+    check("Lookup uses idx_questions_hash", "idx_questions_hash" in plan, plan)
+
+
+def test_failed_answers_not_served():
+    print("\n── Failed answers are not served; a later good answer is ──")
+    _fresh_db()
+
+    async def _run():
+        await _save("How do I size an accumulator?", "I was unable to generate an answer.")
+        miss = await answer_cache.lookup("How do I size an accumulator?")
+        good = await _save("How do I size an accumulator?", "Boyle's law.")
+        answer_cache.clear()
+        return miss, good, await answer_cache.lookup("how do i size an accumulator")
+
+    miss, good, hit = asyncio.run(_run())
+    check("Failure not served", miss is None, str(miss))
+    check("Later good answer takes the hash", hit is not None and hit["id"] == good["id"], str(hit))
+
+
+def test_concurrent_first_asks():
+    print("\n── Two saves of a new question: both kept, the first is served ──")
+    _fresh_db()
+
+    async def _run():
+        a = await _save("Best oil for cold starts?", "ISO VG 32.")
+        b = await _save("best oil for cold starts", "ISO VG 22.")
+        answer_cache.clear()
+        return a, b, await answer_cache.lookup("Best oil for cold starts?"), await database.get_question(b["id"])
+
+    a, b, hit, stored_b = asyncio.run(_run())
+    check("Second answer still saved (votable)", stored_b is not None, str(stored_b))
+    check("First answer served", hit["id"] == a["id"], str(hit))
+
+
+def test_lru():
+    print("\n── In-process LRU in front of the database ──")
+    _fresh_db()
+    saved_size = answer_cache.ANSWER_CACHE_SIZE
+    answer_cache.ANSWER_CACHE_SIZE = 2
+    db_calls = []
+    real = database.get_question_by_hash
+
+    async def _counting(h):
+        db_calls.append(h)
+        return await real(h)
+
+    database.get_question_by_hash = _counting
+    try:
+        async def _run():
+            for q in ("Q one?", "Q two?", "Q three?"):
+                await answer_cache.remember(await _save(q))
+            one = await answer_cache.lookup("q one")
+            three = await answer_cache.lookup("Q three")
+            return one, three
+
+        one, three = asyncio.run(_run())
+        stats = answer_cache.cache_stats()
+    finally:
+        database.get_question_by_hash = real
+        answer_cache.ANSWER_CACHE_SIZE = saved_size
+    check("Capacity respected", stats["lru_size"] == 2, str(stats))
+    check("Oldest entry evicted, fetched from the database", one is not None and len(db_calls) == 1, str(db_calls))
+    check("Recent entry served without the database", three is not None and stats["lru_hits"] == 1, str(stats))
+
+
+# ── Routes ──────────────────────────────────────────────────────────────
+
+def _drain_sse(response) -> list[str]:
+    async def _read():
+        return [chunk async for chunk in response.body_iterator]
+    return asyncio.run(_read())
+
+
+def test_stream_route_serves_cached_sse():
+    print("\n── /api/ask/stream: repeat question answered as cached SSE ──")
+    _fresh_db()
+    saved = asyncio.run(_save("What is a beta ratio?"))
+
+    import core.answer_engine as answer_engine
+    calls = []
+    real = answer_engine.generate_answer_stream
+    answer_engine.generate_answer_stream = lambda q: calls.append(q) or iter(())
+    try:
+        response = asyncio.run(routes.ask_question_stream(AskRequest(question="what is a BETA ratio")))
+        events = _drain_sse(response)
+    finally:
+        answer_engine.generate_answer_stream = real
+    complete = json.loads(events[-1].split("data: ", 1)[1])
+    check("No engine call", calls == [], str(calls))
+    check("status, chunk, complete events", [e.split("\n", 1)[0] for e in events]
+          == ["event: status", "event: chunk", "event: complete"], str(events))
+    check("Stored answer and id", complete["answer"] == saved["answer"] and complete["question_id"] == saved["id"],
+          str(complete))
+
+
+def test_vote_evicts():
+    print("\n── A vote evicts the question from the LRU ──")
+    _fresh_db()
+
+    from starlette.requests import Request
+    from core.models import VoteRequest
+
+    async def _run():
+        saved = await _save("Why does my pump cavitate?")
+        await answer_cache.remember(saved)
+        before = answer_cache.cache_stats()["lru_size"]
+        request = Request({"type": "http", "headers": [], "client": ("1.2.3.4", 0)})
+        await routes.vote(saved["id"], VoteRequest(direction="up"), request)
+        evicted = answer_cache.cache_stats()["lru_size"]
+        after = await answer_cache.lookup("why does my pump cavitate")
+        return before, evicted, after
+
+    before, evicted, after = asyncio.run(_run())
+    check("Entry evicted by the vote", before == 1 and evicted == 0, f"{before} → {evicted}")
+    check("Reloaded with current vote counts", after["vote_up"] == 1, str(after))
+
+
+# ── Migration ───────────────────────────────────────────────────────────
+
+def test_backfill():
+    print("\n── Existing database: hashes backfilled, newest answer wins ──")
+    path = tempfile.mktemp(suffix=".db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE questions (
+            id TEXT PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL,
+            confidence TEXT NOT NULL, sources TEXT, warnings TEXT,
+            vote_up INTEGER DEFAULT 0, vote_down INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    rows = [
+        ("old", "Filter for gearboxes?", "10 micron.", "2025-01-01"),
+        ("new", "filter for gearboxes", "6 micron.", "2025-06-01"),
+        ("failed", "Filter for gearboxes?", "unable to generate", "2025-09-01"),
+    ]
+    conn.executemany("INSERT INTO questions (id, question, answer, confidence, created_at) VALUES (?, ?, ?, 'HIGH', ?)",
+                     rows)
+    conn.commit()
+    conn.close()
+
+    database.set_db_path(path)
+    asyncio.run(database.init_db())
+    asyncio.run(database.init_db())  # idempotent
+    answer_cache.clear()
+    hit = asyncio.run(answer_cache.lookup("Filter for gearboxes"))
+    conn = sqlite3.connect(path)
+    hashed = conn.execute("SELECT COUNT(*) FROM questions WHERE question_hash IS NOT NULL").fetchone()[0]
+    conn.close()
+    check("Newest good answer served", hit is not None and hit["id"] == "new", str(hit))
+    check("One hash per duplicate group", hashed == 1, str(hashed))
+
+
+# ── Semantic cache ──────────────────────────────────────────────────────
+
+_VECTORS = {
+    "What beta ratio do servo valves need?": [1.0, 0.0, 0.0],
+    "Best beta ratio for servo valves": [0.99, 0.1, 0.0],
+    "Beta ratio for a servo valve in a steel mill": [0.99, 0.1, 0.0],
+    "How do I flush a new hydraulic system?": [0.0, 1.0, 0.0],
+}
+_SERVO_CHUNKS = ["iso-16889#beta", "servo-valves#filtration", "iso-4406#codes"]
+
+
+def _fake_embed(text: str):
+    import numpy as np
+    v = np.asarray(_VECTORS[text], dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+async def _answer(question: str, chunk_ids: list[str], answer: str = "Beta 200 at 3 micron.") -> dict:
+    """What the routes do for a fresh answer: engine lookup (stages the
+    embedding), save, remember."""
+    answer_cache.find_similar(question, chunk_ids)
+    saved = await _save(question, answer)
+    await answer_cache.remember(saved)
+    return saved
+
+
+def _with_fake_embed(fn):
+    def wrapper():
+        real = answer_cache._embed
+        answer_cache._embed = _fake_embed
+        try:
+            fn()
+        finally:
+            answer_cache._embed = real
+    wrapper.__name__ = fn.__name__
+    return wrapper
+
+
+@_with_fake_embed
+def test_semantic_hit_and_rejections():
+    print("\n── Paraphrase served only when similar and retrieval overlaps ──")
+    _fresh_db()
+
+    async def _run():
+        original = await _answer("What beta ratio do servo valves need?", _SERVO_CHUNKS)
+        hit = answer_cache.find_similar("Best beta ratio for servo valves", _SERVO_CHUNKS + ["other#x"])
+        different_material = answer_cache.find_similar(
+            "Beta ratio for a servo valve in a steel mill", ["mill-lube#1", "mill-lube#2", "iso-16889#beta"])
+        unrelated = answer_cache.find_similar("How do I flush a new hydraulic system?", _SERVO_CHUNKS)
+        low_confidence = answer_cache.find_similar("Best beta ratio for servo valves", [])
+        return original, hit, different_material, unrelated, low_confidence
+
+    original, hit, different_material, unrelated, low_confidence = asyncio.run(_run())
+    check("Paraphrase served the original answer", hit is not None and hit["answer"] == original["answer"]
+          and hit["id"] == original["id"], str(hit))
+    check("Marked as a similar question", hit is not None and hit["similar_question"]["question_id"] == original["id"]
+          and hit["similar_question"]["similarity"] >= answer_cache.SEMANTIC_CACHE_SIMILARITY, str(hit))
+    check("Similar wording, different retrieved chunks → fresh", different_material is None)
+    check("Below the similarity threshold → fresh", unrelated is None)
+    check("No chunks (low confidence) → no lookup", low_confidence is None)
+    stats = answer_cache.cache_stats()["semantic"]
+    check("Counters", stats["hits"] == 1 and stats["rejected_overlap"] == 1 and stats["size"] == 1, str(stats))
+
+
+@_with_fake_embed
+def test_semantic_votes_and_reload():
+    print("\n── Downvote evicts; index reloaded from the database ──")
+    _fresh_db()
+    from starlette.requests import Request
+    from core.models import VoteRequest
+
+    async def _run():
+        kept = await _answer("How do I flush a new hydraulic system?", ["flushing#1"])
+        downvoted = await _answer("What beta ratio do servo valves need?", _SERVO_CHUNKS)
+        request = Request({"type": "http", "headers": [], "client": ("1.2.3.4", 0)})
+        await routes.vote(downvoted["id"], VoteRequest(direction="up"), request)
+        after_up = answer_cache.find_similar("Best beta ratio for servo valves", _SERVO_CHUNKS)
+        await routes.vote(downvoted["id"], VoteRequest(direction="down"), request)
+        after_down = answer_cache.find_similar("Best beta ratio for servo valves", _SERVO_CHUNKS)
+        answer_cache.clear()
+        loaded = await answer_cache.load_index()
+        reloaded = answer_cache.find_similar("How do I flush a new hydraulic system?", ["flushing#1"])
+        return kept, after_up, after_down, loaded, reloaded
+
+    kept, after_up, after_down, loaded, reloaded = asyncio.run(_run())
+    check("Upvoted answer still served", after_up is not None)
+    check("Downvoted answer evicted", after_down is None)
+    check("Reload skips downvoted questions", loaded == 1, str(loaded))
+    check("Reloaded entry served", reloaded is not None and reloaded["id"] == kept["id"], str(reloaded))
+
+
+def test_semantic_index():
+    print("\n── Semantic index: growth, swap-remove, eviction, bulk load ──")
+    import numpy as np
+    rng = np.random.default_rng(3)
+
+    def _q(i: int) -> dict:
+        return {"id": f"q{i}", "question": f"question {i}", "answer": f"answer {i}"}
+
+    vectors = rng.normal(size=(60, 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    saved = answer_cache.SEMANTIC_CACHE_MAX
+    answer_cache.SEMANTIC_CACHE_MAX = 40
+    try:
+        index = answer_cache.SemanticIndex()
+        for i in range(50):
+            index.add(_q(i), vectors[i], [f"c{i}"])
+        check("Capped at SEMANTIC_CACHE_MAX, oldest evicted", len(index) == 40 and "q9" not in index._rows
+              and "q10" in index._rows, str(len(index)))
+        check("Buffer grows geometrically", index._matrix.shape[0] in (64, 128), str(index._matrix.shape))
+
+        index.remove("q20")
+        index.remove("q49")
+        consistent = all(index._ids[row] == qid and np.array_equal(index._matrix[row], vectors[int(qid[1:])])
+                         for qid, row in index._rows.items())
+        check("Rows consistent after removals", consistent and len(index) == 38 and len(index._ids) == 38)
+        hit, similarity = index.nearest(vectors[33])
+        check("Nearest finds a moved row", hit["id"] == "q33" and similarity > 0.999, str(hit["id"]))
+        check("Removed entry not returned", index.nearest(vectors[20])[0]["id"] != "q20")
+
+        index.add(_q(10), vectors[10], ["c10"])  # re-added: now the newest
+        index.add(_q(50), vectors[50], ["c50"])
+        index.add(_q(51), vectors[51], ["c51"])
+        index.add(_q(52), vectors[52], ["c52"])
+        check("Re-added entry moves to the back of the eviction order",
+              "q10" in index._rows and "q11" not in index._rows, str(sorted(index._rows)))
+
+        index.load([(_q(i), vectors[i], [f"c{i}"]) for i in range(60)])
+        check("Bulk load keeps the newest SEMANTIC_CACHE_MAX", len(index) == 40 and "q19" not in index._rows
+              and index._matrix.shape == (41, 8), str(index._matrix.shape))
+        check("Bulk-loaded rows searchable", index.nearest(vectors[59])[0]["id"] == "q59")
+        index.add(_q(60), rng.normal(size=4).astype(np.float32), ["c60"])
+        check("Other embedding dimension ignored", len(index) == 40 and "q60" not in index._rows)
+        index.clear()
+        check("Cleared", len(index) == 0 and index.nearest(vectors[0]) is None)
+    finally:
+        answer_cache.SEMANTIC_CACHE_MAX = saved
+
+
+@_with_fake_embed
+def test_other_workers():
+    print("\n── Other workers' votes, deletes and new answers ──")
+    _fresh_db()
+    saved = (answer_cache.SEMANTIC_CACHE_REFRESH, answer_cache.ANSWER_CACHE_TTL)
+
+    def _elsewhere(sql: str, *params) -> None:
+        conn = sqlite3.connect(database._get_db_path())
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+    async def _run():
+        original = await _answer("What beta ratio do servo valves need?", _SERVO_CHUNKS)
+        # Downvoted through another worker: this one's index still holds it
+        _elsewhere("UPDATE questions SET vote_down = 1 WHERE id = ?", original["id"])
+        downvoted = answer_cache.find_similar("Best beta ratio for servo valves", _SERVO_CHUNKS)
+        still_indexed = answer_cache.cache_stats()["semantic"]["size"]
+
+        # Answered by another worker: only in the database
+        other = await _save("How do I flush a new hydraulic system?", "Flush at 1.5x flow.")
+        await database.save_question_embedding(other["id"], _fake_embed(other["question"]).tobytes(), ["flushing#1"])
+        answer_cache.SEMANTIC_CACHE_REFRESH = 0
+        picked_up = answer_cache.find_similar("How do I flush a new hydraulic system?", ["flushing#1"])
+
+        # Deleted through another worker: the LRU entry expires
+        await answer_cache.remember(other)
+        answer_cache.ANSWER_CACHE_TTL = 0
+        _elsewhere("DELETE FROM questions WHERE id = ?", other["id"])
+        after_delete = await answer_cache.lookup("How do I flush a new hydraulic system?")
+        return downvoted, still_indexed, picked_up, other, after_delete
+
+    try:
+        downvoted, still_indexed, picked_up, other, after_delete = asyncio.run(_run())
+    finally:
+        answer_cache.SEMANTIC_CACHE_REFRESH, answer_cache.ANSWER_CACHE_TTL = saved
+    stats = answer_cache.cache_stats()["semantic"]
+    check("Downvote elsewhere: not served", downvoted is None)
+    check("...and dropped from the index", still_indexed == 0 and stats["stale"] == 1, f"{still_indexed} {stats}")
+    check("New answer elsewhere: picked up and served", picked_up is not None and picked_up["id"] == other["id"],
+          str(picked_up))
+    check("Delete elsewhere: LRU entry not served past its TTL", after_delete is None, str(after_delete))
+
+
+@_with_fake_embed
+def test_engine_serves_similar():
+    print("\n── Answer engine: paraphrase answered without a Claude call ──")
+    _fresh_db()
+    import core.answer_engine as ae
+
+    rag = {
+        "query": "", "citations": ["[1] ISO 16889"], "warnings": [], "gap_logged": False,
+        "results": [{"parent_id": c, "source": c.split("#")[0], "parent_text": "..."} for c in _SERVO_CHUNKS],
+        "confidence": {"level": "HIGH", "reasoning": "3 sources"},
+    }
+    original = asyncio.run(_answer("What beta ratio do servo valves need?", _SERVO_CHUNKS))
+
+    class _NoClaude:
+        @property
+        def messages(self):
+            raise AssertionError("Claude called for a cached paraphrase")
+
+    saved = (ae.verified_query, ae._client)
+    ae.verified_query = lambda *a, **k: rag
+    ae._client = _NoClaude()
+    try:
+        result = ae.generate_answer("Best beta ratio for servo valves")
+        events = list(ae.generate_answer_stream("Best beta ratio for servo valves"))
+    finally:
+        ae.verified_query, ae._client = saved
+    complete = json.loads(events[-1].split("data: ", 1)[1])
+    check("generate_answer: original answer, marked", result["answer"] == original["answer"]
+          and result["question_id"] == original["id"] and "similar_question" in result, str(result))
+    check("Stream: complete event carries the marker", complete["question_id"] == original["id"]
+          and complete["similar_question"]["question"] == original["question"], str(complete))
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("ANSWER CACHE TESTS")
+    print("=" * 60)
+
+    test_normalization()
+    test_found_at_any_age()
+    test_failed_answers_not_served()
+    test_concurrent_first_asks()
+    test_lru()
+    test_stream_route_serves_cached_sse()
+    test_vote_evicts()
+    test_backfill()
+    test_semantic_hit_and_rejections()
+    test_semantic_votes_and_reload()
+    test_semantic_index()
+    test_other_workers()
+    test_engine_serves_similar()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+Consultation Streaming Tests
+=============================
+The async SSE path (generate_consultation_response_stream_async) must emit
+exactly the events of the sync generator, and must not block the event loop.
+Fake Anthropic clients and a stand-in retrieval function — no API calls.
+"""
+from __future__ import annotations
+import asyncio
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import core.consultation_engine as ce
+import core.session_retrieval as session_retrieval
+import core.speculative_retrieval as sr
+from core.prompt_cache import system_text
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+# ── Fakes ───────────────────────────────────────────────────────────────
+
+SIGNAL = (
+    "Thanks — I have what I need.\n"
+    "<consultation_signal><ready>true</ready>"
+    "<refined_query>hydraulic return filter beta ratio</refined_query>"
+    "<application_domain>hydraulics</application_domain>"
+    '<parameters>{"flow_lpm": 120}</parameters></consultation_signal>'
+)
+RECOMMENDATION = (
+    "<chat_summary>Use a 10 µm return filter.</chat_summary>\n"
+    "<full_report>## Details\nBeta 200 at 10 µm keeps ISO 16/14/11.</full_report>"
+)
+
+
+def _chunks(text: str, size: int = 7) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _response(text: str):
+    return SimpleNamespace(
+        model="fake-model",
+        stop_reason="end_turn",
+        usage=SimpleNamespace(input_tokens=10, output_tokens=20),
+        content=[SimpleNamespace(text=text)],
+    )
+
+
+class _SyncStream:
+    def __init__(self, text):
+        self._text = text
+        self.text_stream = iter(_chunks(text))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def get_final_message(self):
+        return _response(self._text)
+
+
+class _AsyncStream:
+    def __init__(self, text, delay):
+        self._text = text
+        self._delay = delay
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        for chunk in _chunks(self._text):
+            await asyncio.sleep(self._delay)
+            yield chunk
+
+    async def get_final_message(self):
+        return _response(self._text)
+
+
+class _FakeMessages:
+    def __init__(self, gathering_text, stream_text, is_async, delay=0.0):
+        self.gathering_text = gathering_text
+        self.stream_text = stream_text
+        self.is_async = is_async
+        self.delay = delay
+
+    def create(self, **kwargs):
+        if self.is_async:
+            async def _create():
+                await asyncio.sleep(self.delay)
+                return _response(self.gathering_text)
+            return _create()
+        return _response(self.gathering_text)
+
+    def _text_for(self, system) -> str:
+        # Gathering turns stream too (STREAM_GATHERING); answering prompts carry the phase banner
+        return self.stream_text if "ANSWERING phase" in system_text(system) else self.gathering_text
+
+    def stream(self, **kwargs):
+        text = self._text_for(kwargs["system"])
+        if self.is_async:
+            return _AsyncStream(text, self.delay)
+        return _SyncStream(text)
+
+
+def _fake_retrieval(query, **kwargs):
+    time.sleep(0.02)
+    return {
+        "query": query,
+        "results": [{"id": "c1", "source": "filters.md", "rerank_score": 0.9, "parent_text": "Beta ratios."}],
+        "confidence": {"level": "HIGH", "reasoning": "stand-in"},
+        "citations": ["filters.md"],
+    }
+
+
+_PATCHED = ("_client", "_async_client", "_run_retrieval", "log_llm_usage_sync", "build_precomputed_context")
+_ORIGINALS = {name: getattr(ce, name) for name in _PATCHED}
+
+
+_SR_ORIGINALS = {"query_similarity": sr.query_similarity}
+_SESSION_RETRIEVAL = session_retrieval.SESSION_RETRIEVAL
+
+
+def _restore():
+    for name, value in _ORIGINALS.items():
+        setattr(ce, name, value)
+    for name, value in _SR_ORIGINALS.items():
+        setattr(sr, name, value)
+    session_retrieval.SESSION_RETRIEVAL = _SESSION_RETRIEVAL
+
+
+def _install(gathering_text, stream_text, delay=0.0):
+    ce._client = SimpleNamespace(messages=_FakeMessages(gathering_text, stream_text, False))
+    ce._async_client = SimpleNamespace(messages=_FakeMessages(gathering_text, stream_text, True, delay))
+    ce._run_retrieval = _fake_retrieval
+    ce.log_llm_usage_sync = lambda *a, **k: None
+    ce.build_precomputed_context = lambda **k: ""
+    sr.query_similarity = lambda a, b: 1.0 if a == b else 0.0
+    session_retrieval.SESSION_RETRIEVAL = False  # every follow-up retrieves, sync and async alike
+
+
+def _run_both(**kwargs) -> tuple[list, list]:
+    sync_events = list(ce.generate_consultation_response_stream(session_id="s1", **kwargs))
+
+    async def _collect():
+        return [e async for e in ce.generate_consultation_response_stream_async(session_id="s1", **kwargs)]
+
+    return sync_events, asyncio.run(_collect())
+
+
+# ── Event parity ────────────────────────────────────────────────────────
+
+def test_event_parity():
+    print("\n── Sync / async event parity ──")
+    history = [{"role": "user", "content": "Filter question"}, {"role": "assistant", "content": "Which fluid?"}]
+
+    _install("What flow rate are you running?", "")
+    sync_events, async_events = _run_both(user_message="ISO VG 46", phase="gathering",
+                                          conversation_history=history)
+    check("Gathering turn: identical events", sync_events == async_events, f"{sync_events} vs {async_events}")
+    check("Gathering turn: done phase", async_events[-1][1]["phase"] == "gathering")
+
+    _install(SIGNAL, RECOMMENDATION)
+    sync_events, async_events = _run_both(user_message="120 L/min", phase="gathering",
+                                          conversation_history=history, gathering_turn_count=3)
+    check("Transition: identical events", sync_events == async_events, f"{sync_events} vs {async_events}")
+    done = async_events[-1][1]
+    check("Transition: section marker emitted", ("section", "full_report") in async_events)
+    check("Transition: summary saved", done["content"].endswith("Use a 10 µm return filter."), done["content"])
+    check("Transition: full report parsed", done["full_report"].startswith("## Details"), str(done["full_report"]))
+    check("Transition: sources from retrieval", done["sources"] == ["filters.md"] and done["rag_chunks_used"] == ["c1"])
+
+    _install("", "Follow-up answer with detail.")
+    sync_events, async_events = _run_both(user_message="And the bypass valve?", phase="answering",
+                                          conversation_history=history,
+                                          gathered_parameters={"flow_lpm": 120})
+    check("Follow-up: identical events", sync_events == async_events, f"{sync_events} vs {async_events}")
+    check("Follow-up: content", async_events[-1][1]["content"] == "Follow-up answer with detail.")
+    _restore()
+
+
+# ── Incremental section parser ──────────────────────────────────────────
+
+def _reference_sections(deltas: list[str]) -> list:
+    """The original accumulate-and-rescan section splitter, kept as the oracle."""
+    import re
+    events, buffer, mode = [], "", "buffering"
+    for data in deltas:
+        if mode == "buffering":
+            buffer += data
+            if "</chat_summary>" in buffer:
+                m = re.search(r"<chat_summary>(.*?)</chat_summary>", buffer, re.DOTALL)
+                if m:
+                    events.append(("text", m.group(1).strip()))
+                    after = buffer[buffer.index("</chat_summary>") + len("</chat_summary>"):]
+                    if "<full_report>" in after:
+                        events.append(("section", "full_report"))
+                        leftover = after[after.index("<full_report>") + len("<full_report>"):]
+                        if leftover.strip():
+                            events.append(("text", leftover))
+                        mode = "full_report"
+                    else:
+                        buffer, mode = after, "summary_done"
+                else:
+                    events.append(("text", re.sub(r"</?(?:chat_summary|full_report)>", "", buffer)))
+                    mode = "passthrough"
+            elif len(buffer) > 500 and "<chat_summary>" not in buffer:
+                events.append(("text", buffer))
+                mode = "passthrough"
+        elif mode == "summary_done":
+            buffer += data
+            if "<full_report>" in buffer:
+                events.append(("section", "full_report"))
+                leftover = buffer[buffer.index("<full_report>") + len("<full_report>"):]
+                if leftover.strip():
+                    events.append(("text", leftover))
+                mode, buffer = "full_report", ""
+        elif mode == "full_report":
+            chunk = data.replace("</full_report>", "")
+            if chunk:
+                events.append(("text", chunk))
+        else:
+            chunk = re.sub(r"</?(?:chat_summary|full_report)>", "", data)
+            if chunk:
+                events.append(("text", chunk))
+    return events
+
+
+def test_section_parser():
+    print("\n── Incremental section parser ──")
+    import random
+    rng = random.Random(7)
+    long_summary = "Flow and viscosity drive the element choice. " * 40
+    texts = {
+        "well-formed": RECOMMENDATION,
+        "report after gap": "<chat_summary>Short.</chat_summary>\n\nSome stray prose.\n<full_report>Body text</full_report>",
+        "long summary": f"<chat_summary>{long_summary}</chat_summary><full_report>R</full_report>",
+        "no tags": "Plain answer without any section tags. " * 30,
+        "close without open": "Oops</chat_summary> then <full_report>x</full_report>",
+        "open late": ("Preamble " * 80) + "<chat_summary>S</chat_summary><full_report>F</full_report>",
+        "empty leftover": "<chat_summary>S</chat_summary><full_report>   ",
+    }
+    scanner = ce._TagScanner("<full_report>")
+    found = [scanner.feed(d) for d in ["abc<fu", "ll_rep", "ort>tail"]]
+    check("Tag straddling three deltas found", found == [False, False, True] and scanner.found_at == 3,
+          f"{found} at {scanner.found_at}")
+
+    all_match = True
+    for name, text in texts.items():
+        for trial in range(25):
+            cuts = sorted(rng.sample(range(1, len(text)), k=min(len(text) - 1, rng.randint(1, 60))))
+            deltas = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+            parser = ce._SectionStreamer()
+            got = [e for d in deltas for e in parser.feed(d)]
+            if got != _reference_sections(deltas) or parser.text != text:
+                all_match = False
+                check(f"Identical events: {name} (trial {trial})", False, f"{got} vs {_reference_sections(deltas)}")
+                break
+    check("Identical events to the rescanning parser (175 random chunkings)", all_match)
+
+    # 200k-char summary in 1-char deltas: quadratic rescanning would take minutes
+    deltas = ["<chat_summary>"] + ["x"] * 200_000 + ["</chat_summary>", "<full_report>", "done"]
+    parser = ce._SectionStreamer()
+    t0 = time.perf_counter()
+    events = [e for d in deltas for e in parser.feed(d)]
+    elapsed = time.perf_counter() - t0
+    check("Linear in stream length (200k deltas < 2 s)", elapsed < 2.0, f"{elapsed:.2f}s")
+    check("Long summary emitted once", events[0] == ("text", "x" * 200_000) and events[1] == ("section", "full_report"))
+
+
+# ── Streaming gathering turns ───────────────────────────────────────────
+
+def test_signal_gate():
+    print("\n── Streaming gathering (signal gate) ──")
+    import random
+    rng = random.Random(11)
+    tag = ce._SignalGate.TAG
+    plain = "What is the system's operating pressure? And the fluid <b>type</b>? " * 10
+    visible = ce._strip_consultation_signal(SIGNAL)
+    not_ready = "Need more info.\n<consultation_signal><ready>false</ready></consultation_signal>"
+
+    ok_plain = ok_signal = ok_not_ready = bounded = no_leak = True
+    for _ in range(40):
+        for text in (plain, SIGNAL, not_ready):
+            cuts = sorted(rng.sample(range(1, len(text)), k=rng.randint(1, 40)))
+            deltas = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+            gate = ce._SignalGate()
+            out, received = [], 0
+            for d in deltas:
+                out += [e[1] for e in gate.feed(d)]
+                received += len(d)
+                if not gate.signal_started and received - len("".join(out)) > len(tag) - 1 + gate.WHITESPACE_HOLD_LIMIT:
+                    bounded = False
+            if "<consultation" in "".join(out):
+                no_leak = False
+            signal = ce._parse_consultation_signal(gate.text)
+            if signal:
+                out += [e[1] for e in gate.finish(ce._strip_consultation_signal(gate.text))]
+                ok_signal &= "".join(out) == visible + "\n\n"
+            else:
+                out += [e[1] for e in gate.flush()]
+                if text == plain:
+                    ok_plain &= "".join(out) == text
+                else:
+                    ok_not_ready &= "".join(out) == text
+    check("Plain turn streamed verbatim", ok_plain)
+    check("Signal turn streams exactly the visible text + blank line", ok_signal)
+    check("Unready signal flushed verbatim", ok_not_ready)
+    check("Holdback bounded by tag length + whitespace limit", bounded)
+    check("No signal fragment reaches the user before the turn completes", no_leak)
+
+    _install("Which fluid? " * 20, "")
+    events = list(ce.generate_consultation_response_stream(
+        session_id="s1", user_message="hi", phase="gathering", conversation_history=[]))
+    texts = [e for e in events if e[0] == "text"]
+    check("Gathering turn forwarded incrementally", len(texts) > 10, f"{len(texts)} text events")
+    check("Metadata precedes first token", events[0] == ("metadata", {"phase": "gathering"}))
+
+    ce.STREAM_GATHERING = False
+    try:
+        events = list(ce.generate_consultation_response_stream(
+            session_id="s1", user_message="hi", phase="gathering", conversation_history=[]))
+    finally:
+        ce.STREAM_GATHERING = True
+    check("STREAM_GATHERING=false keeps the single-chunk behaviour",
+          [e[0] for e in events] == ["metadata", "text", "done"] and events[1][1] == "Which fluid? " * 20)
+    _restore()
+
+
+# ── Speculative retrieval ───────────────────────────────────────────────
+
+class _SlowMessages(_FakeMessages):
+    def create(self, **kwargs):
+        time.sleep(0.2)
+        return _response(self.gathering_text)
+
+    def stream(self, **kwargs):
+        if "ANSWERING phase" not in system_text(kwargs["system"]):
+            time.sleep(0.2)
+        return super().stream(**kwargs)
+
+
+def test_speculative_retrieval():
+    print("\n── Speculative retrieval ──")
+    history = [{"role": "user", "content": "Return filter for a press"},
+               {"role": "assistant", "content": "What flow?"}]
+    calls = []
+
+    def slow_retrieval(query, **kwargs):
+        calls.append(query)
+        time.sleep(0.2)
+        return _fake_retrieval(query)
+
+    def run(similarity, gathering_text=SIGNAL, turn=3, force=False):
+        _install(gathering_text, RECOMMENDATION)
+        ce._client = SimpleNamespace(messages=_SlowMessages(gathering_text, RECOMMENDATION, False))
+        ce._run_retrieval = slow_retrieval
+        sr.query_similarity = lambda a, b: similarity
+        calls.clear()
+        t0 = time.perf_counter()
+        events = list(ce.generate_consultation_response_stream(
+            session_id="s1", user_message="120 L/min", phase="gathering",
+            conversation_history=history, gathering_turn_count=turn, force_transition=force))
+        return events, time.perf_counter() - t0
+
+    before = sr.speculation_stats()
+    events, elapsed = run(similarity=0.95)
+    check("Hit: one retrieval, on the speculative query", calls == ["Return filter for a press 120 L/min"], str(calls))
+    check("Hit: retrieval overlapped the gathering call", elapsed < 0.35, f"{elapsed:.2f}s")
+    check("Hit: results used", events[-1][1]["rag_chunks_used"] == ["c1"])
+
+    events, elapsed = run(similarity=0.5)
+    check("Miss: refined query retrieved again",
+          calls[-1] == "hydraulic return filter beta ratio" and len(calls) == 2, str(calls))
+
+    events, _ = run(similarity=0.95, turn=1)
+    check("Early turn: no speculation", calls == ["hydraulic return filter beta ratio"], str(calls))
+
+    events, _ = run(similarity=0.95, gathering_text="Which fluid?")
+    check("No transition: speculation unused", events[-1][1]["phase"] == "gathering")
+
+    def failing(query, **kwargs):
+        calls.append(query)
+        if len(calls) == 1:
+            raise RuntimeError("index unavailable")
+        return _fake_retrieval(query)
+
+    _install(SIGNAL, RECOMMENDATION)
+    ce._run_retrieval = failing
+    sr.query_similarity = lambda a, b: 0.99
+    calls.clear()
+    events = list(ce.generate_consultation_response_stream(
+        session_id="s1", user_message="x", phase="gathering", conversation_history=[], force_transition=True))
+    check("Failed speculation falls back to a fresh retrieval", len(calls) == 2 and events[-1][0] == "done", str(calls))
+
+    after = sr.speculation_stats()
+    check("Hits counted", after["hits"] - before["hits"] == 1, str(after))
+    check("Misses counted", after["misses"] - before["misses"] == 2, str(after))
+    check("Unused counted", after["unused"] - before["unused"] == 1, str(after))
+    check("Errors counted", after["errors"] - before["errors"] == 1, str(after))
+    check("Hit rate reported", after["hit_rate"] is not None and 0 < after["hit_rate"] < 1, str(after))
+
+    # A turn that ends early still discards its speculative run
+    _install("Which fluid?", RECOMMENDATION)
+    ce._run_retrieval = slow_retrieval
+    stream = ce.generate_consultation_response_stream(
+        session_id="s1", user_message="x", phase="gathering", conversation_history=history, gathering_turn_count=3)
+    next(stream)
+    stream.close()  # client disconnect
+    abandoned = sr.speculation_stats()["unused"] - after["unused"]
+
+    def _broken(**kwargs):
+        raise RuntimeError("overloaded")
+    ce._client = SimpleNamespace(messages=SimpleNamespace(create=_broken))
+    try:
+        ce.generate_consultation_response(
+            session_id="s1", user_message="x", phase="gathering", conversation_history=history, gathering_turn_count=3)
+    except Exception:
+        pass
+    failed = sr.speculation_stats()["unused"] - after["unused"] - abandoned
+    check("Abandoned stream: speculation discarded", abandoned == 1, str(abandoned))
+    check("Failed turn: speculation discarded", failed == 1, str(failed))
+    _restore()
+
+
+# ── Non-blocking ────────────────────────────────────────────────────────
+
+def test_concurrent_streams():
+    print("\n── Concurrent async streams ──")
+    _install(SIGNAL, RECOMMENDATION, delay=0.01)
+    n_streams = 50
+
+    async def _one():
+        events = [e async for e in ce.generate_consultation_response_stream_async(
+            session_id="s1", user_message="120 L/min", phase="gathering", conversation_history=[])]
+        return events[-1][0] == "done"
+
+    async def _ticker(stop: asyncio.Event, ticks: list):
+        while not stop.is_set():
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.005)
+
+    async def _main():
+        stop, ticks = asyncio.Event(), []
+        ticker = asyncio.create_task(_ticker(stop, ticks))
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(_one() for _ in range(n_streams)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await ticker
+        return results, elapsed, ticks
+
+    async def _single_run():
+        t = time.perf_counter()
+        await _one()
+        return time.perf_counter() - t
+
+    single = asyncio.run(_single_run())
+    results, elapsed, ticks = asyncio.run(_main())
+    _restore()
+
+    check(f"All {n_streams} streams completed", all(results))
+    check("Streams overlap (total < 5× one stream)", elapsed < single * 5,
+          f"{n_streams} streams {elapsed:.2f}s vs one {single:.2f}s")
+    max_gap = max((b - a for a, b in zip(ticks, ticks[1:])), default=0.0)
+    check("Event loop stays responsive (max tick gap < 100 ms)", max_gap < 0.1, f"{max_gap * 1000:.0f} ms")
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("CONSULTATION STREAMING TESTS")
+    print("=" * 60)
+
+    test_event_parity()
+    test_section_parser()
+    test_signal_gate()
+    test_speculative_retrieval()
+    test_concurrent_streams()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
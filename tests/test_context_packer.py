@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Context Packer Tests
+=====================
+Token-budgeted packing of conversation history and retrieved context
+(core/context_packer.py) and its use by the consultation engine.
+No API calls.
+"""
+from __future__ import annotations
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import core.consultation_engine as ce
+from core.context_packer import (
+    count_tokens, log_packed, message_tokens, pack_history, pack_results, result_tokens,
+)
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+def _history(gathering_turns: int, answering_turns: int = 0, size: int = 400) -> list[dict]:
+    """Alternating user/assistant history, each message ~size characters."""
+    history = []
+    for i in range(gathering_turns):
+        history.append({"role": "user", "content": f"gathering answer {i} " + "u" * size, "phase": "gathering"})
+        history.append({"role": "assistant", "content": f"gathering question {i} " + "a" * size, "phase": "gathering"})
+    # The transition reply is saved in the answering phase
+    for i in range(answering_turns):
+        history.append({"role": "user", "content": f"follow-up {i} " + "u" * size, "phase": "answering"})
+        history.append({"role": "assistant", "content": f"answer {i} " + "a" * size, "phase": "answering"})
+    return history
+
+
+_WORDS = (
+    "hydraulic return filter beta ratio viscosity cold start pressure drop bypass valve "
+    "element collapse servo valve cleanliness code contamination ingression reservoir breather "
+    "suction strainer pump cavitation flow rate differential indicator glass fibre cellulose"
+).split()
+
+
+def _text(seed: int, words: int = 300) -> str:
+    return " ".join(_WORDS[(seed * 7 + i * (seed + 3)) % len(_WORDS)] + str(i % 11) for i in range(words))
+
+
+# ── History ─────────────────────────────────────────────────────────────
+
+def test_history_fits():
+    print("\n── History under budget is untouched ──")
+    history = _history(2)
+    packed = pack_history(history, {"flow": "120 L/min"}, 10_000)
+    check("Same messages", packed.messages == history)
+    check("Nothing condensed or dropped", packed.condensed == 0 and packed.dropped == 0)
+    check("Token count reported", packed.tokens == message_tokens(history))
+
+
+def test_history_condenses_gathering():
+    print("\n── Older gathering turns condensed into parameters ──")
+    history = _history(5, answering_turns=2)
+    params = {"flow_rate": "120 L/min", "fluid": "ISO VG 46"}
+    budget = message_tokens(history) // 2
+    packed = pack_history(history, params, budget, keep_recent=4)
+
+    first = packed.messages[0]
+    check("Fits the budget", packed.tokens <= budget, f"{packed.tokens} > {budget}")
+    check("All gathering messages condensed", packed.condensed == 10, str(packed.condensed))
+    check("Parameters carried in the note", "GATHERED PARAMETERS:" in first["content"]
+          and "flow_rate: 120 L/min" in first["content"])
+    check("Starts on a user message", first["role"] == "user")
+    check("Recent messages verbatim (the first carries the note)",
+          packed.messages[-3:] == history[-3:] and first["content"].endswith(history[-4]["content"]))
+    check("Gathering text gone", not any("gathering question" in m["content"] for m in packed.messages))
+    check("Roles still alternate", all(
+        a["role"] != b["role"] for a, b in zip(packed.messages, packed.messages[1:])
+    ))
+    check("Deterministic (stable cache prefix)",
+          pack_history(history, params, budget, keep_recent=4).messages == packed.messages)
+
+
+def test_history_without_parameters():
+    print("\n── Gathering history before any parameters ──")
+    history = _history(6)
+    budget = message_tokens(history) * 3 // 4
+    packed = pack_history(history, None, budget, keep_recent=4)
+    check("Fits the budget", packed.tokens <= budget, f"{packed.tokens} > {budget}")
+    check("User's answers kept", "THE USER SAID:" in packed.messages[0]["content"]
+          and "gathering answer 0" in packed.messages[0]["content"])
+    check("Assistant questions dropped", "gathering question 0" not in packed.messages[0]["content"])
+
+
+def test_history_drops_oldest():
+    print("\n── Oldest turns dropped when condensing is not enough ──")
+    history = _history(1, answering_turns=6)
+    budget = message_tokens(history[-6:]) + 200
+    packed = pack_history(history, {"flow": "120 L/min"}, budget, keep_recent=4)
+    check("Fits the budget", packed.tokens <= budget, f"{packed.tokens} > {budget}")
+    check("Turns dropped in pairs", packed.dropped > 0 and packed.dropped % 2 == 0, str(packed.dropped))
+    check("Omission noted", "earlier messages omitted" in packed.messages[0]["content"])
+    check("Condensed parameters survive the drop", "GATHERED PARAMETERS:" in packed.messages[0]["content"])
+    check("Recent messages verbatim", packed.messages[-4:] == history[-4:])
+
+    tiny = pack_history(history, None, 10, keep_recent=4)
+    check("Never cuts into the recent messages", len(tiny.messages) == 4 and tiny.messages[-3:] == history[-3:]
+          and tiny.messages[0]["content"].endswith(history[-4]["content"]))
+
+
+# ── Retrieved context ───────────────────────────────────────────────────
+
+def test_results_dedupe_and_mmr():
+    print("\n── Retrieved chunks: dedupe, MMR, budget ──")
+    a, b, c = _text(1), _text(2), _text(3)
+    results = [
+        {"id": "a", "source": "s1", "rerank_score": 0.95, "parent_text": a},
+        {"id": "a-dup", "source": "s1-copy", "rerank_score": 0.94, "parent_text": a[:len(a) * 3 // 4]},
+        {"id": "a-near", "source": "s1", "rerank_score": 0.93, "parent_text": a.replace("pump", "motor")},
+        {"id": "b", "source": "s2", "rerank_score": 0.80, "parent_text": b},
+        {"id": "c", "source": "s3", "rerank_score": 0.60, "parent_text": c},
+    ]
+    picked, duplicates = pack_results(results, budget=100_000)
+    ids = [r["id"] for r in picked]
+    check("Contained text dropped as duplicate", "a-dup" not in ids and duplicates >= 1, str(ids))
+    check("Best chunk first", ids[0] == "a", str(ids))
+
+    # Two near-identical relevant chunks vs. a distinct one: MMR prefers diversity
+    similar = [
+        {"id": "x1", "rerank_score": 0.90, "parent_text": " ".join(_WORDS[:10] * 30)},
+        {"id": "x2", "rerank_score": 0.89, "parent_text": " ".join(list(reversed(_WORDS[:10])) * 30)},
+        {"id": "y", "rerank_score": 0.80, "parent_text": " ".join(_WORDS[10:] * 15)},
+    ]
+    picked, _ = pack_results(similar, budget=100_000, mmr_lambda=0.5)
+    check("Diverse chunk ahead of a redundant one", [r["id"] for r in picked][:2] == ["x1", "y"],
+          str([r["id"] for r in picked]))
+
+    # Unscored (reranker skipped): the retrieval order still counts
+    unscored = [{"id": f"u{i}", "rerank_score": None, "parent_text": " ".join(_WORDS[lo:hi] * 20)}
+                for i, (lo, hi) in enumerate(((0, 10), (5, 15), (8, 20), (20, 30)))]
+    picked, _ = pack_results(unscored, budget=100_000)
+    check("Unscored: the #2 hit ahead of a low-ranked distinct one", [r["id"] for r in picked][:2] == ["u0", "u1"],
+          str([r["id"] for r in picked]))
+    mixed = [{**similar[0], "rerank_score": 0.5}, {**similar[2], "rerank_score": None},
+             {**similar[1], "rerank_score": 0.2}]
+    picked, _ = pack_results(mixed, budget=100_000, mmr_lambda=1.0)
+    check("Mixed: unscored tail ranks below scored results", [r["id"] for r in picked] == ["x1", "x2", "y"],
+          str([r["id"] for r in picked]))
+
+    budget = result_tokens(results[0]) + result_tokens(results[4]) + 5
+    picked, _ = pack_results(results, budget=budget)
+    check("Budget respected", sum(result_tokens(r) for r in picked) <= budget)
+    check("Skips what does not fit, keeps what does", [r["id"] for r in picked] == ["a", "c"],
+          str([r["id"] for r in picked]))
+
+    picked, _ = pack_results(results[:1], budget=100)
+    check("Oversized best chunk truncated to fit", len(picked) == 1 and result_tokens(picked[0]) <= 100
+          and results[0]["parent_text"].startswith(picked[0]["parent_text"]))
+    check("Input results not modified", results[0]["parent_text"] == a)
+
+
+# ── Engine ──────────────────────────────────────────────────────────────
+
+def _rag_result(n: int = 12) -> dict:
+    return {
+        "results": [
+            {"id": f"c{i}", "source": f"doc{i % 4}.pdf", "rerank_score": 0.9 - i * 0.03, "parent_text": _text(i, 700)}
+            for i in range(n)
+        ],
+        "confidence": {"level": "HIGH", "reasoning": "ok"},
+        "citations": [],
+    }
+
+
+def test_engine_budget():
+    print("\n── Engine calls fit the vertical budget ──")
+    saved = ce.build_precomputed_context
+    ce.build_precomputed_context = lambda **k: ""
+    try:
+        rag_result = _rag_result()
+        full_context, full_ids = ce._build_rag_context(rag_result)
+        check("Unpacked context carries everything", len(full_ids) == 12)
+
+        history = _history(6, answering_turns=3, size=1500)
+        params = {"flow_rate": "120 L/min", "fluid": "ISO VG 46"}
+        for budget in (6000, 10000, 20000):
+            packed_history, rag_context, chunk_ids = ce._pack_answering_inputs(
+                rag_result, history, params, "What about cold start?", "ANSWERING PROMPT", None, budget,
+            )
+            system, context = ce._build_followup_prompt(params, rag_context, "ANSWERING PROMPT", None, "What about cold start?")
+            messages = ce._build_messages(packed_history, "What about cold start?", context)
+            total = log_packed("test", system, messages, budget)
+            check(f"Budget {budget}: whole prompt fits", total <= budget, f"{total} > {budget}")
+            check(f"Budget {budget}: some retrieved context kept", 0 < len(chunk_ids) < 12, str(len(chunk_ids)))
+            check(f"Budget {budget}: chunk ids match what was sent",
+                  all(f"Reference [{i}]" in rag_context for i in range(1, len(chunk_ids) + 1))
+                  and f"Reference [{len(chunk_ids) + 1}]" not in rag_context)
+
+        system = ce._gathering_system("GATHERING PROMPT", 1, False)
+        packed = ce._pack_gathering_history(system, history, "next answer", 4000)
+        check("Gathering history fits what the system prompt leaves",
+              message_tokens(packed) <= 4000 - count_tokens("GATHERING PROMPT") - count_tokens("next answer"))
+
+        ce.CONTEXT_PACKING = False
+        _, ids = ce._build_rag_context(rag_result, token_budget=1000)
+        check("Packing off → all chunks", len(ids) == 12)
+    finally:
+        ce.CONTEXT_PACKING = True
+        ce.build_precomputed_context = saved
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("CONTEXT PACKER TESTS")
+    print("=" * 60)
+
+    test_history_fits()
+    test_history_condenses_gathering()
+    test_history_without_parameters()
+    test_history_drops_oldest()
+    test_results_dedupe_and_mmr()
+    test_engine_budget()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Connection Manager Tests
+=========================
+Persistent SQLite connections (core/db_pool.py) behind core/database.py:
+WAL and the tuned pragmas, no connection opened per call once started,
+readers that do not wait for the writer, concurrent writes serialized,
+uncommitted work rolled back on release, and transaction() committing or
+rolling back several database calls as one. Temporary SQLite database.
+"""
+from __future__ import annotations
+import asyncio
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import core.database as database
+from core import db_pool
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+async def _fresh_pool() -> str:
+    path = tempfile.mktemp(suffix=".db")
+    database.set_db_path(path)
+    await database.init_db()
+    await db_pool.start(path)
+    return path
+
+
+class _CountConnects:
+    """Counts aiosqlite connections opened through core/db_pool.py."""
+
+    def __init__(self):
+        self.calls = 0
+        self._real = db_pool.aiosqlite.connect
+
+    def __enter__(self):
+        def connect(*args, **kwargs):
+            self.calls += 1
+            return self._real(*args, **kwargs)
+        db_pool.aiosqlite.connect = connect
+        return self
+
+    def __exit__(self, *exc):
+        db_pool.aiosqlite.connect = self._real
+        return False
+
+
+# ── Tests ───────────────────────────────────────────────────────────────
+
+def test_pragmas():
+    print("\n── Pooled connections: WAL, synchronous=NORMAL, mmap, read-only readers ──")
+
+    async def _run():
+        await _fresh_pool()
+        try:
+            async with database._writer() as db:
+                mode = (await db.execute_fetchall("PRAGMA journal_mode"))[0][0]
+                sync = (await db.execute_fetchall("PRAGMA synchronous"))[0][0]
+                mmap = (await db.execute_fetchall("PRAGMA mmap_size"))[0][0]
+            async with database.reader() as db:
+                query_only = (await db.execute_fetchall("PRAGMA query_only"))[0][0]
+                try:
+                    await db.execute("DELETE FROM questions")
+                    refused = False
+                except sqlite3.OperationalError:
+                    refused = True
+            return mode, sync, mmap, query_only, refused, len(db_pool._all_readers)
+        finally:
+            await db_pool.stop()
+
+    mode, sync, mmap, query_only, refused, readers = asyncio.run(_run())
+    check("WAL", mode == "wal", mode)
+    check("synchronous=NORMAL", sync == 1, str(sync))
+    check("mmap_size set", mmap == db_pool.DB_MMAP_SIZE, str(mmap))
+    check("Readers are query_only", query_only == 1 and refused)
+    check("Reader pool sized by DB_READERS", readers == db_pool.DB_READERS, str(readers))
+
+
+def test_no_connection_per_call():
+    print("\n── A consultation turn's calls open no connections ──")
+
+    async def _run():
+        await _fresh_pool()
+        try:
+            with _CountConnects() as connects:
+                session = await database.create_consultation_session(title="t", vertical_id="spray")
+                await database.add_consultation_message(session["id"], "user", "flow rate?")
+                await database.get_consultation_session(session["id"])
+                await database.update_consultation_session(session["id"], phase="answering")
+                await database.add_consultation_message(session["id"], "assistant", "use a 110° nozzle")
+                loaded = await database.get_consultation_session(session["id"])
+            return connects.calls, loaded
+        finally:
+            await db_pool.stop()
+
+    calls, loaded = asyncio.run(_run())
+    check("Zero connections opened", calls == 0, str(calls))
+    check("Writes visible to readers", loaded["phase"] == "answering" and len(loaded["messages"]) == 2, str(loaded))
+
+
+def test_readers_and_writer():
+    print("\n── Readers do not wait for the writer; writes are serialized ──")
+
+    async def _run():
+        await _fresh_pool()
+        try:
+            session = await database.create_consultation_session(title="before")
+            async with database.transaction():
+                await database.update_consultation_session(session["id"], title="inside")
+                # A reader outside the transaction sees the committed state, without blocking
+                seen = await asyncio.wait_for(asyncio.create_task(_title(session["id"])), timeout=2)
+            after = await _title(session["id"])
+
+            await asyncio.gather(*[
+                database.add_consultation_message(session["id"], "user", f"m{i}") for i in range(20)
+            ])
+            loaded = await database.get_consultation_session(session["id"])
+            return seen, after, len(loaded["messages"])
+        finally:
+            await db_pool.stop()
+
+    seen, after, count = asyncio.run(_run())
+    check("Reader saw the last committed title", seen == "before", seen)
+    check("Committed after the block", after == "inside", after)
+    check("Concurrent writes all stored", count == 20, str(count))
+
+
+async def _title(session_id: str) -> str:
+    async with database.reader() as db:
+        rows = await db.execute_fetchall("SELECT title FROM consultation_sessions WHERE id = ?", (session_id,))
+    return rows[0][0]
+
+
+def test_transaction_rollback():
+    print("\n── transaction(): one unit across calls ──")
+
+    async def _run():
+        await _fresh_pool()
+        try:
+            session = await database.create_consultation_session(title="t")
+            try:
+                async with database.transaction():
+                    await database.update_consultation_session(session["id"], phase="answering")
+                    await database.add_consultation_message(session["id"], "assistant", "reply")
+                    inside = await database.get_consultation_session(session["id"])
+                    raise RuntimeError("engine failed after the writes")
+            except RuntimeError:
+                pass
+            rolled_back = await database.get_consultation_session(session["id"])
+            # The writer is usable afterwards
+            await database.add_consultation_message(session["id"], "user", "retry")
+            after = await database.get_consultation_session(session["id"])
+            return inside, rolled_back, after
+        finally:
+            await db_pool.stop()
+
+    inside, rolled_back, after = asyncio.run(_run())
+    check("Calls inside see the transaction's writes", inside["phase"] == "answering"
+          and len(inside["messages"]) == 1, str(inside))
+    check("Exception rolls back every call", rolled_back["phase"] == "gathering"
+          and rolled_back["messages"] == [], str(rolled_back))
+    check("Writer usable after the rollback", len(after["messages"]) == 1, str(after["messages"]))
+
+
+def test_failed_write_released_clean():
+    print("\n── A write that fails midway is rolled back on release ──")
+
+    async def _run():
+        await _fresh_pool()
+        try:
+            session = await database.create_consultation_session(title="t")
+            await database.add_consultation_message(session["id"], "user", "q", idempotency_key="k1")
+            try:
+                await database.add_consultation_message(session["id"], "user", "q", idempotency_key="k1")
+                duplicate = False
+            except sqlite3.IntegrityError:
+                duplicate = True
+            in_tx = db_pool._writer.in_transaction
+            await database.add_consultation_message(session["id"], "assistant", "a")
+            await database.save_question("q1", "q?", "a", "HIGH", [], [])
+            await database.get_question("q1")        # sets aiosqlite.Row on its reader
+            async with database.reader() as db:
+                factory = db.row_factory
+            loaded = await database.get_consultation_session(session["id"])
+            return duplicate, in_tx, factory, len(loaded["messages"])
+        finally:
+            await db_pool.stop()
+
+    duplicate, in_tx, factory, count = asyncio.run(_run())
+    check("Duplicate key still raises", duplicate)
+    check("No transaction left open on the writer", not in_tx)
+    check("Next write unaffected", count == 2, str(count))
+    check("Checked-out connections come back with row_factory reset", factory is None, str(factory))
+
+
+def test_sync_reader():
+    print("\n── Worker-thread reads: one read-only connection per thread ──")
+    import threading
+
+    opened = []
+    real = db_pool._connect_sync
+
+    def counting(path):
+        conn = real(path)
+        opened.append(conn)
+        return conn
+
+    def _read(question_id: str) -> tuple:
+        servable = database.question_servable_sync(question_id)
+        with database.sync_reader() as conn:
+            return servable, conn, conn.execute("PRAGMA query_only").fetchone()[0], \
+                conn.execute("PRAGMA busy_timeout").fetchone()[0]
+
+    async def _run():
+        await _fresh_pool()
+        db_pool._connect_sync = counting
+        try:
+            question = await database.save_question("q1", "Beta for servo valves?", "Beta 200.", "HIGH", [], [])
+            first = _read(question["id"])
+            second = _read(question["id"])
+            other = []
+            thread = threading.Thread(target=lambda: other.append(_read(question["id"])))
+            thread.start()
+            thread.join()
+            while_open = len(opened)
+        finally:
+            await db_pool.stop()
+            db_pool._connect_sync = real
+        closed = all(_is_closed(conn) for conn in opened)
+        return first, second, other[0], while_open, closed
+
+    def _is_closed(conn) -> bool:
+        try:
+            conn.execute("SELECT 1")
+            return False
+        except sqlite3.ProgrammingError:
+            return True
+
+    first, second, other, while_open, closed = asyncio.run(_run())
+    check("Reads answered", first[0] is True and second[0] is True and other[0] is True)
+    check("Same connection for a thread's next read", first[1] is second[1])
+    check("Another thread gets its own", other[1] is not first[1] and while_open == 2, str(while_open))
+    check("Read-only, with the pool's busy timeout", first[2] == 1
+          and first[3] == int(db_pool.DB_BUSY_TIMEOUT * 1000), str(first[2:]))
+    check("Closed by stop()", closed)
+
+
+def test_not_started():
+    print("\n── Not started: a connection per call, as before ──")
+
+    async def _run():
+        path = tempfile.mktemp(suffix=".db")
+        database.set_db_path(path)
+        await database.init_db()
+        with _CountConnects() as connects:
+            session = await database.create_consultation_session(title="t")
+            async with database.transaction():
+                await database.update_consultation_session(session["id"], title="tx")
+                await database.add_consultation_message(session["id"], "user", "q")
+            loaded = await database.get_consultation_session(session["id"])
+        return db_pool.is_open(), connects.calls, loaded
+
+    is_open, calls, loaded = asyncio.run(_run())
+    check("Manager closed", not is_open)
+    check("Per-call connections, one for the whole transaction", calls == 3, str(calls))
+    check("Transaction committed", loaded["title"] == "tx" and len(loaded["messages"]) == 1, str(loaded))
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("CONNECTION MANAGER TESTS")
+    print("=" * 60)
+
+    test_pragmas()
+    test_no_connection_per_call()
+    test_readers_and_writer()
+    test_transaction_rollback()
+    test_failed_write_released_clean()
+    test_sync_reader()
+    test_not_started()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
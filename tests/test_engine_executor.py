@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Engine Executor Tests
+======================
+Per-vertical admission, queue-depth metrics, overload → 503, and driving
+blocking generators from the shared pool (core/engine_executor.py).
+Blocking engine calls are stood in for by time.sleep — no API calls.
+"""
+from __future__ import annotations
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import core.engine_executor as ee
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+def _configure(max_concurrent: int, max_queued: int, timeout: float):
+    ee.ENGINE_MAX_CONCURRENT = max_concurrent
+    ee.ENGINE_MAX_QUEUED = max_queued
+    ee.ENGINE_QUEUE_TIMEOUT = timeout
+
+
+# ── Admission ───────────────────────────────────────────────────────────
+
+def test_concurrency_limit():
+    print("\n── Per-vertical concurrency limit ──")
+    _configure(max_concurrent=2, max_queued=10, timeout=5)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def blocking_call(x):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return x * 2
+
+    async def main():
+        ticks = []
+
+        async def ticker():
+            for _ in range(20):
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+
+        t = asyncio.create_task(ticker())
+        results = await asyncio.gather(
+            *(ee.run_engine("hydraulic_filtration", blocking_call, i) for i in range(6)),
+            *(ee.run_engine("spray_nozzles", blocking_call, i) for i in range(2)),
+        )
+        await t
+        return results, ticks, ee.engine_stats()
+
+    results, ticks, stats = asyncio.run(main())
+    check("Results returned in order", results[:6] == [0, 2, 4, 6, 8, 10], str(results))
+    check("Never more than 2 per vertical + 2 other", peak[0] <= 4, f"peak={peak[0]}")
+    hf = stats["verticals"]["hydraulic_filtration"]
+    check("Completed counted", hf["completed"] == 6, str(hf))
+    check("Queue depth observed", hf["peak_queued"] >= 4, str(hf))
+    check("Nothing left in flight", hf["in_flight"] == 0 and hf["queued"] == 0, str(hf))
+    check("Separate lane per vertical", stats["verticals"]["spray_nozzles"]["completed"] == 2)
+    max_gap = max(b - a for a, b in zip(ticks, ticks[1:]))
+    check("Event loop not blocked by engine calls", max_gap < 0.04, f"{max_gap * 1000:.0f} ms")
+
+
+def test_overload_rejects_fast():
+    print("\n── Overload → EngineOverloaded ──")
+    _configure(max_concurrent=1, max_queued=2, timeout=5)
+
+    async def main():
+        outcomes = []
+
+        async def call(i):
+            t0 = time.perf_counter()
+            try:
+                await ee.run_engine("v", time.sleep, 0.1)
+                outcomes.append(("ok", time.perf_counter() - t0))
+            except ee.EngineOverloaded:
+                outcomes.append(("rejected", time.perf_counter() - t0))
+
+        await asyncio.gather(*(call(i) for i in range(6)))
+        return outcomes, ee.engine_stats()["verticals"]["v"]
+
+    outcomes, stats = asyncio.run(main())
+    rejected = [t for kind, t in outcomes if kind == "rejected"]
+    check("1 running + 2 queued admitted", sum(1 for k, _ in outcomes if k == "ok") == 3, str(outcomes))
+    check("Excess rejected", len(rejected) == 3, str(outcomes))
+    check("Rejection is immediate", all(t < 0.02 for t in rejected), str(rejected))
+    check("Rejections counted", stats["rejected"] == 3, str(stats))
+
+    _configure(max_concurrent=1, max_queued=5, timeout=0.05)
+
+    async def timed_out():
+        slow = asyncio.create_task(ee.run_engine("w", time.sleep, 0.3))
+        await asyncio.sleep(0.01)
+        try:
+            await ee.run_engine("w", time.sleep, 0)
+            return False
+        except ee.EngineOverloaded as e:
+            return "no slot" in e.reason
+        finally:
+            await slow
+
+    check("Queue wait timeout → overload", asyncio.run(timed_out()))
+
+    resp = ee.overloaded_response(ee.EngineOverloaded("v", "full"))
+    check("503 with Retry-After", resp.status_code == 503 and resp.headers.get("retry-after") == str(ee.ENGINE_RETRY_AFTER))
+
+
+def test_slot_and_generator():
+    print("\n── Streaming slots ──")
+    _configure(max_concurrent=1, max_queued=0, timeout=5)
+
+    def blocking_gen():
+        for i in range(3):
+            time.sleep(0.01)
+            yield f"event-{i}"
+
+    async def main():
+        slot = await ee.acquire_slot("s")
+        try:
+            await ee.acquire_slot("s")
+            second_rejected = False
+        except ee.EngineOverloaded:
+            second_rejected = True
+        items = [item async for item in ee.iterate_in_executor(blocking_gen())]
+        slot.release()
+        slot.release()  # idempotent
+        again = await ee.acquire_slot("s")
+        again.release()
+        return second_rejected, items, ee.engine_stats()["verticals"]["s"]
+
+    second_rejected, items, stats = asyncio.run(main())
+    check("Held slot blocks a second stream", second_rejected)
+    check("Generator items in order", items == ["event-0", "event-1", "event-2"], str(items))
+    check("Double release is harmless", stats["in_flight"] == 0 and stats["completed"] == 2, str(stats))
+
+
+def test_stream_lane():
+    print("\n── Async streams: their own, larger lane ──")
+    _configure(max_concurrent=1, max_queued=0, timeout=5)
+    saved_streams = ee.ENGINE_MAX_STREAMS
+    ee.ENGINE_MAX_STREAMS = 3
+
+    async def main():
+        streams = [await ee.acquire_slot("t", stream=True) for _ in range(3)]
+        pool_slot = await ee.acquire_slot("t")  # not crowded out by the streams
+        try:
+            await ee.acquire_slot("t", stream=True)
+            fourth_rejected = False
+        except ee.EngineOverloaded:
+            fourth_rejected = True
+        for slot in streams + [pool_slot]:
+            slot.release()
+        return fourth_rejected, ee.engine_stats()
+
+    try:
+        fourth_rejected, stats = asyncio.run(main())
+    finally:
+        ee.ENGINE_MAX_STREAMS = saved_streams
+    check("Streams do not take pool-bound slots", stats["verticals"]["t"]["completed"] == 1, str(stats["verticals"]))
+    check("Stream lane has its own limit", fourth_rejected and stats["streams"]["t"]["completed"] == 3, str(stats["streams"]))
+
+
+def test_slot_released_if_stream_never_starts():
+    print("\n── Response on_close releases a slot the stream never reached ──")
+    from core.streaming import CancellableStreamingResponse
+    _configure(max_concurrent=1, max_queued=0, timeout=5)
+
+    async def main():
+        slot = await ee.acquire_slot("n")
+
+        async def body():
+            try:
+                yield "data: x\n\n"
+            finally:
+                slot.release()
+
+        response = CancellableStreamingResponse(body(), media_type="text/event-stream", on_close=[slot.release])
+
+        async def send(message):
+            raise OSError("client gone")  # fails before the body is iterated
+
+        async def receive():
+            await asyncio.sleep(3600)
+
+        scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "method": "GET", "headers": []}
+        try:
+            await response(scope, receive, send)
+        except OSError:
+            pass
+        return ee.engine_stats()["verticals"]["n"]
+
+    stats = asyncio.run(main())
+    check("Slot released", stats["in_flight"] == 0 and stats["completed"] == 1, str(stats))
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("ENGINE EXECUTOR TESTS")
+    print("=" * 60)
+
+    test_concurrency_limit()
+    test_overload_rejects_fast()
+    test_slot_and_generator()
+    test_stream_lane()
+    test_slot_released_if_stream_never_starts()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
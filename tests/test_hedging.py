@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Hedged Request Tests
+=====================
+Primary / fallback model races (core/hedging.py) in the consultation and
+answer engines: the fallback starts when the primary is slow, the first
+viable lane wins, the loser is cancelled and its cost recorded. Fake
+Anthropic clients with per-model delays, temporary SQLite database — no
+API calls.
+"""
+from __future__ import annotations
+import asyncio
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import aiosqlite
+
+import core.answer_engine as ae
+import core.consultation_engine as ce
+import core.database as database
+from core import hedging, model_router
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+# ── Fakes ───────────────────────────────────────────────────────────────
+
+PRIMARY, FALLBACK = ce.CONSULT_MODEL, ce.FALLBACK_MODEL
+
+
+def _response(model: str):
+    return SimpleNamespace(
+        model=model, stop_reason="end_turn",
+        usage=SimpleNamespace(input_tokens=1000, output_tokens=200),
+        content=[SimpleNamespace(text=f"answer from {model}")],
+    )
+
+
+class _SyncStream:
+    """Blocks before its first token until `delay` passes or it is closed."""
+
+    def __init__(self, model, delay):
+        self.model = model
+        self.delay = delay
+        self.closed = threading.Event()
+        self.current_message_snapshot = SimpleNamespace(usage=SimpleNamespace(input_tokens=1000))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed.set()
+        return False
+
+    def close(self):
+        self.closed.set()
+
+    @property
+    def text_stream(self):
+        if self.closed.wait(self.delay):
+            raise ConnectionError("stream closed")
+        for word in f"answer from {self.model}".split(" "):
+            yield word + " "
+
+    def get_final_message(self):
+        return _response(self.model)
+
+
+class _AsyncStream:
+    def __init__(self, model, delay):
+        self.model = model
+        self.delay = delay
+        self.closed = False
+        self.current_message_snapshot = SimpleNamespace(usage=SimpleNamespace(input_tokens=1000))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+        return False
+
+    async def close(self):
+        self.closed = True
+
+    @property
+    async def text_stream(self):
+        await asyncio.sleep(self.delay)
+        for word in f"answer from {self.model}".split(" "):
+            yield word + " "
+
+    async def get_final_message(self):
+        return _response(self.model)
+
+
+class _FakeMessages:
+    def __init__(self, delays: dict, is_async: bool):
+        self.delays = delays
+        self.is_async = is_async
+        self.calls: list[str] = []
+        self.streams: dict = {}
+
+    def create(self, **kwargs):
+        model = kwargs["model"]
+        self.calls.append(model)
+        if self.is_async:
+            async def _create():
+                await asyncio.sleep(self.delays[model])
+                return _response(model)
+            return _create()
+        time.sleep(self.delays[model])
+        return _response(model)
+
+    def stream(self, **kwargs):
+        model = kwargs["model"]
+        self.calls.append(model)
+        stream = (_AsyncStream if self.is_async else _SyncStream)(model, self.delays[model])
+        self.streams[model] = stream
+        return stream
+
+
+_ORIGINALS = {
+    "ce": {name: getattr(ce, name) for name in ("_client", "_async_client")},
+    "ae": {name: getattr(ae, name) for name in ("_client", "verified_query")},
+    "hedging": {name: getattr(hedging, name) for name in ("LLM_HEDGING", "HEDGE_AFTER_SECONDS")},
+    "model_router": {"MODEL_ROUTING": model_router.MODEL_ROUTING},
+}
+
+
+def _install(primary_delay: float, fallback_delay: float, hedge: bool = True) -> tuple[_FakeMessages, _FakeMessages]:
+    delays = {PRIMARY: primary_delay, FALLBACK: fallback_delay, ae.CLAUDE_MODEL: primary_delay}
+    sync_messages, async_messages = _FakeMessages(delays, False), _FakeMessages(delays, True)
+    ce._client = SimpleNamespace(messages=sync_messages)
+    ce._async_client = SimpleNamespace(messages=async_messages)
+    ae._client = SimpleNamespace(messages=sync_messages)
+    hedging.LLM_HEDGING = hedge
+    hedging.HEDGE_AFTER_SECONDS = 0.05
+    model_router.MODEL_ROUTING = False  # race the configured primary/fallback pair
+    hedging._counts.clear()
+    hedging._latency.clear()
+    return sync_messages, async_messages
+
+
+def _restore():
+    for module, originals in ((ce, _ORIGINALS["ce"]), (ae, _ORIGINALS["ae"]), (hedging, _ORIGINALS["hedging"]),
+                              (model_router, _ORIGINALS["model_router"])):
+        for name, value in originals.items():
+            setattr(module, name, value)
+
+
+def _fresh_db() -> None:
+    database.set_db_path(tempfile.mktemp(suffix=".db"))
+    asyncio.run(database.init_db())
+
+
+def _usage_rows() -> list[dict]:
+    async def _read():
+        async with aiosqlite.connect(database._get_db_path()) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("SELECT * FROM llm_usage ORDER BY id")
+            return [dict(r) for r in await cursor.fetchall()]
+    return asyncio.run(_read())
+
+
+def _wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+# ── Plain calls ─────────────────────────────────────────────────────────
+
+def test_call_hedged():
+    print("\n── _call_claude: slow primary, fallback hedge wins ──")
+    _fresh_db()
+    messages, _ = _install(primary_delay=0.4, fallback_delay=0.01)
+    try:
+        t0 = time.perf_counter()
+        text, model = ce._call_claude("system", [{"role": "user", "content": "hi"}])
+        elapsed = time.perf_counter() - t0
+        _wait_for(lambda: len(_usage_rows()) == 2)
+        stats = hedging.hedge_stats()
+    finally:
+        _restore()
+
+    rows = _usage_rows()
+    check("Fallback answer returned", model == FALLBACK and text == f"answer from {FALLBACK}", f"{model} {text}")
+    check("Without waiting for the primary", elapsed < 0.3, f"{elapsed:.2f}s")
+    check("Both lanes called", messages.calls == [PRIMARY, FALLBACK], str(messages.calls))
+    check("Loser's usage recorded as hedge cost", sorted((r["model"], r["hedge_loser"]) for r in rows)
+          == sorted([(FALLBACK, 0), (PRIMARY, 1)]), str(rows))
+    check("Stats: one hedge, won by the fallback", stats["calls"]["call"]["hedged"] == 1
+          and stats["calls"]["call"]["won_by_fallback"] == 1, str(stats))
+    check("Stats: loser tokens and cost", stats["loser"]["input_tokens"] == 1000
+          and stats["loser"]["output_tokens"] == 200 and stats["loser"]["estimated_cost_usd"] > 0, str(stats["loser"]))
+
+
+def test_call_not_hedged():
+    print("\n── Hedging off, or a fast primary: no fallback call ──")
+    _fresh_db()
+    messages, _ = _install(primary_delay=0.15, fallback_delay=0.01, hedge=False)
+    try:
+        _, model = ce._call_claude("system", [{"role": "user", "content": "hi"}])
+        off_calls = list(messages.calls)
+        messages, _ = _install(primary_delay=0.0, fallback_delay=0.0)
+        _, fast_model = ce._call_claude("system", [{"role": "user", "content": "hi"}])
+        fast_calls = list(messages.calls)
+        stats = hedging.hedge_stats()
+    finally:
+        _restore()
+    check("Off: waits for the primary", model == PRIMARY and off_calls == [PRIMARY], str(off_calls))
+    check("Fast primary: fallback never started", fast_model == PRIMARY and fast_calls == [PRIMARY], str(fast_calls))
+    check("Latency sampled with percentiles", "first_item_p99_ms" in stats["calls"]["call"], str(stats))
+
+
+# ── Streams ─────────────────────────────────────────────────────────────
+
+def test_async_stream_hedged():
+    print("\n── Async stream: no first token in time, fallback wins ──")
+    _fresh_db()
+    _, messages = _install(primary_delay=1.0, fallback_delay=0.01)
+    try:
+        async def _run():
+            t0 = time.perf_counter()
+            events = [e async for e in ce._call_claude_stream_async("system", [{"role": "user", "content": "hi"}])]
+            return events, time.perf_counter() - t0
+        events, elapsed = asyncio.run(_run())
+    finally:
+        _restore()
+
+    rows = _usage_rows()
+    text = "".join(d for t, d in events if t == "text")
+    check("Fallback streamed", text.strip() == f"answer from {FALLBACK}" and events[-1] == ("done", FALLBACK), str(events))
+    check("Without waiting for the primary", elapsed < 0.5, f"{elapsed:.2f}s")
+    check("Primary stream cancelled and closed", messages.streams[PRIMARY].closed)
+    check("Loser recorded as hedge cost, not as a client abort",
+          [(r["model"], r["hedge_loser"], r["aborted"]) for r in rows if r["model"] == PRIMARY] == [(PRIMARY, 1, 0)],
+          str(rows))
+
+
+def test_sync_stream_hedged():
+    print("\n── Sync stream: a wrapper over the hedged async pipeline ──")
+    _fresh_db()
+    _, messages = _install(primary_delay=5.0, fallback_delay=0.01)
+    try:
+        t0 = time.perf_counter()
+        events = list(ce.generate_consultation_response_stream(
+            session_id="s1", user_message="hi", phase="gathering", conversation_history=[],
+        ))
+        elapsed = time.perf_counter() - t0
+        _wait_for(lambda: any(r["hedge_loser"] for r in _usage_rows()))
+    finally:
+        _restore()
+
+    rows = _usage_rows()
+    text = "".join(d for t, d in events if t == "text")
+    check("Fallback streamed", text.strip() == f"answer from {FALLBACK}", str(events))
+    check("Without waiting for the primary", elapsed < 1.0, f"{elapsed:.2f}s")
+    check("Primary stream closed", messages.streams[PRIMARY].closed)
+    check("Loser recorded", any(r["model"] == PRIMARY and r["hedge_loser"] == 1 for r in rows), str(rows))
+
+
+def test_failure_still_falls_back():
+    print("\n── A failing primary hands over at once, hedging or not ──")
+    _install(primary_delay=0.0, fallback_delay=0.0, hedge=False)
+
+    class _Broken(_FakeMessages):
+        def create(self, **kwargs):
+            if kwargs["model"] == PRIMARY:
+                self.calls.append(PRIMARY)
+                raise RuntimeError("overloaded")
+            return super().create(**kwargs)
+
+    broken = _Broken({PRIMARY: 0.0, FALLBACK: 0.0}, False)
+    ce._client = SimpleNamespace(messages=broken)
+    try:
+        text, model = ce._call_claude("system", [{"role": "user", "content": "hi"}])
+    finally:
+        _restore()
+    check("Fallback used after the error", model == FALLBACK and broken.calls == [PRIMARY, FALLBACK], f"{model} {broken.calls}")
+
+
+# ── Answer engine ───────────────────────────────────────────────────────
+
+def test_generate_answer_hedged():
+    print("\n── generate_answer: fallback lane races the primary strategies ──")
+    _fresh_db()
+    messages, _ = _install(primary_delay=0.4, fallback_delay=0.01)
+
+    def _no_kb(*a, **k):
+        raise RuntimeError("no vector store")
+
+    ae.verified_query = _no_kb
+    saved_prompt = ae.SYSTEM_PROMPT
+    ae.SYSTEM_PROMPT = "You are a test."
+    try:
+        t0 = time.perf_counter()
+        result = ae.generate_answer("Which return filter?")
+        elapsed = time.perf_counter() - t0
+    finally:
+        ae.SYSTEM_PROMPT = saved_prompt
+        _restore()
+    check("Fallback lane's answer", result["answer"] == f"answer from {FALLBACK}", result["answer"])
+    check("Without waiting for the primary", elapsed < 0.3, f"{elapsed:.2f}s")
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("HEDGED REQUEST TESTS")
+    print("=" * 60)
+
+    test_call_hedged()
+    test_call_not_hedged()
+    test_async_stream_hedged()
+    test_sync_stream_hedged()
+    test_failure_still_falls_back()
+    test_generate_answer_hedged()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Background Job Tests
+=====================
+Durable job queue for post-response side work (core/jobs.py): persistence,
+handlers, retries, lease expiry and the worker tasks. Temporary SQLite
+database — no API calls.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import aiosqlite
+
+import core.database as database
+from core import jobs
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+def _fresh_db() -> None:
+    database.set_db_path(tempfile.mktemp(suffix=".db"))
+    asyncio.run(database.init_db())
+
+
+async def _job_rows() -> list[dict]:
+    async with aiosqlite.connect(database._get_db_path()) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute("SELECT * FROM background_jobs ORDER BY id")
+        return [dict(r) for r in await cursor.fetchall()]
+
+
+# ── Handlers ────────────────────────────────────────────────────────────
+
+def test_post_response_jobs():
+    print("\n── Title and follow-up jobs ──")
+    _fresh_db()
+
+    async def _run():
+        session = await database.create_consultation_session(vertical_id="hydraulic_filtration")
+        sid = session["id"]
+        await jobs.enqueue("session_title", session_id=sid, first_message="Which return filter for 120 L/min? More text")
+        await jobs.enqueue("followup_schedule", session_id=sid, transitioned_at="2026-01-01T00:00:00+00:00")
+        queued = await _job_rows()
+        ran = await jobs.run_pending()
+        title = (await database.get_consultation_session(sid))["title"]
+        stages = await database.get_followup_stages(sid)
+
+        # Run the follow-up job again, as after a crash before it was marked done
+        await jobs.enqueue("followup_schedule", session_id=sid, transitioned_at="2026-01-01T00:00:00+00:00")
+        await jobs.run_pending()
+        async with aiosqlite.connect(database._get_db_path()) as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM outcome_followup_schedule WHERE session_id = ?", (sid,))
+            followups = (await cursor.fetchone())[0]
+        return queued, ran, title, stages, followups, await _job_rows()
+
+    queued, ran, title, stages, followups, rows = asyncio.run(_run())
+    check("Jobs persisted as pending", [r["status"] for r in queued] == ["pending", "pending"])
+    check("Both jobs ran", ran == 2, str(ran))
+    check("Title set", title == "Which return filter for 120 L/min", title)
+    check("Follow-ups scheduled", stages == {"30_day", "90_day", "180_day"}, str(stages))
+    check("Re-running the follow-up job adds nothing", followups == 3, str(followups))
+    check("All marked done", all(r["status"] == "done" for r in rows), str([r["status"] for r in rows]))
+
+
+def test_training_log_job():
+    print("\n── Training log job ──")
+    _fresh_db()
+    import core.training as training
+    calls = []
+    saved = training.log_consultation
+    training.log_consultation = lambda **kw: calls.append(kw) or True
+    try:
+        asyncio.run(jobs.enqueue(
+            "training_log", session_id="s1", application_domain="general", gathered_parameters={"a": 1},
+            refined_query="q", messages=[{"role": "user", "content": "hi", "phase": "gathering"}],
+            rag_chunks_used=["c1"], confidence="HIGH", num_gathering_turns=1,
+        ))
+        asyncio.run(jobs.run_pending())
+    finally:
+        training.log_consultation = saved
+    check("Logged with the queued payload", len(calls) == 1 and calls[0]["gathered_parameters"] == {"a": 1}
+          and calls[0]["messages"][0]["phase"] == "gathering", str(calls))
+
+    # A retried job (lease expired after the write) must not log the session twice
+    saved_log = training.CONSULTATIONS_LOG
+    training.CONSULTATIONS_LOG = Path(tempfile.mkdtemp()) / "consultations.jsonl"
+    payload = dict(
+        session_id="s1", application_domain="general", gathered_parameters={"a": 1}, refined_query="q",
+        messages=[], rag_chunks_used=[], confidence="HIGH", num_gathering_turns=1,
+    )
+    try:
+        ok = training.log_consultation(**payload)
+        training.log_consultation_feedback("s1", "up")
+        again = training.log_consultation(**payload)
+        other = training.log_consultation(**{**payload, "session_id": "s2"})
+        lines = training.CONSULTATIONS_LOG.read_text().splitlines()
+    finally:
+        training.CONSULTATIONS_LOG = saved_log
+    check("Re-run for the same session appends nothing", ok and again and other and len(lines) == 3
+          and [json.loads(l)["session_id"] for l in lines] == ["s1", "s1", "s2"], str(lines))
+
+
+# ── Failures ────────────────────────────────────────────────────────────
+
+def test_retry_and_failure():
+    print("\n── Retries with backoff, then failed ──")
+    _fresh_db()
+    attempts = []
+
+    @jobs.job_handler("test_flaky")
+    async def _flaky(payload):
+        attempts.append(payload["n"])
+        raise RuntimeError("boom")
+
+    saved = jobs.JOB_MAX_ATTEMPTS, jobs.JOB_RETRY_BASE
+    jobs.JOB_MAX_ATTEMPTS, jobs.JOB_RETRY_BASE = 2, 0
+    try:
+        async def _run():
+            await jobs.enqueue("test_flaky", n=7)
+            await jobs.run_pending()
+            return await _job_rows()
+        rows = asyncio.run(_run())
+    finally:
+        jobs.JOB_MAX_ATTEMPTS, jobs.JOB_RETRY_BASE = saved
+        jobs._handlers.pop("test_flaky", None)
+
+    check("Retried up to the attempt limit", attempts == [7, 7], str(attempts))
+    check("Marked failed with the error", rows[0]["status"] == "failed" and "boom" in rows[0]["last_error"], str(rows[0]))
+
+    _fresh_db()
+
+    async def _backoff():
+        @jobs.job_handler("test_fail_once")
+        async def _once(payload):
+            raise RuntimeError("later")
+        await jobs.enqueue("test_fail_once")
+        ran = await jobs.run_pending()
+        jobs._handlers.pop("test_fail_once", None)
+        return ran, await _job_rows()
+
+    ran, rows = asyncio.run(_backoff())
+    check("Retry waits for its backoff", ran == 1 and rows[0]["status"] == "pending"
+          and rows[0]["run_after"] > rows[0]["updated_at"], str(rows[0]))
+
+    try:
+        asyncio.run(jobs.enqueue("no_such_kind"))
+        check("Unknown kind rejected", False)
+    except ValueError:
+        check("Unknown kind rejected", True)
+
+
+def test_lease_expiry():
+    print("\n── Jobs of a dead worker are reclaimed ──")
+    _fresh_db()
+
+    async def _run():
+        session = await database.create_consultation_session()
+        await jobs.enqueue("session_title", session_id=session["id"], first_message="Cold start sizing")
+        claimed = await database.claim_job(lease_seconds=60)       # worker takes it, then dies
+        none_while_leased = await database.claim_job(lease_seconds=60)
+        async with aiosqlite.connect(database._get_db_path()) as db:
+            await db.execute("UPDATE background_jobs SET locked_until = '2000-01-01T00:00:00+00:00'")
+            await db.commit()
+        ran = await jobs.run_pending()
+        return claimed, none_while_leased, ran, (await database.get_consultation_session(session["id"]))["title"]
+
+    claimed, none_while_leased, ran, title = asyncio.run(_run())
+    check("Claimed once", claimed is not None and claimed["attempts"] == 1)
+    check("Not claimable while leased", none_while_leased is None)
+    check("Reclaimed after the lease expired", ran == 1 and title == "Cold start sizing", f"{ran} {title}")
+
+
+# ── Workers ─────────────────────────────────────────────────────────────
+
+def test_workers():
+    print("\n── Worker tasks pick up new jobs at once ──")
+    _fresh_db()
+
+    async def _run():
+        session = await database.create_consultation_session()
+        saved_poll = jobs.JOB_POLL_INTERVAL
+        jobs.JOB_POLL_INTERVAL = 30  # only the wakeup can make this quick
+        try:
+            await jobs.start(workers=2)
+            await asyncio.sleep(0.05)
+            await jobs.enqueue("session_title", session_id=session["id"], first_message="Servo valve protection")
+            for _ in range(100):
+                if (await database.get_consultation_session(session["id"]))["title"] != "New Consultation":
+                    break
+                await asyncio.sleep(0.02)
+            stats = await jobs.job_stats()
+            await jobs.stop()
+        finally:
+            jobs.JOB_POLL_INTERVAL = saved_poll
+        return (await database.get_consultation_session(session["id"]))["title"], stats
+
+    title, stats = asyncio.run(_run())
+    check("Job run by a worker", title == "Servo valve protection", title)
+    check("Stats report workers and table", stats["workers"] == 2 and stats["table"].get("done") == 1, str(stats))
+    check("Workers stopped", jobs._workers == [])
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("BACKGROUND JOB TESTS")
+    print("=" * 60)
+
+    test_post_response_jobs()
+    test_training_log_job()
+    test_retry_and_failure()
+    test_lease_expiry()
+    test_workers()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
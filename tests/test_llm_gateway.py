@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+LLM Gateway Tests
+==================
+Admission control for Anthropic calls (core/llm_gateway.py): token buckets
+per model and vertical, round-robin fairness between verticals, queue
+timeouts, and retry with jittered backoff that honours retry-after. Fake
+requests and clients — no API calls.
+"""
+from __future__ import annotations
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import core.consultation_engine as ce
+from core import engine_executor, llm_gateway, model_router
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+# ── Helpers ─────────────────────────────────────────────────────────────
+
+_CONFIG = ("LLM_GATEWAY", "LLM_MODEL_LIMITS", "LLM_VERTICAL_LIMITS", "LLM_QUEUE_TIMEOUT",
+           "LLM_MAX_RETRIES", "LLM_BACKOFF_BASE", "LLM_BACKOFF_MAX")
+_ORIGINALS = {name: getattr(llm_gateway, name) for name in _CONFIG}
+
+
+def _reset(**config) -> None:
+    for name, value in _ORIGINALS.items():
+        setattr(llm_gateway, name, value)
+    llm_gateway.LLM_BACKOFF_BASE = 0.01
+    for name, value in config.items():
+        setattr(llm_gateway, name, value)
+    llm_gateway._models.clear()
+    llm_gateway._verticals.clear()
+    llm_gateway._queues.clear()
+    llm_gateway._rotation.clear()
+
+
+class _APIError(Exception):
+    """Stands in for anthropic.APIStatusError: status_code + response headers."""
+
+    def __init__(self, status: int, headers: dict | None = None):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def _failing(times: int, error: Exception, result="ok"):
+    attempts = []
+
+    def request():
+        attempts.append(time.perf_counter())
+        if len(attempts) <= times:
+            raise error
+        return result
+    return request, attempts
+
+
+def _in_thread(vertical: str, fn):
+    def _run():
+        llm_gateway.set_vertical(vertical)
+        fn()
+    thread = threading.Thread(target=_run)
+    thread.start()
+    return thread
+
+
+# ── Buckets ─────────────────────────────────────────────────────────────
+
+def test_token_bucket():
+    print("\n── Token bucket: calls wait for input-token budget ──")
+    _reset(LLM_MODEL_LIMITS={"m": {"tpm": 600}})  # 10 tokens/s
+    t0 = time.perf_counter()
+    llm_gateway.call("m", lambda: "first", tokens=600)
+    first = time.perf_counter() - t0
+    llm_gateway.call("m", lambda: "second", tokens=5)
+    second = time.perf_counter() - t0 - first
+    stats = llm_gateway.gateway_stats()["models"]["m"]
+    check("Within budget: admitted at once", first < 0.05, f"{first:.3f}s")
+    check("Over budget: waits for the refill", 0.4 < second < 0.8, f"{second:.3f}s")
+    check("Wait recorded", stats["admitted"] == 2 and stats["max_wait_ms"] >= 400, str(stats))
+
+    _reset(LLM_MODEL_LIMITS={"m": {"tpm": 600}})
+    usage = SimpleNamespace(input_tokens=600, cache_creation_input_tokens=0)
+    llm_gateway.call("m", lambda: SimpleNamespace(usage=usage), tokens=10)
+    level = llm_gateway._models["m"].tokens.level
+    check("Estimate corrected from reported usage", level < 5, f"{level:.1f}")
+
+
+def test_vertical_limit_and_timeout():
+    print("\n── Per-vertical bucket, queue timeout ──")
+    _reset(LLM_VERTICAL_LIMITS={"busy": {"rpm": 1}}, LLM_QUEUE_TIMEOUT=0.2)
+    llm_gateway.set_vertical("busy")
+    llm_gateway.call("m", lambda: None)
+    t0 = time.perf_counter()
+    try:
+        llm_gateway.call("m", lambda: None)
+        timed_out = False
+    except llm_gateway.LLMQueueTimeout:
+        timed_out = True
+    waited = time.perf_counter() - t0
+    llm_gateway.set_vertical("quiet")
+    t1 = time.perf_counter()
+    llm_gateway.call("m", lambda: None)
+    other = time.perf_counter() - t1
+    llm_gateway.set_vertical(None)
+    stats = llm_gateway.gateway_stats()
+    check("Second call of the limited vertical times out", timed_out and 0.15 < waited < 0.5, f"{waited:.3f}s")
+    check("Other verticals unaffected", other < 0.05, f"{other:.3f}s")
+    check("Timeout counted, queue empty again", stats["verticals"]["busy"]["queue_timeouts"] == 1
+          and stats["queue_depth"] == 0 and stats["verticals"]["busy"]["queued"] == 0, str(stats))
+
+
+def test_fair_queue():
+    print("\n── Fair queue: verticals served round-robin ──")
+    _reset(LLM_MODEL_LIMITS={"m": {"rpm": 1200}})  # one call per 50 ms once drained
+    llm_gateway._model("m").requests.level = 0
+    order: list[str] = []
+    threads = []
+    for i in range(4):
+        threads.append(_in_thread("bulk", lambda i=i: llm_gateway.call("m", lambda: order.append(f"bulk{i}"))))
+        time.sleep(0.005)
+    threads.append(_in_thread("small", lambda: llm_gateway.call("m", lambda: order.append("small"))))
+    time.sleep(0.01)
+    depth = llm_gateway.gateway_stats()["queue_depth"]
+    for thread in threads:
+        thread.join(5)
+    check("Calls queued while the bucket is empty", depth == 5, str(depth))
+    check("Later vertical not stuck behind the earlier one's backlog",
+          order.index("small") <= 1, str(order))
+    check("FIFO within a vertical", [o for o in order if o.startswith("bulk")] == [f"bulk{i}" for i in range(4)], str(order))
+
+
+def test_blocked_model_does_not_block_vertical():
+    print("\n── A held model does not stall the vertical's other calls ──")
+    _reset(LLM_MODEL_LIMITS={"slow": {"rpm": 1200}})
+    llm_gateway._model("slow").requests.level = 0
+    llm_gateway._model("slow").held_until = time.monotonic() + 0.3
+    order: list[str] = []
+    threads = [_in_thread("v", lambda: llm_gateway.call("slow", lambda: order.append("slow")))]
+    time.sleep(0.01)
+    t0 = time.perf_counter()
+    threads.append(_in_thread("v", lambda: llm_gateway.call("fast", lambda: order.append("fast"))))
+    threads[-1].join(5)
+    fast_waited = time.perf_counter() - t0
+    for thread in threads:
+        thread.join(5)
+    check("Other model's call admitted past the blocked head", order == ["fast", "slow"] and fast_waited < 0.2,
+          f"{order} {fast_waited:.3f}s")
+
+
+# ── Retry ───────────────────────────────────────────────────────────────
+
+def test_retry_after():
+    print("\n── 429 with retry-after: waits it out, holds the model ──")
+    _reset()
+    request, attempts = _failing(1, _APIError(429, {"retry-after": "0.2"}))
+    result = {}
+    t0 = time.perf_counter()
+    worker = threading.Thread(target=lambda: result.setdefault("value", llm_gateway.call("m", request)))
+    worker.start()
+    time.sleep(0.05)
+    t1 = time.perf_counter()
+    llm_gateway.call("m", lambda: None)  # another caller, same model, during the hold
+    other_waited = time.perf_counter() - t1
+    worker.join(5)
+    stats = llm_gateway.gateway_stats()["models"]["m"]
+    check("Retried and succeeded", result.get("value") == "ok" and len(attempts) == 2, str(attempts))
+    check("Retry not before retry-after", attempts[1] - t0 >= 0.2, f"{attempts[1] - t0:.3f}s")
+    check("Other callers held too", other_waited >= 0.1, f"{other_waited:.3f}s")
+    check("Counted", stats["retries"] == 1 and stats["rate_limited"] == 1, str(stats))
+
+
+def test_retry_limits():
+    print("\n── Which errors are retried, and how often ──")
+    _reset(LLM_MAX_RETRIES=2)
+    request, attempts = _failing(10, _APIError(529))
+    try:
+        llm_gateway.call("m", request)
+        raised = False
+    except _APIError:
+        raised = True
+    check("Overloaded: retried LLM_MAX_RETRIES times, then raised", raised and len(attempts) == 3, str(len(attempts)))
+
+    request, attempts = _failing(1, _APIError(400))
+    try:
+        llm_gateway.call("m", request)
+    except _APIError:
+        pass
+    check("Bad request: not retried", len(attempts) == 1, str(len(attempts)))
+
+    _reset(LLM_BACKOFF_MAX=1)
+    request, attempts = _failing(1, _APIError(429, {"retry-after": "120"}))
+    try:
+        llm_gateway.call("m", request)
+    except _APIError:
+        pass
+    check("retry-after beyond LLM_BACKOFF_MAX: handed back at once", len(attempts) == 1, str(len(attempts)))
+
+    _reset(LLM_GATEWAY=False)
+    request, attempts = _failing(1, _APIError(429))
+    try:
+        llm_gateway.call("m", request)
+    except _APIError:
+        pass
+    check("Gateway off: direct call", len(attempts) == 1)
+
+
+def test_stream_open_retried():
+    print("\n── Streams: retried while opening ──")
+    _reset()
+
+    class _Manager:
+        opened = 0
+
+        def __enter__(self):
+            _Manager.opened += 1
+            if _Manager.opened == 1:
+                raise _APIError(503)
+            return self
+
+        def __exit__(self, *exc):
+            self.exited = exc
+            return False
+
+    managers = []
+
+    def _open():
+        managers.append(_Manager())
+        return managers[-1]
+
+    with llm_gateway.stream("m", _open) as stream:
+        pass
+    check("Second attempt opened", _Manager.opened == 2 and stream is managers[-1])
+    check("Stream exited cleanly", managers[-1].exited == (None, None, None))
+
+
+# ── Async ───────────────────────────────────────────────────────────────
+
+def test_async_admission():
+    print("\n── Async callers: queue without a thread, cancel withdraws ──")
+    _reset(LLM_MODEL_LIMITS={"m": {"rpm": 60}})
+    llm_gateway._model("m").requests.level = 0
+
+    async def _run():
+        task = asyncio.ensure_future(llm_gateway.acall("m", lambda: asyncio.sleep(0, "x")))
+        await asyncio.sleep(0.05)
+        queued = llm_gateway.gateway_stats()["queue_depth"]
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        llm_gateway._model("m").requests.level = 1
+        return queued, llm_gateway.gateway_stats()["queue_depth"], await llm_gateway.acall("m", lambda: asyncio.sleep(0, "y"))
+
+    queued, after, result = asyncio.run(_run())
+    check("Waiting call is queued", queued == 1, str(queued))
+    check("Cancelled call leaves the queue", after == 0, str(after))
+    check("Next call admitted", result == "y")
+
+
+# ── Integration ─────────────────────────────────────────────────────────
+
+def test_engine_attribution():
+    print("\n── Engine executor tags calls with the vertical ──")
+    _reset()
+
+    async def _run():
+        return await engine_executor.run_engine("hydraulic", lambda: llm_gateway.call("m", lambda: "done"))
+
+    result = asyncio.run(_run())
+    verticals = llm_gateway.gateway_stats()["verticals"]
+    check("Call admitted under the engine's vertical", result == "done" and verticals.get("hydraulic", {}).get("admitted") == 1,
+          str(verticals))
+
+
+def test_consultation_engine_retries():
+    print("\n── Consultation engine: a rate-limited primary is retried, not abandoned ──")
+    _reset()
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs["model"])
+        if len(calls) == 1:
+            raise _APIError(429, {"retry-after": "0.05"})
+        return SimpleNamespace(
+            model=kwargs["model"], stop_reason="end_turn",
+            usage=SimpleNamespace(input_tokens=10, output_tokens=5),
+            content=[SimpleNamespace(text="filter it")],
+        )
+
+    saved_client, saved_log, saved_routing = ce._client, ce.log_llm_usage_sync, model_router.MODEL_ROUTING
+    ce._client = SimpleNamespace(messages=SimpleNamespace(create=create))
+    ce.log_llm_usage_sync = lambda *a, **k: None
+    model_router.MODEL_ROUTING = False
+    try:
+        text, model = ce._call_claude("system", [{"role": "user", "content": "hi"}])
+    finally:
+        ce._client, ce.log_llm_usage_sync, model_router.MODEL_ROUTING = saved_client, saved_log, saved_routing
+    check("Primary answer after the retry", (text, model) == ("filter it", ce.CONSULT_MODEL), f"{model} {text}")
+    check("No fallback call", calls == [ce.CONSULT_MODEL, ce.CONSULT_MODEL], str(calls))
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("LLM GATEWAY TESTS")
+    print("=" * 60)
+
+    test_token_bucket()
+    test_vertical_limit_and_timeout()
+    test_fair_queue()
+    test_blocked_model_does_not_block_vertical()
+    test_retry_after()
+    test_retry_limits()
+    test_stream_open_retried()
+    test_async_admission()
+    test_engine_attribution()
+    test_consultation_engine_retries()
+    _reset()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
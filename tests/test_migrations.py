@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Schema Migration Tests
+=======================
+The versioned migration runner (core/migrations.py): a fresh database gets
+every migration once, a database set up by the old CREATE/ALTER blocks (or
+an older one still) is brought up to date without losing data, a failing
+migration leaves the previous version intact, concurrent starts apply each
+migration once — and EXPLAIN QUERY PLAN uses an index for every hot query.
+Temporary SQLite databases.
+"""
+from __future__ import annotations
+import asyncio
+import re
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import aiosqlite
+
+import core.database as database
+from core import migrations
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+def _fresh_path() -> str:
+    path = tempfile.mktemp(suffix=".db")
+    database.set_db_path(path)
+    return path
+
+
+def _versions(path: str) -> list[int]:
+    conn = sqlite3.connect(path)
+    try:
+        return [r[0] for r in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+    finally:
+        conn.close()
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _plan(conn: sqlite3.Connection, sql: str, params: tuple) -> list[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def _full_scans(plan: list[str]) -> list[str]:
+    """Plan steps that read a whole table rather than through an index."""
+    return [step for step in plan if re.match(r"SCAN \w+( AS \w+)?$", step)]
+
+
+_ALL = [v for v, _, _ in migrations.MIGRATIONS]
+
+
+# ── Tests ───────────────────────────────────────────────────────────────
+
+def test_fresh_database():
+    print("\n── Fresh database: every migration, once ──")
+    path = _fresh_path()
+    first = asyncio.run(database.init_db())
+    second = asyncio.run(database.init_db())
+    check("All migrations applied in order", first == [v for v, _, _ in migrations.MIGRATIONS], str(first))
+    check("Second start applies nothing", second == [], str(second))
+    check("Recorded once each", _versions(path) == [v for v, _, _ in migrations.MIGRATIONS], str(_versions(path)))
+
+    async def _version():
+        async with aiosqlite.connect(path) as db:
+            return await migrations.schema_version(db)
+    check("schema_version is the latest", asyncio.run(_version()) == migrations.LATEST_VERSION)
+
+
+def test_hot_queries_use_indexes():
+    print("\n── EXPLAIN QUERY PLAN: every hot query uses an index ──")
+    path = _fresh_path()
+    asyncio.run(database.init_db())
+    conn = sqlite3.connect(path)
+    try:
+        for name, (sql, params) in migrations.HOT_QUERIES.items():
+            plan = _plan(conn, sql, params)
+            check(f"{name}", any("INDEX" in step for step in plan) and not _full_scans(plan), " | ".join(plan))
+        plan = _plan(conn, *migrations.HOT_QUERIES["session messages"])
+        check("Session messages come back in index order (no sort)",
+              not any("TEMP B-TREE" in step for step in plan), " | ".join(plan))
+        plan = _plan(conn, *migrations.HOT_QUERIES["session message count"])
+        check("Message count reads only the index", any("COVERING INDEX" in step for step in plan), " | ".join(plan))
+    finally:
+        conn.close()
+
+
+def test_indexes_are_what_make_the_difference():
+    print("\n── Before the hot-path migration the same queries scan ──")
+    path = _fresh_path()
+    saved = migrations.MIGRATIONS
+    migrations.MIGRATIONS = saved[:1]
+    try:
+        asyncio.run(database.init_db())
+    finally:
+        migrations.MIGRATIONS = saved
+    conn = sqlite3.connect(path)
+    try:
+        for name in ("session messages", "question comments", "due follow-ups", "usage since",
+                     "recent off-vertical demand"):
+            plan = _plan(conn, *migrations.HOT_QUERIES[name])
+            check(f"{name}: scan at version 1", bool(_full_scans(plan)) or any("TEMP B-TREE" in s for s in plan),
+                  " | ".join(plan))
+    finally:
+        conn.close()
+    applied = asyncio.run(database.init_db())
+    check("Upgrade from version 1 applies only the rest", applied == _ALL[1:], str(applied))
+
+
+def test_database_from_old_init_db():
+    print("\n── Database set up by the old CREATE/ALTER blocks ──")
+    path = _fresh_path()
+    # Everything in place, nothing recorded: the old init_db's end state
+    asyncio.run(database.init_db())
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO consultation_sessions (id, title) VALUES ('s1', 'kept')")
+    conn.execute("DROP TABLE schema_migrations")
+    for index in ("idx_consultation_messages_session", "idx_llm_usage_timestamp", "idx_comments_question"):
+        conn.execute(f"DROP INDEX {index}")
+    conn.commit()
+    conn.close()
+
+    applied = asyncio.run(database.init_db())
+    conn = sqlite3.connect(path)
+    try:
+        title = conn.execute("SELECT title FROM consultation_sessions WHERE id = 's1'").fetchone()[0]
+        indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        conn.close()
+    check("Baseline is a no-op there, then the rest", applied == _ALL, str(applied))
+    check("Data untouched", title == "kept")
+    check("Indexes created", {"idx_consultation_messages_session", "idx_llm_usage_timestamp",
+                              "idx_comments_question"} <= indexes, str(indexes))
+
+
+def test_older_database_gets_columns():
+    print("\n── Older database: missing columns added ──")
+    path = _fresh_path()
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE consultation_sessions (
+            id TEXT PRIMARY KEY, title TEXT NOT NULL DEFAULT 'New Consultation',
+            phase TEXT NOT NULL DEFAULT 'gathering', application_domain TEXT,
+            gathered_parameters TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+        );
+        CREATE TABLE consultation_messages (
+            id TEXT PRIMARY KEY, session_id TEXT NOT NULL, role TEXT NOT NULL,
+            content TEXT NOT NULL, phase_at_time TEXT, rag_chunks_used TEXT, created_at TIMESTAMP
+        );
+        CREATE TABLE llm_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, vertical_id TEXT, platform_id TEXT,
+            phase TEXT, model TEXT, input_tokens INTEGER, output_tokens INTEGER,
+            estimated_cost_usd REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT INTO consultation_messages (id, session_id, role, content, created_at)
+            VALUES ('m1', 's1', 'user', 'old message', '2025-01-01');
+    """)
+    conn.commit()
+    conn.close()
+
+    applied = asyncio.run(database.init_db())
+    conn = sqlite3.connect(path)
+    try:
+        message_cols = _columns(conn, "consultation_messages")
+        session_cols = _columns(conn, "consultation_sessions")
+        usage_cols = _columns(conn, "llm_usage")
+        old = conn.execute("SELECT content, incomplete FROM consultation_messages WHERE id = 'm1'").fetchone()
+    finally:
+        conn.close()
+    check("Migrated to the latest", applied == _ALL, str(applied))
+    check("Message columns added", {"full_report", "incomplete", "idempotency_key", "reply_to"} <= message_cols,
+          str(message_cols))
+    check("Session columns added", {"user_id", "vertical_id", "platform_id"} <= session_cols, str(session_cols))
+    check("Usage columns added", {"hedge_loser", "route_tier", "latency_ms", "first_token_ms"} <= usage_cols,
+          str(usage_cols))
+    check("Existing row kept, new column defaulted", old == ("old message", 0), str(old))
+
+
+def test_reply_links_backfilled():
+    print("\n── Reply links: keyed turns linked to the reply that followed ──")
+    path = _fresh_path()
+    saved = migrations.MIGRATIONS
+    migrations.MIGRATIONS = saved[:2]
+    try:
+        asyncio.run(database.init_db())
+    finally:
+        migrations.MIGRATIONS = saved
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        INSERT INTO consultation_messages (id, session_id, role, content, idempotency_key, created_at) VALUES
+            ('u1', 's1', 'user', 'answered', 'k1', '2026-01-01T00:00:01'),
+            ('a1', 's1', 'assistant', 'reply', NULL, '2026-01-01T00:00:02'),
+            ('u2', 's1', 'user', 'never answered', 'k2', '2026-01-01T00:00:03'),
+            ('u3', 's1', 'user', 'unkeyed', NULL, '2026-01-01T00:00:04'),
+            ('a3', 's1', 'assistant', 'reply to u3', NULL, '2026-01-01T00:00:05');
+    """)
+    conn.commit()
+    conn.close()
+
+    applied = asyncio.run(database.init_db())
+    answered = asyncio.run(database.get_idempotent_turn("s1", "k1"))
+    pending = asyncio.run(database.get_idempotent_turn("s1", "k2"))
+    check("Reply-link migration applied", applied == [3], str(applied))
+    check("Answered turn linked to its reply", answered["reply"] and answered["reply"]["id"] == "a1", str(answered))
+    check("A later turn's reply is not taken for a pending one", pending["reply"] is None, str(pending))
+
+
+def test_failed_migration_rolls_back():
+    print("\n── A failing migration leaves the previous version ──")
+    path = _fresh_path()
+    asyncio.run(database.init_db())
+
+    async def _broken(db):
+        await db.execute("CREATE TABLE half_done (id INTEGER)")
+        await db.execute("ALTER TABLE no_such_table ADD COLUMN x TEXT")
+
+    saved = migrations.MIGRATIONS
+    migrations.MIGRATIONS = saved + [(99, "broken", _broken)]
+    try:
+        try:
+            asyncio.run(database.init_db())
+            raised = False
+        except sqlite3.OperationalError:
+            raised = True
+    finally:
+        migrations.MIGRATIONS = saved
+    conn = sqlite3.connect(path)
+    try:
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+    check("Startup fails loudly", raised)
+    check("Partial work rolled back", "half_done" not in tables, str(tables))
+    check("Version unchanged", _versions(path) == [v for v, _, _ in saved], str(_versions(path)))
+
+
+def test_concurrent_start():
+    print("\n── Workers starting together apply each migration once ──")
+    path = _fresh_path()
+
+    async def _both():
+        return await asyncio.gather(database.init_db(), database.init_db())
+
+    first, second = asyncio.run(_both())
+    check("Each migration applied by exactly one", sorted(first + second) == [v for v, _, _ in migrations.MIGRATIONS],
+          f"{first} {second}")
+    check("Recorded once", _versions(path) == [v for v, _, _ in migrations.MIGRATIONS], str(_versions(path)))
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("SCHEMA MIGRATION TESTS")
+    print("=" * 60)
+
+    test_fresh_database()
+    test_hot_queries_use_indexes()
+    test_indexes_are_what_make_the_difference()
+    test_database_from_old_init_db()
+    test_older_database_gets_columns()
+    test_reply_links_backfilled()
+    test_failed_migration_rolls_back()
+    test_concurrent_start()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
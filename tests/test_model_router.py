@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Model Routing Tests
+====================
+Routing table decisions (core/model_router.py) and their effect on the
+consultation engine: short gathering turns go to the fast tier, answering
+stays on primary, a refused fast call escalates to the primary model, and
+every call lands in llm_usage with its tier, rule and latency. Fake
+Anthropic client, temporary SQLite database — no API calls.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import aiosqlite
+
+import core.consultation_engine as ce
+import core.database as database
+from core import hedging, model_router
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+PRIMARY, FALLBACK = "primary-model", "fallback-model"
+FAST, STANDARD = model_router.MODEL_TIER_FAST, model_router.MODEL_TIER_STANDARD
+SHORT = model_router.MODEL_ROUTING_SHORT_TOKENS
+
+
+def _route(call_type: str, phase: str, tokens: int, vertical: str = "spray"):
+    return model_router.route(call_type, phase, tokens, PRIMARY, FALLBACK, vertical=vertical)
+
+
+def _enable(routes: list[dict] | None = None):
+    """Switch routing on with `routes` (default: the candidate rules)."""
+    saved = (model_router.MODEL_ROUTING, model_router.MODEL_ROUTES)
+    model_router.MODEL_ROUTING = True
+    model_router.MODEL_ROUTES = model_router.CANDIDATE_ROUTES if routes is None else routes
+    return saved
+
+
+def _disable(saved):
+    model_router.MODEL_ROUTING, model_router.MODEL_ROUTES = saved
+
+
+# ── Routing table ───────────────────────────────────────────────────────
+
+def test_shipped_default():
+    print("\n── Shipped default: off, empty table ──")
+    if os.getenv("MODEL_ROUTING") is None:
+        check("Routing off by default", model_router.MODEL_ROUTING is False)
+    check("Empty default table", model_router.DEFAULT_ROUTES == [])
+    saved = _enable(model_router.DEFAULT_ROUTES)
+    try:
+        r = _route("consultation", "gathering", 200)
+    finally:
+        _disable(saved)
+    check("Switched on without rules: still primary", r.tier == "primary" and r.rule == "default", str(r))
+
+
+def test_candidate_table():
+    print("\n── Candidate table ──")
+    saved = _enable()
+    try:
+        _check_candidate_table()
+    finally:
+        _disable(saved)
+
+
+def _check_candidate_table():
+    r = _route("consultation", "gathering", 200)
+    check("Short gathering → fast", r.tier == "fast" and r.model == FAST and r.rule == "short-gathering", str(r))
+    check("Fast route escalates to the primary", r.fallback == PRIMARY and r.fallback_tier == "primary", str(r))
+    r = _route("consultation", "gathering", SHORT + 1)
+    check("Long gathering → primary with its fallback", r.tier == "primary" and r.models() == [PRIMARY, FALLBACK]
+          and r.rule == "default", str(r))
+    r = _route("consultation", "answering", 200)
+    check("Answering keeps the primary", r.tier == "primary" and r.model == PRIMARY, str(r))
+    r = _route("answer", "answering", 200)
+    check("Q&A answers keep the primary", r.tier == "primary", str(r))
+    r = _route("invention", "invention", 200)
+    check("Short invention → standard", r.tier == "standard" and r.model == STANDARD, str(r))
+    check("Boundary is inclusive", _route("consultation", "gathering", SHORT).tier == "fast")
+
+
+def test_custom_routes():
+    print("\n── MODEL_ROUTES override ──")
+    saved = _enable([
+        {"name": "hydraulic-qa", "call_type": "answer", "vertical": "hydraulic", "tier": "standard"},
+        {"call_type": "consultation", "min_input_tokens": 100, "max_input_tokens": 500, "tier": "fast"},
+    ])
+    try:
+        check("Vertical match", _route("answer", "answering", 5000, "hydraulic").tier == "standard")
+        check("Other vertical untouched", _route("answer", "answering", 5000, "spray").tier == "primary")
+        check("Inside the size band", _route("consultation", "answering", 300).tier == "fast")
+        check("Below min_input_tokens", _route("consultation", "answering", 50).tier == "primary")
+        check("Unnamed rule gets a positional name", _route("consultation", "answering", 300).rule == "rule1")
+    finally:
+        _disable(saved)
+
+    os.environ["MODEL_ROUTES"] = json.dumps([{"call_type": "answer", "tier": "fast"}])
+    try:
+        check("Loaded from the environment", model_router._load_routes() == [{"call_type": "answer", "tier": "fast"}])
+        os.environ["MODEL_ROUTES"] = '[{"tier": "huge"}]'
+        check("Unknown tier → default table", model_router._load_routes() is model_router.DEFAULT_ROUTES)
+        os.environ["MODEL_ROUTES"] = "not json"
+        check("Invalid JSON → default table", model_router._load_routes() is model_router.DEFAULT_ROUTES)
+    finally:
+        del os.environ["MODEL_ROUTES"]
+
+
+def test_routing_off():
+    print("\n── Routing off ──")
+    saved = model_router.MODEL_ROUTING
+    model_router.MODEL_ROUTING = False
+    try:
+        r = _route("consultation", "gathering", 10)
+    finally:
+        model_router.MODEL_ROUTING = saved
+    check("Engine pair, rule 'off'", r.models() == [PRIMARY, FALLBACK] and r.rule == "off", str(r))
+
+
+def test_tags():
+    print("\n── llm_usage tags ──")
+    saved = _enable()
+    try:
+        r = _route("consultation", "gathering", 10)
+    finally:
+        _disable(saved)
+    check("Routed model tagged with its tier", r.tags(FAST) == {"route_tier": "fast", "route_rule": "short-gathering"})
+    check("Escalation tagged primary", r.tags(PRIMARY) == {"route_tier": "primary", "route_rule": "short-gathering"})
+
+
+# ── Engine ──────────────────────────────────────────────────────────────
+
+class _FakeMessages:
+    def __init__(self, refuse: set[str] = frozenset()):
+        self.refuse = refuse
+        self.calls: list[str] = []
+
+    def create(self, **kwargs):
+        model = kwargs["model"]
+        self.calls.append(model)
+        return SimpleNamespace(
+            model=model, stop_reason="refusal" if model in self.refuse else "end_turn",
+            usage=SimpleNamespace(input_tokens=500, output_tokens=100),
+            content=[SimpleNamespace(text=f"reply from {model}")],
+        )
+
+
+def _install(messages: _FakeMessages):
+    saved = (ce._client, ce.CONSULT_MODEL, ce.FALLBACK_MODEL, hedging.LLM_HEDGING, _enable())
+    ce._client = SimpleNamespace(messages=messages)
+    ce.CONSULT_MODEL, ce.FALLBACK_MODEL = PRIMARY, FALLBACK
+    hedging.LLM_HEDGING = False
+    return saved
+
+
+def _restore(saved):
+    ce._client, ce.CONSULT_MODEL, ce.FALLBACK_MODEL, hedging.LLM_HEDGING, routing = saved
+    _disable(routing)
+
+
+def _fresh_db() -> None:
+    database.set_db_path(tempfile.mktemp(suffix=".db"))
+    asyncio.run(database.init_db())
+
+
+def _usage_rows() -> list[dict]:
+    async def _read():
+        async with aiosqlite.connect(database._get_db_path()) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("SELECT * FROM llm_usage ORDER BY id")
+            return [dict(r) for r in await cursor.fetchall()]
+    return asyncio.run(_read())
+
+
+def test_engine_routes_and_logs():
+    print("\n── Consultation engine: routed calls logged with tier and latency ──")
+    _fresh_db()
+    messages = _FakeMessages()
+    saved = _install(messages)
+    try:
+        text, model = ce._call_claude("system", [{"role": "user", "content": "flow rate?"}])
+        _, answer_model = ce._call_claude("system", [{"role": "user", "content": "recommend"}], phase="answering")
+    finally:
+        _restore(saved)
+    rows = _usage_rows()
+    check("Short gathering turn answered by the fast model", model == FAST and text == f"reply from {FAST}", model)
+    check("Answering call on the primary", answer_model == PRIMARY, answer_model)
+    check("Tier and rule recorded", [(r["phase"], r["route_tier"], r["route_rule"]) for r in rows]
+          == [("gathering", "fast", "short-gathering"), ("answering", "primary", "default")], str(rows))
+    check("Latency recorded", all(r["latency_ms"] is not None and r["latency_ms"] >= 0 for r in rows), str(rows))
+
+
+def test_refused_fast_call_escalates():
+    print("\n── A refused fast call escalates to the primary ──")
+    _fresh_db()
+    messages = _FakeMessages(refuse={FAST})
+    saved = _install(messages)
+    try:
+        text, model = ce._call_claude("system", [{"role": "user", "content": "flow rate?"}])
+    finally:
+        _restore(saved)
+    rows = _usage_rows()
+    check("Primary answered", model == PRIMARY and messages.calls == [FAST, PRIMARY], str(messages.calls))
+    check("Both calls tagged", [(r["model"], r["route_tier"]) for r in rows]
+          == [(FAST, "fast"), (PRIMARY, "primary")], str(rows))
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("MODEL ROUTING TESTS")
+    print("=" * 60)
+
+    test_shipped_default()
+    test_candidate_table()
+    test_custom_routes()
+    test_routing_off()
+    test_tags()
+    test_engine_routes_and_logs()
+    test_refused_fast_call_escalates()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Prompt Caching Tests
+=====================
+Consultation and answer calls go to a local stub of the Anthropic Messages
+API (real SDK clients, real HTTP, JSON and SSE responses). The stub keeps
+its own prompt cache keyed on the request prefix up to each cache_control
+breakpoint, the way the API does, and reports cache_creation_input_tokens /
+cache_read_input_tokens accordingly. Checks:
+
+  - breakpoints sit after the stable system prompt and the conversation
+    prefix, with retrieved context after the last one
+  - a later turn reads what an earlier turn wrote
+  - cache tokens and cache-aware cost land in llm_usage
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import anthropic
+
+import core.answer_cache as answer_cache
+import core.answer_engine as ae
+import core.consultation_engine as ce
+import core.prompt_cache as pc
+import core.session_retrieval as session_retrieval
+import core.speculative_retrieval as sr
+import core.database as database
+from core.database import init_db, set_db_path
+from core.vertical_loader import get_vertical_config
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+# ── Stub Messages API ───────────────────────────────────────────────────
+
+SIGNAL = (
+    "Thanks — I have what I need.\n"
+    "<consultation_signal><ready>true</ready>"
+    "<refined_query>hydraulic return filter beta ratio</refined_query>"
+    "<application_domain>hydraulics</application_domain>"
+    '<parameters>{"flow_lpm": 120}</parameters></consultation_signal>'
+)
+RECOMMENDATION = (
+    "<chat_summary>Use a 10 µm return filter.</chat_summary>\n"
+    "<full_report>## Details\nBeta 200 at 10 µm keeps ISO 16/14/11.</full_report>"
+)
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _flatten(body: dict) -> list[tuple[str, bool]]:
+    """Request prefix in cache order (system, then messages) as (text, breakpoint) items."""
+    items = []
+    system = body.get("system", "")
+    blocks = [{"type": "text", "text": system}] if isinstance(system, str) else system
+    for block in blocks:
+        items.append((block["text"], "cache_control" in block))
+    for msg in body["messages"]:
+        content = msg["content"]
+        blocks = [{"type": "text", "text": content}] if isinstance(content, str) else content
+        for block in blocks:
+            items.append((f"{msg['role']}:{block['text']}", "cache_control" in block))
+    return items
+
+
+class _Stub:
+    """Request log plus a prefix cache shared by all handler threads."""
+
+    def __init__(self):
+        self.requests: list[dict] = []
+        self.cache: set[str] = set()
+        self.lock = threading.Lock()
+
+    def usage_for(self, body: dict) -> dict:
+        items = _flatten(body)
+        prefix_tokens = []
+        running = 0
+        for text, _ in items:
+            running += _tokens(text)
+            prefix_tokens.append(running)
+        breakpoints = [i for i, (_, bp) in enumerate(items) if bp]
+        if not breakpoints:
+            return {"input_tokens": running, "output_tokens": 25,
+                    "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+
+        keys = [json.dumps([text for text, _ in items[:i + 1]]) for i in range(breakpoints[-1] + 1)]
+        with self.lock:
+            # Longest previously cached prefix ending at any block boundary
+            hits = [i for i, key in enumerate(keys) if key in self.cache]
+            read_upto = prefix_tokens[hits[-1]] if hits else 0
+            for i in breakpoints:
+                self.cache.add(keys[i])
+        cached_upto = prefix_tokens[breakpoints[-1]]
+        return {
+            "input_tokens": running - cached_upto,
+            "output_tokens": 25,
+            "cache_creation_input_tokens": cached_upto - read_upto,
+            "cache_read_input_tokens": read_upto,
+        }
+
+    @staticmethod
+    def reply_for(body: dict) -> str:
+        system = pc.system_text(body.get("system", ""))
+        if "ANSWERING phase" in system:
+            return RECOMMENDATION
+        return SIGNAL if "CRITICAL OVERRIDE" in system else "What flow rate are you running?"
+
+
+STUB = _Stub()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        STUB.requests.append(body)
+        usage = STUB.usage_for(body)
+        text = STUB.reply_for(body)
+        model = body["model"]
+
+        if not body.get("stream"):
+            payload = json.dumps({
+                "id": "msg_stub", "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn", "stop_sequence": None, "usage": usage,
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        events = [
+            ("message_start", {"type": "message_start", "message": {
+                "id": "msg_stub", "type": "message", "role": "assistant", "model": model, "content": [],
+                "stop_reason": None, "stop_sequence": None, "usage": {**usage, "output_tokens": 1},
+            }}),
+            ("content_block_start", {"type": "content_block_start", "index": 0,
+                                     "content_block": {"type": "text", "text": ""}}),
+        ]
+        for i in range(0, len(text), 16):
+            events.append(("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                   "delta": {"type": "text_delta", "text": text[i:i + 16]}}))
+        events += [
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            ("message_delta", {"type": "message_delta",
+                               "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                               "usage": {"output_tokens": usage["output_tokens"]}}),
+            ("message_stop", {"type": "message_stop"}),
+        ]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for name, data in events:
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+
+def _start_stub() -> tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ── Setup ───────────────────────────────────────────────────────────────
+
+def _fake_retrieval(query, **kwargs):
+    return {
+        "query": query,
+        "results": [{"id": "c1", "source": "filters.md", "rerank_score": 0.9,
+                     "parent_text": f"Beta ratios relevant to: {query}"}],
+        "confidence": {"level": "HIGH", "reasoning": "stand-in"},
+        "citations": ["filters.md"],
+        "warnings": [],
+    }
+
+
+def _low_confidence_retrieval(query, **kwargs):
+    result = _fake_retrieval(query)
+    result["confidence"] = {"level": "LOW", "reasoning": "stand-in"}
+    return result
+
+
+_PATCHED_CE = ("_client", "_async_client", "_run_retrieval", "build_precomputed_context")
+_PATCHED_AE = ("_client", "verified_query", "SYSTEM_PROMPT", "_current_vertical_id")
+
+
+@contextmanager
+def _stub_env():
+    """Engines pointed at a fresh stub server and a temp DB; restored afterwards."""
+    saved_ce = {name: getattr(ce, name) for name in _PATCHED_CE}
+    saved_ae = {name: getattr(ae, name) for name in _PATCHED_AE}
+    saved_speculative = sr.SPECULATIVE_RETRIEVAL
+    saved_semantic = answer_cache.SEMANTIC_CACHE
+    saved_session = session_retrieval.SESSION_RETRIEVAL
+    saved_db = database._db_path
+
+    server, base_url = _start_stub()
+    db_path = tempfile.mktemp(suffix=".db")
+    set_db_path(db_path)
+    asyncio.run(init_db())
+    STUB.requests.clear()
+    STUB.cache.clear()
+
+    vc = get_vertical_config("fps", "hydraulic_filtration")
+    ce._client = anthropic.Anthropic(api_key="test", base_url=base_url, max_retries=0)
+    ce._async_client = anthropic.AsyncAnthropic(api_key="test", base_url=base_url, max_retries=0)
+    ce._run_retrieval = _fake_retrieval
+    ce.build_precomputed_context = lambda **k: ""
+    ae._client = ce._client
+    ae.verified_query = _fake_retrieval
+    ae.init_vertical(vc)
+    sr.SPECULATIVE_RETRIEVAL = False
+    answer_cache.SEMANTIC_CACHE = False
+    session_retrieval.SESSION_RETRIEVAL = False
+    try:
+        yield vc, db_path
+    finally:
+        server.shutdown()
+        server.server_close()
+        for name, value in saved_ce.items():
+            setattr(ce, name, value)
+        for name, value in saved_ae.items():
+            setattr(ae, name, value)
+        sr.SPECULATIVE_RETRIEVAL = saved_speculative
+        answer_cache.SEMANTIC_CACHE = saved_semantic
+        session_retrieval.SESSION_RETRIEVAL = saved_session
+        set_db_path(saved_db)
+        os.unlink(db_path)
+
+
+def _breakpoint_positions(body: dict) -> list[int]:
+    return [i for i, (_, bp) in enumerate(_flatten(body)) if bp]
+
+
+def _usage_rows(db_path: str) -> list[tuple]:
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT phase, input_tokens, cache_creation_input_tokens, cache_read_input_tokens, "
+        "estimated_cost_usd FROM llm_usage ORDER BY id"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+# ── Request shape ───────────────────────────────────────────────────────
+
+def test_request_shape():
+    print("\n── Stable prefix / volatile suffix ──")
+    with _stub_env() as (vc, _db_path):
+        _check_request_shape(vc)
+
+
+def _check_request_shape(vc):
+    history = [
+        {"role": "user", "content": "Return filter for a press"},
+        {"role": "assistant", "content": "Which fluid?"},
+        {"role": "user", "content": "ISO VG 46"},
+        {"role": "assistant", "content": "Here is my recommendation..."},
+    ]
+    STUB.requests.clear()
+    ce.generate_consultation_response(
+        session_id="s1", user_message="What about cold starts?", phase="answering",
+        conversation_history=history, gathered_parameters={"flow_lpm": 120}, vertical_config=vc,
+    )
+    body = STUB.requests[-1]
+    system = body["system"]
+    check("System sent as blocks", isinstance(system, list) and len(system) == 1, str(type(system)))
+    check("Breakpoint on the stable system prompt", system[0].get("cache_control") == {"type": "ephemeral"})
+    check("Vertical answering prompt inside the cached block", system[0]["text"].startswith(vc.answering_prompt_base))
+    check("No retrieved context in the system prompt", "Beta ratios relevant" not in pc.system_text(system))
+
+    last_history = body["messages"][-2]
+    check("Breakpoint on the last history message",
+          isinstance(last_history["content"], list) and "cache_control" in last_history["content"][-1])
+    final = body["messages"][-1]["content"]
+    check("Context and question in the new turn",
+          isinstance(final, list) and "RETRIEVED TECHNICAL CONTEXT" in final[0]["text"]
+          and final[-1]["text"] == "What about cold starts?", str(final)[:200])
+    check("Nothing after the new turn is cached", all("cache_control" not in b for b in final))
+    check("Two breakpoints", len(_breakpoint_positions(body)) == 2, str(_breakpoint_positions(body)))
+
+    # Transition: the format instructions ride after the cached answering prompt
+    STUB.requests.clear()
+    events = list(ce.generate_consultation_response_stream(
+        session_id="s1", user_message="That's all I know", phase="gathering",
+        conversation_history=history[:2], gathering_turn_count=1, force_transition=True, vertical_config=vc,
+    ))
+    gathering_body, answering_body = STUB.requests[0], STUB.requests[-1]
+    check("Transition made two calls", len(STUB.requests) == 2, str(len(STUB.requests)))
+    check("Force-transition instruction follows the cached gathering prompt",
+          gathering_body["system"][0]["text"] == vc.gathering_prompt
+          and "CRITICAL OVERRIDE" in gathering_body["system"][1]["text"]
+          and "cache_control" not in gathering_body["system"][1])
+    check("Initial format follows the cached answering prompt",
+          "RESPONSE FORMAT" in answering_body["system"][1]["text"]
+          and "RESPONSE FORMAT" not in answering_body["system"][0]["text"])
+    check("Transition stream completed", events[-1][0] == "done" and events[-1][1]["phase"] == "answering",
+          str(events[-1])[:200])
+
+    # Answer engine: low-confidence addendum after the cached vertical prompt
+    STUB.requests.clear()
+    ae.verified_query = _low_confidence_retrieval
+    ae.generate_answer("Why do filters bypass?")
+    ae.verified_query = _fake_retrieval
+    system = STUB.requests[-1]["system"]
+    check("Answer engine caches the vertical prompt",
+          system[0]["text"] == vc.answering_prompt and "cache_control" in system[0])
+    check("Low-confidence addendum after the breakpoint",
+          "LOW RETRIEVAL CONFIDENCE" in system[1]["text"] and "cache_control" not in system[1])
+
+
+# ── Cache reuse across turns ────────────────────────────────────────────
+
+def test_cache_reuse():
+    print("\n── Later turns read the cached prefix ──")
+    with _stub_env() as (vc, db_path):
+        _check_cache_reuse(vc, db_path)
+
+
+def _check_cache_reuse(vc, db_path):
+
+    history = [
+        {"role": "user", "content": "Return filter for a 120 L/min press"},
+        {"role": "assistant", "content": "Which fluid and target cleanliness?"},
+    ]
+    ce.generate_consultation_response(
+        session_id="s2", user_message="ISO VG 46, 16/14/11", phase="answering",
+        conversation_history=history, vertical_config=vc,
+    )
+    history += [
+        {"role": "user", "content": "ISO VG 46, 16/14/11"},
+        {"role": "assistant", "content": "Use a 10 µm return filter."},
+    ]
+    events = list(ce.generate_consultation_response_stream(
+        session_id="s2", user_message="And for cold starts?", phase="answering",
+        conversation_history=history, vertical_config=vc,
+    ))
+    history += [
+        {"role": "user", "content": "And for cold starts?"},
+        {"role": "assistant", "content": "Fit a bypass valve."},
+    ]
+
+    async def _async_turn():
+        return [e async for e in ce.generate_consultation_response_stream_async(
+            session_id="s2", user_message="Element change interval?", phase="answering",
+            conversation_history=history, vertical_config=vc,
+        )]
+
+    async_events = asyncio.run(_async_turn())
+    check("Streams completed", events[-1][0] == "done" and async_events[-1][0] == "done")
+
+    rows = _usage_rows(db_path)
+    check("Three answering calls logged", len(rows) == 3, str(rows))
+    first, second, third = rows
+    check("First turn writes the cache", first[2] > 0 and first[3] == 0, str(first))
+    check("Second turn (sync stream) reads all of it", second[3] == first[2], str(second))
+    check("Third turn (async stream) reads the longer prefix", third[3] == second[2] + second[3], str(third))
+    new_turn = STUB.requests[-1]["messages"][-1]["content"]
+    new_turn_tokens = sum(_tokens(f"user:{block['text']}") for block in new_turn)
+    check("Uncached input is only the new turn", third[1] == new_turn_tokens, f"{third} vs {new_turn_tokens}")
+
+    # Cost: 3.0 in / 15.0 out per 1M, writes 1.25× and reads 0.1× the input price
+    phase, inp, write, read, cost = third
+    expected = (inp * 3.0 + write * 3.75 + read * 0.3 + 25 * 15.0) / 1_000_000
+    check("Cost accounts for cache pricing", abs(cost - expected) < 1e-9, f"{cost} vs {expected}")
+    uncached = ((inp + write + read) * 3.0 + 25 * 15.0) / 1_000_000
+    check("Cached turn costs less than uncached", cost < uncached, f"{cost} vs {uncached}")
+
+
+def test_caching_disabled():
+    print("\n── PROMPT_CACHING=false ──")
+    pc.PROMPT_CACHING = False
+    try:
+        with _stub_env() as (vc, _db_path):
+            STUB.requests.clear()
+            ce.generate_consultation_response(
+                session_id="s3", user_message="ISO VG 46", phase="answering",
+                conversation_history=[{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Fluid?"}],
+                vertical_config=vc,
+            )
+            body = STUB.requests[-1]
+            check("No breakpoints", _breakpoint_positions(body) == [], str(_breakpoint_positions(body)))
+            check("Context still after the history", "RETRIEVED TECHNICAL CONTEXT" in body["messages"][-1]["content"][0]["text"])
+    finally:
+        pc.PROMPT_CACHING = True
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("PROMPT CACHING TESTS")
+    print("=" * 60)
+
+    test_request_shape()
+    test_cache_reuse()
+    test_caching_disabled()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
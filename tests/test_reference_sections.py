@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Reference Section Tests
+========================
+CORE REFERENCE DATA split out of the answering prompts at vertical load
+time (core/reference_sections.py) and injected per call by relevance
+under a token budget. Uses the real vertical prompt files — no API calls.
+"""
+from __future__ import annotations
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import core.consultation_engine as ce
+from core.prompt_cache import system_text
+from core.reference_sections import split_reference_data
+from core.vertical_loader import get_vertical_config
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+VERTICALS = [("fps", "hydraulic_filtration"), ("fds", "spray_nozzles")]
+
+
+# ── Splitting ───────────────────────────────────────────────────────────
+
+def test_split():
+    print("\n── Split at vertical load ──")
+    for platform_id, vertical_id in VERTICALS:
+        vc = get_vertical_config(platform_id, vertical_id)
+        index = vc.reference_index
+        check(f"{vertical_id}: sections indexed", index is not None and len(index.sections) >= 10,
+              str(index and len(index.sections)))
+        check(f"{vertical_id}: block cut from the base prompt",
+              index.header not in vc.answering_prompt_base
+              and vc.core_reference_data.startswith(index.header))
+        check(f"{vertical_id}: closing instructions kept",
+              "ANSWER STRUCTURE:" in vc.answering_prompt_base
+              and "If the context doesn't cover" in vc.answering_prompt_base)
+        check(f"{vertical_id}: base prompt much smaller",
+              len(vc.answering_prompt_base) < len(vc.answering_prompt) * 0.7,
+              f"{len(vc.answering_prompt_base)} / {len(vc.answering_prompt)}")
+
+        covered = "\n".join(f"{s.group}\n{s.text}" for s in index.sections)
+        lost = [
+            ln for ln in vc.core_reference_data.split("\n")[1:]
+            if ln.strip() and not ln.startswith("━") and ln.strip() not in covered
+        ]
+        check(f"{vertical_id}: no reference line lost", not lost, str(lost[:3]))
+        ids = [s.section_id for s in index.sections]
+        check(f"{vertical_id}: section ids unique", len(ids) == len(set(ids)))
+
+    base, block, header, sections = split_reference_data("No reference block here.")
+    check("Prompt without a block is unchanged", base == "No reference block here." and not sections)
+
+
+# ── Selection ───────────────────────────────────────────────────────────
+
+def test_selection():
+    print("\n── Relevance selection under budget ──")
+    index = get_vertical_config("fps", "hydraulic_filtration").reference_index
+
+    chosen = [s.section_id for s in index.select("ISO VG 46 cold start viscosity pressure drop")]
+    check("Viscosity table selected", "4-viscosity-reference-data-iso-vg-mineral-oil" in chosen, str(chosen))
+    check("Cold start warning selected", "4-cold-start-warning" in chosen, str(chosen))
+    check("Unrelated sections left out", "10-seal-material-compatibility" not in chosen
+          and "1-efficiency-table" not in chosen, str(chosen))
+
+    chosen = [s.section_id for s in index.select("phosphate ester seal compatibility")]
+    check("Seal table for a seal question", "10-seal-material-compatibility" in chosen, str(chosen))
+
+    sections = index.select("return filter beta ratio viscosity cold start pressure drop bypass", budget=300)
+    check("Budget respected", 0 < sum(s.tokens for s in sections) <= 300,
+          str(sum(s.tokens for s in sections)))
+    order = [index.sections.index(s) for s in sections]
+    check("Returned in document order", order == sorted(order), str(order))
+    check("Nothing for an unrelated query", index.select("zzqx unrelated words") == [])
+
+    rendered = index.render(index.select("cold start viscosity"))
+    check("Rendered under the block header", rendered.startswith(index.header))
+    check("Section banner once per group", rendered.count("SECTION 4 — PRESSURE DROP") == 1, rendered[:300])
+
+
+# ── Engine injection ────────────────────────────────────────────────────
+
+def test_engine_injection():
+    print("\n── Answering prompts carry only selected sections ──")
+    vc = get_vertical_config("fps", "hydraulic_filtration")
+    saved = ce.build_precomputed_context
+    ce.build_precomputed_context = lambda **k: ""
+    try:
+        template, index = ce._answering_template(vc)
+        signal = {"refined_query": "cold start viscosity ISO VG 46", "parameters": {"fluid": "ISO VG 46"}}
+        system, context = ce._build_transition_prompt(signal, "(retrieved)", template, index)
+        check("System prompt without the reference block", "EFFICIENCY TABLE:" not in system_text(system)
+              and "VISCOSITY REFERENCE DATA" not in system_text(system))
+        check("Relevant reference data in the per-call context", "VISCOSITY REFERENCE DATA" in context
+              and "EFFICIENCY TABLE:" not in context)
+
+        system, context = ce._build_followup_prompt(
+            {"fluid": "phosphate ester"}, "(retrieved)", template, index, "Which seals?"
+        )
+        check("Follow-up selects on the new message", "SEAL MATERIAL COMPATIBILITY" in context, context[-400:])
+
+        ce.REFERENCE_SELECTION = False
+        template, index = ce._answering_template(vc)
+        check("Selection off → full prompt, no index", template == vc.answering_prompt and index is None)
+    finally:
+        ce.REFERENCE_SELECTION = True
+        ce.build_precomputed_context = saved
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("REFERENCE SECTION TESTS")
+    print("=" * 60)
+
+    test_split()
+    test_selection()
+    test_engine_injection()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+"""
+Retrieval Pipeline Tests
+=========================
+Unit tests for the retrieval engine internals (core/retrieval/).
+Synthetic candidates and a deterministic stand-in scorer — no embedding
+API calls, no cross-encoder download, no ingested knowledge base.
+"""
+from __future__ import annotations
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+def _candidate(i: int, sem_rank: int | None, bm25_rank: int | None) -> dict:
+    return {
+        "child_id": f"c{i}",
+        "parent_id": f"p{i}",
+        "child_text": f"child {i}",
+        "parent_text": f"parent text {i}",
+        "metadata": {"source": f"doc{i}.md"},
+        "semantic_rank": sem_rank,
+        "bm25_rank": bm25_rank,
+        "combined_score": 1.0 / (60 + i),
+    }
+
+
+class _LengthScorer:
+    """Deterministic cross-encoder stand-in: longer parent text scores higher."""
+
+    def __init__(self):
+        self.pairs_scored = 0
+
+    def predict(self, pairs):
+        self.pairs_scored += len(pairs)
+        return [float(len(text)) / 10 for _, text in pairs]
+
+
+# ── Cascaded Reranking ──────────────────────────────────────────────────
+
+def test_rerank_cascade():
+    print("\n── Cascaded Reranking ──")
+
+    import core.retrieval.hybrid_search as hs
+
+    agreeing = [_candidate(i, i, i) for i in range(1, 13)]
+    disagreeing = [_candidate(i, i, None) for i in range(1, 13)]
+
+    check("Rank agreement counts shared top-N", hs._rank_agreement(agreeing) == 3)
+    check("No agreement when BM25 missed", hs._rank_agreement(disagreeing) == 0)
+
+    hs._rerank_ms_per_pair = None
+    path, n = hs._plan_rerank(agreeing, 10, cascade=True, budget_ms=0, elapsed_ms=0)
+    check("Decisive agreement truncates", path == "truncated" and n == hs.CASCADE_TRUNCATE_K, f"{path}, {n}")
+
+    path, n = hs._plan_rerank(disagreeing, 10, cascade=True, budget_ms=0, elapsed_ms=0)
+    check("Weak agreement reranks everything", path == "full" and n == 12, f"{path}, {n}")
+
+    path, n = hs._plan_rerank(agreeing, 10, cascade=False, budget_ms=0, elapsed_ms=0)
+    check("Cascade off reranks everything", path == "full" and n == 12, f"{path}, {n}")
+
+    hs._rerank_ms_per_pair = 10.0
+    path, n = hs._plan_rerank(disagreeing, 10, cascade=True, budget_ms=100, elapsed_ms=20)
+    check("Budget truncates to affordable pairs", path == "budget_truncated" and n == 8, f"{path}, {n}")
+
+    path, n = hs._plan_rerank(disagreeing, 10, cascade=True, budget_ms=100, elapsed_ms=90)
+    check("Exhausted budget falls back", path == "budget_fallback" and n == 0, f"{path}, {n}")
+
+    hs._rerank_ms_per_pair = None
+    path, n = hs._plan_rerank(disagreeing, 10, cascade=True, budget_ms=100, elapsed_ms=500)
+    check("Unknown cost never blocks first rerank", n == 12, f"{path}, {n}")
+
+    import core.retrieval.config as retrieval_config
+    check("Cascade off by default", retrieval_config.RERANK_CASCADE is False)
+
+    # Truncated rerank: head is cross-encoded, tail follows unscored in RRF order
+    scorer = _LengthScorer()
+    saved = hs._cross_encoder
+    hs._cross_encoder = scorer
+    try:
+        cands = [dict(c) for c in agreeing]
+        cands[2]["parent_text"] = "a much longer parent text that should win"
+        out = hs._cascade_rerank("q", cands, top_k=10, n_pairs=4)
+    finally:
+        hs._cross_encoder = saved
+
+    check("Only head pairs scored", scorer.pairs_scored == 4, str(scorer.pairs_scored))
+    check("Returns top_k results", len(out) == 10)
+    check("Cross-encoder reorders head", out[0]["child_id"] == "c3", out[0]["child_id"])
+    check("Head keeps cross-encoder scores", all(r["rerank_score"] is not None for r in out[:4]))
+    check("Tail left unscored", all(r["rerank_score"] is None for r in out[4:]),
+          str([r["rerank_score"] for r in out[4:]]))
+    check("Tail marked unreranked", all(r["rerank_path"] == "unreranked" for r in out[4:]))
+    check("Tail keeps RRF order", [r["child_id"] for r in out[4:]] == [f"c{i}" for i in range(5, 11)])
+
+    from core.retrieval.verified_query import assess_confidence, format_relevance
+    scored = [{"source": f"doc{i}.md", "parent_text": f"text {i}", "rerank_score": s}
+              for i, s in enumerate((0.82, 0.78))]
+    unscored = [{"source": f"doc{i}.md", "parent_text": f"text {i}", "rerank_score": None} for i in range(2, 8)]
+    confidence = assess_confidence(scored + unscored)
+    check("Confidence from cross-encoder scores only", confidence["level"] == "HIGH"
+          and confidence["num_high_confidence"] == 2, str(confidence))
+    check("Scored set not marked unscored", confidence["unscored"] is False)
+    skipped = [{**r, "rerank_path": "budget_fallback"} for r in unscored]
+    confidence = assess_confidence(skipped)
+    check("Budget-skipped set is unscored, not LOW", confidence["level"] == "MEDIUM"
+          and confidence["unscored"] is True and confidence["top_score"] == 0.0, str(confidence))
+    check("No results → LOW", assess_confidence([])["level"] == "LOW")
+
+    import core.retrieval.verified_query as vq
+    gaps = []
+    saved = (vq.search, vq.log_gap)
+    vq.search = lambda query, **kwargs: skipped
+    vq.log_gap = lambda query, confidence: gaps.append(query)
+    try:
+        result = vq.verified_query("budget spent")
+    finally:
+        vq.search, vq.log_gap = saved
+    check("Budget fallback keeps its results", result["results"] == skipped)
+    check("...without a LOW warning or a gap", not gaps and result["gap_logged"] is False
+          and not any(w.startswith("LOW CONFIDENCE") for w in result["warnings"]), str(result["warnings"]))
+    check("Unscored relevance labelled", format_relevance(None) == "not reranked" and format_relevance(0.5) == "0.500")
+
+
+# ── Flat Vector Index ───────────────────────────────────────────────────
+
+def test_flat_index():
+    print("\n── Flat Vector Index ──")
+
+    import tempfile
+    import numpy as np
+    import chromadb
+    from core.retrieval.flat_index import FlatIndex, export_flat_index
+
+    rng = np.random.default_rng(7)
+    n, dim = 300, 64
+    raw = rng.normal(size=(n, dim)).astype(np.float32)
+    ids = [f"c{i}" for i in range(n)]
+    docs = [f"chunk {i}" for i in range(n)]
+    metas = [{"source": f"doc{i % 5}.md", "page": i % 10,
+              "section_header": "Beta ratio" if i % 7 == 0 else "Other"} for i in range(n)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.EphemeralClient()
+        col = client.get_or_create_collection(name="flat-test", metadata={"hnsw:space": "cosine"})
+        col.add(ids=ids, documents=docs, metadatas=metas, embeddings=raw.tolist())
+
+        path = export_flat_index("flat-test", index_dir=tmp, dtype="float32", chroma_client=client)
+        check("Export writes vectors file", path is not None and path.exists())
+
+        index = FlatIndex.load("flat-test", index_dir=tmp)
+        check("Load returns index", index is not None and len(index) == n)
+        check("Vectors are mmap'd", isinstance(index.vectors, np.memmap))
+        check("Missing export → None", FlatIndex.load("nope", index_dir=tmp) is None)
+
+        check("Rows are unit-normalized",
+              np.allclose(np.linalg.norm(np.asarray(index.vectors), axis=1), 1.0, atol=1e-5))
+
+        q = rng.normal(size=dim).astype(np.float32)
+        hits = index.search(q, top_k=10)
+        unit = raw / np.linalg.norm(raw, axis=1, keepdims=True)
+        brute = np.argsort(-(unit @ (q / np.linalg.norm(q))))[:10]
+        check("Exact top-10 matches brute force",
+              [h["child_id"] for h in hits] == [ids[i] for i in brute])
+        check("Scores descending",
+              all(hits[i]["semantic_score"] >= hits[i + 1]["semantic_score"] for i in range(9)))
+        check("Hit shape matches _semantic_search",
+              set(hits[0]) == {"child_id", "child_text", "metadata", "semantic_score", "bm25_score", "source"})
+
+        hits = index.search(q, top_k=50, where_filter={"source": "doc2.md"})
+        check("Equality filter", len(hits) == 50 and all(h["metadata"]["source"] == "doc2.md" for h in hits))
+
+        hits = index.search(q, top_k=500, where_filter={"$and": [{"source": {"$in": ["doc1.md", "doc3.md"]}},
+                                                                  {"page": {"$gte": 5}}]})
+        expected = sum(1 for m in metas if m["source"] in ("doc1.md", "doc3.md") and m["page"] >= 5)
+        check("$and/$in/$gte filter", len(hits) == expected, f"{len(hits)} vs {expected}")
+
+        hits = index.search(q, top_k=500, where_filter={"section_header": {"$contains": "Beta"}})
+        check("$contains filter", len(hits) == sum(1 for i in range(n) if i % 7 == 0))
+
+        hits = index.search(q, top_k=5, where_filter={"source": "missing.md"})
+        check("Empty filter result", hits == [])
+
+        export_flat_index("flat-test", index_dir=tmp, dtype="float16", chroma_client=client)
+        index16 = FlatIndex.load("flat-test", index_dir=tmp)
+        check("float16 export", index16.vectors.dtype == np.float16)
+        top16 = [h["child_id"] for h in index16.search(q, top_k=5)]
+        check("float16 top-5 agrees with exact", top16 == [ids[i] for i in brute[:5]], str(top16))
+
+
+# ── Quantized / Reduced-Dimension Index ─────────────────────────────────
+
+def test_quantized_index():
+    print("\n── Quantized / Reduced-Dimension Index ──")
+
+    import tempfile
+    import numpy as np
+    from core.retrieval.flat_index import FlatIndex
+    from core.retrieval.quantized_index import QuantizedIndex, parse_variant, active_variant
+    from core.retrieval.index_report import build_report
+
+    check("Parse d512-int8", parse_variant("d512-int8") == (512, "int8"))
+    check("Parse binary", parse_variant("binary") == (None, "binary"))
+    check("Parse d768 defaults float16", parse_variant("d768") == (768, "float16"))
+    try:
+        parse_variant("pq16")
+        check("Rejects unknown variant", False)
+    except ValueError:
+        check("Rejects unknown variant", True)
+    rejected = []
+    for junk in ("", "d512-", "-int8", "d-int8", "d0", "int8-d512", "d512int8"):
+        try:
+            parse_variant(junk)
+        except ValueError:
+            rejected.append(junk)
+    check("Rejects malformed variant names", len(rejected) == 7, str(rejected))
+
+    # Clustered data so neighbours are meaningful (like real embeddings)
+    rng = np.random.default_rng(11)
+    n, dim = 2000, 256
+    centers = rng.normal(size=(40, dim))
+    raw = centers[rng.integers(0, 40, n)] + 0.35 * rng.normal(size=(n, dim))
+    unit = (raw / np.linalg.norm(raw, axis=1, keepdims=True)).astype(np.float32)
+    metas = [{"source": f"doc{i % 4}.md"} for i in range(n)]
+    full = FlatIndex(unit, [f"c{i}" for i in range(n)], [f"t{i}" for i in range(n)], metas)
+    queries = (centers[rng.integers(0, 40, 25)] + 0.35 * rng.normal(size=(25, dim))).astype(np.float32)
+
+    int8 = QuantizedIndex.build(full, "int8")
+    binary = QuantizedIndex.build(full, "binary")
+    d64 = QuantizedIndex.build(full, "d64-int8")
+    check("int8 is 1 byte/dim", int8.codes.nbytes == n * dim, str(int8.codes.nbytes))
+    check("binary is 1 bit/dim", binary.codes.nbytes == n * dim // 8, str(binary.codes.nbytes))
+    check("d64-int8 keeps 64 dims", d64.codes.shape == (n, 64))
+
+    q = queries[0]
+    exact = full.search(q, 10)
+    rescored = d64.search(q, 10)
+    exact_scores = {h["child_id"]: h["semantic_score"] for h in exact}
+    check("Rescored scores are full-precision cosine",
+          all(abs(h["semantic_score"] - exact_scores[h["child_id"]]) < 1e-5
+              for h in rescored if h["child_id"] in exact_scores))
+
+    report = build_report(full, queries, ["int8", "binary", "d64-int8"], top_k=10)
+    by_variant = {r["variant"]: r for r in report["variants"]}
+    check("Report has exact baseline", report["variants"][0]["recall@10"] == 1.0)
+    check("int8 + rescore recall ≥ 0.95", by_variant["int8"]["recall@10"] >= 0.95,
+          str(by_variant["int8"]["recall@10"]))
+    check("Rescoring never hurts binary recall",
+          by_variant["binary"]["recall@10"] >= by_variant["binary"]["recall@10_no_rescore"])
+    check("Report sizes shrink", by_variant["binary"]["coarse_mb"] < by_variant["int8"]["coarse_mb"]
+          < report["variants"][0]["coarse_mb"])
+    check("Disk footprint includes the full-precision store",
+          all(r["disk_mb"] >= report["full_precision_mb"] for r in report["variants"]))
+
+    hits = int8.search(q, 20, where_filter={"source": "doc1.md"})
+    check("Filter applies before rescoring", hits and all(h["metadata"]["source"] == "doc1.md" for h in hits))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        int8.save("qtest", index_dir=tmp)
+        loaded = QuantizedIndex.load("qtest", "int8", full=full, index_dir=tmp)
+        check("Save/load round-trip",
+              loaded is not None and [h["child_id"] for h in loaded.search(q, 10)]
+              == [h["child_id"] for h in int8.search(q, 10)])
+        check("Unbuilt variant → None", QuantizedIndex.load("qtest", "binary", full=full, index_dir=tmp) is None)
+        check("No active variant by default", active_variant("qtest", index_dir=tmp) is None)
+        (Path(tmp) / "qtest.variant").write_text("int8\n")
+        check("Active variant marker read", active_variant("qtest", index_dir=tmp) == "int8")
+
+
+# ── Retrieval Service (Unix socket) ─────────────────────────────────────
+
+def test_retrieval_service():
+    print("\n── Retrieval Service ──")
+
+    import os
+    import tempfile
+    import threading
+    import core.retrieval.hybrid_search as hs
+    from core.retrieval import retrieval_service as rs
+
+    kwargs = {
+        "use_reranker": False, "semantic_weight": 0.7, "bm25_weight": None,
+        "metadata_filter": {"source": {"$in": ["a.md", "b.md"]}},
+        "child_collection": "x-children", "parent_collection": "x-parents",
+        "bm25_index_path": "/tmp/x.pkl", "cascade": False, "rerank_budget_ms": 150.0,
+    }
+    decoded = rs.decode_search_request(rs.encode_search_request("β-ratio ≥ 200?", 12, **kwargs))
+    check("Request round-trip", decoded == {"query": "β-ratio ≥ 200?", "top_k": 12, **kwargs}, str(decoded))
+    decoded = rs.decode_search_request(rs.encode_search_request("q", 5))
+    check("Defaults decode to None", decoded["cascade"] is None and decoded["semantic_weight"] is None
+          and decoded["child_collection"] is None and decoded["use_reranker"] is True)
+
+    results = [{
+        "parent_id": f"p{i}", "parent_text": "Parent ünïcode text " * 50, "child_text": f"child {i}",
+        "source": f"doc{i}.md", "rerank_score": 0.9123, "semantic_score": 0.5, "bm25_score": 12.25,
+        "combined_score": 0.0161, "metadata": {"source": f"doc{i}.md", "page": i},
+        "parent_metadata": {"section_header": "Beta"}, "rerank_path": "truncated",
+    } for i in range(3)]
+    payload = rs.encode_results(results)
+    check("Results round-trip", rs.decode_results(payload) == results)
+    unreranked = [{**results[0], "rerank_score": None, "rerank_path": "unreranked"}]
+    check("Unreranked score round-trips as None", rs.decode_results(rs.encode_results(unreranked)) == unreranked)
+    check("Binary payload smaller than JSON", len(payload) < len(json.dumps(results).encode()))
+
+    calls = []
+
+    def fake_local_search(**kw):
+        calls.append(kw)
+        if kw["query"] == "boom":
+            raise ValueError("index missing")
+        return results[: kw["top_k"]]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sock_path = os.path.join(tmp, "r.sock")
+        saved = hs._local_search
+        hs._local_search = fake_local_search
+        server = rs.RetrievalServer(sock_path, rs._Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            client = rs.RetrievalClient(sock_path, timeout=5)
+            check("Ping", client.ping())
+            got = client.search("filter life", 2, child_collection="x-children")
+            check("Search over socket", got == results[:2])
+            check("Kwargs reach server", calls[-1]["child_collection"] == "x-children" and calls[-1]["top_k"] == 2)
+            got = client.search("again", 1)
+            check("Persistent connection reused", got == results[:1])
+            try:
+                client.search("boom", 1)
+                check("Server error surfaces", False)
+            except RuntimeError as e:
+                check("Server error surfaces", "index missing" in str(e), str(e))
+            check("Connection survives error", client.search("ok", 3) == results)
+        finally:
+            server.shutdown()
+            server.server_close()
+            hs._local_search = saved
+
+        dead = rs.RetrievalClient(os.path.join(tmp, "missing.sock"), timeout=1)
+        check("Ping on missing socket is False", dead.ping() is False)
+
+        # search(): only an unreachable service falls back in-process
+        sock_path = os.path.join(tmp, "search.sock")
+        server = rs.RetrievalServer(sock_path, rs._Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        saved_client, saved_respawn = hs.get_retrieval_client, hs.respawn_if_down
+        respawns = []
+        hs.respawn_if_down = lambda: respawns.append(1)
+        hs._local_search = fake_local_search
+        try:
+            hs.get_retrieval_client = lambda: rs.RetrievalClient(sock_path, timeout=5)
+            before = len(calls)
+            try:
+                hs.search("boom", 1)
+                check("Service-reported error raised, not hidden", False)
+            except rs.RetrievalServiceError:
+                check("Service-reported error raised, not hidden", True)
+            check("No in-process search after a service error", len(calls) == before + 1, str(len(calls) - before))
+
+            # Slow, not down: one request, no retry, no in-process search
+            import time
+            slow_calls = []
+
+            def slow_local_search(*args, **kw):
+                if args:  # called in-process by search()
+                    slow_calls.append("in-process")
+                    return results[:1]
+                slow_calls.append(kw["query"])
+                time.sleep(0.5)
+                return results[: kw["top_k"]]
+
+            hs._local_search = slow_local_search
+            slow = rs.RetrievalClient(sock_path, timeout=0.2)
+            hs.get_retrieval_client = lambda: slow
+            try:
+                hs.search("slow", 1)
+                check("Timeout raised as a service error", False)
+            except rs.RetrievalServiceError as e:
+                check("Timeout raised as a service error", "timed out" in str(e), str(e))
+            check("Timed-out search not resent or run in-process", slow_calls == ["slow"] and not respawns,
+                  f"{slow_calls} {respawns}")
+            time.sleep(0.4)
+            hs._local_search = fake_local_search
+            check("Next search gets its own reply", slow.search("after", 2) == results[:2])
+
+            hs.get_retrieval_client = lambda: dead
+            hs._local_search = lambda query, top_k, *args: fake_local_search(query=query, top_k=top_k)
+            got = hs.search("fallback", 1)
+            check("Unreachable service → in-process search", got == results[:1])
+            check("Unreachable service → respawn requested", respawns == [1], str(respawns))
+        finally:
+            server.shutdown()
+            server.server_close()
+            hs._local_search = saved
+            hs.get_retrieval_client, hs.respawn_if_down = saved_client, saved_respawn
+
+
+def test_retrieval_service_lifetime():
+    print("\n── Retrieval Service Lifetime ──")
+
+    import os
+    import subprocess
+    import tempfile
+    import threading
+    import time
+    from core.retrieval import retrieval_service as rs
+
+    saved_poll, saved_interval, saved_spawn = rs._OWNER_POLL_S, rs.RESPAWN_INTERVAL_S, rs._spawn
+    rs._OWNER_POLL_S, rs.RESPAWN_INTERVAL_S = 0.05, 0.1
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            sock_path = os.path.join(tmp, "r.sock")
+
+            held = rs._take_lock(sock_path)
+            t0 = time.monotonic()
+            rs.serve(sock_path)
+            check("Second copy exits while the lock is held", time.monotonic() - t0 < 1
+                  and not os.path.exists(sock_path))
+            held.close()
+
+            owner = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+            thread = threading.Thread(target=rs.serve, args=(sock_path, None, owner.pid), daemon=True)
+            thread.start()
+            client = rs.RetrievalClient(sock_path, timeout=1)
+            deadline = time.monotonic() + 5
+            while not client.ping() and time.monotonic() < deadline:
+                time.sleep(0.02)
+            check("Service up while its owner lives", client.ping())
+            owner.kill()
+            owner.wait()
+            thread.join(timeout=5)
+            check("Service exits when its owner exits", not thread.is_alive()
+                  and not os.path.exists(sock_path))
+
+            spawned = []
+
+            def fake_spawn(platform_id, socket_path, owner_pid):
+                proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(0.1)"])
+                spawned.append((owner_pid, proc))
+                return proc
+
+            rs._spawn = fake_spawn
+            rs.supervise("fps", sock_path)
+            deadline = time.monotonic() + 5
+            while len(spawned) < 3 and time.monotonic() < deadline:
+                time.sleep(0.02)
+            rs.stop_supervised()
+            count = len(spawned)
+            time.sleep(0.3)
+            check("Supervisor respawns the service when it exits", count >= 3, str(count))
+            check("Supervised service owned by the supervisor", all(pid == os.getpid() for pid, _ in spawned))
+            check("Stopping the supervisor stops respawning", len(spawned) == count, f"{count} → {len(spawned)}")
+    finally:
+        rs._OWNER_POLL_S, rs.RESPAWN_INTERVAL_S, rs._spawn = saved_poll, saved_interval, saved_spawn
+
+
+# ── Compact (Preload) Layouts ───────────────────────────────────────────
+
+def test_compact_store():
+    print("\n── Compact Preload Layouts ──")
+
+    import os
+    import numpy as np
+    from rank_bm25 import BM25Okapi
+    import core.retrieval.hybrid_search as hs
+    from core.retrieval.ingest import tokenize_for_bm25
+    from core.retrieval.compact_store import (
+        PackedStrings, PackedJSON, CompactBM25, ParentStore, compact_bm25_data,
+    )
+
+    strings = ["", "ISO 4406 16/14/11", "β ≥ 200", "x" * 5000]
+    packed = PackedStrings(strings)
+    check("PackedStrings round-trip", list(packed) == strings and packed[-1] == strings[-1])
+    check("PackedStrings slice", packed[1:3] == strings[1:3])
+    metas = [{"source": "a.md", "page": 3}, {}, None]
+    check("PackedJSON round-trip", list(PackedJSON(metas)) == [{"source": "a.md", "page": 3}, {}, {}])
+
+    docs = [
+        "Return line filter beta ratio 200 at 10 micron",
+        "ISO 4406 cleanliness code 16/14/11 for servo valves",
+        "Servo valve clearances are 1-4 micron; target 15/13/11",
+        "Bypass valve cracking pressure for return line filters",
+        "Viscosity VG46 at 40C and cold start bypass",
+    ] * 8
+    tokenized = [tokenize_for_bm25(d) for d in docs]
+    bm25 = BM25Okapi(tokenized)
+    compact = CompactBM25(bm25)
+    for q in ["servo valve micron", "return line bypass bypass", "unknownterm", "16/14/11 iso"]:
+        toks = tokenize_for_bm25(q)
+        check(f"BM25 scores identical: {q!r}", np.array_equal(bm25.get_scores(toks), compact.get_scores(toks)))
+
+    data = {"bm25": bm25, "ids": [f"c{i}" for i in range(len(docs))], "documents": docs,
+            "metadatas": [{"source": f"doc{i % 5}.md"} for i in range(len(docs))],
+            "tokenized_corpus": tokenized}
+    saved = dict(hs._bm25_data)
+    try:
+        hs._bm25_data["plain"] = data
+        hs._bm25_data["compact"] = compact_bm25_data(data)
+        a = hs._bm25_search("servo valve clearance", top_k=10, bm25_index_path="plain")
+        b = hs._bm25_search("servo valve clearance", top_k=10, bm25_index_path="compact")
+        check("_bm25_search unchanged on compact data", a == b and len(a) > 0)
+        a = hs._bm25_search("bypass", top_k=10, metadata_filter={"source": "doc3.md"}, bm25_index_path="plain")
+        b = hs._bm25_search("bypass", top_k=10, metadata_filter={"source": "doc3.md"}, bm25_index_path="compact")
+        check("Metadata filter unchanged on compact data", a == b)
+    finally:
+        hs._bm25_data.clear()
+        hs._bm25_data.update(saved)
+
+    store = ParentStore(["p2", "p1", "p3"], ["two", "one", "three"], [{"n": 2}, {"n": 1}, {"n": 3}])
+    got = store.get(ids=["p3", "missing", "p1"], include=["documents", "metadatas"])
+    check("ParentStore get", got == {"ids": ["p3", "p1"], "documents": ["three", "one"],
+                                     "metadatas": [{"n": 3}, {"n": 1}]}, str(got))
+
+    sys.path.insert(0, str(Path(__file__).parent.parent / "deploy"))
+    import measure_rss
+    if os.path.exists(f"/proc/{os.getpid()}/smaps_rollup"):
+        counters = measure_rss.read_smaps_rollup(os.getpid())
+        check("smaps_rollup parsed", counters.get("Rss", 0) > 0 and "Private_Dirty" in counters)
+        report = measure_rss.measure(os.getpid())
+        check("Report covers master", report["processes"][0]["pid"] == os.getpid())
+
+
+def test_preload_gc():
+    print("\n── Preload: the master collects again afterwards ──")
+
+    import gc
+    from types import SimpleNamespace
+    import core.vertical_loader as vertical_loader
+    import core.retrieval.hybrid_search as hs
+    from core import preload
+
+    saved = (vertical_loader.load_platform, hs._get_cross_encoder, hs._chroma_client, preload._preloaded)
+    hs._get_cross_encoder = lambda: None
+    try:
+        def broken(platform_id):
+            raise ImportError("no such platform")
+
+        vertical_loader.load_platform = broken
+        try:
+            preload.preload("missing")
+            raised = False
+        except ImportError:
+            raised = True
+        check("Failed load raises", raised)
+        check("...with GC re-enabled", gc.isenabled() and not preload.is_preloaded())
+
+        vertical_loader.load_platform = lambda platform_id: SimpleNamespace(verticals={})
+        preload.preload("empty")
+        check("Loaded and frozen, GC enabled in the master", preload.is_preloaded() and gc.isenabled()
+              and gc.get_freeze_count() > 0)
+    finally:
+        gc.unfreeze()
+        gc.enable()
+        (vertical_loader.load_platform, hs._get_cross_encoder, hs._chroma_client, preload._preloaded) = saved
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("RETRIEVAL PIPELINE TESTS")
+    print("=" * 60)
+
+    test_rerank_cascade()
+    test_flat_index()
+    test_quantized_index()
+    test_retrieval_service()
+    test_retrieval_service_lifetime()
+    test_compact_store()
+    test_preload_gc()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
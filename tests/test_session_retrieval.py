@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Session Retrieval Tests
+========================
+The per-session working set (core/session_retrieval.py): a follow-up close
+to what the session already retrieved is answered from the working set with
+no retrieval, one outside it — or close to a single parent only — retrieves
+the delta and merges, a session with no working set does a full retrieval
+and seeds one, and chunk ids stay the same parent ids across turns. Fake embedder, fake retrieval, fake Anthropic
+client — no API calls.
+"""
+from __future__ import annotations
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+import core.consultation_engine as ce
+import core.database as database
+from core import hedging, model_router, session_retrieval as sr
+from core import speculative_retrieval
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+# ── Fakes ───────────────────────────────────────────────────────────────
+
+_TOPICS = ["nozzle", "pump", "valve"]
+
+
+class _FakeEmbedder:
+    """One axis per topic word; a text points at the topics it mentions."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls: list[list[str]] = []
+
+    def __call__(self, texts: list[str]) -> list[np.ndarray]:
+        self.calls.append(list(texts))
+        if self.fail:
+            raise RuntimeError("embedding service down")
+        vectors = []
+        for t in texts:
+            v = np.array([float(w in t.lower()) for w in _TOPICS] + [0.01], dtype=np.float32)
+            vectors.append(v / np.linalg.norm(v))
+        return vectors
+
+
+def _parent(pid: str, topic: str, score: float) -> dict:
+    return {
+        "parent_id": pid,
+        "parent_text": f"{topic} guidance from {pid}",
+        "source": f"{pid}.md",
+        "rerank_score": score,
+    }
+
+
+def _rag(results: list[dict], query: str = "q") -> dict:
+    return {
+        "query": query,
+        "results": results,
+        "confidence": {"level": "HIGH", "top_score": 0.9, "reasoning": "Strong match."},
+        "citations": [f"[{i}] {r['source']}" for i, r in enumerate(results, 1)],
+        "warnings": [],
+        "gap_logged": False,
+    }
+
+
+_TRANSITION = [_parent("nozzle#1", "nozzle", 0.9), _parent("nozzle#2", "nozzle", 0.8),
+               _parent("nozzle#3", "nozzle", 0.75), _parent("pump#1", "pump", 0.7)]
+
+
+class _FakeRetrieve:
+    def __init__(self, results: list[dict]):
+        self.results = results
+        self.queries: list[str] = []
+
+    def __call__(self, query: str) -> dict:
+        self.queries.append(query)
+        return _rag(self.results, query)
+
+
+def _setup(fail_embed: bool = False) -> tuple[_FakeEmbedder, tuple]:
+    embedder = _FakeEmbedder(fail=fail_embed)
+    saved = (sr._embed, sr.SESSION_RETRIEVAL, sr.SESSION_RETRIEVAL_TTL, sr.SESSION_RETRIEVAL_MAX_SESSIONS)
+    sr._embed = embedder
+    sr.SESSION_RETRIEVAL = True
+    sr.clear()
+    sr._counts.clear()
+    return embedder, saved
+
+
+def _teardown(saved: tuple) -> None:
+    sr._embed, sr.SESSION_RETRIEVAL, sr.SESSION_RETRIEVAL_TTL, sr.SESSION_RETRIEVAL_MAX_SESSIONS = saved
+    sr.clear()
+
+
+# ── Working set ─────────────────────────────────────────────────────────
+
+def test_covered_followup():
+    print("\n── A follow-up on the same topic is served from the working set ──")
+    embedder, saved = _setup()
+    try:
+        sr.seed("s1", _rag(_TRANSITION))
+        retrieve = _FakeRetrieve([])
+        result = sr.followup("s1", "What nozzle spacing?", retrieve)
+        again = sr.followup("s1", "And the nozzle angle?", retrieve)
+        stats = sr.session_retrieval_stats()
+    finally:
+        _teardown(saved)
+    ids = [r["id"] for r in result["results"]]
+    check("No retrieval", retrieve.queries == [], str(retrieve.queries))
+    check("Nozzle parents ranked first", ids[:3] == ["nozzle#1", "nozzle#2", "nozzle#3"], str(ids))
+    check("Off-topic parent damped", result["results"][-1]["rerank_score"] < 0.7 * 0.1, str(result["results"]))
+    check("Confidence carried from the transition", result["confidence"]["level"] == "HIGH")
+    check("Citations follow the ranked results", result["citations"][0].startswith("[1]")
+          and len(result["citations"]) == len(ids), str(result["citations"]))
+    check("Parents embedded once", len(embedder.calls) == 2 and len(embedder.calls[0]) == 5
+          and embedder.calls[1] == ["And the nozzle angle?"], str(embedder.calls))
+    check("Same ids on the next turn", [r["id"] for r in again["results"]] == ids)
+    check("Counted as covered", stats["seeded"] == 1 and stats["covered"] == 2
+          and stats["covered_rate"] == 1.0, str(stats))
+
+
+def test_delta_followup():
+    print("\n── A follow-up on a new topic retrieves the delta and merges ──")
+    embedder, saved = _setup()
+    try:
+        sr.seed("s1", _rag(_TRANSITION))
+        retrieve = _FakeRetrieve([_parent("valve#1", "valve", 0.95), _parent("valve#2", "valve", 0.85),
+                                  _parent("valve#3", "valve", 0.8), _parent("nozzle#1", "nozzle", 0.5)])
+        result = sr.followup("s1", "Which valve should I use?", retrieve)
+        ws = sr._get("s1")
+        covered = sr.followup("s1", "valve seat material?", _FakeRetrieve([]))
+        stats = sr.session_retrieval_stats()
+    finally:
+        _teardown(saved)
+    ids = [r["id"] for r in result["results"]]
+    check("Retrieved once on the message", retrieve.queries == ["Which valve should I use?"], str(retrieve.queries))
+    check("Fresh parent first", ids[0] == "valve#1", str(ids))
+    check("Session parents merged without duplicates", sorted(ids) == sorted(["valve#1", "valve#2", "valve#3",
+          "nozzle#1", "nozzle#2", "nozzle#3", "pump#1"]), str(ids))
+    check("Working set grew", list(ws.parents) == ["nozzle#2", "nozzle#3", "pump#1", "valve#1", "valve#2",
+          "valve#3", "nozzle#1"], str(list(ws.parents)))
+    check("Better prior score kept on re-retrieval", ws.parents["nozzle#1"]["rerank_score"] == 0.9)
+    check("Next valve follow-up is covered", covered["results"][0]["id"] == "valve#1", str(covered["results"]))
+    check("Counted", stats["delta"] == 1 and stats["covered"] == 1, str(stats))
+
+
+def test_single_parent_not_enough():
+    print("\n── One close parent does not cover a follow-up ──")
+    embedder, saved = _setup()
+    try:
+        sr.seed("s1", _rag(_TRANSITION))
+        retrieve = _FakeRetrieve([_parent("pump#2", "pump", 0.9), _parent("pump#3", "pump", 0.85)])
+        result = sr.followup("s1", "What pump pressure?", retrieve)
+        stats = sr.session_retrieval_stats()
+    finally:
+        _teardown(saved)
+    ids = [r["id"] for r in result["results"]]
+    check("Retrieved on the message", retrieve.queries == ["What pump pressure?"], str(retrieve.queries))
+    check("Fresh pump parents merged ahead of the session's one", ids[:3] == ["pump#2", "pump#3", "pump#1"], str(ids))
+    check("Counted as a delta", stats["delta"] == 1 and stats["covered"] == 0
+          and stats["cover_parents"] == sr.SESSION_RETRIEVAL_COVER_PARENTS, str(stats))
+
+
+def test_cold_session_seeds():
+    print("\n── A session without a working set retrieves in full and seeds one ──")
+    embedder, saved = _setup()
+    try:
+        retrieve = _FakeRetrieve(_TRANSITION)
+        first = sr.followup("cold", "nozzle drift?", retrieve)
+        second = sr.followup("cold", "nozzle wear?", retrieve)
+        stats = sr.session_retrieval_stats()
+        anonymous = sr.followup(None, "nozzle?", retrieve)
+    finally:
+        _teardown(saved)
+    check("Full retrieval first", retrieve.queries[0] == "nozzle drift?" and first["results"] == _TRANSITION)
+    check("Seeded: the next follow-up reuses it", len(retrieve.queries) == 2
+          and second["results"][0]["id"] == "nozzle#1", str(retrieve.queries))
+    check("Counted cold then covered", stats["cold"] == 1 and stats["covered"] == 1 and stats["seeded"] == 1, str(stats))
+    check("No session id → plain retrieval", anonymous["results"] == _TRANSITION and not embedder.calls[2:])
+
+
+def test_embedding_failure():
+    print("\n── An embedding failure falls back to a full retrieval ──")
+    embedder, saved = _setup(fail_embed=True)
+    try:
+        sr.seed("s1", _rag(_TRANSITION))
+        retrieve = _FakeRetrieve([_parent("valve#1", "valve", 0.95)])
+        result = sr.followup("s1", "nozzle spacing?", retrieve)
+        ws = sr._get("s1")
+        stats = sr.session_retrieval_stats()
+    finally:
+        _teardown(saved)
+    check("Retrieval result returned as is", retrieve.queries == ["nozzle spacing?"]
+          and result["results"] == retrieve.results, str(result["results"]))
+    check("Retrieved parents still join the working set", "valve#1" in ws.parents)
+    check("Counted as an error", stats["errors"] == 1, str(stats))
+
+
+def test_expiry_and_forget():
+    print("\n── Working sets expire, are capped, and are dropped with their session ──")
+    embedder, saved = _setup()
+    try:
+        sr.seed("old", _rag(_TRANSITION))
+        sr._sets["old"].used_at = time.monotonic() - sr.SESSION_RETRIEVAL_TTL - 1
+        check("Expired after the TTL", sr._get("old") is None)
+
+        sr.SESSION_RETRIEVAL_MAX_SESSIONS = 2
+        for sid in ("a", "b", "c"):
+            sr.seed(sid, _rag(_TRANSITION))
+        check("Least recently used dropped at the cap", list(sr._sets) == ["b", "c"], str(list(sr._sets)))
+
+        sr.forget("b")
+        check("Forgotten", sr._get("b") is None and sr._get("c") is not None)
+
+        sr.seed("empty", _rag([]))
+        check("Empty retrieval seeds nothing", sr._get("empty") is None)
+
+        sr.SESSION_RETRIEVAL = False
+        sr.seed("off", _rag(_TRANSITION))
+        check("Disabled: nothing seeded", "off" not in sr._sets)
+    finally:
+        _teardown(saved)
+
+
+def test_chunk_ids():
+    print("\n── Chunk ids ──")
+    check("Explicit id wins", sr.chunk_id({"id": "x", "parent_id": "p"}, 1) == "x")
+    check("Parent id", sr.chunk_id({"parent_id": "p"}, 1) == "p")
+    check("Positional without either", sr.chunk_id({}, 3) == "chunk_3")
+    _, ids = ce._build_rag_context(_rag(_TRANSITION))
+    check("rag_chunks_used are parent ids", ids == ["nozzle#1", "nozzle#2", "nozzle#3", "pump#1"], str(ids))
+
+
+# ── Engine ──────────────────────────────────────────────────────────────
+
+_SIGNAL = ("Here is the recommendation.\n<consultation_signal><ready>true</ready>"
+           "<refined_query>nozzle selection</refined_query>"
+           "<application_domain>spray</application_domain><parameters>{}</parameters>"
+           "</consultation_signal>")
+
+
+class _FakeMessages:
+    def create(self, **kwargs):
+        return SimpleNamespace(
+            model=kwargs["model"], stop_reason="end_turn",
+            usage=SimpleNamespace(input_tokens=100, output_tokens=50),
+            content=[SimpleNamespace(text=_SIGNAL)],
+        )
+
+
+def test_engine_followup_uses_working_set():
+    print("\n── Consultation engine: transition seeds, follow-up reuses ──")
+    database.set_db_path(tempfile.mktemp(suffix=".db"))
+    asyncio.run(database.init_db())
+    embedder, saved = _setup()
+    retrieve = _FakeRetrieve(_TRANSITION)
+    engine_saved = (ce._client, ce._run_retrieval, hedging.LLM_HEDGING, model_router.MODEL_ROUTING,
+                    speculative_retrieval.SPECULATIVE_RETRIEVAL)
+    ce._client = SimpleNamespace(messages=_FakeMessages())
+    ce._run_retrieval = lambda q, **kwargs: retrieve(q)
+    hedging.LLM_HEDGING = False
+    model_router.MODEL_ROUTING = False
+    speculative_retrieval.SPECULATIVE_RETRIEVAL = False
+    try:
+        transition = ce.generate_consultation_response(
+            "engine-s", "I spray herbicide", "gathering", [], gathering_turn_count=3,
+        )
+        followup = ce.generate_consultation_response(
+            "engine-s", "Which nozzle size?", "answering",
+            [{"role": "user", "content": "I spray herbicide"}, {"role": "assistant", "content": "..."}],
+        )
+    finally:
+        (ce._client, ce._run_retrieval, hedging.LLM_HEDGING, model_router.MODEL_ROUTING,
+         speculative_retrieval.SPECULATIVE_RETRIEVAL) = engine_saved
+        _teardown(saved)
+    check("Transitioned", transition["phase"] == "answering", str(transition.get("phase")))
+    check("Retrieval only at the transition", len(retrieve.queries) == 1, str(retrieve.queries))
+    check("Transition chunks are parent ids",
+          transition["rag_chunks_used"] == ["nozzle#1", "nozzle#2", "nozzle#3", "pump#1"],
+          str(transition["rag_chunks_used"]))
+    check("Follow-up names the same chunks", set(followup["rag_chunks_used"]) <= set(transition["rag_chunks_used"])
+          and followup["rag_chunks_used"][0] == "nozzle#1", str(followup["rag_chunks_used"]))
+    check("Follow-up confidence from the working set", followup["confidence"] == "HIGH", str(followup["confidence"]))
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("SESSION RETRIEVAL TESTS")
+    print("=" * 60)
+
+    test_covered_followup()
+    test_delta_followup()
+    test_single_parent_not_enough()
+    test_cold_session_seeds()
+    test_embedding_failure()
+    test_expiry_and_forget()
+    test_chunk_ids()
+    test_engine_followup_uses_working_set()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Stream Cancellation Tests
+==========================
+A client that disconnects mid-answer must stop the upstream LLM stream
+(core/streaming.py): the engine closes the stream, the aborted call is
+recorded in llm_usage, and the consultation route keeps the partial reply
+as an incomplete message. Fake Anthropic streams, temporary SQLite
+database — no API calls.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import aiosqlite
+
+import core.consultation_engine as ce
+import core.database as database
+from core import engine_executor, session_retrieval
+from core.engine_executor import iterate_in_executor
+from core.models import ConsultMessageRequest
+from core.routes import consultation as consultation_routes
+from core.streaming import CancellableStreamingResponse
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+# ── Fakes ───────────────────────────────────────────────────────────────
+
+_SNAPSHOT = SimpleNamespace(usage=SimpleNamespace(
+    input_tokens=1200, output_tokens=1, cache_creation_input_tokens=0, cache_read_input_tokens=800,
+))
+_WORDS = ["Use ", "a ", "10 ", "µm ", "return ", "filter ", "with ", "a ", "bypass ", "valve. "] * 50
+
+
+class _AsyncStream:
+    """Endless-ish answer, one word per tick; remembers whether it was closed."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.closed = False
+        self.current_message_snapshot = _SNAPSHOT
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    async def close(self):
+        self.closed = True
+
+    @property
+    async def text_stream(self):
+        for word in _WORDS:
+            if self.closed:
+                return
+            await asyncio.sleep(self.delay)
+            yield word
+
+
+class _SyncStream:
+    def __init__(self, delay):
+        self.delay = delay
+        self.closed = False
+        self.current_message_snapshot = _SNAPSHOT
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+        return False
+
+    @property
+    def text_stream(self):
+        for word in _WORDS:
+            time.sleep(self.delay)
+            yield word
+
+
+class _FakeMessages:
+    def __init__(self, is_async, delay):
+        self.is_async = is_async
+        self.delay = delay
+        self.streams = []
+
+    def stream(self, **kwargs):
+        stream = _AsyncStream(self.delay) if self.is_async else _SyncStream(self.delay)
+        self.streams.append(stream)
+        return stream
+
+
+def _fake_retrieval(query, **kwargs):
+    return {
+        "query": query,
+        "results": [{"id": "c1", "source": "filters.md", "rerank_score": 0.9, "parent_text": "Beta ratios."}],
+        "confidence": {"level": "HIGH", "reasoning": "stand-in"},
+        "citations": ["filters.md"],
+    }
+
+
+_PATCHED = ("_client", "_async_client", "_run_retrieval", "build_precomputed_context")
+_ORIGINALS = {name: getattr(ce, name) for name in _PATCHED}
+_SESSION_RETRIEVAL = session_retrieval.SESSION_RETRIEVAL
+
+
+def _install(delay=0.005) -> tuple[_FakeMessages, _FakeMessages]:
+    sync_messages, async_messages = _FakeMessages(False, delay), _FakeMessages(True, delay)
+    ce._client = SimpleNamespace(messages=sync_messages)
+    ce._async_client = SimpleNamespace(messages=async_messages)
+    ce._run_retrieval = _fake_retrieval
+    ce.build_precomputed_context = lambda **k: ""
+    session_retrieval.SESSION_RETRIEVAL = False
+    return sync_messages, async_messages
+
+
+def _restore():
+    for name, value in _ORIGINALS.items():
+        setattr(ce, name, value)
+    session_retrieval.SESSION_RETRIEVAL = _SESSION_RETRIEVAL
+
+
+def _fresh_db() -> None:
+    database.set_db_path(tempfile.mktemp(suffix=".db"))
+    asyncio.run(database.init_db())
+
+
+async def _usage_rows() -> list[dict]:
+    async with aiosqlite.connect(database._get_db_path()) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute("SELECT * FROM llm_usage ORDER BY id")
+        return [dict(r) for r in await cursor.fetchall()]
+
+
+_ANSWERING = dict(
+    session_id="s1", user_message="What about cold start?", phase="answering",
+    conversation_history=[], gathered_parameters={"flow_lpm": 120},
+)
+
+
+# ── Usage accounting ────────────────────────────────────────────────────
+
+def test_aborted_usage():
+    print("\n── Aborted calls in llm_usage ──")
+    _fresh_db()
+    completed = SimpleNamespace(input_tokens=1000, output_tokens=900)
+    database.log_llm_usage_sync(completed, "m", "answering")
+    database.log_llm_usage_sync(SimpleNamespace(input_tokens=1000, output_tokens=1100), "m", "answering")
+    saved = database.log_aborted_llm_usage_sync(SimpleNamespace(input_tokens=1000, output_tokens=150), "m", "answering", 6000)
+    capped = database.log_aborted_llm_usage_sync(SimpleNamespace(input_tokens=1000, output_tokens=150), "m", "answering", 400)
+    unknown = database.log_aborted_llm_usage_sync(SimpleNamespace(input_tokens=10, output_tokens=5), "m", "gathering", 4000)
+    rows = asyncio.run(_usage_rows())
+
+    check("Saved = typical completed output − generated", saved == 850, str(saved))
+    check("Typical output capped at max_tokens", capped == 250, str(capped))
+    check("No history for the phase → nothing claimed", unknown == 0, str(unknown))
+    check("Aborted rows flagged, completed rows not", [r["aborted"] for r in rows] == [0, 0, 1, 1, 1])
+    check("Generated output and cost still recorded", rows[2]["output_tokens"] == 150
+          and rows[2]["estimated_cost_usd"] > 0 and rows[2]["output_tokens_saved"] == 850, str(rows[2]))
+
+
+# ── Engine ──────────────────────────────────────────────────────────────
+
+def test_async_engine_aclose():
+    print("\n── Async engine: aclose mid-stream closes upstream ──")
+    _fresh_db()
+    _, messages = _install()
+    try:
+        async def _run():
+            events = ce.generate_consultation_response_stream_async(**_ANSWERING)
+            texts = []
+            async for event_type, data in events:
+                if event_type == "text":
+                    texts.append(data)
+                    if len(texts) == 5:
+                        break
+            await events.aclose()
+            return texts
+        texts = asyncio.run(_run())
+    finally:
+        _restore()
+
+    rows = asyncio.run(_usage_rows())
+    check("Upstream stream closed", messages.streams and messages.streams[-1].closed)
+    check("Stopped early", len(texts) == 5)
+    check("One aborted answering call recorded", len(rows) == 1 and rows[0]["aborted"] == 1
+          and rows[0]["phase"] == "answering", str(rows))
+    check("Input and cache tokens from the message_start snapshot",
+          rows and rows[0]["input_tokens"] == 1200 and rows[0]["cache_read_input_tokens"] == 800, str(rows))
+    check("Output estimated from the partial text", rows and 0 < rows[0]["output_tokens"] < 20, str(rows))
+
+
+def test_async_engine_cancel():
+    print("\n── Async engine: task cancelled while waiting on a delta ──")
+    _fresh_db()
+    _, messages = _install(delay=0.05)
+    try:
+        async def _run():
+            seen = asyncio.Event()
+
+            async def _consume():
+                async for event_type, _ in ce.generate_consultation_response_stream_async(**_ANSWERING):
+                    if event_type == "text":
+                        seen.set()
+
+            task = asyncio.create_task(_consume())
+            await seen.wait()
+            await asyncio.sleep(0.02)  # cancel mid-await, not at a yield
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            return task.cancelled()
+        cancelled = asyncio.run(_run())
+    finally:
+        _restore()
+
+    rows = asyncio.run(_usage_rows())
+    check("Cancellation propagates", cancelled)
+    check("Upstream stream closed", messages.streams and messages.streams[-1].closed)
+    check("Aborted call recorded", len(rows) == 1 and rows[0]["aborted"] == 1, str(rows))
+
+
+def test_sync_engine_in_executor():
+    print("\n── Sync engine in the pool: closed after its in-flight next() ──")
+    _fresh_db()
+    _, messages = _install(delay=0.05)  # the sync wrapper drives the async pipeline
+    errors = []
+    saved_hook = threading.excepthook
+    threading.excepthook = lambda args: errors.append(args.exc_value)
+    try:
+        async def _run():
+            seen = asyncio.Event()
+
+            async def _consume():
+                gen = ce.generate_consultation_response_stream(**_ANSWERING)
+                async for event_type, _ in iterate_in_executor(gen):
+                    if event_type == "text":
+                        seen.set()
+
+            task = asyncio.create_task(_consume())
+            await seen.wait()
+            await asyncio.sleep(0.01)  # a blocking next() is running in a pool thread
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        asyncio.run(_run())
+    finally:
+        threading.excepthook = saved_hook
+        _restore()
+
+    rows = asyncio.run(_usage_rows())
+    check("Upstream stream closed", messages.streams and messages.streams[-1].closed)
+    check("Aborted call recorded", len(rows) == 1 and rows[0]["aborted"] == 1, str(rows))
+    check("No 'generator already executing'", not errors, str(errors))
+
+
+# ── Route ───────────────────────────────────────────────────────────────
+
+async def _drive(response, disconnect_after: int) -> list[bytes]:
+    """Run a streaming response over fake ASGI; the client goes away after
+    `disconnect_after` body chunks."""
+    bodies: list[bytes] = []
+    gone = asyncio.Event()
+
+    async def receive():
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            bodies.append(message["body"])
+            if len(bodies) >= disconnect_after:
+                gone.set()
+
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "method": "POST", "headers": []}
+    await response(scope, receive, send)
+    return bodies
+
+
+def test_route_disconnect():
+    print("\n── Consultation route: disconnect saves an incomplete reply ──")
+    _fresh_db()
+    _, messages = _install()
+    try:
+        async def _run():
+            session = await database.create_consultation_session()
+            sid = session["id"]
+            await database.update_consultation_session(sid, phase="answering", gathered_parameters={"flow_lpm": 120})
+            response = await consultation_routes.send_consult_message_stream(
+                sid, ConsultMessageRequest(content="What about cold start?"), idempotency_key=None, last_event_id=None,
+            )
+            bodies = await _drive(response, disconnect_after=8)
+            return response, bodies, await database.get_consultation_session(sid)
+        response, bodies, session = asyncio.run(_run())
+    finally:
+        _restore()
+
+    rows = asyncio.run(_usage_rows())
+    streamed = "".join(
+        json.loads(b.decode().split("data: ", 1)[1])["text"] for b in bodies if b.startswith(b"event: chunk")
+    )
+    reply = session["messages"][-1]
+    check("Disconnect-aware response", isinstance(response, CancellableStreamingResponse))
+    check("Stream stopped at the disconnect", len(bodies) < 20, str(len(bodies)))
+    check("Upstream stream closed", messages.streams and messages.streams[-1].closed)
+    check("Partial reply saved as incomplete", reply["role"] == "assistant" and reply["incomplete"]
+          and reply["content"].startswith(streamed.strip()), str(reply))
+    check("Session phase unchanged", session["phase"] == "answering")
+    check("Aborted call recorded", len(rows) == 1 and rows[0]["aborted"] == 1, str(rows))
+    stats = engine_executor.engine_stats()
+    check("Engine slot released", all(
+        v["in_flight"] == 0 for v in (*stats["verticals"].values(), *stats["streams"].values())
+    ) and stats["streams"], str(stats))
+
+    history = consultation_routes._history_message(reply)
+    check("Next turn sees the reply was cut short", "Response interrupted" in history["content"])
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("STREAM CANCELLATION TESTS")
+    print("=" * 60)
+
+    test_aborted_usage()
+    test_async_engine_aclose()
+    test_async_engine_cancel()
+    test_sync_engine_in_executor()
+    test_route_disconnect()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
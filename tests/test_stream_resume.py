@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Resumable Stream Tests
+=======================
+Idempotent consultation message submission and SSE resume via
+Last-Event-ID (core/stream_buffer.py): a retried submission must not save a
+second user message or generate a second reply, and a reconnect continues
+the stream where it broke off. Fake Anthropic stream, temporary SQLite
+database — no API calls.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import HTTPException
+
+import core.consultation_engine as ce
+import core.database as database
+from core import stream_buffer
+from core.models import ConsultMessageRequest
+from core.routes import consultation as routes
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+# ── Fakes ───────────────────────────────────────────────────────────────
+
+ANSWER = "Use a 10 µm return filter with a 3.5 bar bypass valve and a cold-start indicator lockout. " * 3
+
+
+class _AsyncStream:
+    def __init__(self, delay):
+        self.delay = delay
+        self.closed = False
+        self.current_message_snapshot = SimpleNamespace(usage=SimpleNamespace(input_tokens=100))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+        return False
+
+    async def close(self):
+        self.closed = True
+
+    @property
+    async def text_stream(self):
+        for i in range(0, len(ANSWER), 6):
+            await asyncio.sleep(self.delay)
+            yield ANSWER[i:i + 6]
+
+    async def get_final_message(self):
+        return SimpleNamespace(
+            model="fake-model", stop_reason="end_turn",
+            usage=SimpleNamespace(input_tokens=100, output_tokens=40),
+        )
+
+
+class _FakeMessages:
+    def __init__(self, delay):
+        self.delay = delay
+        self.streams = []
+
+    fail = False
+
+    def stream(self, **kwargs):
+        if self.fail:
+            raise RuntimeError("overloaded")
+        self.streams.append(_AsyncStream(self.delay))
+        return self.streams[-1]
+
+
+def _fake_retrieval(query, **kwargs):
+    return {
+        "query": query,
+        "results": [{"id": "c1", "source": "filters.md", "rerank_score": 0.9, "parent_text": "Beta ratios."}],
+        "confidence": {"level": "HIGH", "reasoning": "stand-in"},
+        "citations": ["filters.md"],
+    }
+
+
+_PATCHED = ("_async_client", "_run_retrieval", "build_precomputed_context", "log_llm_usage_sync")
+_ORIGINALS = {name: getattr(ce, name) for name in _PATCHED}
+
+
+def _install(delay=0.005) -> _FakeMessages:
+    messages = _FakeMessages(delay)
+    ce._async_client = SimpleNamespace(messages=messages)
+    ce._run_retrieval = _fake_retrieval
+    ce.build_precomputed_context = lambda **k: ""
+    ce.log_llm_usage_sync = lambda *a, **k: None
+    return messages
+
+
+def _restore():
+    for name, value in _ORIGINALS.items():
+        setattr(ce, name, value)
+    stream_buffer._buffers.clear()
+
+
+def _fresh_db() -> None:
+    database.set_db_path(tempfile.mktemp(suffix=".db"))
+    asyncio.run(database.init_db())
+
+
+async def _answering_session() -> str:
+    session = await database.create_consultation_session()
+    await database.update_consultation_session(session["id"], phase="answering", gathered_parameters={"flow_lpm": 120})
+    return session["id"]
+
+
+async def _drive(response, disconnect_after: int | None = None) -> list[str]:
+    """Run a streaming response over fake ASGI; the client goes away after
+    `disconnect_after` body chunks (or reads to the end)."""
+    bodies: list[str] = []
+    gone = asyncio.Event()
+
+    async def receive():
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            bodies.append(message["body"].decode())
+            if disconnect_after is not None and len(bodies) >= disconnect_after:
+                gone.set()
+
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "method": "POST", "headers": []}
+    await response(scope, receive, send)
+    return bodies
+
+
+def _parse(event: str) -> tuple[int | None, str, dict]:
+    fields = dict(line.split(": ", 1) for line in event.strip().split("\n"))
+    return (int(fields["id"]) if "id" in fields else None), fields["event"], json.loads(fields["data"])
+
+
+def _text(events: list[str]) -> str:
+    return "".join(data["text"] for _, name, data in map(_parse, events) if name == "chunk")
+
+
+def _post(sid: str, key: str | None, last_event_id: str | None = None):
+    return routes.send_consult_message_stream(
+        sid, ConsultMessageRequest(content="What about cold start?"),
+        idempotency_key=key, last_event_id=last_event_id,
+    )
+
+
+async def _user_messages(sid: str) -> int:
+    return sum(1 for m in (await database.get_consultation_session(sid))["messages"] if m["role"] == "user")
+
+
+# ── Buffer ──────────────────────────────────────────────────────────────
+
+def test_buffer():
+    print("\n── Stream buffer: ids, replay after an id, live follow ──")
+
+    async def _run():
+        release = asyncio.Event()
+
+        async def source():
+            yield "event: status\ndata: {}\n\n"
+            yield "event: chunk\ndata: {}\n\n"
+            await release.wait()
+            yield "event: complete\ndata: {}\n\n"
+
+        buffer = stream_buffer.start(source(), "s", "k1")
+        await asyncio.sleep(0.01)
+        from_one = []
+        follower = buffer.follow(after=1)
+        from_one.append(await follower.__anext__())
+        waiting = asyncio.ensure_future(follower.__anext__())
+        await asyncio.sleep(0.01)
+        blocked = not waiting.done()
+        release.set()
+        from_one.append(await waiting)
+        await follower.aclose()
+        replay = [e async for e in buffer.follow()]
+        return buffer, from_one, blocked, replay
+
+    try:
+        buffer, from_one, blocked, replay = asyncio.run(_run())
+    finally:
+        stream_buffer._buffers.clear()
+    check("Events numbered from 1", [e.split("\n")[0] for e in buffer.events] == ["id: 1", "id: 2", "id: 3"])
+    check("Follow resumes after the given id", [e.split("\n")[0] for e in from_one] == ["id: 2", "id: 3"], str(from_one))
+    check("Follower waits for live events", blocked)
+    check("Finished stream replays in full", replay == buffer.events)
+    check("Last-Event-ID parsing", stream_buffer.parse_event_id("7") == 7
+          and stream_buffer.parse_event_id(None) == 0 and stream_buffer.parse_event_id("x") == 0)
+
+
+# ── Route ───────────────────────────────────────────────────────────────
+
+def test_retry_resumes():
+    print("\n── Retry with the same key resumes instead of regenerating ──")
+    _fresh_db()
+    messages = _install()
+    try:
+        async def _run():
+            sid = await _answering_session()
+            first = await _drive(await _post(sid, "key-1"), disconnect_after=6)
+            last_id = _parse(first[-1])[0]
+            second = await _drive(await _post(sid, "key-1", last_event_id=str(last_id)))
+            replay = await _drive(await routes.resume_consult_message_stream(sid, "key-1", last_event_id=None))
+            return sid, first, second, replay, await _user_messages(sid), await database.get_consultation_session(sid)
+        sid, first, second, replay, users, session = asyncio.run(_run())
+    finally:
+        _restore()
+
+    ids = [_parse(e)[0] for e in first + second]
+    check("One user message saved", users == 1, str(users))
+    check("One generation", len(messages.streams) == 1, str(len(messages.streams)))
+    check("Resume continues after Last-Event-ID", ids == list(range(1, len(ids) + 1)), str(ids))
+    check("First + resumed text is the whole answer", _text(first + second) == ANSWER)
+    check("Resumed stream ends with complete", _parse(second[-1])[1] == "complete")
+    check("Reply saved once, complete", [m["incomplete"] for m in session["messages"] if m["role"] == "assistant"] == [False])
+    check("Resume endpoint replays the finished stream", replay == first + second)
+
+
+def test_replay_from_database():
+    print("\n── Retry after the buffer is gone: stored reply ──")
+    _fresh_db()
+    messages = _install()
+    try:
+        async def _run():
+            sid = await _answering_session()
+            await _drive(await _post(sid, "key-2"))
+            stream_buffer._buffers.clear()  # evicted, or a different worker
+            return await _drive(await _post(sid, "key-2", last_event_id="4")), await _user_messages(sid)
+        events, users = asyncio.run(_run())
+    finally:
+        _restore()
+
+    names = [_parse(e)[1] for e in events]
+    check("Replayed, not regenerated", names == ["replay", "complete"] and len(messages.streams) == 1, str(names))
+    check("Whole stored reply sent", _parse(events[0])[2]["content"] == ANSWER.strip())
+    check("Still one user message", users == 1)
+
+
+def test_pending_duplicate():
+    print("\n── Duplicate of a turn with no reply and no buffer ──")
+    _fresh_db()
+    _install()
+    try:
+        async def _run():
+            sid = await _answering_session()
+            await database.add_consultation_message(sid, "user", "hi", "answering", idempotency_key="key-3")
+            try:
+                await _post(sid, "key-3")
+                return None
+            except HTTPException as e:
+                return e.status_code
+        status = asyncio.run(_run())
+    finally:
+        _restore()
+    check("409 instead of a second submission", status == 409, str(status))
+
+
+def test_failed_turn_runs_again():
+    print("\n── A failed turn is undone, so its retry runs again ──")
+    _fresh_db()
+    messages = _install()
+    saved_generate = ce.generate_consultation_response
+    try:
+        async def _run():
+            sid = await _answering_session()
+            messages.fail = True
+            failed = await _drive(await _post(sid, "key-5"))
+            users_after_failure = await _user_messages(sid)
+            messages.fail = False
+            retried = await _drive(await _post(sid, "key-5"))
+
+            # Non-streaming route: the same for an engine exception
+            def _broken(**kwargs):
+                raise RuntimeError("overloaded")
+            ce.generate_consultation_response = _broken
+            try:
+                await routes.send_consult_message(sid, ConsultMessageRequest(content="And hot oil?"),
+                                                  idempotency_key="key-6")
+                status = None
+            except HTTPException as e:
+                status = e.status_code
+            ce.generate_consultation_response = saved_generate
+            turn = await database.get_idempotent_turn(sid, "key-6")
+            return failed, users_after_failure, retried, status, turn, await database.get_idempotent_turn(sid, "key-5")
+        failed, users_after_failure, retried, status, turn, answered = asyncio.run(_run())
+    finally:
+        ce.generate_consultation_response = saved_generate
+        _restore()
+
+    check("Stream error reported", _parse(failed[-1])[1] == "error", str(failed[-1:]))
+    check("Failed turn's user message removed", users_after_failure == 0, str(users_after_failure))
+    check("Retry with the same key generated the reply", _parse(retried[-1])[1] == "complete"
+          and _text(retried) == ANSWER, str(retried[-1:]))
+    check("Reply linked to the retried message", answered and answered["reply"]
+          and answered["reply"]["content"] == ANSWER.strip(), str(answered))
+    check("Non-stream failure: 500 and the key is free again", status == 500 and turn is None, f"{status} {turn}")
+
+
+def test_abandoned_after_grace():
+    print("\n── No reconnect within the grace period ──")
+    _fresh_db()
+    messages = _install(delay=0.02)
+    saved = stream_buffer.STREAM_RESUME_GRACE
+    stream_buffer.STREAM_RESUME_GRACE = 0.1
+    try:
+        async def _run():
+            sid = await _answering_session()
+            await _drive(await _post(sid, "key-4"), disconnect_after=4)
+            still_running = not messages.streams[-1].closed
+            await asyncio.sleep(0.3)
+            return still_running, await database.get_consultation_session(sid)
+        still_running, session = asyncio.run(_run())
+    finally:
+        stream_buffer.STREAM_RESUME_GRACE = saved
+        _restore()
+
+    reply = session["messages"][-1]
+    check("Kept generating during the grace period", still_running)
+    check("Then cancelled upstream", messages.streams[-1].closed)
+    check("Partial reply saved as incomplete", reply["role"] == "assistant" and reply["incomplete"]
+          and ANSWER.startswith(reply["content"]), str(reply))
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("RESUMABLE STREAM TESTS")
+    print("=" * 60)
+
+    test_buffer()
+    test_retry_resumes()
+    test_replay_from_database()
+    test_pending_duplicate()
+    test_failed_turn_runs_again()
+    test_abandoned_after_grace()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Usage Writer Tests
+===================
+The buffered llm_usage writer (core/usage_writer.py): while it runs, logging
+usage only appends to memory and request threads open no SQLite connection;
+rows land in batches on the interval, on the size threshold and on
+shutdown, keep the time they were logged, survive a failed flush, and the
+aborted-stream estimate comes from in-memory averages. Temporary SQLite
+database — no API calls.
+"""
+from __future__ import annotations
+import asyncio
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import core.database as database
+from core import usage_writer
+
+PASS = 0
+FAIL = 0
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    global PASS, FAIL
+    if condition:
+        PASS += 1
+        print(f"  ✅ {name}")
+    else:
+        FAIL += 1
+        print(f"  ❌ {name} — {detail}")
+
+
+def _usage(output_tokens: int = 200) -> SimpleNamespace:
+    return SimpleNamespace(input_tokens=1000, output_tokens=output_tokens)
+
+
+def _fresh_db() -> str:
+    path = tempfile.mktemp(suffix=".db")
+    database.set_db_path(path)
+    asyncio.run(database.init_db())
+    return path
+
+
+def _rows(path: str) -> list[tuple]:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT phase, model, output_tokens, aborted, output_tokens_saved, timestamp "
+                            "FROM llm_usage ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def _start(path: str, interval: float = 60.0, rows: int = 200, buffer_max: int = 10000) -> tuple:
+    saved = (usage_writer.USAGE_BUFFER, usage_writer.USAGE_FLUSH_INTERVAL,
+             usage_writer.USAGE_FLUSH_ROWS, usage_writer.USAGE_BUFFER_MAX)
+    usage_writer.USAGE_BUFFER = True
+    usage_writer.USAGE_FLUSH_INTERVAL = interval
+    usage_writer.USAGE_FLUSH_ROWS = rows
+    usage_writer.USAGE_BUFFER_MAX = buffer_max
+    usage_writer._counts.clear()
+    usage_writer.start(path)
+    return saved
+
+
+def _stop(saved: tuple) -> None:
+    usage_writer.stop()
+    (usage_writer.USAGE_BUFFER, usage_writer.USAGE_FLUSH_INTERVAL,
+     usage_writer.USAGE_FLUSH_ROWS, usage_writer.USAGE_BUFFER_MAX) = saved
+
+
+class _CountConnects:
+    """Counts sqlite3.connect calls made by core/database.py."""
+
+    def __init__(self):
+        self.calls = 0
+        self._real = database.sqlite3
+
+    def __enter__(self):
+        real = self._real
+
+        def connect(*args, **kwargs):
+            self.calls += 1
+            return real.connect(*args, **kwargs)
+        database.sqlite3 = SimpleNamespace(connect=connect, IntegrityError=real.IntegrityError, Row=real.Row)
+        return self
+
+    def __exit__(self, *exc):
+        database.sqlite3 = self._real
+        return False
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+# ── Tests ───────────────────────────────────────────────────────────────
+
+def test_buffered_until_flush():
+    print("\n── Logged rows stay in memory until a flush ──")
+    path = _fresh_db()
+    saved = _start(path)
+    try:
+        with _CountConnects() as connects:
+            for _ in range(5):
+                database.log_llm_usage_sync(_usage(), "m", "answering", route_tier="primary")
+            asyncio.run(database.log_llm_usage(_usage(), "m", "gathering"))
+        before = _rows(path)
+        written = usage_writer.flush()
+        after = _rows(path)
+        stats = usage_writer.usage_writer_stats()
+    finally:
+        _stop(saved)
+    check("No SQLite connection from the logging thread", connects.calls == 0, str(connects.calls))
+    check("Nothing written before the flush", before == [], str(before))
+    check("All rows written in one batch", written == 6 and len(after) == 6 and stats["batches"] == 1, str(stats))
+    check("Flags written as 0, not NULL", all(r[3] == 0 and r[4] == 0 for r in after), str(after))
+    check("Sync and async rows both buffered", sorted({r[0] for r in after}) == ["answering", "gathering"])
+    check("Logged-at timestamp in CURRENT_TIMESTAMP format", len(after[0][5]) == 19 and after[0][5][10] == " ",
+          after[0][5])
+
+
+def test_flush_on_interval_and_size():
+    print("\n── The writer thread flushes on the interval and on the size threshold ──")
+    path = _fresh_db()
+    saved = _start(path, interval=0.05)
+    try:
+        database.log_llm_usage_sync(_usage(), "m", "answering")
+        on_interval = _wait_for(lambda: len(_rows(path)) == 1)
+    finally:
+        _stop(saved)
+    check("Written after the interval", on_interval)
+
+    path = _fresh_db()
+    saved = _start(path, interval=60.0, rows=10)
+    try:
+        for _ in range(9):
+            database.log_llm_usage_sync(_usage(), "m", "answering")
+        time.sleep(0.1)
+        below = len(_rows(path))
+        database.log_llm_usage_sync(_usage(), "m", "answering")
+        on_size = _wait_for(lambda: len(_rows(path)) == 10)
+    finally:
+        _stop(saved)
+    check("Below the threshold: still buffered", below == 0, str(below))
+    check("Threshold reached: flushed without waiting for the interval", on_size)
+
+
+def test_flush_on_stop():
+    print("\n── Stopping flushes what is pending ──")
+    path = _fresh_db()
+    saved = _start(path)
+    database.log_llm_usage_sync(_usage(), "m", "answering")
+    database.log_llm_usage_sync(_usage(), "m", "answering")
+    _stop(saved)
+    check("Pending rows written on stop", len(_rows(path)) == 2)
+    check("Writer stopped", not usage_writer.running())
+    database.log_llm_usage_sync(_usage(), "m", "answering")
+    check("Stopped: rows written straight away", len(_rows(path)) == 3)
+
+
+def test_failed_flush_keeps_rows():
+    print("\n── A failed flush keeps its rows for the next one ──")
+    path = _fresh_db()
+    saved = _start(path, buffer_max=3)
+    try:
+        for _ in range(2):
+            database.log_llm_usage_sync(_usage(), "m", "answering")
+        usage_writer._db_path = str(Path(path).parent / "missing-dir" / "x.db")
+        failed = usage_writer.flush()
+        pending = usage_writer.usage_writer_stats()["pending"]
+        for _ in range(2):
+            database.log_llm_usage_sync(_usage(), "m", "answering")
+        usage_writer._db_path = path
+        written = usage_writer.flush()
+        stats = usage_writer.usage_writer_stats()
+    finally:
+        _stop(saved)
+    check("Failed flush writes nothing and keeps the rows", failed == 0 and pending == 2, str(pending))
+    check("Over the cap, new rows are dropped", stats["dropped"] == 1 and written == 3, str(stats))
+    check("Failure counted", stats["failures"] == 1, str(stats))
+    check("Kept rows written by the next flush", len(_rows(path)) == 3)
+
+
+def test_aborted_estimate_from_memory():
+    print("\n── The aborted-stream estimate uses in-memory averages ──")
+    path = _fresh_db()
+    database.log_llm_usage_sync(_usage(1000), "m", "answering")   # written before the writer starts
+    saved = _start(path)
+    try:
+        database.log_llm_usage_sync(_usage(1200), "m", "answering")  # buffered
+        database.log_llm_usage_sync(_usage(50), "m", "answering", hedge_loser=True)
+        with _CountConnects() as connects:
+            est = database.log_aborted_llm_usage_sync(_usage(100), "m", "answering", 6000)
+            capped = database.log_aborted_llm_usage_sync(_usage(100), "m", "answering", 500)
+            unknown = database.log_aborted_llm_usage_sync(_usage(5), "m", "gathering", 4000)
+        usage_writer.flush()
+        rows = _rows(path)
+    finally:
+        _stop(saved)
+    check("Average of stored and buffered completed calls", est == 1000, str(est))
+    check("Capped at max_tokens", capped == 400, str(capped))
+    check("No history → nothing saved", unknown == 0, str(unknown))
+    check("No SQLite connection for the estimate", connects.calls == 0, str(connects.calls))
+    check("Aborted rows recorded", [r[3] for r in rows].count(1) == 3 and rows[3][4] == 1000, str(rows))
+
+
+def test_disabled():
+    print("\n── USAGE_BUFFER=false: writes stay inline ──")
+    path = _fresh_db()
+    saved = usage_writer.USAGE_BUFFER
+    usage_writer.USAGE_BUFFER = False
+    try:
+        check("Not started", usage_writer.start(path) is False and not usage_writer.running())
+        database.log_llm_usage_sync(_usage(), "m", "answering")
+        check("Row written immediately", len(_rows(path)) == 1)
+    finally:
+        usage_writer.USAGE_BUFFER = saved
+
+
+# ── Run All ─────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("USAGE WRITER TESTS")
+    print("=" * 60)
+
+    test_buffered_until_flush()
+    test_flush_on_interval_and_size()
+    test_flush_on_stop()
+    test_failed_flush_keeps_rows()
+    test_aborted_estimate_from_memory()
+    test_disabled()
+
+    print("\n" + "=" * 60)
+    total = PASS + FAIL
+    print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")
+    if FAIL > 0:
+        print("❌ SOME TESTS FAILED")
+    else:
+        print("✅ ALL TESTS PASSED")
+    print("=" * 60)
+
+    sys.exit(1 if FAIL > 0 else 0)